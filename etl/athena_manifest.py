@@ -0,0 +1,315 @@
+"""
+Incremental Delta symlink manifests and Glue Catalog partitions for Athena.
+
+Athena reads the bronze Delta table through a manifest table: one ``manifest`` file per
+``event_date`` partition under ``_symlink_format_manifest/`` lists the partition's live Parquet
+files, and one Glue Catalog partition points at each manifest directory.
+
+``AthenaManifestPublisher.publish`` is the post-commit hook of the streaming and replay jobs.
+Instead of regenerating every manifest, which costs more as the table grows, it replays only
+the Delta commits made since its last run (recorded in ``_symlink_format_manifest/_last_version``):
+
+* the ``add``/``remove`` actions of those commits are applied to the manifests of the
+  partitions they touch, so a micro-batch rewrites one small file per touched partition;
+* partitions without a manifest yet are registered with ``BatchCreatePartition``;
+* without a recorded version, or once the commits after it have been cleaned up from the log,
+  the live file set is rebuilt once from the latest checkpoint and every partition is published.
+
+Table paths may be ``s3://`` URIs or local directories.
+"""
+import io
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import unquote
+
+logger = logging.getLogger("athena_manifest")
+logger.setLevel(logging.INFO)
+
+MANIFEST_DIR = "_symlink_format_manifest"
+# Leading underscore: Hive and Athena ignore the file when listing the manifest location
+VERSION_FILE = "_last_version"
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# BatchCreatePartition accepts at most 100 partitions per call
+MAX_PARTITIONS_PER_CALL = 100
+
+PARTITION_STORAGE = {
+    "InputFormat": "org.apache.hadoop.hive.ql.io.SymlinkTextInputFormat",
+    "OutputFormat": "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+    "SerdeInfo": {"SerializationLibrary": "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"},
+}
+
+_COMMIT_FILE_RE = re.compile(r"^(\d{20})\.json$")
+
+
+class ObjectStorage:
+    """Just enough object-store access for the Delta log and manifests: S3 or a local directory."""
+
+    def __init__(self, s3_client=None):
+        self.s3_client = s3_client
+
+    @staticmethod
+    def _split(uri):
+        bucket, _, key = uri[5:].partition("/")
+        return bucket, key
+
+    def read(self, uri):
+        """Return the bytes at ``uri``, or None if there is no such object."""
+        if uri.startswith("s3://"):
+            bucket, key = self._split(uri)
+            try:
+                return self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            except self.s3_client.exceptions.NoSuchKey:
+                return None
+        if not os.path.exists(uri):
+            return None
+        with open(uri, "rb") as f:
+            return f.read()
+
+    def write(self, uri, body):
+        if uri.startswith("s3://"):
+            bucket, key = self._split(uri)
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+            return
+        os.makedirs(os.path.dirname(uri), exist_ok=True)
+        tmp_path = f"{uri}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, uri)
+
+    def list_names_after(self, directory_uri, start_after):
+        """Names of the objects directly under ``directory_uri`` that sort after ``start_after``."""
+        if directory_uri.startswith("s3://"):
+            bucket, prefix = self._split(directory_uri)
+            request = {"Bucket": bucket, "Prefix": prefix, "StartAfter": prefix + start_after}
+            names = []
+            while True:
+                response = self.s3_client.list_objects_v2(**request)
+                names.extend(item["Key"][len(prefix):] for item in response.get("Contents", []))
+                if not response.get("IsTruncated"):
+                    return names
+                request["ContinuationToken"] = response["NextContinuationToken"]
+        if not os.path.isdir(directory_uri):
+            return []
+        return sorted(name for name in os.listdir(directory_uri) if name > start_after)
+
+
+def _map_entries(value):
+    # Checkpoint partitionValues come back from Arrow as (key, value) pairs
+    return dict(value) if value else {}
+
+
+class DeltaLog:
+    """Reads the commits and checkpoints of one Delta table without a Spark or delta-rs snapshot."""
+
+    def __init__(self, table_path, storage):
+        self.table_path = table_path.rstrip("/")
+        self.storage = storage
+
+    @property
+    def log_path(self):
+        return f"{self.table_path}/_delta_log"
+
+    def absolute_path(self, path):
+        path = unquote(path)
+        if "://" in path or path.startswith("/"):
+            return path
+        return f"{self.table_path}/{path}"
+
+    @staticmethod
+    def partition_value(action, partition_column):
+        values = action.get("partitionValues")
+        if values is None:
+            # Removes written without extended file metadata carry only the path
+            match = re.search(rf"(?:^|/){re.escape(partition_column)}=([^/]*)/", unquote(action["path"]))
+            return match.group(1) if match else HIVE_DEFAULT_PARTITION
+        value = _map_entries(values).get(partition_column)
+        return HIVE_DEFAULT_PARTITION if value is None else value
+
+    def commit_versions_after(self, version):
+        """Versions of the commits after ``version`` (all of them for None), in order."""
+        start_after = f"{version:020d}.json" if version is not None else ""
+        names = self.storage.list_names_after(f"{self.log_path}/", start_after)
+        return sorted(int(match.group(1)) for match in map(_COMMIT_FILE_RE.match, names) if match)
+
+    def commit_actions(self, version):
+        """Yield the ``("add" | "remove", action)`` pairs of one commit, in commit order."""
+        body = self.storage.read(f"{self.log_path}/{version:020d}.json")
+        for line in body.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            for kind in ("add", "remove"):
+                if kind in action:
+                    yield kind, action[kind]
+
+    def checkpoint_adds(self):
+        """Return ``(version, add actions)`` of the latest checkpoint, or ``(None, [])`` without one."""
+        body = self.storage.read(f"{self.log_path}/_last_checkpoint")
+        if not body:
+            return None, []
+        import pyarrow.parquet as pq
+
+        checkpoint = json.loads(body)
+        version = checkpoint["version"]
+        parts = checkpoint.get("parts")
+        names = ([f"{version:020d}.checkpoint.parquet"] if not parts else
+                 [f"{version:020d}.checkpoint.{part:010d}.{parts:010d}.parquet" for part in range(1, parts + 1)])
+        adds = []
+        for name in names:
+            table = pq.read_table(io.BytesIO(self.storage.read(f"{self.log_path}/{name}")), columns=["add"])
+            adds.extend(add for add in table.column("add").to_pylist() if add)
+        return version, adds
+
+    def snapshot(self):
+        """
+        Return ``(version, {absolute path: add action})`` for the live files of the latest version.
+
+        Starts from the latest checkpoint and applies the commits after it; raises RuntimeError
+        when the commits needed are no longer in the log. ``version`` is None for an empty log.
+        """
+        version, adds = self.checkpoint_adds()
+        files = {self.absolute_path(add["path"]): add for add in adds}
+        versions = self.commit_versions_after(version)
+        expected = 0 if version is None else version + 1
+        if versions and versions[0] != expected:
+            raise RuntimeError(f"Delta log of {self.table_path} has no checkpoint or commits from version {expected}")
+        for commit_version in versions:
+            for kind, action in self.commit_actions(commit_version):
+                path = self.absolute_path(action["path"])
+                if kind == "add":
+                    files[path] = action
+                else:
+                    files.pop(path, None)
+            version = commit_version
+        return version, files
+
+
+class AthenaManifestPublisher:
+    """
+    Keeps the symlink manifests and Glue partitions of one Delta table in step with its log.
+
+    ``glue_client`` is optional: without it only the manifests are maintained. ``publish`` is
+    safe to call from a streaming listener thread and the driver at the same time.
+    """
+
+    def __init__(self, table_path, partition_column="event_date", glue_client=None, database=None,
+                 table_name=None, s3_client=None):
+        self.table_path = table_path.rstrip("/")
+        self.partition_column = partition_column
+        self.glue_client = glue_client
+        self.database = database
+        self.table_name = table_name
+        self._storage = ObjectStorage(s3_client)
+        self.delta_log = DeltaLog(self.table_path, self._storage)
+        self._lock = threading.Lock()
+
+    # ─── Paths ──────────────────────────────────────────────────────────────
+    @property
+    def manifest_root(self):
+        return f"{self.table_path}/{MANIFEST_DIR}"
+
+    def manifest_path(self, value):
+        return f"{self.manifest_root}/{self.partition_column}={value}/manifest"
+
+    def _last_published_version(self):
+        body = self._storage.read(f"{self.manifest_root}/{VERSION_FILE}")
+        return int(body) if body else None
+
+    # ─── Publishing ─────────────────────────────────────────────────────────
+    def _read_manifest(self, value):
+        body = self._storage.read(self.manifest_path(value))
+        return None if body is None else set(body.decode("utf-8").splitlines())
+
+    def _write_manifest(self, value, files):
+        self._storage.write(self.manifest_path(value), "".join(f"{path}\n" for path in sorted(files)).encode("utf-8"))
+
+    def register_partitions(self, values):
+        """Create Glue partitions for ``values`` in bulk; existing partitions are left as they are."""
+        values = [value for value in values if value != HIVE_DEFAULT_PARTITION]
+        if not self.glue_client or not values:
+            return 0
+        created = 0
+        for start in range(0, len(values), MAX_PARTITIONS_PER_CALL):
+            batch = values[start:start + MAX_PARTITIONS_PER_CALL]
+            response = self.glue_client.batch_create_partition(
+                DatabaseName=self.database,
+                TableName=self.table_name,
+                PartitionInputList=[
+                    {"Values": [value],
+                     "StorageDescriptor": {**PARTITION_STORAGE,
+                                           "Location": f"{self.manifest_root}/{self.partition_column}={value}/"}}
+                    for value in batch
+                ],
+            )
+            failed = 0
+            for error in response.get("Errors", []):
+                # The location is derived from the value, so an existing partition is already correct
+                if error.get("ErrorDetail", {}).get("ErrorCode") != "AlreadyExistsException":
+                    failed += 1
+                    logger.error(f"Could not register partition {error.get('PartitionValues')}: "
+                                 f"{error.get('ErrorDetail', {}).get('ErrorMessage')}")
+            if failed:
+                raise RuntimeError(f"BatchCreatePartition failed for {failed} partition(s) of "
+                                   f"{self.database}.{self.table_name}")
+            created += len(batch)
+        return created
+
+    def _publish(self, version, partition_files, new_partitions):
+        # Partitions go first: if writing a manifest fails, the next run sees it still missing
+        # and registers it again
+        registered = self.register_partitions(sorted(new_partitions))
+        for value, files in sorted(partition_files.items()):
+            self._write_manifest(value, files)
+        self._storage.write(f"{self.manifest_root}/{VERSION_FILE}", str(version).encode("utf-8"))
+        summary = {"version": version, "partitions": sorted(partition_files), "registered": registered}
+        logger.info(f"Published Athena manifests for {self.table_path}: {summary}")
+        return summary
+
+    def rebuild(self):
+        """Rebuild every manifest from the latest checkpoint plus later commits and register all partitions."""
+        version, live_files = self.delta_log.snapshot()
+        files = {}
+        for path, add in live_files.items():
+            files.setdefault(self.delta_log.partition_value(add, self.partition_column), set()).add(path)
+        if version is None:
+            logger.info(f"{self.table_path} has no Delta commits yet; nothing to publish")
+            return None
+        return self._publish(version, files, new_partitions=files)
+
+    def publish(self):
+        """
+        Bring the manifests and Glue partitions up to date with the commits since the last run.
+
+        Returns a summary (version, touched partitions, partitions registered), or None when
+        there was nothing new.
+        """
+        with self._lock:
+            last_version = self._last_published_version()
+            versions = self.delta_log.commit_versions_after(last_version)
+            if last_version is None or (versions and versions[0] != last_version + 1):
+                logger.info(f"Rebuilding Athena manifests for {self.table_path} "
+                            f"(last published version {last_version}, next commit {versions[:1]})")
+                return self.rebuild()
+            if not versions:
+                return None
+
+            changes = {}
+            for version in versions:
+                for kind, action in self.delta_log.commit_actions(version):
+                    changes.setdefault(self.delta_log.partition_value(action, self.partition_column), []).append(
+                        (kind, self.delta_log.absolute_path(action["path"])))
+
+            partition_files = {}
+            new_partitions = []
+            for value, actions in changes.items():
+                files = self._read_manifest(value)
+                if files is None:
+                    files = set()
+                    new_partitions.append(value)
+                for kind, path in actions:
+                    (files.add if kind == "add" else files.discard)(path)
+                partition_files[value] = files
+            return self._publish(versions[-1], partition_files, new_partitions)
@@ -0,0 +1,183 @@
+"""
+Backfill bookkeeping for click dumps in the raw landing bucket.
+
+Historical or replayed clicks used to be pushed back through Kinesis. Instead, NDJSON files
+(optionally gzipped, one click per line) are dropped under a landing prefix, e.g.
+``s3://<bucket>/<env>/landing/clicks/2024/05/01/part-0000.json.gz``, and the replay Glue job
+run with ``--BACKFILL_SOURCE`` loads them into bronze (``glue_stream.run_backfill_job``).
+This module holds the Spark-free parts of that job:
+
+* ``list_landing_files`` lists the prefix tree in parallel, one directory level per call, so
+  a date-partitioned layout is listed with as many requests in flight as there are workers;
+* ``BackfillManifest`` records which files went into which bronze write, one small JSON
+  object per batch under the manifest prefix;
+* ``plan_batches`` splits the files not yet ingested into batches of bounded size.
+
+A batch is recorded as claimed before its bronze write and as ingested after it. Its id is a
+hash of its file list and its Delta txnAppId is derived from that id, so a batch interrupted
+between the two steps is re-run with the same files and id on the next run and the bronze
+write is skipped by Delta if it had already committed. Files of ingested batches are never
+read again.
+
+Both the landing prefix and the manifest may be ``s3://`` URIs or local directories. Print
+what a run would load, without Spark:
+
+    python -m etl.backfill s3://bucket/dev/landing/clicks/ s3://bucket/dev/backfill/manifest/
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import boto3
+
+from etl.athena_manifest import ObjectStorage
+
+logger = logging.getLogger("backfill")
+logger.setLevel(logging.INFO)
+
+LANDING_SUFFIXES = (".json", ".jsonl", ".ndjson", ".json.gz", ".jsonl.gz", ".ndjson.gz")
+LIST_WORKERS = 16
+MAX_FILES_PER_BATCH = 500
+MAX_MB_PER_BATCH = 2048
+
+BATCH_CLAIMED = "claimed"
+BATCH_INGESTED = "ingested"
+
+
+def _is_landing_file(name):
+    # Leading "_" or ".": markers and temporary uploads, skipped like Hive does
+    return not name.startswith(("_", ".")) and name.lower().endswith(LANDING_SUFFIXES)
+
+
+def _list_level(uri, s3_client):
+    """Landing files directly under directory ``uri`` and its subdirectories, as ``(files, subdirectories)``."""
+    files, subdirectories = [], []
+    if uri.startswith("s3://"):
+        bucket, _, prefix = uri[5:].partition("/")
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+            for item in page.get("Contents", []):
+                if _is_landing_file(item["Key"][len(prefix):]):
+                    files.append({"path": f"s3://{bucket}/{item['Key']}", "size": item["Size"]})
+            subdirectories.extend(f"s3://{bucket}/{entry['Prefix']}" for entry in page.get("CommonPrefixes", []))
+        return files, subdirectories
+    with os.scandir(uri) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirectories.append(os.path.join(entry.path, ""))
+            elif _is_landing_file(entry.name):
+                files.append({"path": entry.path, "size": entry.stat().st_size})
+    return files, subdirectories
+
+
+def list_landing_files(source_uri, s3_client=None, max_workers=LIST_WORKERS):
+    """
+    Every landing file under ``source_uri`` as ``{"path", "size"}``, sorted by path.
+
+    Each directory level is listed as soon as its parent has been, on ``max_workers`` threads.
+    """
+    if not source_uri.startswith("s3://") and not os.path.isdir(source_uri):
+        raise ValueError(f"Backfill source {source_uri} is not a directory")
+    root = source_uri if source_uri.endswith("/") else f"{source_uri}/"
+    files, directories = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = {pool.submit(_list_level, root, s3_client)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                level_files, subdirectories = future.result()
+                directories += 1
+                files.extend(level_files)
+                pending.update(pool.submit(_list_level, subdirectory, s3_client) for subdirectory in subdirectories)
+    logger.info(f"Listed {len(files)} landing file(s) in {directories} director(y/ies) under {root}")
+    return sorted(files, key=lambda item: item["path"])
+
+
+class BackfillManifest:
+    """The batches loaded from the landing prefix so far: one ``<batch_id>.json`` object each."""
+
+    def __init__(self, manifest_uri, s3_client=None, max_workers=LIST_WORKERS):
+        self.manifest_uri = manifest_uri if manifest_uri.endswith("/") else f"{manifest_uri}/"
+        self.storage = ObjectStorage(s3_client)
+        self.max_workers = max_workers
+
+    def _batch_uri(self, batch_id):
+        return f"{self.manifest_uri}{batch_id}.json"
+
+    def load(self):
+        """Recorded batches as ``{batch_id: entry}``."""
+        names = [name for name in self.storage.list_names_after(self.manifest_uri, "") if name.endswith(".json")]
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            bodies = pool.map(self.storage.read, [f"{self.manifest_uri}{name}" for name in names])
+            entries = [json.loads(body) for body in bodies if body is not None]
+        return {entry["batch_id"]: entry for entry in entries}
+
+    def record(self, batch, state):
+        entry = {**batch, "state": state, "recorded_at": datetime.now(timezone.utc).isoformat()}
+        self.storage.write(self._batch_uri(batch["batch_id"]), json.dumps(entry, sort_keys=True).encode("utf-8"))
+        return entry
+
+
+def _batch_id(files):
+    digest = hashlib.sha256("\n".join(item["path"] for item in files).encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+def plan_batches(files, recorded, max_files=MAX_FILES_PER_BATCH, max_bytes=MAX_MB_PER_BATCH * 1024 * 1024):
+    """
+    Batches to load, as ``{"batch_id", "files"}``: claimed but unfinished batches first, unchanged,
+    then the files of no recorded batch in path order, at most ``max_files`` files and (past the
+    first file) ``max_bytes`` bytes each.
+    """
+    resumed = sorted((entry for entry in recorded.values() if entry["state"] != BATCH_INGESTED),
+                     key=lambda entry: entry["batch_id"])
+    batches = [{"batch_id": entry["batch_id"], "files": entry["files"]} for entry in resumed]
+    known = {item["path"] for entry in recorded.values() for item in entry["files"]}
+
+    current, current_bytes = [], 0
+    for item in files:
+        if item["path"] in known:
+            continue
+        if current and (len(current) >= max_files or current_bytes + item["size"] > max_bytes):
+            batches.append({"batch_id": _batch_id(current), "files": current})
+            current, current_bytes = [], 0
+        current.append(item)
+        current_bytes += item["size"]
+    if current:
+        batches.append({"batch_id": _batch_id(current), "files": current})
+
+    skipped = sum(item["path"] in known for item in files)
+    logger.info(f"Backfill plan: {len(batches)} batch(es), {len(resumed)} resumed; "
+                f"{skipped} file(s) already in the manifest")
+    return batches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the batches a backfill of the landing prefix would load")
+    parser.add_argument("source_uri")
+    parser.add_argument("manifest_uri")
+    parser.add_argument("--region")
+    parser.add_argument("--max-files-per-batch", type=int, default=MAX_FILES_PER_BATCH)
+    parser.add_argument("--max-mb-per-batch", type=int, default=MAX_MB_PER_BATCH)
+    parser.add_argument("--list-workers", type=int, default=LIST_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="[%(asctime)s] %(levelname)s %(filename)s:%(lineno)d %(message)s")
+    s3_client = None
+    if args.source_uri.startswith("s3://") or args.manifest_uri.startswith("s3://"):
+        s3_client = boto3.client("s3", region_name=args.region)
+    files = list_landing_files(args.source_uri, s3_client, args.list_workers)
+    recorded = BackfillManifest(args.manifest_uri, s3_client, args.list_workers).load()
+    for batch in plan_batches(files, recorded, args.max_files_per_batch, args.max_mb_per_batch * 1024 * 1024):
+        print(json.dumps({"batch_id": batch["batch_id"], "files": len(batch["files"]),
+                          "bytes": sum(item["size"] for item in batch["files"])}))
+
+
+if __name__ == "__main__":
+    main()
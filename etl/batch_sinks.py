@@ -0,0 +1,187 @@
+"""
+Single-pass fan-out of streaming micro-batches to several outputs.
+
+Every streaming query over the Kinesis source re-reads and re-decodes the shards, so each new
+output (bronze, DLQ, aggregates, samples) used to cost a full extra read. ``MicroBatchFanOut`` is
+the ``foreachBatch`` function of the one query the job runs: it prepares and persists each
+micro-batch once and hands it to a list of sinks in turn.
+
+A sink has a ``name`` and a ``write(prepared_df, batch_id, txn_app_id)`` method. Delta sinks
+append with ``txnAppId``/``txnVersion`` = (per-sink app id, batch id), so when a batch is re-run
+after a failure, the sinks that already committed it skip it and only the rest write. Time spent
+per sink is recorded in ``SinkMetrics``.
+"""
+import logging
+import time
+
+from pyspark import StorageLevel
+
+logger = logging.getLogger("batch_sinks")
+logger.setLevel(logging.INFO)
+
+
+def write_delta_batch(df, out_path, partition_column, txn_app_id, txn_version, sort_columns=()):
+    # Delta skips the commit if this (txnAppId, txnVersion) pair was already written to the table
+    logger.info(f"Writing batch to {out_path} (txnAppId={txn_app_id}, txnVersion={txn_version})")
+    if sort_columns:
+        # Partition column first: the writer's required ordering is then already met and it does
+        # not re-sort the rows by partition only
+        df = df.sortWithinPartitions(partition_column, *sort_columns)
+    (
+        df.write
+        .format("delta")
+        .mode("append")
+        .option("txnAppId", txn_app_id)
+        .option("txnVersion", txn_version)
+        .option("mergeSchema", "true")
+        .partitionBy(partition_column)
+        .save(out_path)
+    )
+
+
+class DeltaBatchSink:
+    """Appends ``build(prepared_df)`` to a partitioned Delta table, once per micro-batch."""
+
+    def __init__(self, name, out_path, build, partition_column, sort_columns=()):
+        self.name = name
+        self.out_path = out_path
+        self.build = build
+        self.partition_column = partition_column
+        self.sort_columns = tuple(sort_columns)
+
+    def write(self, prepared_df, batch_id, txn_app_id):
+        write_delta_batch(self.build(prepared_df), self.out_path, self.partition_column, txn_app_id, batch_id,
+                          self.sort_columns)
+
+
+class LogSampleSink:
+    """Logs a few rows of the first ``batches`` non-empty micro-batches, for debugging."""
+
+    def __init__(self, build, name="sample", rows=5, batches=1):
+        self.name = name
+        self.build = build
+        self.rows = rows
+        self.batches = batches
+        self._logged = 0
+
+    def write(self, prepared_df, batch_id, txn_app_id):
+        if self._logged >= self.batches:
+            return
+        rows = self.build(prepared_df).limit(self.rows).collect()
+        if not rows:
+            return
+        self._logged += 1
+        for row in rows:
+            logger.info(f"Sample from batch {batch_id}: {row.asDict()}")
+
+
+class PartitionSpreadSink:
+    """
+    Logs how the rows of each micro-batch spread over the partitions they are written to.
+
+    A batch normally lands in one or two ``partition_column`` values; every other value it
+    touches gets a small file of its own. Partitions with under ``stray_fraction`` of a batch's
+    rows are reported as stray, and rows are also counted per ``flag_column`` value.
+    """
+
+    def __init__(self, build, partition_column, flag_column=None, name="partition_spread", stray_fraction=0.01):
+        self.name = name
+        self.build = build
+        self.partition_column = partition_column
+        self.flag_column = flag_column
+        self.stray_fraction = stray_fraction
+        self._totals = {"batches": 0, "rows": 0, "partitions": 0, "max_partitions": 0, "stray_partitions": 0,
+                        "flags": {}}
+
+    def write(self, prepared_df, batch_id, txn_app_id):
+        group = [self.partition_column] + ([self.flag_column] if self.flag_column else [])
+        partitions, flags = {}, {}
+        for row in self.build(prepared_df).groupBy(*group).count().collect():
+            partitions[row[0]] = partitions.get(row[0], 0) + row["count"]
+            if self.flag_column:
+                flags[row[1]] = flags.get(row[1], 0) + row["count"]
+        rows = sum(partitions.values())
+        if not rows:
+            return
+        stray = sorted(str(value) for value, count in partitions.items() if count < self.stray_fraction * rows)
+
+        totals = self._totals
+        totals["batches"] += 1
+        totals["rows"] += rows
+        totals["partitions"] += len(partitions)
+        totals["max_partitions"] = max(totals["max_partitions"], len(partitions))
+        totals["stray_partitions"] += len(stray)
+        for flag, count in flags.items():
+            totals["flags"][flag] = totals["flags"].get(flag, 0) + count
+
+        logger.info(f"Batch {batch_id}: {rows} rows over {len(partitions)} {self.partition_column} partition(s), "
+                    f"{len(stray)} stray" + (f" ({', '.join(stray[:10])})" if stray else "")
+                    + (f"; {self.flag_column}: {flags}" if flags else ""))
+
+    def summary(self):
+        """Totals over the batches seen, with the mean number of partitions a batch wrote to."""
+        totals = self._totals
+        return {**totals, "flags": dict(totals["flags"]),
+                "mean_partitions": totals["partitions"] / totals["batches"] if totals["batches"] else 0.0}
+
+
+class SinkMetrics:
+    """Per-sink timings across the micro-batches of one run."""
+
+    def __init__(self):
+        self._sinks = {}
+
+    def record(self, sink_name, seconds, failed=False):
+        stats = self._sinks.setdefault(sink_name, {"batches": 0, "failures": 0, "total_seconds": 0.0,
+                                                   "max_seconds": 0.0})
+        stats["batches"] += 1
+        stats["failures"] += int(failed)
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def summary(self):
+        """``{sink: {batches, failures, total_seconds, mean_seconds, max_seconds}}`` in sink order."""
+        return {name: {**stats, "mean_seconds": stats["total_seconds"] / stats["batches"]}
+                for name, stats in self._sinks.items()}
+
+
+class MicroBatchFanOut:
+    """
+    ``foreachBatch`` function writing each micro-batch to every sink in order.
+
+    ``prepare`` turns the raw batch into the frame the sinks share (decoding, parsing); it is
+    persisted for the duration of the batch. ``txn_app_id`` maps a sink name to its Delta app id,
+    which must stay the same across restarts of the query and change when its checkpoint is reset
+    (batch ids start again at 0).
+    """
+
+    def __init__(self, sinks, txn_app_id, prepare=None, metrics=None, storage_level=StorageLevel.MEMORY_AND_DISK):
+        names = [sink.name for sink in sinks]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Sink names must be unique, got {names}")
+        self.sinks = list(sinks)
+        self.txn_app_id = txn_app_id
+        self.prepare = prepare
+        self.metrics = metrics or SinkMetrics()
+        self.storage_level = storage_level
+
+    def __call__(self, batch_df, batch_id):
+        prepared_df = (self.prepare(batch_df) if self.prepare else batch_df).persist(self.storage_level)
+        try:
+            rows = prepared_df.count()  # Materializes the cache the sinks read from
+            timings = []
+            for sink in self.sinks:
+                started = time.perf_counter()
+                try:
+                    sink.write(prepared_df, batch_id, self.txn_app_id(sink.name))
+                except Exception:
+                    self.metrics.record(sink.name, time.perf_counter() - started, failed=True)
+                    logger.error(f"Sink {sink.name} failed on batch {batch_id}; the batch will be retried "
+                                 f"and sinks that already committed it skip it")
+                    raise
+                seconds = time.perf_counter() - started
+                self.metrics.record(sink.name, seconds)
+                timings.append(f"{sink.name} {seconds:.2f}s")
+            logger.info(f"Batch {batch_id} ({rows} rows): {', '.join(timings)}")
+        finally:
+            prepared_df.unpersist()
@@ -0,0 +1,331 @@
+"""
+Shard and Glue worker recommendations from the stream's own metrics.
+
+Capacity is static (the stream's ``shard_count`` and the streaming job's ``number_of_workers``),
+and under-provisioning used to show up as write throttles and a growing iterator age. The
+advisor reads, per ``period`` seconds, the stream's CloudWatch metrics (incoming bytes and
+records, write/read throttles, ``GetRecords.IteratorAgeMilliseconds``) and the Glue streaming
+job's per-batch metrics (records and processing time), and recommends:
+
+* shards: enough for a high percentile of the incoming rate at ``target_utilization`` of the
+  per-shard write limits (1 MiB/s and 1,000 records/s); more when writes are throttled;
+* workers: enough executors to process that rate, plus the backlog behind the iterator age
+  within ``catch_up_seconds``, at the records/s per executor the recent batches achieved. One
+  worker is the driver, and executors past one core per shard add no read parallelism.
+
+Scaling down is damped: a recommendation only goes below the current capacity when the need
+is under ``scale_down_ratio`` of it, with no throttling and no backlog.
+
+``ShardScaler`` can apply shard recommendations with ``UpdateShardCount``. A scale-down must be
+recommended on ``scale_down_evaluations`` consecutive runs, a change waits out the cooldown of
+its direction, at most ``max_changes_per_day`` are made, and each step stays within what
+uniform scaling allows (half to double the open shards). Its state is a small JSON object on
+S3 or local disk. Worker counts are only recommended: set the Glue module's
+``number_of_workers``.
+
+    python -m etl.capacity_advisor --stream-name clickstream-click-dev --job-name clickstream-stream-dev \\
+        --workers 2 [--apply --state-uri s3://bucket/dev/capacity/state.json]
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+from etl.athena_manifest import ObjectStorage
+
+logger = logging.getLogger("capacity_advisor")
+logger.setLevel(logging.INFO)
+
+SHARD_WRITE_BYTES_PER_SECOND = 1024 * 1024
+SHARD_WRITE_RECORDS_PER_SECOND = 1000
+# vCPUs of a worker, i.e. Kinesis shards one executor reads in parallel
+GLUE_WORKER_CORES = {"G.025X": 2, "G.1X": 4, "G.2X": 8, "G.4X": 16, "G.8X": 32}
+
+DEFAULT_POLICY = {
+    "target_utilization": 0.7,
+    # Nearest-rank percentile of the per-period rates sized for
+    "percentile": 95,
+    "throttled_period_fraction": 0.05,
+    # Growth when writes are throttled but the average rate looks sufficient (hot shards)
+    "throttle_scale_up": 1.5,
+    "max_iterator_age_seconds": 60,
+    "catch_up_seconds": 900,
+    "scale_down_ratio": 0.6,
+    "scale_down_evaluations": 3,
+    "scale_up_cooldown_seconds": 15 * 60,
+    "scale_down_cooldown_seconds": 6 * 3600,
+    "max_changes_per_day": 10,
+    "min_shards": 1,
+    "max_shards": 64,
+    "min_workers": 2,
+    "max_workers": 32,
+}
+
+# Series name -> (namespace, metric, statistic); stream metrics are per stream, Glue ones per job
+STREAM_METRICS = {
+    "incoming_bytes": ("AWS/Kinesis", "IncomingBytes", "Sum"),
+    "incoming_records": ("AWS/Kinesis", "IncomingRecords", "Sum"),
+    "write_throttles": ("AWS/Kinesis", "WriteProvisionedThroughputExceeded", "Sum"),
+    "read_throttles": ("AWS/Kinesis", "ReadProvisionedThroughputExceeded", "Sum"),
+    "iterator_age_ms": ("AWS/Kinesis", "GetRecords.IteratorAgeMilliseconds", "Maximum"),
+}
+GLUE_METRICS = {
+    "batch_records": ("Glue", "glue.driver.streaming.numRecords", "Sum"),
+    "batch_ms": ("Glue", "glue.driver.streaming.batchProcessingTimeInMs", "Sum"),
+}
+
+
+def _metric_query(series_id, namespace, metric, statistic, dimensions, period):
+    return {
+        "Id": series_id,
+        "MetricStat": {
+            "Metric": {"Namespace": namespace, "MetricName": metric,
+                       "Dimensions": [{"Name": name, "Value": value} for name, value in dimensions.items()]},
+            "Period": period,
+            "Stat": statistic,
+        },
+        "ReturnData": True,
+    }
+
+
+def fetch_metric_series(cloudwatch, metrics, dimensions, start, end, period=60):
+    """
+    ``{series name: [values]}`` for ``metrics`` (see STREAM_METRICS), one value per period in
+    time order. Periods without data points are missing from a series.
+    """
+    request = {
+        "MetricDataQueries": [_metric_query(name, *spec, dimensions, period) for name, spec in metrics.items()],
+        "StartTime": start,
+        "EndTime": end,
+        "ScanBy": "TimestampAscending",
+    }
+    points = {name: [] for name in metrics}
+    while True:
+        response = cloudwatch.get_metric_data(**request)
+        for result in response["MetricDataResults"]:
+            points[result["Id"]].extend(zip(result["Timestamps"], result["Values"]))
+        if not response.get("NextToken"):
+            break
+        request["NextToken"] = response["NextToken"]
+    return {name: [value for _, value in sorted(series, key=lambda point: point[0])] for name, series in points.items()}
+
+
+def fetch_stream_metrics(cloudwatch, stream_name, start, end, period=60):
+    return fetch_metric_series(cloudwatch, STREAM_METRICS, {"StreamName": stream_name}, start, end, period)
+
+
+def fetch_glue_metrics(cloudwatch, job_name, start, end, period=60):
+    # Streaming metrics need --enable-metrics on the job
+    dimensions = {"JobName": job_name, "JobRunId": "ALL", "Type": "count"}
+    return fetch_metric_series(cloudwatch, GLUE_METRICS, dimensions, start, end, period)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``; 0 when empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _damped(needed, current, scale_down_ok, policy):
+    """``needed`` when scaling up, or down past the hysteresis band; else ``current``."""
+    if needed > current:
+        return needed
+    if scale_down_ok and needed <= current * policy["scale_down_ratio"]:
+        return needed
+    return current
+
+
+def recommend(stream_metrics, glue_metrics, shards, workers, worker_type="G.1X", period=60, policy=None):
+    """
+    Shard and worker counts for the load in ``stream_metrics`` / ``glue_metrics`` (series as
+    returned by fetch_stream_metrics / fetch_glue_metrics) given the current capacity.
+
+    Returns ``{"shards", "workers", "reasons", "load"}``; ``reasons`` explains every change.
+    """
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    utilization = policy["target_utilization"]
+    reasons = []
+
+    bytes_per_second = [value / period for value in stream_metrics.get("incoming_bytes", [])]
+    records_per_second = [value / period for value in stream_metrics.get("incoming_records", [])]
+    peak_bytes = percentile(bytes_per_second, policy["percentile"])
+    peak_records = percentile(records_per_second, policy["percentile"])
+    write_throttles = stream_metrics.get("write_throttles", [])
+    throttled = sum(value > 0 for value in write_throttles) / len(write_throttles) if write_throttles else 0.0
+    iterator_age = stream_metrics.get("iterator_age_ms", [])
+    age_seconds = iterator_age[-1] / 1000 if iterator_age else 0.0
+    lagging = age_seconds > policy["max_iterator_age_seconds"]
+    read_throttled = any(value > 0 for value in stream_metrics.get("read_throttles", []))
+
+    # ─── Shards ──────────────────────────────────────────────────────────
+    needed_shards = max(math.ceil(peak_bytes / (SHARD_WRITE_BYTES_PER_SECOND * utilization)),
+                        math.ceil(peak_records / (SHARD_WRITE_RECORDS_PER_SECOND * utilization)), 1)
+    rate_reason = (f"p{policy['percentile']} write rate {peak_bytes / 1024:.0f} KiB/s, {peak_records:.0f} "
+                   f"records/s needs {needed_shards} shard(s) at {utilization:.0%} utilization")
+    if throttled > policy["throttled_period_fraction"]:
+        if needed_shards <= shards:
+            needed_shards = math.ceil(shards * policy["throttle_scale_up"])
+            rate_reason = (f"writes throttled in {throttled:.0%} of periods at only {peak_bytes / 1024:.0f} KiB/s: "
+                           f"likely hot shards")
+        else:
+            reasons.append(f"writes throttled in {throttled:.0%} of periods")
+    new_shards = _damped(needed_shards, shards, throttled == 0 and not lagging and not read_throttled, policy)
+    new_shards = min(max(new_shards, policy["min_shards"]), policy["max_shards"])
+    if new_shards != shards:
+        reasons.append(rate_reason)
+
+    # ─── Workers ─────────────────────────────────────────────────────────
+    cores = GLUE_WORKER_CORES.get(worker_type, 4)
+    batch_seconds = sum(glue_metrics.get("batch_ms", [])) / 1000
+    processed = sum(glue_metrics.get("batch_records", []))
+    executors = max(workers - 1, 1)
+    new_workers = workers
+    executor_rate = processed / batch_seconds / executors if batch_seconds and processed else 0.0
+    if not executor_rate:
+        reasons.append("no Glue batch metrics: worker count left as is")
+    else:
+        mean_records = sum(records_per_second) / len(records_per_second) if records_per_second else 0.0
+        backlog_rate = age_seconds * mean_records / policy["catch_up_seconds"] if lagging else 0.0
+        demand = peak_records / utilization + backlog_rate
+        needed_workers = 1 + max(math.ceil(demand / executor_rate), 1)
+        if lagging:
+            reasons.append(f"iterator age {age_seconds:.0f}s: {backlog_rate:.0f} records/s to catch up within "
+                           f"{policy['catch_up_seconds']}s")
+        useful = 1 + math.ceil(new_shards / cores)
+        if needed_workers > useful:
+            reasons.append(f"{needed_workers} worker(s) needed but {new_shards} shard(s) keep only {useful} busy; "
+                           f"add shards for more read parallelism")
+            needed_workers = useful
+        new_workers = _damped(needed_workers, workers, not lagging, policy)
+        new_workers = min(max(new_workers, policy["min_workers"]), policy["max_workers"])
+        if new_workers != workers:
+            reasons.append(f"{demand:.0f} records/s at {executor_rate:.0f} records/s per executor needs "
+                           f"{needed_workers} worker(s)")
+    if read_throttled:
+        reasons.append("reads throttled: enable enhanced fan-out (ENABLE_EFO) or add shards")
+
+    return {
+        "shards": new_shards,
+        "workers": new_workers,
+        "reasons": reasons,
+        "load": {"write_bytes_per_second": peak_bytes, "write_records_per_second": peak_records,
+                 "throttled_fraction": throttled, "iterator_age_seconds": age_seconds,
+                 "records_per_second_per_executor": executor_rate},
+    }
+
+
+def _uniform_scaling_bounds(open_shards):
+    # UpdateShardCount with UNIFORM_SCALING: at least half, at most double the open shards
+    return math.ceil(open_shards / 2), open_shards * 2
+
+
+class ShardScaler:
+    """Applies shard recommendations with ``UpdateShardCount``, with hysteresis and cooldowns."""
+
+    def __init__(self, kinesis_client, stream_name, state_uri, s3_client=None, policy=None):
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.state_uri = state_uri
+        self.storage = ObjectStorage(s3_client)
+        self.policy = {**DEFAULT_POLICY, **(policy or {})}
+
+    def load_state(self):
+        body = self.storage.read(self.state_uri)
+        return json.loads(body) if body else {"changes": [], "low_evaluations": 0}
+
+    def _save_state(self, state):
+        self.storage.write(self.state_uri, json.dumps(state, sort_keys=True).encode("utf-8"))
+
+    def _skip(self, state, reason, **details):
+        self._save_state(state)
+        logger.info(f"Shard count of {self.stream_name} unchanged: {reason}")
+        return {"action": "skipped", "reason": reason, **details}
+
+    def apply(self, target_shards, now=None):
+        """Move the stream towards ``target_shards`` if hysteresis, cooldowns and limits allow."""
+        now = now or datetime.now(timezone.utc)
+        policy = self.policy
+        state = self.load_state()
+        summary = self.kinesis_client.describe_stream_summary(StreamName=self.stream_name)["StreamDescriptionSummary"]
+        if summary.get("StreamModeDetails", {}).get("StreamMode") == "ON_DEMAND":
+            return self._skip(state, "stream is on-demand")
+        if summary["StreamStatus"] != "ACTIVE":
+            return self._skip(state, f"stream is {summary['StreamStatus']}")
+        current = summary["OpenShardCount"]
+        if target_shards == current:
+            state["low_evaluations"] = 0
+            return self._skip(state, "at the recommended count", shards=current)
+
+        scaling_up = target_shards > current
+        if scaling_up:
+            state["low_evaluations"] = 0
+        else:
+            state["low_evaluations"] += 1
+            if state["low_evaluations"] < policy["scale_down_evaluations"]:
+                return self._skip(state, f"scale-down recommended {state['low_evaluations']} of "
+                                         f"{policy['scale_down_evaluations']} times in a row", shards=current)
+
+        changes = [change for change in state["changes"]
+                   if now - datetime.fromisoformat(change["at"]) < timedelta(days=1)]
+        state["changes"] = changes
+        if changes:
+            cooldown = policy["scale_up_cooldown_seconds" if scaling_up else "scale_down_cooldown_seconds"]
+            since = (now - datetime.fromisoformat(changes[-1]["at"])).total_seconds()
+            if since < cooldown:
+                return self._skip(state, f"last change {since:.0f}s ago, cooldown {cooldown}s", shards=current)
+        if len(changes) >= policy["max_changes_per_day"]:
+            return self._skip(state, f"{len(changes)} changes in the last 24h", shards=current)
+
+        low, high = _uniform_scaling_bounds(current)
+        target = min(max(target_shards, low), high)
+        self.kinesis_client.update_shard_count(StreamName=self.stream_name, TargetShardCount=target,
+                                               ScalingType="UNIFORM_SCALING")
+        state["changes"].append({"at": now.isoformat(), "from": current, "to": target})
+        state["low_evaluations"] = 0
+        self._save_state(state)
+        logger.info(f"Resharding {self.stream_name} from {current} to {target} shard(s)")
+        return {"action": "updated", "from": current, "to": target}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recommend Kinesis shards and Glue workers from recent metrics")
+    parser.add_argument("--stream-name", required=True)
+    parser.add_argument("--job-name", required=True, help="Glue streaming job (needs --enable-metrics)")
+    parser.add_argument("--workers", type=int, required=True, help="Current number_of_workers of the job")
+    parser.add_argument("--worker-type", choices=sorted(GLUE_WORKER_CORES), default="G.1X")
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--period", type=int, default=60)
+    parser.add_argument("--region")
+    parser.add_argument("--apply", action="store_true", help="Apply the shard recommendation with UpdateShardCount")
+    parser.add_argument("--state-uri", help="Where the scaler keeps its history (s3:// URI or local path)")
+    args = parser.parse_args(argv)
+    if args.apply and not args.state_uri:
+        parser.error("--apply needs --state-uri")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="[%(asctime)s] %(levelname)s %(filename)s:%(lineno)d %(message)s")
+    cloudwatch = boto3.client("cloudwatch", region_name=args.region)
+    kinesis_client = boto3.client("kinesis", region_name=args.region)
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=args.hours)
+    shards = kinesis_client.describe_stream_summary(StreamName=args.stream_name)["StreamDescriptionSummary"][
+        "OpenShardCount"]
+
+    result = recommend(fetch_stream_metrics(cloudwatch, args.stream_name, start, end, args.period),
+                       fetch_glue_metrics(cloudwatch, args.job_name, start, end, args.period),
+                       shards, args.workers, args.worker_type, args.period)
+    if args.apply:
+        s3_client = boto3.client("s3", region_name=args.region) if args.state_uri.startswith("s3://") else None
+        result["applied"] = ShardScaler(kinesis_client, args.stream_name, args.state_uri, s3_client).apply(
+            result["shards"])
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
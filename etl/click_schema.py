@@ -0,0 +1,165 @@
+"""
+Canonical click event schema and transform rules.
+
+This module is the single definition of the click payload shared by every consumer of the
+stream: the Glue job builds its Spark schema from it, and the pure-Python micro-batch
+consumer applies the same parsing, rejection and event-time rules without importing Spark.
+It deliberately has no third-party dependencies.
+"""
+import json
+import re
+from datetime import datetime, timedelta, timezone
+
+# (name, description) of every field in the JSON click payload; all are optional strings
+CLICK_FIELDS = [
+    ("element", "Clicked element identifier"),
+    ("page", "Page URL where the event occurred"),
+    ("userAgent", "User agent string of the client"),
+    ("timestamp", "Timestamp of the event (ISO 8601 string)"),
+    ("ingest_ts", "Timestamp when the event was ingested (ISO 8601 string)"),
+    ("request_id", "Unique identifier for the request"),
+    ("event_id", "Client-generated event identifier, reused when the browser retries"),
+    ("geo_country", "Country code resolved from the caller IP at ingest"),
+    ("geo_region", "Region (subdivision) code resolved from the caller IP at ingest"),
+    ("referrer_host", "Host of the request Referer header"),
+    ("client_ip", "Caller IP truncated to /24 (IPv4) or /48 (IPv6), only when GEOIP_RAW_IP=truncate"),
+    ("visitor_id", "First-party visitor identifier the browser keeps in localStorage"),
+]
+FIELD_NAMES = [name for name, _ in CLICK_FIELDS]
+
+# Fields the ingest tier sets itself (client values are overwritten), the client fields it
+# requires, and the maximum length of each client field; checked at ingest by etl.handlers.validator
+SERVER_FIELDS = ["ingest_ts", "request_id", "geo_country", "geo_region", "referrer_host", "client_ip"]
+REQUIRED_CLIENT_FIELDS = ["page", "timestamp"]
+FIELD_MAX_LENGTHS = {
+    "element": 256,
+    "page": 2048,
+    "userAgent": 1024,
+    "timestamp": 64,
+    "event_id": 128,
+    "visitor_id": 128,
+}
+
+# Spark datetime pattern for the client `timestamp`, and the equivalent Python regex
+EVENT_TIMESTAMP_FORMAT = "yyyy-MM-dd'T'HH:mm:ss[.SSS]X"
+_EVENT_TIMESTAMP_RE = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{3}))?(Z|[+-]\d{2}(?:\d{2})?)$"
+)
+
+# Event-time policies: what event_ts becomes when the client clock disagrees with the server
+# (ingest_ts, else Kinesis arrival) by more than the allowed skew. "client" keeps the client
+# time and only flags the row, "clamp" moves it to the nearest allowed time, "server" replaces
+# it with the server time. Rows without a client time use the server time under every policy.
+EVENT_TIME_POLICIES = ("client", "clamp", "server")
+# Clamp by default: the streaming gold stages window and watermark on event_ts, which a skewed
+# client time kept under "client" would move for every visitor
+DEFAULT_EVENT_TIME_POLICY = "clamp"
+# Clients ahead of the server are always wrong; behind it may be a browser retry
+MAX_FUTURE_SKEW_SECONDS = 300
+MAX_PAST_SKEW_SECONDS = 3600
+
+# Values of the bronze event_time_source column
+EVENT_TIME_CLIENT = "client"
+EVENT_TIME_CLIENT_SKEWED = "client_skewed"
+EVENT_TIME_CLAMPED = "clamped"
+EVENT_TIME_SERVER = "server"
+
+# Reasons a record is routed to the dead-letter table instead of bronze
+REJECT_MALFORMED_JSON = "malformed_json"
+REJECT_NO_KNOWN_FIELDS = "no_known_fields"
+REJECT_INVALID_TIMESTAMP = "invalid_timestamp"
+
+# Kinesis metadata kept on bronze rows, and the full bronze column order
+BRONZE_METADATA_COLUMNS = ["shard_id", "partition_key", "sequence_number"]
+BRONZE_COLUMNS = (
+    ["element", "page", "userAgent", "ingest_ts", "request_id", "event_id"]
+    + ["geo_country", "geo_region", "referrer_host", "client_ip", "visitor_id", "timestamp"]
+    + BRONZE_METADATA_COLUMNS
+    + ["clock_skew_seconds", "event_time_source", "event_ts", "event_date"]
+)
+
+
+def parse_event_timestamp(value):
+    """
+    Parse a client timestamp with the same rules as EVENT_TIMESTAMP_FORMAT.
+
+    Returns an aware UTC datetime, or None when ``value`` does not match the format.
+    """
+    match = _EVENT_TIMESTAMP_RE.match(value)
+    if not match:
+        return None
+    year, month, day, hour, minute, second, millis, offset = match.groups()
+    try:
+        parsed = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                          int(millis or 0) * 1000, tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+    if offset != "Z":
+        sign = 1 if offset[0] == "+" else -1
+        offset_minutes = int(offset[1:3]) * 60 + int(offset[3:5] or 0)
+        parsed -= sign * timedelta(minutes=offset_minutes)
+    return parsed
+
+
+def trusted_event_time(client_ts, ingest_ts=None, arrival_ts=None, policy=DEFAULT_EVENT_TIME_POLICY,
+                       max_future_seconds=MAX_FUTURE_SKEW_SECONDS, max_past_seconds=MAX_PAST_SKEW_SECONDS):
+    """
+    Pick the event time of a click under an EVENT_TIME_POLICIES policy.
+
+    ``client_ts`` and ``arrival_ts`` are aware datetimes or None, ``ingest_ts`` the server's ISO
+    8601 string. Returns ``(event_ts, clock_skew_seconds, event_time_source)``, where the skew
+    is the client time minus the server time, rounded down to whole seconds, or None when
+    either is missing.
+    """
+    server_ts = (parse_event_timestamp(ingest_ts) if ingest_ts is not None else None) or arrival_ts
+    if client_ts is None:
+        return server_ts, None, EVENT_TIME_SERVER if server_ts is not None else None
+    if server_ts is None:
+        return client_ts, None, EVENT_TIME_CLIENT
+
+    skew = (client_ts - server_ts) // timedelta(seconds=1)
+    if -max_past_seconds <= skew <= max_future_seconds:
+        return client_ts, skew, EVENT_TIME_CLIENT
+    if policy == "clamp":
+        bound = max_future_seconds if skew > 0 else -max_past_seconds
+        return server_ts + timedelta(seconds=bound), skew, EVENT_TIME_CLAMPED
+    if policy == "server":
+        return server_ts, skew, EVENT_TIME_SERVER
+    return client_ts, skew, EVENT_TIME_CLIENT_SKEWED
+
+
+def format_event_timestamp(value):
+    """Render an aware UTC datetime as canonical ISO 8601 with milliseconds, e.g. 2024-05-01T10:00:00.123Z."""
+    return (f"{value.year:04d}-{value.month:02d}-{value.day:02d}T{value.hour:02d}:{value.minute:02d}:"
+            f"{value.second:02d}.{value.microsecond // 1000:03d}Z")
+
+
+def _as_string(value):
+    # Spark keeps the JSON text of non-string values when the schema declares a string
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, separators=(",", ":"))
+
+
+def parse_payload(data):
+    """
+    Parse raw record bytes into ``(fields, reject_reason)``.
+
+    ``fields`` maps every name in FIELD_NAMES to a string or None, and ``reject_reason`` is
+    None for clean records or one of the REJECT_* constants.
+    """
+    text = data.decode("utf-8", errors="replace") if isinstance(data, (bytes, bytearray)) else data
+    try:
+        payload = json.loads(text)
+    except (TypeError, ValueError):
+        payload = None
+    if not isinstance(payload, dict):
+        return {name: None for name in FIELD_NAMES}, REJECT_MALFORMED_JSON
+
+    fields = {name: _as_string(payload.get(name)) for name in FIELD_NAMES}
+    if all(value is None for value in fields.values()):
+        return fields, REJECT_NO_KNOWN_FIELDS
+    if fields["timestamp"] is not None and parse_event_timestamp(fields["timestamp"]) is None:
+        return fields, REJECT_INVALID_TIMESTAMP
+    return fields, None
@@ -0,0 +1,244 @@
+"""
+Incremental funnels over the bronze click stream.
+
+Funnel reports (landing -> signup -> confirm) used to self-join every bronze click. The funnel
+stage instead follows each visitor through the configured funnels with Spark's stateful
+streaming (``applyInPandasWithState``) over bronze read as a Delta stream, and appends how many
+visitors reached each step to a small gold table.
+
+A funnel is declared as JSON (the ``FUNNELS`` job argument)::
+
+    [{"name": "signup", "window_minutes": 30,
+      "steps": [{"name": "landing", "page": "/"},
+                {"name": "form", "page": "/signup", "element": ["submit", "submit-footer"]},
+                {"name": "confirm", "page": "/confirm"}]}]
+
+A step matches a click on all of its ``page``/``element`` conditions (a value or a list of
+values). A visitor (``etl.unique_visitors.visitor_key``; clicks it cannot identify are left out and
+counted as ``unidentified_events`` by the unique-visitors table instead) enters the funnel on a click matching
+the first step and must reach each next step, in order, within ``window_minutes`` of entering;
+after that they are back at the start. State is one small row per (funnel, visitor) in
+progress, with an event-time timeout at the end of its window, so the watermark expires it and
+state stays bounded by the visitors active within one window. Clicks whose client clock is ahead
+of the server (``event_time_source = client_skewed``) are dropped before the watermark: one of
+them would move it forward for every visitor, expiring their progress and dropping their next
+clicks as late.
+
+Step counts table columns: ``funnel``, ``step`` (1-based), ``step_name``, ``funnel_date`` (the
+day the visitors entered the funnel, partition column) and ``visitors``. Each micro-batch
+appends the visitors who reached a step in it; sum ``visitors`` for totals
+(``funnel_step_counts``).
+"""
+import json
+import logging
+
+from pyspark.sql.functions import (
+    array, array_compact, col, count, lit, size, timestamp_millis, to_date, unix_millis, when,
+)
+from pyspark.sql.functions import sum as sum_
+from pyspark.sql.streaming.state import GroupStateTimeout
+from pyspark.sql.types import IntegerType, LongType, StringType, StructField, StructType, TimestampType
+
+from etl.batch_sinks import write_delta_batch
+from etl.click_schema import EVENT_TIME_CLIENT_SKEWED
+from etl.unique_visitors import visitor_key
+
+logger = logging.getLogger("funnels")
+logger.setLevel(logging.INFO)
+
+FUNNELS_SINK = "funnels"
+FUNNEL_QUERY_NAME = "funnel_progress"
+STEP_COLUMNS = ("page", "element")
+# How late a click may arrive and still count; also how long state outlives its window
+WATERMARK_DELAY = "10 minutes"
+
+STEP_EVENT_SCHEMA = StructType([
+    StructField("funnel", StringType()),
+    StructField("step", IntegerType()),
+    StructField("step_name", StringType()),
+    StructField("step_ts", TimestampType()),
+    # When the visitor entered the funnel, in epoch ms like the watermark
+    StructField("started_ms", LongType()),
+])
+
+# Steps completed so far, and when the visitor entered the funnel / reached the last step
+PROGRESS_STATE_SCHEMA = StructType([
+    StructField("completed", IntegerType()),
+    StructField("started_ms", LongType()),
+    StructField("last_ms", LongType()),
+])
+
+
+class Funnel:
+    """An ordered list of click predicates a visitor must match within ``window_minutes``."""
+
+    def __init__(self, name, steps, window_minutes):
+        if not name:
+            raise ValueError("A funnel needs a name")
+        if len(steps) < 2:
+            raise ValueError(f"Funnel {name!r} needs at least two steps")
+        if not window_minutes or window_minutes <= 0:
+            raise ValueError(f"Funnel {name!r} needs a positive window_minutes")
+        self.name = name
+        self.window_minutes = window_minutes
+        self.steps = []
+        for index, step in enumerate(steps, start=1):
+            unknown = set(step) - set(STEP_COLUMNS) - {"name"}
+            conditions = {column: [step[column]] if isinstance(step[column], str) else list(step[column])
+                          for column in STEP_COLUMNS if column in step}
+            if unknown or not conditions or not all(conditions.values()):
+                raise ValueError(f"Step {index} of funnel {name!r} must match on {' and/or '.join(STEP_COLUMNS)} "
+                                 f"only, got {step}")
+            self.steps.append((step.get("name") or f"step_{index}", conditions))
+
+    @property
+    def window_ms(self):
+        return int(self.window_minutes * 60_000)
+
+    def step_matches(self):
+        """Column with the 0-based indexes of the steps each click matches."""
+        matches = []
+        for index, (_, conditions) in enumerate(self.steps):
+            predicate = None
+            for column, values in conditions.items():
+                condition = col(column).isin(values)
+                predicate = condition if predicate is None else predicate & condition
+            matches.append(when(predicate, lit(index)))
+        return array_compact(array(*matches))
+
+
+def parse_funnels(config):
+    """Funnels from their JSON declaration (a string or the decoded list); raises ValueError when invalid."""
+    if isinstance(config, str):
+        try:
+            config = json.loads(config)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Funnel config is not valid JSON: {exc}") from None
+    if not isinstance(config, list):
+        raise ValueError("Funnel config must be a list of funnels")
+    funnels = [Funnel(item.get("name"), item.get("steps") or [], item.get("window_minutes")) for item in config]
+    names = [funnel.name for funnel in funnels]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Funnel names must be unique, got {names}")
+    return funnels
+
+
+def trusted_clicks(clicks_df):
+    """Clicks whose ``event_ts`` may drive the watermark: all but those flagged ``client_skewed``."""
+    if "event_time_source" not in clicks_df.columns:
+        return clicks_df
+    return clicks_df.where(~col("event_time_source").eqNullSafe(EVENT_TIME_CLIENT_SKEWED))
+
+
+def _watermarked_clicks(clicks_df, watermark_delay):
+    # Filtered first: the watermark follows every row that reaches it, whatever is dropped later
+    return trusted_clicks(clicks_df).withWatermark("event_ts", watermark_delay)
+
+
+def funnel_step_events(clicks_df, funnels):
+    """Clicks matching a step of some funnel, as (funnel, visitor, event_ts, event_ms, steps), one row per funnel."""
+    clicks_df = trusted_clicks(clicks_df)
+    matched = None
+    for funnel in funnels:
+        frame = (
+            clicks_df
+            .where(col("event_ts").isNotNull())
+            .select(lit(funnel.name).alias("funnel"), visitor_key(clicks_df).alias("visitor"), col("event_ts"),
+                    unix_millis(col("event_ts")).alias("event_ms"), funnel.step_matches().alias("steps"))
+            .where(col("visitor").isNotNull() & (size(col("steps")) > 0))
+        )
+        matched = frame if matched is None else matched.unionByName(frame)
+    return matched
+
+
+def _advance_progress(funnels):
+    """The applyInPandasWithState function moving each (funnel, visitor) through its funnel."""
+    import pandas as pd
+
+    by_name = {funnel.name: funnel for funnel in funnels}
+
+    def advance(key, frames, state):
+        if state.hasTimedOut:
+            # The watermark passed the end of the visitor's window without them finishing
+            state.remove()
+            return
+        funnel = by_name[key[0]]
+        completed, started_ms, last_ms = state.get if state.exists else (0, None, None)
+        reached = []
+        events = pd.concat(list(frames)).sort_values("event_ms")
+        for event_ts, event_ms, steps in zip(events["event_ts"], events["event_ms"], events["steps"]):
+            event_ms = int(event_ms)
+            if completed and event_ms - started_ms > funnel.window_ms:
+                completed, started_ms, last_ms = 0, None, None
+            if completed and event_ms < last_ms:
+                continue
+            if completed not in steps:
+                continue
+            if not completed:
+                started_ms = event_ms
+            completed, last_ms = completed + 1, event_ms
+            reached.append((funnel.name, completed, funnel.steps[completed - 1][0], event_ts, started_ms))
+            if completed == len(funnel.steps):
+                completed, started_ms, last_ms = 0, None, None
+
+        expires_ms = started_ms + funnel.window_ms if completed else None
+        if expires_ms is None or expires_ms <= state.getCurrentWatermarkMs():
+            state.remove()
+        else:
+            state.update((completed, started_ms, last_ms))
+            state.setTimeoutTimestamp(expires_ms)
+        if reached:
+            yield pd.DataFrame(reached, columns=[field.name for field in STEP_EVENT_SCHEMA.fields])
+
+    return advance
+
+
+def funnel_progress(clicks_df, funnels, watermark_delay=WATERMARK_DELAY):
+    """Streaming frame of the steps visitors reach, one row per visitor and step (STEP_EVENT_SCHEMA)."""
+    return (
+        funnel_step_events(_watermarked_clicks(clicks_df, watermark_delay), funnels)
+        .groupBy("funnel", "visitor")
+        .applyInPandasWithState(_advance_progress(funnels), STEP_EVENT_SCHEMA, PROGRESS_STATE_SCHEMA, "append",
+                                GroupStateTimeout.EventTimeTimeout)
+    )
+
+
+def step_counts(step_df):
+    """Visitors reaching each step, per funnel and entry day, in the step counts table's layout."""
+    return (
+        step_df
+        .groupBy("funnel", "step", "step_name", to_date(timestamp_millis(col("started_ms"))).alias("funnel_date"))
+        .agg(count(lit(1)).alias("visitors"))
+    )
+
+
+def run_funnel_stream(clicks_df, funnels, out_path, chkpt_path, txn_app_id, watermark_delay=WATERMARK_DELAY):
+    """
+    Run the funnel query over a streaming frame of bronze clicks until it has caught up; returns the query.
+
+    ``txn_app_id`` maps the sink name to its Delta app id, as for ``MicroBatchFanOut``.
+    """
+    def write_batch(step_df, batch_id):
+        write_delta_batch(step_counts(step_df), out_path, "funnel_date", txn_app_id(FUNNELS_SINK), batch_id)
+
+    query = (
+        funnel_progress(clicks_df, funnels, watermark_delay).writeStream
+        .queryName(FUNNEL_QUERY_NAME)
+        .foreachBatch(write_batch)
+        .option("checkpointLocation", chkpt_path)
+        .trigger(availableNow=True)
+        .start()
+    )
+    logger.info(f"Funnel query started with ID {query.id} for {', '.join(funnel.name for funnel in funnels)}")
+    query.awaitTermination()
+    state_rows = [operator["numRowsTotal"] for operator in (query.lastProgress or {}).get("stateOperators", [])]
+    logger.info(f"Funnel query completed; visitors in progress: {sum(state_rows)}")
+    return query
+
+
+def funnel_step_counts(spark, path, funnel=None):
+    """Total visitors per funnel step from the step counts table at ``path``."""
+    df = spark.read.format("delta").load(path)
+    if funnel is not None:
+        df = df.where(col("funnel") == lit(funnel))
+    return df.groupBy("funnel", "step", "step_name").agg(sum_("visitors").alias("visitors")).orderBy("funnel", "step")
@@ -1,13 +1,53 @@
+import hashlib
+import json
 import logging
 import sys
 import time
+from datetime import datetime, timezone
 
 import boto3
 from awsglue.context import GlueContext
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
-from pyspark.sql.functions import col, from_json, to_timestamp, to_date, current_timestamp, lit
-from pyspark.sql.types import StructType, StructField, StringType
+from pyspark.sql.functions import (
+    coalesce, col, floor, from_json, input_file_name, to_timestamp, to_date, trim, current_timestamp, lit,
+    timestamp_micros, unix_micros, when,
+)
+from pyspark.sql.streaming import StreamingQueryListener
+from pyspark.sql.types import StructType, StructField, StringType, BinaryType, TimestampType
+
+from etl.athena_manifest import AthenaManifestPublisher
+from etl.backfill import (
+    BATCH_CLAIMED,
+    BATCH_INGESTED,
+    LIST_WORKERS,
+    MAX_FILES_PER_BATCH,
+    MAX_MB_PER_BATCH,
+    BackfillManifest,
+    list_landing_files,
+    plan_batches,
+)
+from etl.batch_sinks import DeltaBatchSink, LogSampleSink, MicroBatchFanOut, PartitionSpreadSink
+from etl.request_id_index import REQUEST_ID_BLOOM_FILTER_CONF, RequestIdIndex
+from etl.funnels import FUNNELS_SINK, parse_funnels, run_funnel_stream
+from etl.trending import TRENDING_SINK, TrendingSink
+from etl.unique_visitors import UNIQUE_VISITORS_SINK, unique_visitor_sketches
+from etl.click_schema import (
+    BRONZE_METADATA_COLUMNS,
+    CLICK_FIELDS,
+    DEFAULT_EVENT_TIME_POLICY,
+    EVENT_TIME_CLAMPED,
+    EVENT_TIME_CLIENT,
+    EVENT_TIME_CLIENT_SKEWED,
+    EVENT_TIME_POLICIES,
+    EVENT_TIME_SERVER,
+    EVENT_TIMESTAMP_FORMAT,
+    MAX_FUTURE_SKEW_SECONDS,
+    MAX_PAST_SKEW_SECONDS,
+    REJECT_INVALID_TIMESTAMP,
+    REJECT_MALFORMED_JSON,
+    REJECT_NO_KNOWN_FIELDS,
+)
 
 # ─── Logging setup ───────────────────────────────────────────────────────────
 logger = logging.getLogger("glue_stream")
@@ -19,6 +59,170 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# ─── Dead-letter routing ─────────────────────────────────────────────────────
+CORRUPT_RECORD_COLUMN = "_corrupt_record"
+DLQ_REASON_COLUMN = "dlq_reason"
+
+# Kinesis record metadata copied onto every dead-letter row when the source provides it
+KINESIS_METADATA_COLUMNS = {
+    "streamName": "stream_name",
+    "shardId": "shard_id",
+    "partitionKey": "partition_key",
+    "sequenceNumber": "sequence_number",
+    "approximateArrivalTimestamp": "approximate_arrival_timestamp",
+}
+
+# ─── Replay ──────────────────────────────────────────────────────────────────
+# Shape of the raw frame produced by the Glue Kinesis connector, rebuilt for replays
+KINESIS_RECORD_SCHEMA = StructType([
+    StructField("data", BinaryType(), True),
+    StructField("streamName", StringType(), True),
+    StructField("shardId", StringType(), True),
+    StructField("partitionKey", StringType(), True),
+    StructField("sequenceNumber", StringType(), True),
+    StructField("approximateArrivalTimestamp", TimestampType(), True),
+])
+
+# ─── Starting position ───────────────────────────────────────────────────────
+# Precedence when the streaming job starts:
+#   1. Offsets in the Spark checkpoint always win; the job resumes exactly where it stopped.
+#   2. Only without a checkpoint is STARTING_POSITION (or STARTING_SEQUENCE_NUMBERS) used.
+# Glue job bookmarks do not track the Kinesis source of a Spark streaming query, so they are
+# disabled for the streaming job and play no part in deciding where reading starts.
+STARTING_POSITIONS = ("LATEST", "TRIM_HORIZON", "AT_TIMESTAMP")
+
+# ─── Kinesis read tuning ─────────────────────────────────────────────────────
+# Connector options per preset. "default" leaves the Glue connector defaults untouched
+# (1s fetch window, 100k records per shard per batch, no idle time between reads).
+KINESIS_READ_PRESETS = {
+    "default": {},
+    # Small, frequent fetches for dashboards that need fresh data; stays within the
+    # 5 GetRecords calls/sec/shard limit shared with other consumers.
+    "low_latency": {
+        "maxFetchTimeInMs": 500,
+        "maxFetchRecordsPerShard": 20000,
+        "maxRecordPerRead": 10000,
+        "idleTimeBetweenReadsInMs": 250,
+    },
+    # Long fetch windows and large batches to drain a backlog at full shard throughput.
+    "throughput": {
+        "maxFetchTimeInMs": 10000,
+        "maxFetchRecordsPerShard": 500000,
+        "maxRecordPerRead": 10000,
+        "idleTimeBetweenReadsInMs": 200,
+    },
+}
+
+# Job argument -> connector option, with inclusive (min, max) bounds
+KINESIS_READ_OPTION_ARGS = {
+    "MAX_FETCH_TIME_IN_MS": ("maxFetchTimeInMs", 100, 60000),
+    "MAX_FETCH_RECORDS_PER_SHARD": ("maxFetchRecordsPerShard", 1, 10000000),
+    "MAX_RECORD_PER_READ": ("maxRecordPerRead", 1, 10000),  # GetRecords returns at most 10k records
+    "IDLE_TIME_BETWEEN_READS_IN_MS": ("idleTimeBetweenReadsInMs", 0, 60000),
+}
+
+# Below this idle time a shared-throughput consumer exceeds 5 GetRecords calls/sec/shard
+MIN_SHARED_IDLE_TIME_IN_MS = 200
+
+# ─── Bronze write layout ─────────────────────────────────────────────────────
+# Row order and Parquet encoding of bronze files. Unset keys keep the Parquet writer defaults.
+BRONZE_WRITE_LAYOUTS = {
+    # Arrival order, snappy: cheapest to write
+    "arrival": {
+        "sort_columns": (),
+        "compression": "snappy",
+    },
+    # Rows clustered by page/element within each file so the low-cardinality columns compress to
+    # long dictionary runs and their row-group min/max stats skip row groups on page filters
+    "sorted": {
+        "sort_columns": ("page", "element", "event_ts"),
+        "compression": "zstd",
+        "zstd_level": 3,
+        "row_group_mb": 128,
+        "page_kb": 1024,
+        "force_dictionary": True,
+    },
+}
+
+PARQUET_CODECS = ("snappy", "zstd", "gzip", "lz4", "uncompressed")
+
+# Job argument -> layout key, with inclusive (min, max) bounds
+WRITE_LAYOUT_INT_ARGS = {
+    "PARQUET_ZSTD_LEVEL": ("zstd_level", 1, 22),
+    "PARQUET_ROW_GROUP_MB": ("row_group_mb", 1, 1024),
+    "PARQUET_PAGE_KB": ("page_kb", 8, 65536),
+}
+
+# With forced dictionary encoding, dictionaries up to this size never fall back to plain pages
+DICTIONARY_PAGE_SIZE = 8 * 1024 * 1024
+# Near-unique columns, for which a dictionary only adds bytes
+NO_DICTIONARY_COLUMNS = ("request_id", "event_id", "sequence_number")
+
+# ─── Event time ──────────────────────────────────────────────────────────────
+# Job argument -> trusted_event_time keyword, with inclusive (min, max) bounds
+EVENT_TIME_INT_ARGS = {
+    "CLOCK_SKEW_MAX_FUTURE_SECONDS": ("max_future_seconds", 0, 7 * 86400),
+    "CLOCK_SKEW_MAX_PAST_SECONDS": ("max_past_seconds", 0, 30 * 86400),
+}
+
+# ─── Backfill ────────────────────────────────────────────────────────────────
+# Job argument -> backfill setting, with inclusive (min, max) bounds
+BACKFILL_INT_ARGS = {
+    "BACKFILL_MAX_FILES_PER_BATCH": ("max_files", 1, 100_000),
+    "BACKFILL_MAX_MB_PER_BATCH": ("max_mb", 1, 1024 * 1024),
+    "BACKFILL_LIST_WORKERS": ("list_workers", 1, 256),
+}
+
+# ─── Gold ────────────────────────────────────────────────────────────────────
+# Aggregates written by the bronze query from the same micro-batches (GOLD_SINKS)
+GOLD_SINK_NAMES = (UNIQUE_VISITORS_SINK, TRENDING_SINK)
+# Only meaningful on the live stream: a replay would publish the trend of its last window
+STREAMING_ONLY_GOLD_SINKS = (TRENDING_SINK,)
+
+# Optional job arguments and their defaults; getResolvedOptions fails on absent keys
+OPTIONAL_JOB_ARGS = {
+    "KINESIS_READ_PRESET": "default",
+    "MAX_FETCH_TIME_IN_MS": None,
+    "MAX_FETCH_RECORDS_PER_SHARD": None,
+    "MAX_RECORD_PER_READ": None,
+    "IDLE_TIME_BETWEEN_READS_IN_MS": None,
+    "ENABLE_EFO": "false",
+    "EFO_CONSUMER_NAME": None,
+    "STARTING_POSITION": "TRIM_HORIZON",
+    "STARTING_TIMESTAMP": None,
+    "STARTING_SEQUENCE_NUMBERS": None,
+    "REPLAY_SHARD_RANGES": None,
+    "REPLAY_FROM_TIMESTAMP": None,
+    "REPLAY_TO_TIMESTAMP": None,
+    "ATHENA_DATABASE": None,
+    "ATHENA_MANIFEST_TABLE": None,
+    "REQUEST_ID_INDEX": "false",
+    "WRITE_LAYOUT": "arrival",
+    "WRITE_SORT_COLUMNS": None,
+    "PARQUET_COMPRESSION": None,
+    "PARQUET_ZSTD_LEVEL": None,
+    "PARQUET_ROW_GROUP_MB": None,
+    "PARQUET_PAGE_KB": None,
+    "PARQUET_FORCE_DICTIONARY": None,
+    "GOLD_SINKS": "",
+    "FUNNELS": None,
+    "EVENT_TIME_POLICY": DEFAULT_EVENT_TIME_POLICY,
+    "CLOCK_SKEW_MAX_FUTURE_SECONDS": None,
+    "CLOCK_SKEW_MAX_PAST_SECONDS": None,
+    "BACKFILL_SOURCE": None,
+    "BACKFILL_MANIFEST": None,
+    "BACKFILL_MAX_FILES_PER_BATCH": None,
+    "BACKFILL_MAX_MB_PER_BATCH": None,
+    "BACKFILL_LIST_WORKERS": None,
+}
+
+# ─── Athena metadata ─────────────────────────────────────────────────────────
+# Name of the bronze streaming query; the post-commit hook listens to its progress only
+BRONZE_QUERY_NAME = "bronze_clicks"
+
+# Delta transaction version used for replays and backfill batches; the app id is derived from what they read
+REPLAY_TXN_VERSION = 0
+
 
 def _get_job_args():
     logger.info("Reading job arguments...")
@@ -34,8 +238,10 @@ def _get_job_args():
             "glue.schemaRegistry.schemaName",
             "glue.schemaRegistry.region",
             "glue.schemaRegistry.dataFormat",
-        ]
+        ] + [name for name in OPTIONAL_JOB_ARGS if f"--{name}" in sys.argv]
     )
+    for name, default in OPTIONAL_JOB_ARGS.items():
+        args.setdefault(name, default)
     logger.info(f"Job arguments received: {args}")
     return args
 
@@ -56,14 +262,8 @@ def _initialize_spark_glue():
 
 def _define_input_schema():
     logger.info("Defining JSON input schema...")
-    schema = StructType([
-        StructField("element", StringType(), True),
-        StructField("page", StringType(), True),
-        StructField("userAgent", StringType(), True),
-        StructField("timestamp", StringType(), True),
-        StructField("ingest_ts", StringType(), True),
-        StructField("request_id", StringType(), True),
-    ])
+    # Built from the canonical field list in etl.click_schema, shared with the non-Spark consumers
+    schema = StructType([StructField(name, StringType(), True) for name, _ in CLICK_FIELDS])
     logger.info("Schema for JSON payload defined.")
     return schema
 
@@ -118,7 +318,220 @@ def check_for_kinesis_data(stream_name, aws_region):
         logger.error(f"Error checking Kinesis directly: {err}", exc_info=True)
 
 
-def _read_from_kinesis_stream(glue_context, stream_arn, aws_region, registry_name, schema_name, data_format):
+def _resolve_starting_position(job_args, stream_name):
+    """
+    Translate the starting-position job arguments into the connector's ``startingPosition``.
+
+    ``STARTING_SEQUENCE_NUMBERS`` (JSON map of shard id to sequence number) takes priority and
+    resumes each listed shard right after the given sequence number. Otherwise
+    ``STARTING_POSITION`` is one of LATEST, TRIM_HORIZON or AT_TIMESTAMP, the latter requiring
+    ``STARTING_TIMESTAMP`` in ``yyyy-MM-ddTHH:mm:ssZ`` form.
+    """
+    sequence_numbers = job_args.get("STARTING_SEQUENCE_NUMBERS")
+    if sequence_numbers:
+        shard_sequences = json.loads(sequence_numbers) if isinstance(sequence_numbers, str) else sequence_numbers
+        if not shard_sequences:
+            raise ValueError("STARTING_SEQUENCE_NUMBERS must map at least one shard id to a sequence number")
+        position = {"metadata": {"streamName": stream_name, "batchId": "0"}}
+        for shard_id, sequence_number in sorted(shard_sequences.items()):
+            position[shard_id] = {"iteratorType": "AFTER_SEQUENCE_NUMBER", "iteratorPosition": str(sequence_number)}
+        return json.dumps(position)
+
+    starting_position = (job_args.get("STARTING_POSITION") or "TRIM_HORIZON").upper()
+    if starting_position not in STARTING_POSITIONS:
+        raise ValueError(f"STARTING_POSITION must be one of {', '.join(STARTING_POSITIONS)}, got {starting_position!r}")
+
+    if starting_position == "AT_TIMESTAMP":
+        starting_timestamp = job_args.get("STARTING_TIMESTAMP")
+        if not starting_timestamp:
+            raise ValueError("STARTING_POSITION=AT_TIMESTAMP requires STARTING_TIMESTAMP")
+        _parse_replay_timestamp(starting_timestamp)  # Fail fast on a malformed timestamp
+        return starting_timestamp
+    return starting_position
+
+
+def _split_s3_path(s3_path):
+    bucket, _, prefix = s3_path.replace("s3://", "", 1).partition("/")
+    return bucket, prefix
+
+
+def _read_checkpoint_offsets(s3_client, checkpoint_path):
+    """
+    Return ``(batch_id, shard_offsets)`` from the newest offsets file of a Spark checkpoint.
+
+    Each offsets file is ``v1``, a JSON metadata line, then one JSON line per source. Returns
+    None when the checkpoint has no committed offsets yet.
+    """
+    bucket, prefix = _split_s3_path(checkpoint_path.rstrip("/") + "/offsets/")
+    batch_keys = {}
+    request = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3_client.list_objects_v2(**request)
+        for item in response.get("Contents", []):
+            name = item["Key"].rsplit("/", 1)[-1]
+            if name.isdigit():
+                batch_keys[int(name)] = item["Key"]
+        if not response.get("IsTruncated"):
+            break
+        request["ContinuationToken"] = response["NextContinuationToken"]
+
+    if not batch_keys:
+        return None
+
+    batch_id = max(batch_keys)
+    body = s3_client.get_object(Bucket=bucket, Key=batch_keys[batch_id])["Body"].read().decode("utf-8")
+    lines = body.splitlines()
+    if len(lines) < 3:
+        logger.warning(f"Checkpoint offsets file for batch {batch_id} has no source offsets")
+        return None
+
+    source_offsets = json.loads(lines[2])
+    shard_offsets = {shard_id: offset for shard_id, offset in source_offsets.items() if shard_id != "metadata"}
+    return batch_id, shard_offsets
+
+
+def _report_checkpoint_lag(kinesis_client, stream_name, shard_offsets):
+    """
+    Log how far behind the tip of each shard the checkpointed position is.
+
+    Returns a map of shard id to ``MillisBehindLatest`` (None when the position could not be
+    resolved, e.g. it is older than the stream retention).
+    """
+    lag = {}
+    for shard_id, offset in sorted(shard_offsets.items()):
+        iterator_args = {"StreamName": stream_name, "ShardId": shard_id}
+        iterator_type = offset.get("iteratorType", "TRIM_HORIZON")
+        if iterator_type in ("AT_SEQUENCE_NUMBER", "AFTER_SEQUENCE_NUMBER") and offset.get("iteratorPosition"):
+            iterator_args["ShardIteratorType"] = iterator_type
+            iterator_args["StartingSequenceNumber"] = offset["iteratorPosition"]
+        elif iterator_type in ("LATEST", "TRIM_HORIZON"):
+            iterator_args["ShardIteratorType"] = iterator_type
+        else:
+            iterator_args["ShardIteratorType"] = "TRIM_HORIZON"
+
+        try:
+            shard_iterator = kinesis_client.get_shard_iterator(**iterator_args)["ShardIterator"]
+            response = kinesis_client.get_records(ShardIterator=shard_iterator, Limit=1)
+            lag[shard_id] = response.get("MillisBehindLatest")
+            logger.info(f"Shard {shard_id}: checkpoint is {lag[shard_id]} ms behind latest")
+        except Exception as err:
+            lag[shard_id] = None
+            logger.warning(f"Could not resolve checkpoint position for shard {shard_id}: {err}")
+
+    known = [millis for millis in lag.values() if millis is not None]
+    if known:
+        logger.info(f"Checkpoint lag across {len(lag)} shard(s): max {max(known) / 1000:.1f}s behind latest")
+    return lag
+
+
+def _check_resume_position(checkpoint_path, stream_name, aws_region, starting_position):
+    """Log where the streaming query will start reading and, when resuming, how far behind it is."""
+    s3_client = boto3.client('s3', region_name=aws_region)
+    try:
+        checkpoint = _read_checkpoint_offsets(s3_client, checkpoint_path)
+    except Exception as err:
+        logger.warning(f"Could not read checkpoint offsets at {checkpoint_path}: {err}")
+        return None
+
+    if checkpoint is None:
+        logger.info(f"No checkpoint offsets at {checkpoint_path}; starting from {starting_position}")
+        return None
+
+    batch_id, shard_offsets = checkpoint
+    logger.info(f"Resuming from checkpoint batch {batch_id} at {checkpoint_path}; "
+                f"starting position {starting_position} is ignored while the checkpoint exists")
+    kinesis_client = boto3.client('kinesis', region_name=aws_region)
+    return _report_checkpoint_lag(kinesis_client, stream_name, shard_offsets)
+
+
+def _bounded_int_args(job_args, int_args):
+    """
+    ``{key: int}`` for the job arguments of ``int_args`` (argument -> (key, min, max)) that are set.
+
+    Raises ValueError for a non-integer or out-of-range value.
+    """
+    values = {}
+    for arg_name, (key, minimum, maximum) in int_args.items():
+        value = job_args.get(arg_name)
+        if value is None or value == "":
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{arg_name} must be an integer, got {value!r}") from None
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{arg_name} must be between {minimum} and {maximum}, got {value}")
+        values[key] = value
+    return values
+
+
+def _resolve_kinesis_read_options(job_args):
+    """
+    Build the connector tuning options from KINESIS_READ_PRESET plus per-option overrides.
+
+    Raises ValueError for an unknown preset, a non-integer or out-of-range override, or an idle
+    time that would exceed the shared GetRecords limit when enhanced fan-out is off.
+    """
+    preset_name = (job_args.get("KINESIS_READ_PRESET") or "default").lower()
+    if preset_name not in KINESIS_READ_PRESETS:
+        raise ValueError(f"KINESIS_READ_PRESET must be one of {', '.join(KINESIS_READ_PRESETS)}, got {preset_name!r}")
+    options = dict(KINESIS_READ_PRESETS[preset_name])
+
+    options.update(_bounded_int_args(job_args, KINESIS_READ_OPTION_ARGS))
+
+    idle_time = options.get("idleTimeBetweenReadsInMs")
+    if idle_time is not None and not _efo_enabled(job_args) and idle_time < MIN_SHARED_IDLE_TIME_IN_MS:
+        raise ValueError(f"IDLE_TIME_BETWEEN_READS_IN_MS below {MIN_SHARED_IDLE_TIME_IN_MS} needs ENABLE_EFO=true; "
+                         f"shared consumers are limited to 5 GetRecords calls/sec/shard")
+
+    connector_options = {name: str(value) for name, value in options.items()}
+    if idle_time is not None:
+        connector_options["addIdleTimeBetweenReads"] = "true"
+    logger.info(f"Kinesis read preset '{preset_name}' resolved to {connector_options}")
+    return connector_options
+
+
+def _efo_enabled(job_args):
+    return str(job_args.get("ENABLE_EFO") or "false").lower() == "true"
+
+
+def _register_efo_consumer(kinesis_client, stream_arn, consumer_name, timeout_seconds=120):
+    """
+    Register (or reuse) an enhanced fan-out consumer and wait until it is ACTIVE.
+
+    Returns the consumer ARN to pass to the connector as ``fanoutConsumerARN``.
+    """
+    try:
+        description = kinesis_client.describe_stream_consumer(StreamARN=stream_arn, ConsumerName=consumer_name)
+        consumer = description["ConsumerDescription"]
+        logger.info(f"Reusing enhanced fan-out consumer {consumer['ConsumerARN']} ({consumer['ConsumerStatus']})")
+    except kinesis_client.exceptions.ResourceNotFoundException:
+        consumer = kinesis_client.register_stream_consumer(StreamARN=stream_arn, ConsumerName=consumer_name)["Consumer"]
+        logger.info(f"Registered enhanced fan-out consumer {consumer['ConsumerARN']}")
+
+    consumer_arn = consumer["ConsumerARN"]
+    deadline = time.time() + timeout_seconds
+    delay = 1
+    while consumer["ConsumerStatus"] != "ACTIVE":
+        if time.time() >= deadline:
+            raise TimeoutError(f"Enhanced fan-out consumer {consumer_arn} not ACTIVE after {timeout_seconds}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+        consumer = kinesis_client.describe_stream_consumer(ConsumerARN=consumer_arn)["ConsumerDescription"]
+    return consumer_arn
+
+
+def _deregister_efo_consumer(kinesis_client, consumer_arn):
+    # Enhanced fan-out is billed per consumer-shard hour, so never leave the consumer behind
+    try:
+        kinesis_client.deregister_stream_consumer(ConsumerARN=consumer_arn)
+        logger.info(f"Deregistered enhanced fan-out consumer {consumer_arn}")
+    except Exception as err:
+        logger.warning(f"Failed to deregister enhanced fan-out consumer {consumer_arn}: {err}")
+
+
+def _read_from_kinesis_stream(glue_context, stream_arn, aws_region, registry_name, schema_name, data_format,
+                              starting_position="TRIM_HORIZON", read_options=None):
     stream_name = stream_arn.split('/')[-1]
     logger.info(f"Extracted stream name: {stream_name}")
     check_for_kinesis_data(stream_name, aws_region)  # Initial check
@@ -128,12 +541,13 @@ def _read_from_kinesis_stream(glue_context, stream_arn, aws_region, registry_nam
 
     kinesis_opts = {
         "streamARN": stream_arn,
-        "startingPosition": "TRIM_HORIZON",
+        "startingPosition": starting_position,
         "classification": data_format.lower(),
         "inferSchema": "false",  # use the registry
         "validateSchema": "true",
         "awsGlueSchemaRegistryName": registry_name,
         "awsGlueSchemaRegistrySchemaName": schema_name,
+        **(read_options or {}),
     }
     logger.info(f"Reading from Kinesis stream {stream_arn} with Schema Registry validation options: {kinesis_opts}")
 
@@ -146,18 +560,22 @@ def _read_from_kinesis_stream(glue_context, stream_arn, aws_region, registry_nam
         logger.info("Raw DataFrame schema from Kinesis with Schema Registry validation:")
         raw_df.printSchema()
     except Exception as err:
-        logger.error(f"Error reading from Kinesis with Schema Registry validation: {e}", exc_info=True)
+        logger.error(f"Error reading from Kinesis with Schema Registry validation: {err}", exc_info=True)
+        # Fall back to the raw payload rather than schema inference: every record is then
+        # parsed against the explicit schema in _prepare_batch and rejects go to the DLQ.
         fallback_opts = {
             "streamARN": stream_arn,
-            "startingPosition": "TRIM_HORIZON",
+            "startingPosition": starting_position,
             "classification": "json",
-            "inferSchema": "true"
+            "inferSchema": "false",
+            **(read_options or {}),
         }
         raw_df = glue_context.create_data_frame.from_options(
             connection_type="kinesis",
             connection_options=fallback_opts
         )
-        logger.warning("Reading without schema validation succeeded")
+        logger.warning("Reading raw records without schema validation succeeded; "
+                       "malformed records will be routed to the dead-letter table")
 
     if not raw_df.columns:
         logger.warning("No data columns found in Kinesis stream after read. Exiting job.")
@@ -165,147 +583,288 @@ def _read_from_kinesis_stream(glue_context, stream_arn, aws_region, registry_nam
     return raw_df
 
 
-def _transform_data(raw_df, json_schema):
-    logger.info("Starting data transformation...")
+def _parse_click_payload(raw_df, json_schema):
+    """
+    Parse the raw Kinesis ``data`` column against ``json_schema`` in PERMISSIVE mode.
+
+    Records that fail ``from_json`` keep their original text in ``_corrupt_record`` instead of
+    silently becoming all-null rows. Every row gets a ``dlq_reason`` column which is null for
+    clean records, and the raw bytes plus Kinesis metadata are carried along for the DLQ.
+    """
     cols = raw_df.columns
-    if not cols:
-        logger.warning("Raw DataFrame is empty, cannot transform.")
-        return raw_df  # Return empty DF
-
-    logger.info(f"Raw DataFrame columns: {cols}")
-
-    # Check if data column exists (the JSON payload)
-    if 'data' in cols:
-        json_col_name = 'data'  # The column containing the JSON payload
-        arrival_col_name = 'approximateArrivalTimestamp' if 'approximateArrivalTimestamp' in cols else None
-
-        logger.info(f"Using '{json_col_name}' as JSON column and '{arrival_col_name}' as arrival timestamp")
-
-        exprs = [f"CAST(`{json_col_name}` AS STRING) AS json_str"]
-        if arrival_col_name:
-            exprs.append(f"`{arrival_col_name}` AS record_timestamp")
-
-        # Parse the JSON data
-        parsed_df = (
-            raw_df
-            .selectExpr(*exprs)
-            .select(from_json(col("json_str"), json_schema).alias("payload"), 
-                    col("record_timestamp") if arrival_col_name else None)
-            .select("payload.*", "record_timestamp")
+    arrival_col_name = 'approximateArrivalTimestamp' if 'approximateArrivalTimestamp' in cols else None
+    logger.info(f"Using 'data' as JSON column and '{arrival_col_name}' as arrival timestamp")
+
+    parse_schema = StructType(
+        list(json_schema.fields) + [StructField(CORRUPT_RECORD_COLUMN, StringType(), True)]
+    )
+    parse_opts = {"mode": "PERMISSIVE", "columnNameOfCorruptRecord": CORRUPT_RECORD_COLUMN}
+
+    metadata_cols = [
+        col(f"`{source}`").alias(target) if source in cols else lit(None).cast("string").alias(target)
+        for source, target in KINESIS_METADATA_COLUMNS.items()
+    ]
+    record_ts = col(f"`{arrival_col_name}`") if arrival_col_name else lit(None).cast("timestamp")
+
+    with_payload = raw_df.select(
+        col("`data`").cast("binary").alias("raw_data"),
+        from_json(col("`data`").cast("string"), parse_schema, parse_opts).alias("payload"),
+        record_ts.alias("record_timestamp"),
+        *metadata_cols,
+    )
+
+    field_names = [field.name for field in json_schema.fields]
+    no_known_fields = None
+    for name in field_names:
+        is_null = col(f"payload.`{name}`").isNull()
+        no_known_fields = is_null if no_known_fields is None else (no_known_fields & is_null)
+
+    reason = when(
+        col("payload").isNull() | col(f"payload.{CORRUPT_RECORD_COLUMN}").isNotNull(), lit(REJECT_MALFORMED_JSON)
+    )
+    if no_known_fields is not None:
+        reason = reason.when(no_known_fields, lit(REJECT_NO_KNOWN_FIELDS))
+    if "timestamp" in field_names:
+        reason = reason.when(
+            col("payload.timestamp").isNotNull()
+            & to_timestamp(col("payload.timestamp"), EVENT_TIMESTAMP_FORMAT).isNull(),
+            lit(REJECT_INVALID_TIMESTAMP),
         )
-        logger.info("Parsed DataFrame schema (after JSON parsing):")
-        parsed_df.printSchema()
-    else:
-        # If data is already parsed (e.g., by schema registry), use it directly
-        logger.info("Data appears to be already parsed, using raw DataFrame")
-        parsed_df = raw_df
-        parsed_df.printSchema()
-
-    # Show sample data for debugging
-    logger.info("Sample data after parsing:")
-    # Using _collect_sample_data instead of show() for streaming DataFrame
-    _collect_sample_data(parsed_df.limit(5))
-
-    # Use 'ingest_ts' from JSON payload if present, otherwise use Kinesis arrival time
-    # This assumes 'ingest_ts' in your schema is the preferred one.
-    # If Kinesis arrival time is different and also needed, ensure the column names are distinct.
-    # For simplicity, this example prioritizes 'ingest_ts' from the JSON payload if it exists.
-    iso_fmt = "yyyy-MM-dd'T'HH:mm:ss[.SSS]X"
-
-    # Check if 'timestamp' column exists
-    if 'timestamp' in parsed_df.columns:
-        df_with_event_ts = (
-            parsed_df.withColumn(
-                "event_ts", to_timestamp(col("timestamp"), iso_fmt))
+
+    return with_payload.withColumn(DLQ_REASON_COLUMN, reason)
+
+
+def _split_dead_letters(parsed_df, json_schema):
+    """
+    Split the output of _parse_click_payload into (clean_df, dead_letter_df).
+
+    The clean frame has the flattened payload fields, ``record_timestamp`` and the Kinesis
+    shard/sequence metadata; the dead-letter frame keeps only the raw bytes, the rejection
+    reason and Kinesis metadata.
+    """
+    clean_df = (
+        parsed_df
+        .where(col(DLQ_REASON_COLUMN).isNull())
+        .select(*[col(f"payload.`{field.name}`").alias(field.name) for field in json_schema.fields],
+                col("record_timestamp"),
+                *[col(name) for name in BRONZE_METADATA_COLUMNS])
+    )
+    dead_letter_df = (
+        parsed_df
+        .where(col(DLQ_REASON_COLUMN).isNotNull())
+        .select(
+            col("raw_data"),
+            col(DLQ_REASON_COLUMN).alias("error_reason"),
+            *[col(target) for target in KINESIS_METADATA_COLUMNS.values()],
+            current_timestamp().alias("dlq_ts"),
         )
+        .withColumn("dlq_date", to_date(col("dlq_ts")))
+    )
+    return clean_df, dead_letter_df
+
+
+def _with_event_ts(parsed_df, event_time=None):
+    """
+    Add ``event_ts``, ``clock_skew_seconds`` and ``event_time_source`` with the rules of
+    etl.click_schema.trusted_event_time: the client ``timestamp`` is checked against the server
+    time (``ingest_ts``, else the Kinesis arrival time) under the ``event_time`` policy and
+    allowed skew (keywords of trusted_event_time, see _resolve_event_time).
+    """
+    options = {"policy": DEFAULT_EVENT_TIME_POLICY, "max_future_seconds": MAX_FUTURE_SKEW_SECONDS,
+               "max_past_seconds": MAX_PAST_SKEW_SECONDS, **(event_time or {})}
+    columns = parsed_df.columns
+    no_timestamp = lit(None).cast("timestamp")
+    client_ts = to_timestamp(col("timestamp"), EVENT_TIMESTAMP_FORMAT) if "timestamp" in columns else no_timestamp
+    server_times = [to_timestamp(col("ingest_ts"), EVENT_TIMESTAMP_FORMAT)] if "ingest_ts" in columns else []
+    if "record_timestamp" in columns:
+        server_times.append(col("record_timestamp"))
+    if not server_times and "timestamp" not in columns:
+        logger.warning("Neither 'timestamp' nor a server time found, using current time")
+        server_times.append(current_timestamp())
+    server_ts = coalesce(*server_times) if server_times else no_timestamp
+
+    # Whole seconds, rounded down like the pure-Python rule
+    skew = floor((unix_micros(client_ts) - unix_micros(server_ts)) / 1_000_000)
+    within = skew.between(-options["max_past_seconds"], options["max_future_seconds"])
+    if options["policy"] == "clamp":
+        # As long: bound * 1_000_000 overflows an int for bounds past 35 minutes
+        bound = when(skew > 0, lit(options["max_future_seconds"])).otherwise(lit(-options["max_past_seconds"]))
+        bound = bound.cast("long")
+        skewed_ts, skewed_source = timestamp_micros(unix_micros(server_ts) + bound * 1_000_000), EVENT_TIME_CLAMPED
+    elif options["policy"] == "server":
+        skewed_ts, skewed_source = server_ts, EVENT_TIME_SERVER
     else:
-        # If 'timestamp' doesn't exist but 'record_timestamp' does, use that
-        if 'record_timestamp' in parsed_df.columns:
-            logger.info("Using 'record_timestamp' instead of 'timestamp'")
-            df_with_event_ts = parsed_df.withColumnRenamed("record_timestamp", "event_ts")
-        else:
-            # If neither exists, create a current timestamp
-            logger.warning("Neither 'timestamp' nor 'record_timestamp' found, using current time")
-            df_with_event_ts = parsed_df.withColumn("event_ts", current_timestamp())
-
-    logger.info("DataFrame schema with event_ts:")
-    df_with_event_ts.printSchema()
-
-    # Show sample data for debugging
-    logger.info("Sample data with event_ts:")
-    # Using _collect_sample_data instead of show() for streaming DataFrame
-    _collect_sample_data(df_with_event_ts.limit(5))
-
-    df_with_event_date = df_with_event_ts.withColumn("event_date", to_date(col("event_ts")))
-    logger.info("DataFrame schema with event_date (partition key):")
-    df_with_event_date.printSchema()
-    return df_with_event_date
-
-
-def _collect_sample_data(df, timeout_seconds=30):
-    logger.info("Attempting to collect sample data...")
-    sample_data = []
-
-    def collect_batch_sample(batch_df, batch_id):
-        if not sample_data and batch_df.count() > 0:  # Collect only from the first non-empty batch
-            logger.info(f"Collecting samples from batch {batch_id}...")
-            rows = batch_df.limit(5).collect()
-            for row in rows:
-                sample_data.append(row.asDict())
-            logger.info(f"Collected {len(sample_data)} sample records.")
-
-    sample_query = (
-        df.coalesce(1)
-        .writeStream
-        .foreachBatch(collect_batch_sample)
-        .outputMode("append")
-        .trigger(once=True)
-        .start()
+        skewed_ts, skewed_source = client_ts, EVENT_TIME_CLIENT_SKEWED
+
+    event_ts = when(client_ts.isNull(), server_ts).when(server_ts.isNull() | within, client_ts).otherwise(skewed_ts)
+    source = (
+        when(client_ts.isNull(), when(server_ts.isNotNull(), lit(EVENT_TIME_SERVER)))
+        .when(server_ts.isNull() | within, lit(EVENT_TIME_CLIENT))
+        .otherwise(lit(skewed_source))
+    )
+    return (
+        parsed_df
+        .withColumn("clock_skew_seconds", skew.cast("long"))
+        .withColumn("event_time_source", source)
+        .withColumn("event_ts", event_ts)
     )
 
-    logger.info(f"Waiting for sample data collection (max {timeout_seconds} seconds)...")
-    start_time = time.time()
-    try:
-        sample_query.awaitTermination(timeout_seconds)
-        if time.time() - start_time >= timeout_seconds and not sample_data:
-            logger.info("Sample collection timed out - no data received within the period.")
-        else:
-            logger.info("Sample collection process completed.")
-    except Exception as err:
-        logger.warning(f"Error during sample collection: {err}", exc_info=True)
-    finally:
-        if sample_query.isActive:
-            try:
-                sample_query.stop()
-                logger.info("Sample query stopped.")
-                return None
-            except Exception as e_stop:
-                logger.warning(f"Error stopping sample query: {e_stop}", exc_info=True)
-                return None
-
-    if sample_data:
-        logger.info("Sample records collected:")
-        for idx, record in enumerate(sample_data, start=1):
-            logger.info(f"Record {idx}: {record}")
-    else:
-        logger.info("No sample records collected (stream might be empty or processing timed out).")
-    return sample_data
 
+def _prepare_batch(raw_df, json_schema):
+    """
+    Decode a raw Kinesis frame once for all sinks.
 
-def _configure_spark_for_s3_parquet(spark):
+    With a ``data`` column the JSON payload is parsed by _parse_click_payload, which flags the
+    records the DLQ gets; frames already parsed (e.g. by the schema registry) pass through.
+    """
+    if 'data' in raw_df.columns:
+        return _parse_click_payload(raw_df, json_schema)
+    return raw_df
+
+
+def _bronze_frame(prepared_df, json_schema, event_time=None):
+    """Bronze rows of a prepared frame: clean records with event_ts, event_date and consistent column types."""
+    if DLQ_REASON_COLUMN in prepared_df.columns:
+        prepared_df, _ = _split_dead_letters(prepared_df, json_schema)
+    df_with_event_ts = _with_event_ts(prepared_df, event_time)
+    return _select_bronze_columns(df_with_event_ts.withColumn("event_date", to_date(col("event_ts"))))
+
+
+def _resolve_event_time(job_args):
+    """
+    trusted_event_time keywords from EVENT_TIME_POLICY and the allowed clock skew arguments.
+
+    Raises ValueError for an unknown policy or a non-integer or out-of-range skew.
+    """
+    policy = (job_args.get("EVENT_TIME_POLICY") or DEFAULT_EVENT_TIME_POLICY).lower()
+    if policy not in EVENT_TIME_POLICIES:
+        raise ValueError(f"EVENT_TIME_POLICY must be one of {', '.join(EVENT_TIME_POLICIES)}, got {policy!r}")
+    event_time = {"policy": policy, "max_future_seconds": MAX_FUTURE_SKEW_SECONDS,
+                  "max_past_seconds": MAX_PAST_SKEW_SECONDS, **_bounded_int_args(job_args, EVENT_TIME_INT_ARGS)}
+    logger.info(f"Event time resolved to {event_time}")
+    return event_time
+
+
+def _resolve_gold_sinks(job_args):
+    """Names of the gold sinks enabled by the comma-separated GOLD_SINKS argument, in GOLD_SINK_NAMES order."""
+    names = {name.strip().lower() for name in (job_args.get("GOLD_SINKS") or "").split(",") if name.strip()}
+    unknown = names - set(GOLD_SINK_NAMES)
+    if unknown:
+        raise ValueError(f"GOLD_SINKS must be a subset of {', '.join(GOLD_SINK_NAMES)}, got {', '.join(sorted(unknown))}")
+    return [name for name in GOLD_SINK_NAMES if name in names]
+
+
+def _gold_root(job_args):
+    return f"s3://{job_args['S3_BRONZE_BUCKET']}/{job_args['ENVIRONMENT']}/gold/"
+
+
+def _resolve_funnels(job_args):
+    """Funnels declared in the FUNNELS job argument (JSON, see etl.funnels); empty when unset."""
+    config = job_args.get("FUNNELS")
+    return parse_funnels(config) if config else []
+
+
+def _run_funnel_stage(spark_session, funnels, job_args, bronze_path):
+    """
+    Advance the configured funnels over the bronze rows committed since the last run.
+
+    Reads bronze as a Delta stream with its own checkpoint, after the bronze query, so funnel
+    progress costs no extra read of the Kinesis shards.
+    """
+    chkpt_path = f"s3://{job_args['S3_BRONZE_BUCKET']}/{job_args['ENVIRONMENT']}/checkpoints/{FUNNELS_SINK}/"
+    # Compactions and request_id deletes rewrite files without adding clicks
+    clicks_df = spark_session.readStream.format("delta").option("skipChangeCommits", "true").load(bronze_path)
+    run_funnel_stream(clicks_df, funnels, f"{_gold_root(job_args)}{FUNNELS_SINK}/", chkpt_path,
+                      _CheckpointTxnAppIds(spark_session, chkpt_path))
+
+
+def _clickstream_sinks(json_schema, out_path, dlq_path, write_layout, with_dead_letters=True, gold_sinks=(),
+                       gold_root=None, event_time=None):
+    """
+    Sinks of the bronze query, in write order: bronze, the DLQ (for JSON payloads), the enabled
+    gold aggregates (each under ``gold_root/<name>/``), the partition spread report, a debug sample.
+    """
+    def bronze(df):
+        return _bronze_frame(df, json_schema, event_time)
+
+    sinks = [DeltaBatchSink("bronze", out_path, bronze, "event_date", write_layout.get("sort_columns", ()))]
+    if with_dead_letters:
+        sinks.append(DeltaBatchSink("dlq", dlq_path, lambda df: _split_dead_letters(df, json_schema)[1], "dlq_date"))
+    if UNIQUE_VISITORS_SINK in gold_sinks:
+        sinks.append(DeltaBatchSink(UNIQUE_VISITORS_SINK, f"{gold_root}{UNIQUE_VISITORS_SINK}/",
+                                    lambda df: unique_visitor_sketches(bronze(df)), "bucket_date"))
+    if TRENDING_SINK in gold_sinks:
+        max_future_seconds = (event_time or {}).get("max_future_seconds", MAX_FUTURE_SKEW_SECONDS)
+        sinks.append(TrendingSink(f"{gold_root}{TRENDING_SINK}/", bronze, max_future_seconds=max_future_seconds))
+    sinks.append(PartitionSpreadSink(bronze, "event_date", flag_column="event_time_source"))
+    sinks.append(LogSampleSink(bronze))
+    return sinks
+
+
+def _resolve_write_layout(job_args):
+    """
+    Build the bronze write layout from WRITE_LAYOUT plus per-setting overrides.
+
+    Raises ValueError for an unknown layout or codec, or a non-integer or out-of-range size/level.
+    """
+    layout_name = (job_args.get("WRITE_LAYOUT") or "arrival").lower()
+    if layout_name not in BRONZE_WRITE_LAYOUTS:
+        raise ValueError(f"WRITE_LAYOUT must be one of {', '.join(BRONZE_WRITE_LAYOUTS)}, got {layout_name!r}")
+    layout = dict(BRONZE_WRITE_LAYOUTS[layout_name])
+
+    sort_columns = job_args.get("WRITE_SORT_COLUMNS")
+    if sort_columns:
+        layout["sort_columns"] = () if sort_columns.lower() == "none" else \
+            tuple(name.strip() for name in sort_columns.split(",") if name.strip())
+
+    compression = job_args.get("PARQUET_COMPRESSION")
+    if compression:
+        compression = compression.lower()
+        if compression not in PARQUET_CODECS:
+            raise ValueError(f"PARQUET_COMPRESSION must be one of {', '.join(PARQUET_CODECS)}, got {compression!r}")
+        layout["compression"] = compression
+
+    layout.update(_bounded_int_args(job_args, WRITE_LAYOUT_INT_ARGS))
+
+    force_dictionary = job_args.get("PARQUET_FORCE_DICTIONARY")
+    if force_dictionary:
+        layout["force_dictionary"] = force_dictionary.lower() == "true"
+
+    logger.info(f"Bronze write layout '{layout_name}' resolved to {layout}")
+    return layout
+
+
+def _parquet_layout_conf(layout):
+    """Spark session confs for a write layout; Spark copies them into the Parquet writer's Hadoop conf."""
+    conf = {"spark.sql.parquet.compression.codec": layout.get("compression", "snappy")}
+    if layout.get("compression") == "zstd" and layout.get("zstd_level"):
+        conf["parquet.compression.codec.zstd.level"] = str(layout["zstd_level"])
+    if layout.get("row_group_mb"):
+        conf["parquet.block.size"] = str(layout["row_group_mb"] * 1024 * 1024)
+    if layout.get("page_kb"):
+        conf["parquet.page.size"] = str(layout["page_kb"] * 1024)
+    if layout.get("force_dictionary"):
+        conf["parquet.enable.dictionary"] = "true"
+        conf["parquet.dictionary.page.size"] = str(DICTIONARY_PAGE_SIZE)
+        conf.update({f"parquet.enable.dictionary#{name}": "false" for name in NO_DICTIONARY_COLUMNS})
+    return conf
+
+
+def _configure_spark_for_s3_parquet(spark, request_id_bloom_filter=False, write_layout=None):
     logger.info("Configuring Spark for S3 and Parquet writing...")
     spark.conf.set("spark.sql.shuffle.partitions", "1")  # Re-evaluate for production scale
     spark.conf.set("spark.sql.streaming.minBatchesToRetain", "1")
-    spark.conf.set("spark.sql.parquet.compression.codec", "snappy")
     spark.conf.set("spark.sql.parquet.mergeSchema", "false")  # Global setting
     spark.conf.set("spark.sql.parquet.filterPushdown", "true")
+    for key, value in _parquet_layout_conf(write_layout or BRONZE_WRITE_LAYOUTS["arrival"]).items():
+        spark.conf.set(key, value)
+    if request_id_bloom_filter:
+        # Random ids defeat min/max stats; a bloom filter lets readers skip row groups instead
+        for key, value in REQUEST_ID_BLOOM_FILTER_CONF.items():
+            spark.conf.set(key, value)
 
 
-def _write_stream_to_s3(df, out_path, chkpt_path, spark_session):
-    logger.info(f"Preparing to write stream to S3: {out_path} (checkpoints at {chkpt_path})")
-
-    _configure_spark_for_s3_parquet(spark_session)
-
+def _select_bronze_columns(df):
     logger.info("Ensuring consistent data types for Parquet conversion...")
     # Ensure all expected columns are present and cast them
     # This is important to prevent schema evolution issues if a field is occasionally missing
@@ -313,7 +872,8 @@ def _write_stream_to_s3(df, out_path, chkpt_path, spark_session):
     select_cols = []
 
     # Add columns if they exist, with appropriate casting
-    for column_name in ["element", "page", "userAgent", "ingest_ts", "request_id"]:
+    for column_name in ["element", "page", "userAgent", "ingest_ts", "request_id", "event_id",
+                        "geo_country", "geo_region", "referrer_host", "client_ip", "visitor_id"]:
         if column_name in df.columns:
             select_cols.append(col(column_name).cast("string"))
         else:
@@ -327,32 +887,463 @@ def _write_stream_to_s3(df, out_path, chkpt_path, spark_session):
         # If timestamp doesn't exist, add a null column
         select_cols.append(lit(None).cast("string").alias("timestamp"))
 
+    # Kinesis shard/sequence metadata, null when the source did not expose it
+    for column_name in BRONZE_METADATA_COLUMNS:
+        if column_name in df.columns:
+            select_cols.append(col(column_name).cast("string"))
+        else:
+            select_cols.append(lit(None).cast("string").alias(column_name))
+
+    # How event_ts was chosen (see _with_event_ts)
+    select_cols.append(col("clock_skew_seconds").cast("long") if "clock_skew_seconds" in df.columns
+                       else lit(None).cast("long").alias("clock_skew_seconds"))
+    select_cols.append(col("event_time_source").cast("string") if "event_time_source" in df.columns
+                       else lit(None).cast("string").alias("event_time_source"))
+
     # Always include event_ts and event_date
     select_cols.append(col("event_ts"))
     select_cols.append(col("event_date"))
 
-    final_df = df.select(*select_cols)
-    logger.info("Final DataFrame schema before S3 write:")
-    final_df.printSchema()
+    return df.select(*select_cols)
+
+
+def _athena_manifest_publisher(job_args, table_path):
+    """Post-commit hook keeping the Athena manifest table in step with bronze, or None if not configured."""
+    table_name = job_args.get("ATHENA_MANIFEST_TABLE")
+    if not table_name:
+        return None
+    aws_region = job_args["AWS_REGION"]
+    return AthenaManifestPublisher(
+        table_path,
+        partition_column="event_date",
+        glue_client=boto3.client('glue', region_name=aws_region),
+        database=job_args["ATHENA_DATABASE"],
+        table_name=table_name,
+        s3_client=boto3.client('s3', region_name=aws_region),
+    )
+
+
+def _request_id_index_enabled(job_args):
+    return str(job_args.get("REQUEST_ID_INDEX") or "false").lower() == "true"
+
+
+def _post_commit_hook(job_args, table_path):
+    """
+    Combine the configured post-commit hooks for the bronze table into one callable, or None.
+
+    Each hook catches up from the Delta log on its own, so one failing never blocks the others.
+    """
+    hooks = []
+    manifest_publisher = _athena_manifest_publisher(job_args, table_path)
+    if manifest_publisher is not None:
+        hooks.append(("athena manifest", manifest_publisher.publish))
+    if _request_id_index_enabled(job_args):
+        index = RequestIdIndex(table_path, s3_client=boto3.client('s3', region_name=job_args["AWS_REGION"]))
+        hooks.append(("request_id index", index.update))
+    if not hooks:
+        return None
+
+    def run_hooks():
+        failures = []
+        for name, hook in hooks:
+            try:
+                hook()
+            except Exception as err:
+                logger.warning(f"Post-commit hook {name} failed: {err}", exc_info=True)
+                failures.append(err)
+        if failures:
+            raise failures[0]
+
+    return run_hooks
+
+
+class _PostCommitHookListener(StreamingQueryListener):
+    """Runs ``hook`` after every micro-batch of the named query that read any rows."""
+
+    def __init__(self, query_name, hook):
+        self.query_name = query_name
+        self.hook = hook
+
+    def onQueryStarted(self, event):
+        pass
+
+    def onQueryProgress(self, event):
+        progress = event.progress
+        if progress.name != self.query_name or not progress.numInputRows:
+            return
+        try:
+            self.hook()
+        except Exception as err:
+            # The hook catches up on the next batch; never let it disturb the query
+            logger.warning(f"Post-commit hook failed after batch {progress.batchId}: {err}", exc_info=True)
+
+    def onQueryIdle(self, event):
+        pass
+
+    def onQueryTerminated(self, event):
+        pass
+
+
+def _sink_txn_app_id(chkpt_path, sink_name, query_id):
+    """Delta txnAppId of one sink of a streaming query: one per (checkpoint location, query id, sink)."""
+    return f"clicks-{sink_name}-{hashlib.sha256(f'{chkpt_path}#{query_id}'.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _checkpoint_query_id(spark_session, chkpt_path):
+    """Id of the streaming query Spark keeps in ``<checkpoint>/metadata`` (written when the query starts)."""
+    row = spark_session.read.text(f"{chkpt_path.rstrip('/')}/metadata").first()
+    return json.loads(row.value)["id"]
+
+
+class _CheckpointTxnAppIds:
+    """
+    Maps a sink name to its txnAppId for the query running on ``chkpt_path``.
+
+    The txnVersion is the batch id, which restarts at 0 when the checkpoint is deleted, so the app
+    id also covers the query id: a new checkpoint writes under new app ids instead of having its
+    first batches skipped by Delta as already committed. The id is read on the first batch, once
+    the query has written its metadata, and kept for the run.
+    """
+
+    def __init__(self, spark_session, chkpt_path):
+        self.spark_session = spark_session
+        self.chkpt_path = chkpt_path
+        self._query_id = None
+
+    def __call__(self, sink_name):
+        if self._query_id is None:
+            self._query_id = _checkpoint_query_id(self.spark_session, self.chkpt_path)
+            logger.info(f"Sink transactions of {self.chkpt_path} use query id {self._query_id}")
+        return _sink_txn_app_id(self.chkpt_path, sink_name, self._query_id)
+
+
+def _write_stream_to_s3(raw_df, sinks, chkpt_path, spark_session, prepare=None, post_commit_hook=None,
+                        request_id_bloom_filter=False, write_layout=None):
+    """
+    Run the one streaming query of the job: every micro-batch is prepared and persisted once, then
+    written to each sink, so adding a sink costs no extra read of the Kinesis shards.
+
+    Returns the per-sink timing summary.
+    """
+    logger.info(f"Preparing to write stream to {', '.join(sink.name for sink in sinks)} "
+                f"(checkpoints at {chkpt_path})")
+
+    _configure_spark_for_s3_parquet(spark_session, request_id_bloom_filter,
+                                    write_layout or BRONZE_WRITE_LAYOUTS["arrival"])
+
+    listener = None
+    if post_commit_hook is not None:
+        listener = _PostCommitHookListener(BRONZE_QUERY_NAME, post_commit_hook)
+        spark_session.streams.addListener(listener)
+
+    # Streaming DataFrames cannot be sorted or written to several tables, so each micro-batch is
+    # written as a batch. Each sink commits with (its txnAppId, batch id): a batch re-run after a
+    # failure is skipped by the sinks that already committed it.
+    fan_out = MicroBatchFanOut(sinks, _CheckpointTxnAppIds(spark_session, chkpt_path), prepare=prepare)
 
     logger.info(f"Starting micro-batch processing to S3 at {time.time()}...")
     query = (
-        final_df.writeStream
-        .format("delta")
-        .outputMode("append")
-        .option("path", out_path)
+        raw_df.writeStream
+        .queryName(BRONZE_QUERY_NAME)
+        .foreachBatch(fan_out)
         .option("checkpointLocation", chkpt_path)
-        .option("mergeSchema", "true")  # Allow schema merging at the sink if necessary
-        .partitionBy("event_date")
         .trigger(availableNow=True)
         .start()
     )
     logger.info(f"Streaming query started with ID {query.id}")
 
     logger.info("Waiting for streaming query to complete...")
-    query.awaitTermination()
+    try:
+        query.awaitTermination()
+    finally:
+        if listener is not None:
+            spark_session.streams.removeListener(listener)
+        logger.info(f"Per-sink timings: {fan_out.metrics.summary()}")
+        for sink in sinks:
+            if isinstance(sink, PartitionSpreadSink):
+                logger.info(f"Partition spread over the run: {sink.summary()}")
     logger.info("Streaming query completed.")
 
+    if post_commit_hook is not None:
+        # Progress events are delivered asynchronously; pick up whatever the listener missed
+        post_commit_hook()
+    return fan_out.metrics.summary()
+
+
+def _parse_replay_timestamp(value):
+    """
+    Parse an ISO-8601 replay bound such as ``2024-05-01T13:00:00Z`` into an aware datetime.
+
+    Raises ValueError for a value without ``Z`` or a UTC offset: it could not be compared with
+    the records' arrival times.
+    """
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        raise ValueError(f"Replay timestamp {value!r} needs a UTC offset, e.g. {value}Z")
+    return parsed
+
+
+def _pin_replay_tip(job_args, now=None):
+    """
+    Job arguments with an open-ended replay bounded at ``now`` through REPLAY_TO_TIMESTAMP.
+
+    A replay "up to the tip" (no REPLAY_TO_TIMESTAMP, or a shard range without ``to_sequence``)
+    would hash to the same txnAppId on every run, so a later run meant to pick up newer records
+    would be skipped by Delta. Pinning the tip to the run start makes the bound part of the id.
+    """
+    if job_args.get("REPLAY_TO_TIMESTAMP"):
+        return job_args
+    shard_ranges = job_args.get("REPLAY_SHARD_RANGES")
+    if shard_ranges:
+        spec = json.loads(shard_ranges) if isinstance(shard_ranges, str) else shard_ranges
+        if all(bounds[1] for bounds in spec.values()):
+            return job_args
+    pinned = (now or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    logger.warning(f"Open-ended replay pinned to REPLAY_TO_TIMESTAMP={pinned}; pass it to re-run this replay")
+    return {**job_args, "REPLAY_TO_TIMESTAMP": pinned}
+
+
+def _build_replay_ranges(kinesis_client, stream_name, shard_ranges=None, from_timestamp=None, to_timestamp=None):
+    """
+    Build the per-shard ranges to replay.
+
+    ``shard_ranges`` is a JSON map of shard id to ``[from_sequence, to_sequence]`` (both
+    inclusive, ``to_sequence`` may be null for "up to ``to_timestamp``, else the tip"). Without
+    it, every shard of the stream is replayed between ``from_timestamp`` and ``to_timestamp``
+    using ``AT_TIMESTAMP``. Timestamps without a UTC offset raise ValueError.
+    """
+    for value in (from_timestamp, to_timestamp):
+        if value:
+            _parse_replay_timestamp(value)
+
+    if shard_ranges:
+        spec = json.loads(shard_ranges) if isinstance(shard_ranges, str) else shard_ranges
+        ranges = []
+        for shard_id, bounds in sorted(spec.items()):
+            replay_range = {"shard_id": shard_id, "from_sequence": bounds[0], "to_sequence": bounds[1]}
+            if bounds[1] is None and to_timestamp:
+                replay_range["to_timestamp"] = to_timestamp
+            ranges.append(replay_range)
+        return ranges
+
+    if not from_timestamp:
+        raise ValueError("Replay needs either REPLAY_SHARD_RANGES or REPLAY_FROM_TIMESTAMP")
+
+    shards = []
+    request = {"StreamName": stream_name}
+    while True:
+        response = kinesis_client.list_shards(**request)
+        shards.extend(response.get("Shards", []))
+        if not response.get("NextToken"):
+            break
+        request = {"NextToken": response["NextToken"]}
+
+    return [
+        {"shard_id": shard["ShardId"], "from_timestamp": from_timestamp, "to_timestamp": to_timestamp}
+        for shard in shards
+    ]
+
+
+def _read_kinesis_range(kinesis_client, stream_name, replay_range, limit=10000, poll_interval_seconds=0.2):
+    """
+    Yield raw records of one shard that fall inside ``replay_range``.
+
+    Rows match KINESIS_RECORD_SCHEMA. Reading stops at the first record past the upper bound,
+    when the shard is closed, or once the iterator has caught up with the tip of the shard.
+    """
+    shard_id = replay_range["shard_id"]
+    iterator_args = {"StreamName": stream_name, "ShardId": shard_id}
+    if replay_range.get("from_sequence"):
+        iterator_args["ShardIteratorType"] = "AT_SEQUENCE_NUMBER"
+        iterator_args["StartingSequenceNumber"] = replay_range["from_sequence"]
+    else:
+        iterator_args["ShardIteratorType"] = "AT_TIMESTAMP"
+        iterator_args["Timestamp"] = _parse_replay_timestamp(replay_range["from_timestamp"])
+
+    to_sequence = int(replay_range["to_sequence"]) if replay_range.get("to_sequence") else None
+    to_timestamp = _parse_replay_timestamp(replay_range["to_timestamp"]) if replay_range.get("to_timestamp") else None
+
+    shard_iterator = kinesis_client.get_shard_iterator(**iterator_args)["ShardIterator"]
+    while shard_iterator:
+        response = kinesis_client.get_records(ShardIterator=shard_iterator, Limit=limit)
+        records = response.get("Records", [])
+        for record in records:
+            if to_sequence is not None and int(record["SequenceNumber"]) > to_sequence:
+                return
+            if to_timestamp is not None and record["ApproximateArrivalTimestamp"] >= to_timestamp:
+                return
+            yield (
+                record["Data"],
+                stream_name,
+                shard_id,
+                record.get("PartitionKey"),
+                record["SequenceNumber"],
+                record.get("ApproximateArrivalTimestamp"),
+            )
+
+        if not records and response.get("MillisBehindLatest", 0) == 0:
+            return  # Caught up with the tip of the shard
+        shard_iterator = response.get("NextShardIterator")
+        time.sleep(poll_interval_seconds)  # Stay under the 5 GetRecords calls/sec/shard limit
+
+
+def _replay_kinesis_records(spark, stream_name, aws_region, replay_ranges):
+    """Read the replay ranges in parallel, one Spark task per shard, into a raw Kinesis frame."""
+
+    def read_partition(ranges):
+        kinesis_client = boto3.client('kinesis', region_name=aws_region)
+        for replay_range in ranges:
+            yield from _read_kinesis_range(kinesis_client, stream_name, replay_range)
+
+    records_rdd = (
+        spark.sparkContext
+        .parallelize(replay_ranges, max(len(replay_ranges), 1))
+        .mapPartitions(read_partition)
+    )
+    return spark.createDataFrame(records_rdd, KINESIS_RECORD_SCHEMA)
+
+
+def _replay_spec(job_args, stream_name, replay_ranges):
+    """
+    What a replay was asked for: the explicit shard ranges, or the stream and time window.
+
+    A time window is not keyed on the shards it expanded to: a reshard between two runs of the
+    same replay changes that list, and a new id would write the window to bronze twice.
+    """
+    if job_args.get("REPLAY_SHARD_RANGES"):
+        return replay_ranges
+    return {"stream_name": stream_name, "from_timestamp": job_args.get("REPLAY_FROM_TIMESTAMP"),
+            "to_timestamp": job_args.get("REPLAY_TO_TIMESTAMP")}
+
+
+def _replay_txn_app_id(environment, replay_spec):
+    """Stable Delta txnAppId for a replay: the same requested range always maps to the same id."""
+    digest = hashlib.sha256(json.dumps(replay_spec, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"clicks-replay-{environment}-{digest[:16]}"
+
+
+def run_replay_job(job_args, spark_session, out_path, dlq_path):
+    """
+    Re-ingest a shard/sequence or timestamp range from Kinesis into bronze.
+
+    The range is read once, transformed with the same rules as the streaming path, and written
+    with a Delta transaction id derived from the range so re-running the same replay is a no-op.
+    An open-ended range is first bounded at the run start (_pin_replay_tip).
+    """
+    job_args = _pin_replay_tip(job_args)
+    stream_name = job_args["STREAM_ARN"].split('/')[-1]
+    aws_region = job_args["AWS_REGION"]
+
+    kinesis_client = boto3.client('kinesis', region_name=aws_region)
+    replay_ranges = _build_replay_ranges(
+        kinesis_client,
+        stream_name,
+        shard_ranges=job_args.get("REPLAY_SHARD_RANGES"),
+        from_timestamp=job_args.get("REPLAY_FROM_TIMESTAMP"),
+        to_timestamp=job_args.get("REPLAY_TO_TIMESTAMP"),
+    )
+    txn_app_id = _replay_txn_app_id(job_args["ENVIRONMENT"], _replay_spec(job_args, stream_name, replay_ranges))
+    logger.info(f"Replaying {len(replay_ranges)} shard range(s) from {stream_name}: {replay_ranges}")
+
+    input_schema = _define_input_schema()
+    raw_df = _replay_kinesis_records(spark_session, stream_name, aws_region, replay_ranges)
+    write_layout = _resolve_write_layout(job_args)
+    _configure_spark_for_s3_parquet(spark_session, _request_id_index_enabled(job_args), write_layout)
+
+    # The whole range is one batch through the same sinks as the streaming query
+    fan_out = MicroBatchFanOut(
+        _clickstream_sinks(input_schema, out_path, dlq_path, write_layout,
+                           gold_sinks=[name for name in _resolve_gold_sinks(job_args)
+                                       if name not in STREAMING_ONLY_GOLD_SINKS],
+                           gold_root=_gold_root(job_args), event_time=_resolve_event_time(job_args)),
+        lambda sink_name: txn_app_id if sink_name == "bronze" else f"{txn_app_id}-{sink_name}",
+        prepare=lambda df: _parse_click_payload(df, input_schema),
+    )
+    fan_out(raw_df, REPLAY_TXN_VERSION)
+
+    post_commit_hook = _post_commit_hook(job_args, out_path)
+    if post_commit_hook is not None:
+        post_commit_hook()
+    logger.info(f"Replay {txn_app_id} completed.")
+
+
+def _read_landing_files(spark, paths):
+    """
+    Raw frame shaped like KINESIS_RECORD_SCHEMA from NDJSON landing files (gzipped or not), one
+    row per non-blank line. ``streamName`` holds the source file, so dead letters point back to
+    it; there is no arrival time, so the server time of a click is its ``ingest_ts`` only.
+    """
+    no_string = lit(None).cast("string")
+    return (
+        spark.read.text(paths)
+        .where(trim(col("value")) != "")
+        .select(
+            col("value").cast("binary").alias("data"),
+            input_file_name().alias("streamName"),
+            no_string.alias("shardId"),
+            no_string.alias("partitionKey"),
+            no_string.alias("sequenceNumber"),
+            lit(None).cast("timestamp").alias("approximateArrivalTimestamp"),
+        )
+    )
+
+
+def _backfill_txn_app_id(environment, batch_id):
+    """Stable Delta txnAppId of one backfill batch: the same files always map to the same id."""
+    return f"clicks-backfill-{environment}-{batch_id}"
+
+
+def run_backfill_job(job_args, spark_session, out_path, dlq_path, s3_client=None):
+    """
+    Load the NDJSON files under BACKFILL_SOURCE into bronze, skipping those already in the manifest.
+
+    Files are read in batches (etl.backfill.plan_batches), each transformed with the same rules
+    as the streaming path and written through the same sinks as a replay. A batch is claimed in
+    the manifest before its write and marked ingested after it; its txnAppId is derived from its
+    file list, so a re-run after a failure repeats no committed write. Returns the number of
+    batches loaded.
+    """
+    source_uri = job_args["BACKFILL_SOURCE"]
+    manifest_uri = (job_args.get("BACKFILL_MANIFEST")
+                    or f"s3://{job_args['S3_BRONZE_BUCKET']}/{job_args['ENVIRONMENT']}/backfill/manifest/")
+    limits = {"max_files": MAX_FILES_PER_BATCH, "max_mb": MAX_MB_PER_BATCH, "list_workers": LIST_WORKERS,
+              **_bounded_int_args(job_args, BACKFILL_INT_ARGS)}
+    if s3_client is None and (source_uri.startswith("s3://") or manifest_uri.startswith("s3://")):
+        s3_client = boto3.client('s3', region_name=job_args["AWS_REGION"])
+
+    manifest = BackfillManifest(manifest_uri, s3_client, limits["list_workers"])
+    files = list_landing_files(source_uri, s3_client, limits["list_workers"])
+    batches = plan_batches(files, manifest.load(), limits["max_files"], limits["max_mb"] * 1024 * 1024)
+    if not batches:
+        logger.info(f"Nothing to backfill under {source_uri}")
+        return 0
+
+    input_schema = _define_input_schema()
+    write_layout = _resolve_write_layout(job_args)
+    _configure_spark_for_s3_parquet(spark_session, _request_id_index_enabled(job_args), write_layout)
+    sinks = _clickstream_sinks(input_schema, out_path, dlq_path, write_layout,
+                               gold_sinks=[name for name in _resolve_gold_sinks(job_args)
+                                           if name not in STREAMING_ONLY_GOLD_SINKS],
+                               gold_root=_gold_root(job_args), event_time=_resolve_event_time(job_args))
+
+    for number, batch in enumerate(batches, start=1):
+        txn_app_id = _backfill_txn_app_id(job_args["ENVIRONMENT"], batch["batch_id"])
+        logger.info(f"Backfill batch {number}/{len(batches)} {batch['batch_id']}: {len(batch['files'])} file(s)")
+        manifest.record(batch, BATCH_CLAIMED)
+        fan_out = MicroBatchFanOut(
+            sinks,
+            lambda sink_name, app_id=txn_app_id: app_id if sink_name == "bronze" else f"{app_id}-{sink_name}",
+            prepare=lambda df: _parse_click_payload(df, input_schema),
+        )
+        fan_out(_read_landing_files(spark_session, [item["path"] for item in batch["files"]]), REPLAY_TXN_VERSION)
+        manifest.record(batch, BATCH_INGESTED)
+
+    post_commit_hook = _post_commit_hook(job_args, out_path)
+    if post_commit_hook is not None:
+        post_commit_hook()
+    logger.info(f"Backfill of {source_uri} completed: {len(batches)} batch(es)")
+    return len(batches)
+
 
 def check_data_post_processing(s3_bucket, s3_prefix, aws_region):
     s3_client = boto3.client('s3', region_name=aws_region)
@@ -372,56 +1363,107 @@ def check_data_post_processing(s3_bucket, s3_prefix, aws_region):
         logger.error(f"Error checking for output files in S3: {exc}", exc_info=True)
 
 
-def run_glue_job():
-    job_args = _get_job_args()
-    JOB_NAME = job_args["JOB_NAME"]
+def _run_streaming_pipeline(glue_context, spark_session, job_args, input_schema, starting_position, read_options,
+                            s3_output_path, s3_checkpoint_path, s3_dlq_path):
     STREAM_ARN = job_args["STREAM_ARN"]
     AWS_REGION = job_args["AWS_REGION"]
     ENVIRONMENT = job_args["ENVIRONMENT"]
     S3_BRONZE_BUCKET = job_args["S3_BRONZE_BUCKET"]
-
-    # Schema Registry parameters
     REGISTRY_NAME = job_args["glue.schemaRegistry.registryName"]
     SCHEMA_NAME = job_args["glue.schemaRegistry.schemaName"]
     DATA_FORMAT = job_args["glue.schemaRegistry.dataFormat"]
 
-    logger.info(f"Starting job {JOB_NAME} → stream {STREAM_ARN} using schema {REGISTRY_NAME}/{SCHEMA_NAME}")
-
-    logger.info(f"Starting job {JOB_NAME} → stream {STREAM_ARN}")
-
-    glue_context, spark_session = _initialize_spark_glue()
-    input_schema = _define_input_schema()
-
     raw_kinesis_df = _read_from_kinesis_stream(
         glue_context,
         STREAM_ARN,
         AWS_REGION,
         REGISTRY_NAME,
         SCHEMA_NAME,
-        DATA_FORMAT
+        DATA_FORMAT,
+        starting_position=starting_position,
+        read_options=read_options
     )
 
     if raw_kinesis_df is None or not raw_kinesis_df.columns:
         logger.warning("No data read from Kinesis or DataFrame is empty. Exiting job.")
         return
 
-    transformed_df = _transform_data(raw_kinesis_df, input_schema)
+    logger.info(f"Raw DataFrame columns: {raw_kinesis_df.columns}")
+    write_layout = _resolve_write_layout(job_args)
+    # Payloads already parsed upstream (e.g. by the schema registry) have nothing to reject
+    sinks = _clickstream_sinks(input_schema, s3_output_path, s3_dlq_path, write_layout,
+                               with_dead_letters='data' in raw_kinesis_df.columns,
+                               gold_sinks=_resolve_gold_sinks(job_args), gold_root=_gold_root(job_args),
+                               event_time=_resolve_event_time(job_args))
 
-    if transformed_df is None or not transformed_df.columns:
-        logger.warning("Data transformation resulted in an empty DataFrame. Exiting job.")
-        return
+    _write_stream_to_s3(raw_kinesis_df, sinks, s3_checkpoint_path, spark_session,
+                        prepare=lambda df: _prepare_batch(df, input_schema),
+                        post_commit_hook=_post_commit_hook(job_args, s3_output_path),
+                        request_id_bloom_filter=_request_id_index_enabled(job_args),
+                        write_layout=write_layout)
+
+    funnels = _resolve_funnels(job_args)
+    if funnels:
+        _run_funnel_stage(spark_session, funnels, job_args, s3_output_path)
+
+    # Post-processing check
+    output_s3_prefix = f"{ENVIRONMENT}/bronze/clicks/"
+    check_data_post_processing(S3_BRONZE_BUCKET, output_s3_prefix, AWS_REGION)
+
+
+def run_glue_job():
+    job_args = _get_job_args()
+    JOB_NAME = job_args["JOB_NAME"]
+    STREAM_ARN = job_args["STREAM_ARN"]
+    AWS_REGION = job_args["AWS_REGION"]
+    ENVIRONMENT = job_args["ENVIRONMENT"]
+    S3_BRONZE_BUCKET = job_args["S3_BRONZE_BUCKET"]
+
+    # Schema Registry parameters
+    REGISTRY_NAME = job_args["glue.schemaRegistry.registryName"]
+    SCHEMA_NAME = job_args["glue.schemaRegistry.schemaName"]
+    DATA_FORMAT = job_args["glue.schemaRegistry.dataFormat"]
 
-    # Collect sample data for logging/debugging (optional, can be removed in production)
-    _collect_sample_data(transformed_df.limit(10))  # Limit input to sampling for performance
+    logger.info(f"Starting job {JOB_NAME} → stream {STREAM_ARN} using schema {REGISTRY_NAME}/{SCHEMA_NAME}")
+
+    logger.info(f"Starting job {JOB_NAME} → stream {STREAM_ARN}")
+
+    glue_context, spark_session = _initialize_spark_glue()
 
     s3_output_path = f"s3://{S3_BRONZE_BUCKET}/{ENVIRONMENT}/bronze/clicks/"
     s3_checkpoint_path = f"s3://{S3_BRONZE_BUCKET}/{ENVIRONMENT}/checkpoints/clicks/"
+    s3_dlq_path = f"s3://{S3_BRONZE_BUCKET}/{ENVIRONMENT}/dlq/clicks/"
 
-    _write_stream_to_s3(transformed_df, s3_output_path, s3_checkpoint_path, spark_session)
+    if job_args["REPLAY_SHARD_RANGES"] or job_args["REPLAY_FROM_TIMESTAMP"]:
+        run_replay_job(job_args, spark_session, s3_output_path, s3_dlq_path)
+        logger.info(f"Job {JOB_NAME} completed successfully.")
+        return
 
-    # Post-processing check
-    output_s3_prefix = f"{ENVIRONMENT}/bronze/clicks/"
-    check_data_post_processing(S3_BRONZE_BUCKET, output_s3_prefix, AWS_REGION)
+    if job_args["BACKFILL_SOURCE"]:
+        run_backfill_job(job_args, spark_session, s3_output_path, s3_dlq_path)
+        logger.info(f"Job {JOB_NAME} completed successfully.")
+        return
+
+    input_schema = _define_input_schema()
+
+    starting_position = _resolve_starting_position(job_args, STREAM_ARN.split('/')[-1])
+    read_options = _resolve_kinesis_read_options(job_args)
+    _check_resume_position(s3_checkpoint_path, STREAM_ARN.split('/')[-1], AWS_REGION, starting_position)
+
+    efo_consumer_arn = None
+    if _efo_enabled(job_args):
+        kinesis_client = boto3.client('kinesis', region_name=AWS_REGION)
+        efo_consumer_arn = _register_efo_consumer(
+            kinesis_client, STREAM_ARN, job_args["EFO_CONSUMER_NAME"] or f"{JOB_NAME}-efo"
+        )
+        read_options["fanoutConsumerARN"] = efo_consumer_arn
+
+    try:
+        _run_streaming_pipeline(glue_context, spark_session, job_args, input_schema, starting_position,
+                                read_options, s3_output_path, s3_checkpoint_path, s3_dlq_path)
+    finally:
+        if efo_consumer_arn:
+            _deregister_efo_consumer(kinesis_client, efo_consumer_arn)
 
     logger.info(f"Job {JOB_NAME} completed successfully.")
 
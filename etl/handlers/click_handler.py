@@ -1,10 +1,21 @@
 import json
 import logging
 import os
+import random
 import sys
+import threading
 import time
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .enrichment import enrich_click, enrich_request_context, partition_key_for
+from .geoip import load_geoip_table
+from .idempotency import SeenEventCache
+from .producer import ShardMap, ThrottleAwareProducer, ThrottledError
+from .spill import SpillBuffer
+from .validator import ValidationError, validate_click
 
 # Set up a more detailed logger
 logger = logging.getLogger()
@@ -13,7 +24,9 @@ logger.setLevel(logging.INFO)
 # Initialize Kinesis client with proper error handling
 try:
     REGION = os.environ.get('REGION')
-    kinesis = boto3.client("kinesis", region_name=REGION)
+    # Retries are left to the throttle-aware producer so they stay within its latency budget
+    kinesis = boto3.client("kinesis", region_name=REGION,
+                           config=Config(retries={"mode": "standard", "max_attempts": 1}))
     STREAM = os.environ["STREAM_NAME"]
 except KeyError as e:
     logger.error(f"Missing required environment variable: {e}")
@@ -124,48 +137,226 @@ if os.path.exists('/opt/python'):
         logger.error(f"Failed to import orjson: {e}")
         # Continue anyway, as the schema registry import might still work
 
-# Schema validation has been removed and deferred to the Glue ETL job
-# This simplifies the Lambda function and reduces dependencies
+# Payloads are checked against the canonical click schema (etl/click_schema.py) by a validator
+# compiled once per container; the Glue ETL job still quarantines anything malformed downstream
+
+# Per-invocation metrics are emitted in CloudWatch Embedded Metric Format (EMF); event bodies are
+# only logged for a sample of invocations to keep CloudWatch ingestion down
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "ClickstreamIngest")
+EVENT_LOG_SAMPLE_RATE = float(os.environ.get("EVENT_LOG_SAMPLE_RATE", "0.01"))
+
+# (name, unit) of every per-invocation metric
+INVOCATION_METRICS = [
+    ("ParseLatency", "Milliseconds"),
+    ("EnrichLatency", "Milliseconds"),
+    ("KinesisPutLatency", "Milliseconds"),
+    ("PayloadBytes", "Bytes"),
+    ("SpilledRecords", "Count"),
+    ("DrainedRecords", "Count"),
+    ("DuplicateEvents", "Count"),
+]
+METRIC_DIMENSIONS = [["StreamName"]]
+
+# Throttled writes are retried for up to PUT_LATENCY_BUDGET_MS before the client gets a 429
+PUT_LATENCY_BUDGET_MS = int(os.environ.get("PUT_LATENCY_BUDGET_MS", "1000"))
+# Rate-limit per shard (needs kinesis:ListShards); false, or a failed shard listing, uses one bucket
+SHARD_AWARE_THROTTLING = os.environ.get("SHARD_AWARE_THROTTLING", "true").lower() == "true"
+_producer = None
+
+# Records that still fail after the producer's retries are spilled under SPILL_DIR (unset or empty
+# disables spilling) and re-sent with PutRecords in the background once Kinesis recovers. /tmp dies
+# with the container, so only SPILL_MAX_RECORDS are held there; past that the client gets a 429
+SPILL_DIR = os.environ.get("SPILL_DIR")
+SPILL_MAX_BYTES = int(os.environ.get("SPILL_MAX_BYTES", str(64 * 1024 * 1024)))
+SPILL_MAX_RECORDS = int(os.environ.get("SPILL_MAX_RECORDS", "100"))
+SPILL_DRAIN_INTERVAL_SECONDS = float(os.environ.get("SPILL_DRAIN_INTERVAL_SECONDS", "5"))
+spill = SpillBuffer(SPILL_DIR, max_bytes=SPILL_MAX_BYTES) if SPILL_DIR else None
+_last_spill_drain = 0.0
+_spill_drainer = None
+
+# Client event IDs seen by this container; repeats (browser/network retries) skip the Kinesis write
+seen_events = SeenEventCache(max_entries=int(os.environ.get("DEDUP_CACHE_MAX_ENTRIES", "50000")),
+                             ttl_seconds=float(os.environ.get("DEDUP_CACHE_TTL_SECONDS", "300")))
+
+# Optional geo-IP enrichment from a range table shipped in a Lambda layer (unset GEOIP_TABLE_PATH
+# disables it). The caller IP itself is dropped, or kept truncated with GEOIP_RAW_IP=truncate
+GEOIP_TABLE_PATH = os.environ.get("GEOIP_TABLE_PATH")
+GEOIP_RAW_IP = os.environ.get("GEOIP_RAW_IP", "drop").lower()
+geoip = load_geoip_table(GEOIP_TABLE_PATH) if GEOIP_TABLE_PATH else None
+
+
+def emit_invocation_metrics(metrics, properties=None):
+    """
+    Print one EMF record to stdout, where CloudWatch Logs extracts the metrics.
+
+    Only metrics present in ``metrics`` are declared, so an invocation that failed before the
+    Kinesis put does not report a zero put latency. ``properties`` are logged alongside as
+    searchable fields without becoming dimensions.
+    """
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": METRIC_DIMENSIONS,
+                "Metrics": [{"Name": name, "Unit": unit} for name, unit in INVOCATION_METRICS if name in metrics],
+            }],
+        },
+        "StreamName": STREAM,
+        **(properties or {}),
+        **metrics,
+    }
+    print(json.dumps(record, default=str), flush=True)
+    return record
+
+
+def get_producer():
+    """Producer for this container, rebuilt if the module's Kinesis client or stream is replaced."""
+    global _producer
+    if _producer is None or _producer.kinesis_client is not kinesis or _producer.stream_name != STREAM:
+        shard_map = None
+        if SHARD_AWARE_THROTTLING:
+            try:
+                shard_map = ShardMap.from_stream(kinesis, STREAM)
+            except Exception as err:
+                logger.warning(f"Falling back to stream-wide throttling: {err}")
+        _producer = ThrottleAwareProducer(kinesis, STREAM, latency_budget_ms=PUT_LATENCY_BUDGET_MS,
+                                          shard_map=shard_map)
+    return _producer
+
+
+def drain_spill():
+    """Re-send the oldest spilled segment and report it as its own EMF record; returns records sent."""
+    try:
+        drained = spill.drain(kinesis, STREAM)
+    except Exception as err:
+        logger.error(f"Failed to drain spilled records: {err}", exc_info=True)
+        return 0
+    logger.info(f"Drained {drained} spilled records, {spill.pending_records} still pending")
+    emit_invocation_metrics({"DrainedRecords": drained})
+    return drained
+
+
+def start_spill_drain():
+    """
+    Start a background drain, at most once every SPILL_DRAIN_INTERVAL_SECONDS and one at a time.
+
+    The response never waits on it: a drain still running when the invocation returns is frozen
+    with the container and resumes on its next invocation. Returns the thread, or None.
+    """
+    global _last_spill_drain, _spill_drainer
+    now = time.monotonic()
+    if now - _last_spill_drain < SPILL_DRAIN_INTERVAL_SECONDS:
+        return None
+    if _spill_drainer is not None and _spill_drainer.is_alive():
+        return None
+    _last_spill_drain = now
+    _spill_drainer = threading.Thread(target=drain_spill, name="spill-drain", daemon=True)
+    _spill_drainer.start()
+    return _spill_drainer
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
 
 
 def lambda_handler(event, context):
+    request_id = context.aws_request_id if context else "direct-invocation"
+    metrics = {}
+    properties = {"RequestId": request_id}
     try:
         # event from API GW, body is JSON string
-        logger.info(f"Received event: {event}")
-
         # Handle different event types (direct invocation vs. API Gateway)
         body = event.get("body", "{}")
+        if random.random() < EVENT_LOG_SAMPLE_RATE:
+            logger.info(f"Sampled event body: {body}")
 
+        started = time.perf_counter()
         try:
             # Parse the JSON body
             parsed_body = json.loads(body)
         except json.JSONDecodeError as err:
             logger.error(f"Invalid JSON in request body: {err}")
+            properties["StatusCode"] = 400
             return {
                 "statusCode": 400,
                 "body": json.dumps({"error": "Invalid JSON in request body"})
             }
-
-        # Add timestamp and request ID for traceability
-        payload = {
-            **parsed_body,
-            "ingest_ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "request_id": context.aws_request_id if context else "direct-invocation"
-        }
+        try:
+            # Required fields, types and lengths; timestamp normalized to UTC, unknown fields dropped
+            parsed_body = validate_click(parsed_body)
+        except ValidationError as err:
+            logger.warning(f"Invalid click payload: {err}")
+            properties["StatusCode"] = 400
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": "Invalid click payload", "message": str(err)})
+            }
+        metrics["ParseLatency"] = _elapsed_ms(started)
+
+        # Browser retries reuse the client event_id: acknowledge repeats without another write
+        event_id = parsed_body.get("event_id") or None
+        if event_id:
+            duplicate = seen_events.seen(event_id)
+            metrics["DuplicateEvents"] = int(duplicate)
+            properties.update(DedupCacheHits=seen_events.stats["hits"],
+                              DedupCacheMisses=seen_events.stats["misses"],
+                              DedupCacheSize=len(seen_events))
+            if duplicate:
+                properties["StatusCode"] = 200
+                return {
+                    "statusCode": 200,
+                    "headers": {
+                        "Content-Type": "application/json",
+                        "Access-Control-Allow-Origin": "*"  # CORS support
+                    },
+                    "body": json.dumps({"ingested": True, "duplicate": True})
+                }
+
+        # Add timestamp and request ID for traceability, then geo and referrer context
+        started = time.perf_counter()
+        source_ip = ((event.get("requestContext") or {}).get("identity") or {}).get("sourceIp")
+        payload = enrich_request_context(enrich_click(parsed_body, request_id), event.get("headers") or {},
+                                         source_ip, geoip, GEOIP_RAW_IP)
 
         # Add basic validation
         if not payload.get("element"):
             logger.warning("No element specified in payload, using 'unknown'")
+        data = json.dumps(payload).encode("utf-8")
+        metrics["EnrichLatency"] = _elapsed_ms(started)
+        metrics["PayloadBytes"] = len(data)
 
         # Send it to Kinesis with a more specific partition key strategy
-        # Schema validation is now deferred to the Glue ETL job
-        response = kinesis.put_record(
-            StreamName=STREAM,
-            PartitionKey=payload.get("element", "unknown"),
-            Data=json.dumps(payload).encode("utf-8")
-        )
+        started = time.perf_counter()
+        partition_key = partition_key_for(payload)
+        try:
+            response = get_producer().put_record(data, partition_key)
+        except (ThrottledError, ClientError, BotoCoreError) as exc:
+            # A full spill answers 429 like no spill at all, so clients keep retrying the click
+            spill_full = spill is None or spill.pending_records >= SPILL_MAX_RECORDS
+            if spill_full or not spill.append([(partition_key, data)]):
+                raise
+            logger.warning(f"Kinesis write failed, record spilled locally: {exc}")
+            metrics["SpilledRecords"] = 1
+            if event_id:
+                seen_events.add(event_id)
+            properties["StatusCode"] = 202
+            return {
+                "statusCode": 202,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"  # CORS support
+                },
+                "body": json.dumps({"ingested": False, "spilled": True})
+            }
+        metrics["KinesisPutLatency"] = _elapsed_ms(started)
+        properties.update(StatusCode=200, ShardId=response.get("ShardId"))
+        if event_id:
+            seen_events.add(event_id)
 
-        logger.info(f"Successfully sent record to Kinesis: {response}")
+        # Kinesis is accepting writes again: catch up on records spilled during the outage
+        if spill is not None and not spill.empty:
+            start_spill_drain()
 
         return {
             "statusCode": 200,
@@ -179,8 +370,24 @@ def lambda_handler(event, context):
                 "sequenceNumber": response.get("SequenceNumber")
             })
         }
+    except ThrottledError as exc:
+        logger.warning(f"Kinesis write throttled: {exc}")
+        properties["StatusCode"] = 429
+        return {
+            "statusCode": 429,
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*",  # CORS support
+                "Retry-After": str(exc.retry_after_seconds)
+            },
+            "body": json.dumps({
+                "error": "Too many requests",
+                "message": "Click stream is throttled, retry later"
+            })
+        }
     except Exception as exc:
         logger.error(f"Error processing event: {exc}", exc_info=True)
+        properties["StatusCode"] = 500
         return {
             "statusCode": 500,
             "headers": {
@@ -192,3 +399,5 @@ def lambda_handler(event, context):
                 "message": str(exc)
             })
         }
+    finally:
+        emit_invocation_metrics(metrics, properties)
@@ -0,0 +1,385 @@
+"""
+Long-running asyncio HTTP collector for click events.
+
+An alternative to the per-click Lambda for sustained high request rates. It applies the same
+validation and enrichment as ``lambda_handler`` (see validator.validate_click,
+enrichment.enrich_click and enrichment.enrich_request_context, with the geo-IP table from
+``GEOIP_TABLE_PATH`` and ``GEOIP_RAW_IP``; behind a load balancer set ``TRUSTED_PROXY_HOPS`` so the
+caller is read from ``X-Forwarded-For``), accepts a single click or a JSON array of clicks per request, and
+buffers records in per-partition-key queues that are flushed to Kinesis ``PutRecords`` when a
+size or age threshold is reached.
+
+Memory is bounded: once the buffer holds ``max_buffered_records`` records or
+``max_buffered_bytes`` bytes, new requests get ``429`` with a ``Retry-After`` header until
+the flusher catches up.
+
+Clicks whose ``event_id`` this process accepted within ``DEDUP_CACHE_TTL_SECONDS`` (browser and
+network retries) are acknowledged without being buffered again, like the Lambda does.
+
+Accepted clicks are acknowledged with ``202`` before they reach Kinesis; records still
+buffered when the process is killed without a graceful shutdown are lost. With ``SPILL_DIR``
+set, records that exhaust their retries are written to a local spill buffer (etl/handlers/spill.py)
+and re-sent in the background instead of being dropped.
+
+    STREAM_NAME=clickstream-dev-events REGION=us-east-1 python -m etl.handlers.collector
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import boto3
+from aiohttp import web
+
+from .enrichment import enrich_click, enrich_request_context, partition_key_for
+from .geoip import GeoIpTable, load_geoip_table
+from .idempotency import SeenEventCache
+from .spill import SpillBuffer
+from .validator import ValidationError, validate_click
+
+logger = logging.getLogger("collector")
+logger.setLevel(logging.INFO)
+
+# Kinesis PutRecords limits
+MAX_RECORDS_PER_PUT = 500
+MAX_BYTES_PER_PUT = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Methods": "OPTIONS,POST",
+}
+
+BATCHER_KEY = web.AppKey("batcher", object)
+RETRY_AFTER_KEY = web.AppKey("retry_after_seconds", int)
+SEEN_EVENTS_KEY = web.AppKey("seen_events", SeenEventCache)
+GEOIP_KEY = web.AppKey("geoip", GeoIpTable)
+RAW_IP_MODE_KEY = web.AppKey("raw_ip_mode", str)
+TRUSTED_PROXY_HOPS_KEY = web.AppKey("trusted_proxy_hops", int)
+FLUSHER_KEY = web.AppKey("flusher", asyncio.Task)
+
+
+class KinesisBatcher:
+    """
+    Buffer records per partition key and flush them to Kinesis in PutRecords batches.
+
+    A batch is sent when ``max_batch_records`` or ``max_batch_bytes`` are buffered, or when the
+    oldest buffered record is ``max_batch_age_ms`` old. Batches take one record per partition
+    key in turn, so a single hot key cannot starve the others. Records rejected by Kinesis are
+    put back at the front of their queue and retried up to ``max_attempts`` times, then spilled
+    to ``spill`` (a SpillBuffer) when one is given, or dropped.
+    """
+
+    def __init__(self, kinesis_client, stream_name, max_batch_records=MAX_RECORDS_PER_PUT,
+                 max_batch_bytes=MAX_BYTES_PER_PUT, max_batch_age_ms=100, max_buffered_records=20000,
+                 max_buffered_bytes=32 * 1024 * 1024, max_inflight_puts=4, max_attempts=5, spill=None,
+                 spill_drain_interval_ms=5000):
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.max_batch_records = min(max_batch_records, MAX_RECORDS_PER_PUT)
+        self.max_batch_bytes = min(max_batch_bytes, MAX_BYTES_PER_PUT)
+        self.max_batch_age = max_batch_age_ms / 1000
+        self.max_buffered_records = max_buffered_records
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_attempts = max_attempts
+        self.spill = spill
+        self.spill_drain_interval = spill_drain_interval_ms / 1000
+
+        self._queues = OrderedDict()  # partition key -> deque of (data, enqueued_at, attempts)
+        self._buffered_records = 0
+        self._buffered_bytes = 0
+        self._wakeup = asyncio.Event()
+        self._inflight = asyncio.Semaphore(max_inflight_puts)
+        self._pending_puts = set()
+        self._closing = False
+        self.stats = {"accepted": 0, "rejected": 0, "put_calls": 0, "put_records": 0,
+                      "retried_records": 0, "spilled_records": 0, "dropped_records": 0}
+
+    @property
+    def buffered_records(self):
+        return self._buffered_records
+
+    def offer(self, records):
+        """
+        Buffer ``(partition_key, data)`` records; all or nothing.
+
+        Returns False without buffering anything when the records would exceed the memory bound.
+        """
+        size = sum(len(data) + len(key) for key, data in records)
+        if (self._closing
+                or self._buffered_records + len(records) > self.max_buffered_records
+                or self._buffered_bytes + size > self.max_buffered_bytes):
+            self.stats["rejected"] += len(records)
+            return False
+
+        now = time.monotonic()
+        for key, data in records:
+            self._queues.setdefault(key, deque()).append((data, now, 0))
+        self._buffered_records += len(records)
+        self._buffered_bytes += size
+        self.stats["accepted"] += len(records)
+
+        if self._buffered_records >= self.max_batch_records or self._buffered_bytes >= self.max_batch_bytes:
+            self._wakeup.set()
+        return True
+
+    def _oldest_enqueued_at(self):
+        return min((queue[0][1] for queue in self._queues.values()), default=None)
+
+    def _flush_due(self):
+        if not self._buffered_records:
+            return False
+        if self._closing or self._buffered_records >= self.max_batch_records \
+                or self._buffered_bytes >= self.max_batch_bytes:
+            return True
+        return time.monotonic() - self._oldest_enqueued_at() >= self.max_batch_age
+
+    def _take_batch(self):
+        batch = []
+        batch_bytes = 0
+        while self._queues and len(batch) < self.max_batch_records:
+            for key in list(self._queues):
+                queue = self._queues[key]
+                data, enqueued_at, attempts = queue[0]
+                record_bytes = len(data) + len(key)
+                if batch and batch_bytes + record_bytes > self.max_batch_bytes:
+                    return batch
+                queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                batch.append((key, data, enqueued_at, attempts))
+                batch_bytes += record_bytes
+                self._buffered_records -= 1
+                self._buffered_bytes -= record_bytes
+                if len(batch) >= self.max_batch_records:
+                    return batch
+        return batch
+
+    def _requeue(self, failed):
+        # Put failures back at the front of their queue, keeping their original order
+        exhausted = []
+        for key, data, enqueued_at, attempts in reversed(failed):
+            if attempts + 1 >= self.max_attempts:
+                exhausted.append((key, data))
+                continue
+            self._queues.setdefault(key, deque()).appendleft((data, enqueued_at, attempts + 1))
+            self._queues.move_to_end(key, last=False)
+            self._buffered_records += 1
+            self._buffered_bytes += len(data) + len(key)
+            self.stats["retried_records"] += 1
+
+        if exhausted:
+            exhausted.reverse()
+            if self.spill is not None and self.spill.append(exhausted):
+                self.stats["spilled_records"] += len(exhausted)
+                logger.warning(f"Spilled {len(exhausted)} records after {self.max_attempts} attempts")
+            else:
+                self.stats["dropped_records"] += len(exhausted)
+                logger.error(f"Dropping {len(exhausted)} records after {self.max_attempts} attempts")
+
+    async def _put(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(None, functools.partial(
+                self.kinesis_client.put_records,
+                StreamName=self.stream_name,
+                Records=[{"Data": data, "PartitionKey": key} for key, data, _, _ in batch],
+            ))
+            self.stats["put_calls"] += 1
+            results = response.get("Records", [])
+            failed = [record for record, result in zip(batch, results) if result.get("ErrorCode")]
+            self.stats["put_records"] += len(batch) - len(failed)
+        except Exception as err:
+            logger.warning(f"PutRecords failed for {len(batch)} records: {err}")
+            failed = batch
+        finally:
+            self._inflight.release()
+
+        if failed:
+            self._requeue(failed)
+            await asyncio.sleep(0.05)  # Brief pause before the retried records are flushed again
+            self._wakeup.set()
+
+    async def _drain_spill(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            await asyncio.sleep(self.spill_drain_interval)
+            if not self.spill.empty:
+                drained = await loop.run_in_executor(None, self.spill.drain, self.kinesis_client, self.stream_name)
+                if drained:
+                    logger.info(f"Drained {drained} spilled records, {self.spill.pending_records} still pending")
+
+    async def run(self):
+        """Flush loop; returns once ``close()`` was called and every buffered record was sent."""
+        drainer = asyncio.create_task(self._drain_spill()) if self.spill is not None else None
+        try:
+            await self._flush_loop()
+        finally:
+            if drainer:
+                drainer.cancel()
+
+    async def _flush_loop(self):
+        while not (self._closing and not self._buffered_records and not self._pending_puts):
+            oldest = self._oldest_enqueued_at()
+            timeout = self.max_batch_age if oldest is None else max(0.0, oldest + self.max_batch_age - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._flush_due():
+                await self._inflight.acquire()
+                batch = self._take_batch()
+                if not batch:
+                    self._inflight.release()
+                    break
+                task = asyncio.create_task(self._put(batch))
+                self._pending_puts.add(task)
+                task.add_done_callback(self._pending_puts.discard)
+
+            if self._closing and self._pending_puts:
+                await asyncio.wait(set(self._pending_puts))
+
+    def close(self):
+        self._closing = True
+        self._wakeup.set()
+
+
+def _json_response(status, body, headers=None):
+    return web.json_response(body, status=status, headers={**CORS_HEADERS, **(headers or {})})
+
+
+def client_address(request, trusted_proxy_hops=0):
+    """
+    Caller IP: the ``X-Forwarded-For`` entry added by the outermost of ``trusted_proxy_hops`` proxies.
+
+    Each proxy appends the address it was connected from, so the entry ``trusted_proxy_hops`` from the
+    right is the last one no client can forge. Without the header (or with no trusted proxies) the
+    connecting peer is used.
+    """
+    forwarded = request.headers.get("X-Forwarded-For")
+    if trusted_proxy_hops <= 0 or not forwarded:
+        return request.remote
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    if not hops:
+        return request.remote
+    return hops[-min(trusted_proxy_hops, len(hops))]
+
+
+async def handle_events(request):
+    """POST /events: one click object or a JSON array of click objects."""
+    batcher = request.app[BATCHER_KEY]
+    try:
+        # sendBeacon posts text/plain, so parse the raw body instead of relying on Content-Type
+        body = json.loads(await request.text())
+    except ValueError:
+        return _json_response(400, {"error": "Invalid JSON in request body"})
+
+    events = body if isinstance(body, list) else [body]
+    if not events or not all(isinstance(event, dict) for event in events):
+        return _json_response(400, {"error": "Expected a click object or an array of click objects"})
+
+    try:
+        events = [validate_click(event) for event in events]
+    except ValidationError as err:
+        return _json_response(400, {"error": "Invalid click payload", "message": str(err)})
+
+    # Browser retries reuse the client event_id: skip repeats, including repeats within this request
+    seen_events = request.app[SEEN_EVENTS_KEY]
+    source_ip = client_address(request, request.app[TRUSTED_PROXY_HOPS_KEY])
+    records, event_ids, duplicates = [], set(), 0
+    for event in events:
+        event_id = event.get("event_id") or None
+        if event_id and (event_id in event_ids or seen_events.seen(event_id)):
+            duplicates += 1
+            continue
+        payload = enrich_request_context(enrich_click(event, str(uuid.uuid4())), request.headers, source_ip,
+                                         request.app[GEOIP_KEY], request.app[RAW_IP_MODE_KEY])
+        data = json.dumps(payload).encode("utf-8")
+        if len(data) > MAX_RECORD_BYTES:
+            return _json_response(413, {"error": "Click payload exceeds the 1 MiB Kinesis record limit"})
+        records.append((partition_key_for(payload), data))
+        if event_id:
+            event_ids.add(event_id)
+
+    if records and not batcher.offer(records):
+        retry_after = request.app[RETRY_AFTER_KEY]
+        return _json_response(429, {"error": "Ingest buffer full, retry later"},
+                              headers={"Retry-After": str(retry_after)})
+    # Remembered only once buffered, so a click rejected with 429 can be retried
+    for event_id in event_ids:
+        seen_events.add(event_id)
+    return _json_response(202, {"ingested": True, "accepted": len(records), "duplicates": duplicates})
+
+
+async def handle_preflight(request):
+    return web.Response(status=200, headers=CORS_HEADERS)
+
+
+async def handle_health(request):
+    batcher = request.app[BATCHER_KEY]
+    seen_events = request.app[SEEN_EVENTS_KEY]
+    return web.json_response({"status": "ok", "buffered_records": batcher.buffered_records, **batcher.stats,
+                              "dedup_cache_size": len(seen_events),
+                              "dedup_cache_hits": seen_events.stats["hits"]})
+
+
+def create_app(batcher, retry_after_seconds=1, seen_events=None, geoip=None, raw_ip_mode="drop",
+               trusted_proxy_hops=0):
+    app = web.Application(client_max_size=MAX_BYTES_PER_PUT)
+    app[BATCHER_KEY] = batcher
+    app[RETRY_AFTER_KEY] = retry_after_seconds
+    app[SEEN_EVENTS_KEY] = seen_events if seen_events is not None else SeenEventCache()
+    app[GEOIP_KEY] = geoip
+    app[RAW_IP_MODE_KEY] = raw_ip_mode
+    app[TRUSTED_PROXY_HOPS_KEY] = trusted_proxy_hops
+    app.router.add_post("/events", handle_events)
+    app.router.add_route("OPTIONS", "/events", handle_preflight)
+    app.router.add_get("/healthz", handle_health)
+
+    async def start_flusher(app):
+        app[FLUSHER_KEY] = asyncio.create_task(batcher.run())
+
+    async def drain_flusher(app):
+        batcher.close()
+        await app[FLUSHER_KEY]
+
+    app.on_startup.append(start_flusher)
+    app.on_cleanup.append(drain_flusher)
+    return app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="[%(asctime)s] %(levelname)s %(filename)s:%(lineno)d %(message)s")
+    kinesis_client = boto3.client("kinesis", region_name=os.environ.get("REGION"))
+    spill_dir = os.environ.get("SPILL_DIR")
+    spill = SpillBuffer(spill_dir, max_bytes=int(os.environ.get("SPILL_MAX_BYTES", str(1024 ** 3))),
+                        segment_bytes=4 * 1024 * 1024) if spill_dir else None
+    batcher = KinesisBatcher(
+        kinesis_client,
+        os.environ["STREAM_NAME"],
+        max_batch_records=int(os.environ.get("MAX_BATCH_RECORDS", MAX_RECORDS_PER_PUT)),
+        max_batch_age_ms=int(os.environ.get("MAX_BATCH_AGE_MS", "100")),
+        max_buffered_records=int(os.environ.get("MAX_BUFFERED_RECORDS", "20000")),
+        spill=spill,
+    )
+    seen_events = SeenEventCache(max_entries=int(os.environ.get("DEDUP_CACHE_MAX_ENTRIES", "100000")),
+                                 ttl_seconds=float(os.environ.get("DEDUP_CACHE_TTL_SECONDS", "300")))
+    geoip_table_path = os.environ.get("GEOIP_TABLE_PATH")
+    app = create_app(batcher, retry_after_seconds=int(os.environ.get("RETRY_AFTER_SECONDS", "1")),
+                     seen_events=seen_events,
+                     geoip=load_geoip_table(geoip_table_path) if geoip_table_path else None,
+                     raw_ip_mode=os.environ.get("GEOIP_RAW_IP", "drop").lower(),
+                     trusted_proxy_hops=int(os.environ.get("TRUSTED_PROXY_HOPS", "0")))
+    web.run_app(app, port=int(os.environ.get("PORT", "8080")))
+
+
+if __name__ == "__main__":
+    main()
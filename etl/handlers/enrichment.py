@@ -0,0 +1,51 @@
+"""
+Click enrichment shared by the Lambda handler and the HTTP collector.
+
+Importing this module has no side effects: no AWS clients, environment lookups or file
+handles, so the collector can use it without pulling in click_handler's Lambda setup.
+"""
+import time
+from urllib.parse import urlsplit
+
+from .geoip import truncate_ip
+
+
+def enrich_click(parsed_body, request_id):
+    """Add the ingest timestamp and request ID for traceability."""
+    return {
+        **parsed_body,
+        "ingest_ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "request_id": request_id
+    }
+
+
+def enrich_request_context(payload, headers, source_ip, geoip=None, raw_ip_mode="drop"):
+    """
+    Add the Referer host and, from the caller IP, its country/region (with a ``geoip`` table).
+
+    The raw IP is never kept: with ``raw_ip_mode="truncate"`` its network prefix is added as
+    ``client_ip``, otherwise it is dropped.
+    """
+    referrer = headers.get("Referer") or headers.get("referer")
+    if referrer:
+        try:
+            host = urlsplit(referrer).hostname
+        except ValueError:
+            host = None
+        if host:
+            payload["referrer_host"] = host
+
+    if not source_ip:
+        return payload
+    if geoip is not None:
+        location = geoip.lookup(source_ip)
+        if location:
+            payload["geo_country"], payload["geo_region"] = location
+    if raw_ip_mode == "truncate":
+        payload["client_ip"] = truncate_ip(source_ip)
+    return payload
+
+
+def partition_key_for(payload):
+    """Kinesis partition key for an enriched click (empty keys are rejected by Kinesis)."""
+    return payload.get("element") or "unknown"
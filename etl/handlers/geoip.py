@@ -0,0 +1,199 @@
+"""
+Memory-mapped geo-IP range table for ingest-time enrichment.
+
+The table is a single binary file, built offline from a CSV of ``network,country,region`` rows
+and shipped in a Lambda layer (extracted under ``/opt``). A container maps it read-only once,
+and lookups bisect directly over the mapped start addresses: nothing is copied onto the Python
+heap except the small location list, and pages the lookups never touch are never read.
+
+File layout (little-endian)::
+
+    header      magic b"GEO1", version u16, reserved u16, v4 count u32, v6 count u32, locations u32
+    v4 starts   u32 * v4 count    first address of each range, ascending
+    v4 index    u16 * v4 count    location of each range (NO_LOCATION for gaps)
+    v6 starts   u64 * v6 count    upper 64 bits of the first address of each range (8-byte aligned)
+    v6 index    u16 * v6 count
+    locations   UTF-8 "country\\tregion" lines
+
+Each range runs up to the next start. IPv6 is resolved on the /64 routing prefix, which is
+as fine-grained as geo databases get.
+
+    python -m etl.handlers.geoip blocks.csv geoip-layer.zip
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import mmap
+import socket
+import struct
+import sys
+import zipfile
+from array import array
+
+logger = logging.getLogger("geoip")
+
+HEADER = struct.Struct("<4sHHIII")
+MAGIC = b"GEO1"
+VERSION = 1
+NO_LOCATION = 0xFFFF
+LAYER_TABLE_PATH = "geoip/ranges.bin"  # /opt/geoip/ranges.bin once the layer is attached
+
+_V4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def _padded(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _range_entries(ranges, max_key):
+    """Turn sorted, non-overlapping ``(start, end, location)`` ranges into start-only entries."""
+    starts = []
+    locations = []
+    next_start = 0
+    for start, end, location in ranges:
+        if start < next_start:
+            raise ValueError(f"Overlapping networks at {start:#x}")
+        if start > next_start and starts:
+            starts.append(next_start)
+            locations.append(NO_LOCATION)
+        if not (locations and locations[-1] == location and next_start == start):
+            starts.append(start)
+            locations.append(location)
+        next_start = end + 1
+    if starts and next_start <= max_key:
+        starts.append(next_start)
+        locations.append(NO_LOCATION)
+    return starts, locations
+
+
+def build_range_table(rows):
+    """Return the binary table for ``(network, country, region)`` rows."""
+    location_ids = {}
+    v4 = []
+    v6 = []
+    for network, country, region in rows:
+        net = ipaddress.ip_network(network.strip(), strict=False)
+        location = location_ids.setdefault((country.strip(), region.strip()), len(location_ids))
+        if location >= NO_LOCATION:
+            raise ValueError(f"More than {NO_LOCATION} distinct locations")
+        if net.version == 4:
+            v4.append((int(net.network_address), int(net.broadcast_address), location))
+        elif net.prefixlen > 64:
+            raise ValueError(f"IPv6 networks longer than /64 are not supported: {network}")
+        else:
+            v6.append((int(net.network_address) >> 64, int(net.broadcast_address) >> 64, location))
+
+    v4_starts, v4_locations = _range_entries(sorted(v4), 2 ** 32 - 1)
+    v6_starts, v6_locations = _range_entries(sorted(v6), 2 ** 64 - 1)
+    locations = "\n".join(f"{country}\t{region}" for country, region in location_ids).encode("utf-8")
+
+    body = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(v4_starts), len(v6_starts), len(location_ids)))
+    body += _little_endian("I", v4_starts) + _little_endian("H", v4_locations)
+    body += b"\x00" * (_padded(len(body)) - len(body))
+    body += _little_endian("Q", v6_starts) + _little_endian("H", v6_locations)
+    return bytes(body + locations)
+
+
+def _little_endian(typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+class GeoIpTable:
+    """Read-only, memory-mapped view of a range table built by ``build_range_table``."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, v4_count, v6_count, location_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} geo-IP range table")
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        self._v4_starts, offset = self._section(view, offset, "I", v4_count)
+        self._v4_locations, offset = self._section(view, offset, "H", v4_count)
+        self._v6_starts, offset = self._section(view, _padded(offset), "Q", v6_count)
+        self._v6_locations, offset = self._section(view, offset, "H", v6_count)
+        # A few thousand (country, region) pairs: cheap to keep as Python objects
+        lines = bytes(view[offset:]).decode("utf-8").split("\n") if location_count else []
+        self._locations = [tuple(line.split("\t", 1)) for line in lines]
+
+    @staticmethod
+    def _section(view, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        section = view[offset:offset + size]
+        if sys.byteorder == "little":
+            # bisect runs directly over the mapped pages
+            return section.cast(typecode), offset + size
+        values = array(typecode, bytes(section))
+        values.byteswap()
+        return values, offset + size
+
+    def __len__(self):
+        return len(self._v4_starts) + len(self._v6_starts)
+
+    def lookup(self, ip):
+        """Return ``(country, region)`` for an IPv4/IPv6 address string, or None if unknown or invalid."""
+        try:
+            if ":" in ip:
+                packed = socket.inet_pton(socket.AF_INET6, ip)
+                if packed[:12] == _V4_MAPPED_PREFIX:
+                    starts, locations, key = self._v4_starts, self._v4_locations, int.from_bytes(packed[12:], "big")
+                else:
+                    starts, locations, key = self._v6_starts, self._v6_locations, int.from_bytes(packed[:8], "big")
+            else:
+                starts, locations = self._v4_starts, self._v4_locations
+                key = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        except (OSError, TypeError):
+            return None
+        index = bisect.bisect_right(starts, key) - 1
+        if index < 0 or locations[index] == NO_LOCATION:
+            return None
+        return self._locations[locations[index]]
+
+
+def truncate_ip(ip):
+    """Zero the host part of an address: IPv4 to its /24, IPv6 to its /48. Returns None if invalid."""
+    try:
+        if ":" in ip:
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+            return socket.inet_ntop(socket.AF_INET6, packed[:6] + b"\x00" * 10)
+        packed = socket.inet_pton(socket.AF_INET, ip)
+        return socket.inet_ntop(socket.AF_INET, packed[:3] + b"\x00")
+    except (OSError, TypeError):
+        return None
+
+
+def load_geoip_table(path):
+    """Map the table at ``path``; returns None (enrichment off) if it is missing or unreadable."""
+    try:
+        table = GeoIpTable(path)
+    except (OSError, ValueError) as err:
+        logger.error(f"Geo-IP enrichment disabled, could not load {path}: {err}")
+        return None
+    logger.info(f"Loaded geo-IP table {path} with {len(table)} ranges")
+    return table
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m etl.handlers.geoip <network,country,region CSV> <layer zip>", file=sys.stderr)
+        return 2
+    source, layer_zip = argv
+    with open(source, newline="", encoding="utf-8") as f:
+        rows = [row[:3] for row in csv.reader(f) if row and row[0] != "network"]
+    table = build_range_table(rows)
+    with zipfile.ZipFile(layer_zip, "w", zipfile.ZIP_DEFLATED) as layer:
+        layer.writestr(LAYER_TABLE_PATH, table)
+    logger.info(f"Wrote {len(table)} byte geo-IP table for {len(rows)} networks to {layer_zip}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
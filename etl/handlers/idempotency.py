@@ -0,0 +1,54 @@
+"""
+Per-container cache of recently seen client event IDs.
+
+The beacon stamps every click with an ``event_id`` that browser and network retries reuse, so a
+repeat within ``ttl_seconds`` can be acknowledged without another Kinesis write. The cache is an
+LRU (OrderedDict) bounded at ``max_entries``; lookups, inserts and evictions are O(1). It only
+sees the traffic of its own container, so it cuts duplicates rather than guaranteeing
+exactly-once; downstream dedup on ``event_id`` stays the source of truth.
+"""
+import time
+from collections import OrderedDict
+
+
+class SeenEventCache:
+    """LRU + TTL set of event IDs with hit/miss counters."""
+
+    def __init__(self, max_entries=100000, ttl_seconds=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._seen = OrderedDict()  # event_id -> first seen (clock seconds)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self):
+        return len(self._seen)
+
+    def seen(self, event_id):
+        """True if ``event_id`` was added within the TTL; counts a hit or a miss."""
+        first_seen = self._seen.get(event_id)
+        if first_seen is not None and self.clock() - first_seen < self.ttl_seconds:
+            self._seen.move_to_end(event_id)
+            self.stats["hits"] += 1
+            return True
+        if first_seen is not None:
+            del self._seen[event_id]
+            self.stats["expirations"] += 1
+        self.stats["misses"] += 1
+        return False
+
+    def add(self, event_id):
+        """Remember ``event_id``; call only once its click is safely written (or spilled)."""
+        now = self.clock()
+        self._seen[event_id] = now
+        self._seen.move_to_end(event_id)
+        # Drop expired entries at the LRU end, then enforce the size bound
+        while self._seen:
+            oldest_id, first_seen = next(iter(self._seen.items()))
+            if now - first_seen < self.ttl_seconds:
+                break
+            del self._seen[oldest_id]
+            self.stats["expirations"] += 1
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+            self.stats["evictions"] += 1
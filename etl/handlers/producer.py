@@ -0,0 +1,216 @@
+"""
+Throttle-aware Kinesis producer for the ingest tier.
+
+Each shard gets an adaptive token bucket when a ShardMap is supplied (one stream-wide bucket
+otherwise, so the bucket count never grows with client-supplied partition keys): its rate is
+halved whenever Kinesis throttles a write to it and creeps back up by a fixed step on every
+success (AIMD), so a container stops hammering a hot shard without a fixed rate limit. A put
+answered by a shard the map does not know (the stream was resharded) reloads the map, at most
+once every ``SHARD_MAP_REFRESH_SECONDS``, and drops the buckets of shards that closed.
+Throttled writes are retried with full-jitter exponential backoff until the latency budget
+would be exceeded, at which point ThrottledError tells the caller to answer ``429`` with a
+``Retry-After`` hint instead of a generic failure.
+
+The happy path costs one dict lookup and one token take per record; nothing sleeps unless
+Kinesis has already throttled the shard.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# Error codes Kinesis returns when a shard or the account is over its write limits
+THROTTLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "LimitExceededException",
+}
+
+logger = logging.getLogger("producer")
+
+# Documented per-shard write limit
+SHARD_WRITE_RECORDS_PER_SEC = 1000
+# Least time between two shard map reloads, so a failing ListShards is not retried on every put
+SHARD_MAP_REFRESH_SECONDS = 30
+
+
+class ThrottledError(Exception):
+    """Raised when a record could not be written before the latency budget ran out."""
+
+    def __init__(self, retry_after_seconds, attempts):
+        super().__init__(f"Kinesis throttled the write after {attempts} attempts; "
+                         f"retry after {retry_after_seconds}s")
+        self.retry_after_seconds = retry_after_seconds
+        self.attempts = attempts
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to throttling (multiplicative decrease, additive increase).
+
+    The bucket holds at most ``burst_seconds`` worth of tokens at the current rate, and starts full.
+    """
+
+    def __init__(self, max_rate, min_rate=1.0, increase=None, decrease=0.5, burst_seconds=1.0,
+                 clock=time.monotonic):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase if increase is not None else max_rate / 100
+        self.decrease = decrease
+        self.burst_seconds = burst_seconds
+        self.clock = clock
+        self.rate = max_rate
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate * self.burst_seconds)
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Take one token; returns 0 when granted, otherwise the seconds until one is available."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class ShardMap:
+    """Map partition keys to open shards the way Kinesis does (MD5 of the key into hash key ranges)."""
+
+    def __init__(self, shards):
+        ranges = sorted((int(shard["HashKeyRange"]["StartingHashKey"]), shard["ShardId"]) for shard in shards)
+        self._starts = [start for start, _ in ranges]
+        self._shard_ids = [shard_id for _, shard_id in ranges]
+        self.shard_ids = frozenset(self._shard_ids)
+
+    @classmethod
+    def from_stream(cls, kinesis_client, stream_name):
+        shards = []
+        request = {"StreamName": stream_name, "ShardFilter": {"Type": "AT_LATEST"}}
+        while True:
+            response = kinesis_client.list_shards(**request)
+            shards.extend(response.get("Shards", []))
+            if not response.get("NextToken"):
+                if not shards:
+                    raise ValueError(f"No open shards listed for {stream_name}")
+                return cls(shards)
+            request = {"NextToken": response["NextToken"]}
+
+    def shard_for(self, partition_key):
+        hash_key = int(hashlib.md5(partition_key.encode("utf-8")).hexdigest(), 16)
+        return self._shard_ids[max(0, bisect.bisect_right(self._starts, hash_key) - 1)]
+
+
+class ThrottleAwareProducer:
+    """
+    ``put_record`` wrapper with per-shard adaptive rate limiting and jittered retries.
+
+    Configure the boto3 client without its own retries (``max_attempts=1``) so the latency
+    budget covers every attempt.
+    """
+
+    def __init__(self, kinesis_client, stream_name, latency_budget_ms=1000, base_backoff_ms=25,
+                 max_backoff_ms=250, max_rate=SHARD_WRITE_RECORDS_PER_SEC, min_rate=5.0, shard_map=None,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.latency_budget = latency_budget_ms / 1000
+        self.base_backoff = base_backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.shard_map = shard_map
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+        self._buckets = {}
+        self._shard_map_loaded_at = float("-inf")
+        self.stats = {"records": 0, "attempts": 0, "throttles": 0, "rejected": 0}
+
+    def bucket_for(self, partition_key):
+        bucket_key = self.shard_map.shard_for(partition_key) if self.shard_map else self.stream_name
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets.setdefault(
+                bucket_key, AdaptiveTokenBucket(self.max_rate, self.min_rate, clock=self.clock))
+        return bucket
+
+    def _check_shard(self, shard_id):
+        """Reload the shard map when a write landed on a shard it does not know."""
+        if self.shard_map is None or not shard_id or shard_id in self.shard_map.shard_ids:
+            return
+        now = self.clock()
+        if now - self._shard_map_loaded_at < SHARD_MAP_REFRESH_SECONDS:
+            return
+        self._shard_map_loaded_at = now
+        try:
+            shard_map = ShardMap.from_stream(self.kinesis_client, self.stream_name)
+        except Exception as err:
+            logger.warning(f"Keeping the current shard map, reload failed: {err}")
+            return
+        logger.info(f"Stream resharded: now {len(shard_map.shard_ids)} open shards")
+        self.shard_map = shard_map
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if key in shard_map.shard_ids}
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform between 0 and the capped exponential delay
+        return self.rng() * min(self.max_backoff, self.base_backoff * 2 ** attempt)
+
+    def put_record(self, data, partition_key):
+        """
+        Write one record, retrying throttles within the latency budget.
+
+        Returns the PutRecord response; raises ThrottledError once the budget is spent and
+        re-raises any non-throttling error immediately.
+        """
+        deadline = self.clock() + self.latency_budget
+        bucket = self.bucket_for(partition_key)
+        attempts = 0
+        while True:
+            wait = bucket.acquire()
+            if not wait:
+                attempts += 1
+                self.stats["attempts"] += 1
+                try:
+                    response = self.kinesis_client.put_record(
+                        StreamName=self.stream_name, PartitionKey=partition_key, Data=data)
+                except ClientError as err:
+                    if err.response.get("Error", {}).get("Code") not in THROTTLE_ERROR_CODES:
+                        raise
+                    self.stats["throttles"] += 1
+                    bucket.on_throttle()
+                    wait = self._backoff(attempts - 1)
+                else:
+                    bucket.on_success()
+                    self.stats["records"] += 1
+                    self._check_shard(response.get("ShardId"))
+                    return response
+
+            if self.clock() + wait > deadline:
+                self.stats["rejected"] += 1
+                raise ThrottledError(max(1, math.ceil(wait)), attempts)
+            self.sleep(wait)
@@ -0,0 +1,193 @@
+"""
+Durable local spill buffer for ingest during Kinesis brownouts.
+
+Records that still fail after the producer's retries are appended to segment files in a local
+directory (``/tmp`` for the Lambda, a disk path for the HTTP collector) and re-sent later with
+``PutRecords`` in bulk. The buffer is capped at ``max_bytes``: when it is full the oldest segment
+is deleted, so a long outage loses the oldest clicks rather than the newest.
+
+Each record is framed as ``<data length:u32><key length:u16><crc32:u32><key><data>``; a torn or
+corrupt frame (e.g. the container died mid-write) ends the read of that segment.
+
+Nothing here runs on the happy path: callers check ``empty`` (an in-memory flag) before draining.
+"""
+import logging
+import os
+import struct
+import threading
+import zlib
+
+logger = logging.getLogger("spill")
+
+FRAME_HEADER = struct.Struct("<IHI")
+SEGMENT_SUFFIX = ".seg"
+
+# Kinesis PutRecords limits
+MAX_RECORDS_PER_PUT = 500
+MAX_BYTES_PER_PUT = 5 * 1024 * 1024
+
+
+def _encode(partition_key, data):
+    key = partition_key.encode("utf-8")
+    return FRAME_HEADER.pack(len(data), len(key), zlib.crc32(key + data)) + key + data
+
+
+def read_segment(path):
+    """Return the ``(partition_key, data)`` records of one segment, stopping at a torn frame."""
+    with open(path, "rb") as f:
+        buffer = f.read()
+    records = []
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(buffer):
+        data_len, key_len, crc = FRAME_HEADER.unpack_from(buffer, offset)
+        start = offset + FRAME_HEADER.size
+        end = start + key_len + data_len
+        body = buffer[start:end]
+        if end > len(buffer) or zlib.crc32(body) != crc:
+            logger.warning(f"Ignoring torn or corrupt spill data in {path} at offset {offset}")
+            break
+        records.append((body[:key_len].decode("utf-8"), body[key_len:]))
+        offset = end
+    return records
+
+
+def _put_batches(records):
+    """Split records into batches within the PutRecords count and size limits."""
+    batch = []
+    batch_bytes = 0
+    for key, data in records:
+        record_bytes = len(key) + len(data)
+        if batch and (len(batch) >= MAX_RECORDS_PER_PUT or batch_bytes + record_bytes > MAX_BYTES_PER_PUT):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append((key, data))
+        batch_bytes += record_bytes
+    if batch:
+        yield batch
+
+
+class SpillBuffer:
+    """Append-only, size-capped segment files with oldest-first eviction."""
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=512 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_seq = None
+        self.stats = {"spilled": 0, "drained": 0, "evicted": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        # Segments left by a previous process (or Lambda invocation) are drained like any other;
+        # new records always go to a fresh segment so a torn tail is never appended to
+        self._segments = {}  # seq -> [bytes, records]
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(SEGMENT_SUFFIX):
+                path = os.path.join(directory, name)
+                self._segments[int(name[:-len(SEGMENT_SUFFIX)])] = [os.path.getsize(path), len(read_segment(path))]
+
+    @property
+    def empty(self):
+        return not self._segments
+
+    @property
+    def total_bytes(self):
+        return sum(size for size, _ in self._segments.values())
+
+    @property
+    def pending_records(self):
+        return sum(count for _, count in self._segments.values())
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _roll(self):
+        if self._active:
+            self._active.close()
+        self._active_seq = max(self._segments, default=0) + 1
+        self._segments[self._active_seq] = [0, 0]
+        self._active = open(self._path(self._active_seq), "ab")
+
+    def _close_active(self):
+        if self._active:
+            self._active.close()
+        self._active = None
+        self._active_seq = None
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._segments) > 1:
+            oldest = min(self._segments)
+            size, count = self._segments.pop(oldest)
+            os.remove(self._path(oldest))
+            self.stats["evicted"] += count
+            logger.error(f"Spill buffer over {self.max_bytes} bytes: evicted {count} oldest records")
+
+    def append(self, records):
+        """Spill ``(partition_key, data)`` records; returns False if they can never fit."""
+        frames = [_encode(key, data) for key, data in records]
+        size = sum(len(frame) for frame in frames)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if self._active is None or self._segments[self._active_seq][0] + size > self.segment_bytes:
+                self._roll()
+            self._active.write(b"".join(frames))
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._segments[self._active_seq][0] += size
+            self._segments[self._active_seq][1] += len(frames)
+            self.stats["spilled"] += len(frames)
+            self._evict()
+        return True
+
+    def _take_oldest(self):
+        with self._lock:
+            if not self._segments:
+                return None, []
+            oldest = min(self._segments)
+            if oldest == self._active_seq:
+                self._close_active()
+            return oldest, read_segment(self._path(oldest))
+
+    def drain(self, kinesis_client, stream_name, max_segments=1):
+        """
+        Re-send up to ``max_segments`` of the oldest segments with PutRecords; returns records sent.
+
+        Once a call fails or Kinesis rejects any record, the drain stops: the rejected and
+        unsent records are spilled again (to the newest segment) for the next attempt.
+        """
+        sent = 0
+        for _ in range(max_segments):
+            seq, records = self._take_oldest()
+            if seq is None:
+                break
+            failed = []
+            for batch in _put_batches(records):
+                if failed:
+                    failed.extend(batch)
+                    continue
+                try:
+                    response = kinesis_client.put_records(
+                        StreamName=stream_name,
+                        Records=[{"PartitionKey": key, "Data": data} for key, data in batch],
+                    )
+                except Exception as err:
+                    logger.warning(f"Spill drain stopped, Kinesis still failing: {err}")
+                    failed.extend(batch)
+                    continue
+                rejected = [record for record, result in zip(batch, response.get("Records", []))
+                            if result.get("ErrorCode")]
+                failed.extend(rejected)
+                sent += len(batch) - len(rejected)
+
+            with self._lock:
+                if seq in self._segments:
+                    del self._segments[seq]
+                    os.remove(self._path(seq))
+            if failed:
+                self.append(failed)
+                break
+        self.stats["drained"] += sent
+        return sent
@@ -0,0 +1,98 @@
+"""
+Compiled click payload validation for the ingest tier.
+
+The validator is generated as straight-line Python from the canonical schema in
+etl.click_schema (the same CLICK_FIELDS the Glue job's ``_define_input_schema`` uses) and
+compiled once per container, in the style of fastjsonschema: no per-event schema walking, just
+one ``type() is str`` and ``len()`` check per field.
+
+It checks that required fields are present, every known field is a string within its maximum
+length, and ``timestamp`` matches EVENT_TIMESTAMP_FORMAT, which it rewrites to canonical UTC
+(``2024-05-01T10:00:00.123Z``); timestamps already in that form (what ``Date.toISOString``
+sends) only get a date check. It returns a new dict holding only the client fields; unknown
+fields and the fields the ingest tier sets itself are dropped.
+"""
+import re
+from datetime import datetime
+
+from etl.click_schema import (
+    FIELD_MAX_LENGTHS,
+    FIELD_NAMES,
+    REQUIRED_CLIENT_FIELDS,
+    SERVER_FIELDS,
+    format_event_timestamp,
+    parse_event_timestamp,
+)
+
+_CANONICAL_TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z\Z")
+
+
+class ValidationError(ValueError):
+    """Raised when a click payload does not match the canonical schema."""
+
+
+def generate_validator_source(field_names=None, required=None, max_lengths=None):
+    """Return the Python source of ``validate(payload)`` for the given schema."""
+    field_names = [name for name in (field_names or FIELD_NAMES) if name not in SERVER_FIELDS]
+    required = set(REQUIRED_CLIENT_FIELDS if required is None else required)
+    max_lengths = FIELD_MAX_LENGTHS if max_lengths is None else max_lengths
+
+    lines = [
+        "def validate(payload):",
+        "    if type(payload) is not dict:",
+        "        raise ValidationError('Click payload must be a JSON object')",
+        "    clean = {}",
+    ]
+    for name in field_names:
+        lines.append(f"    value = payload.get({name!r})")
+        if name in required:
+            lines += [
+                "    if value is None:",
+                f"        raise ValidationError({f'{name} is required'!r})",
+            ]
+            indent = "    "
+        else:
+            lines.append("    if value is not None:")
+            indent = "        "
+        lines += [
+            f"{indent}if type(value) is not str:",
+            f"{indent}    raise ValidationError({f'{name} must be a string'!r})",
+        ]
+        if name in max_lengths:
+            lines += [
+                f"{indent}if len(value) > {max_lengths[name]}:",
+                f"{indent}    raise ValidationError({f'{name} exceeds {max_lengths[name]} characters'!r})",
+            ]
+        if name == "timestamp":
+            lines += [
+                f"{indent}if is_canonical_timestamp(value):",
+                f"{indent}    try:",
+                f"{indent}        fromisoformat(value[:23])",
+                f"{indent}    except ValueError:",
+                f"{indent}        raise ValidationError('timestamp is not a valid date') from None",
+                f"{indent}else:",
+                f"{indent}    parsed = parse_event_timestamp(value)",
+                f"{indent}    if parsed is None:",
+                f"{indent}        raise ValidationError('timestamp must be ISO 8601 with a UTC offset')",
+                f"{indent}    value = format_event_timestamp(parsed)",
+            ]
+        lines.append(f"{indent}clean[{name!r}] = value")
+    lines.append("    return clean")
+    return "\n".join(lines) + "\n"
+
+
+def compile_validator(field_names=None, required=None, max_lengths=None):
+    source = generate_validator_source(field_names, required, max_lengths)
+    namespace = {
+        "ValidationError": ValidationError,
+        "is_canonical_timestamp": _CANONICAL_TIMESTAMP_RE.match,
+        "fromisoformat": datetime.fromisoformat,
+        "parse_event_timestamp": parse_event_timestamp,
+        "format_event_timestamp": format_event_timestamp,
+    }
+    exec(compile(source, "<click_validator>", "exec"), namespace)
+    return namespace["validate"]
+
+
+# Built once per container at import
+validate_click = compile_validator()
@@ -0,0 +1,333 @@
+"""
+Lightweight micro-batch consumer for low-volume environments.
+
+An alternative to the Glue streaming job for dev/staging: it polls every shard of the stream
+with a thread pool, applies the transform rules from etl.click_schema (the same ones the
+Glue job uses), and appends the clean rows to the bronze Delta table with delta-rs. Rejected
+records go to the dead-letter table. Startup is sub-second, so it fits a scheduled Lambda or
+a small container.
+
+Delivery is at-least-once: shard positions are checkpointed only after both Delta appends
+commit, and bronze rows carry shard_id/sequence_number for downstream dedupe. With
+``--starting-position LATEST`` the first run pins each shard to the run start
+(``{"at_timestamp": ...}`` in the checkpoint) so clicks arriving before the next poll are kept;
+shards that appear later (after a reshard) are read from their start.
+
+Run once from a container or shell:
+
+    python -m etl.microbatch_consumer --stream-name clickstream-dev-events \\
+        --bronze-uri s3://bucket/dev/bronze/clicks/ --dlq-uri s3://bucket/dev/dlq/clicks/ \\
+        --checkpoint-uri s3://bucket/dev/checkpoints/clicks_lite.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+import pyarrow as pa
+from botocore.exceptions import ClientError
+from deltalake import write_deltalake
+
+from etl.click_schema import (
+    BRONZE_COLUMNS,
+    DEFAULT_EVENT_TIME_POLICY,
+    EVENT_TIME_POLICIES,
+    FIELD_NAMES,
+    format_event_timestamp,
+    parse_event_timestamp,
+    parse_payload,
+    trusted_event_time,
+)
+
+logger = logging.getLogger("microbatch_consumer")
+logger.setLevel(logging.INFO)
+
+BRONZE_NON_STRING_TYPES = {
+    "clock_skew_seconds": pa.int64(),
+    "event_ts": pa.timestamp("us", tz="UTC"),
+    "event_date": pa.date32(),
+}
+BRONZE_ARROW_SCHEMA = pa.schema(
+    [pa.field(name, BRONZE_NON_STRING_TYPES.get(name, pa.string())) for name in BRONZE_COLUMNS]
+)
+
+DEAD_LETTER_ARROW_SCHEMA = pa.schema([
+    pa.field("raw_data", pa.binary()),
+    pa.field("error_reason", pa.string()),
+    pa.field("stream_name", pa.string()),
+    pa.field("shard_id", pa.string()),
+    pa.field("partition_key", pa.string()),
+    pa.field("sequence_number", pa.string()),
+    pa.field("approximate_arrival_timestamp", pa.timestamp("us", tz="UTC")),
+    pa.field("dlq_ts", pa.timestamp("us", tz="UTC")),
+    pa.field("dlq_date", pa.date32()),
+])
+
+# GetRecords is limited to 5 calls/sec per shard
+GET_RECORDS_INTERVAL_SECONDS = 0.2
+THROTTLE_ERROR_CODES = {"ProvisionedThroughputExceededException", "LimitExceededException"}
+MAX_THROTTLE_RETRIES = 5
+
+
+def list_shard_ids(kinesis_client, stream_name):
+    shard_ids = []
+    request = {"StreamName": stream_name}
+    while True:
+        response = kinesis_client.list_shards(**request)
+        shard_ids.extend(shard["ShardId"] for shard in response.get("Shards", []))
+        if not response.get("NextToken"):
+            return shard_ids
+        request = {"NextToken": response["NextToken"]}
+
+
+def _get_records(kinesis_client, shard_iterator, limit, sleep):
+    """GetRecords, retrying throttles with exponential backoff; None once the retries are spent."""
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        try:
+            return kinesis_client.get_records(ShardIterator=shard_iterator, Limit=limit)
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") not in THROTTLE_ERROR_CODES:
+                raise
+            if attempt < MAX_THROTTLE_RETRIES:
+                sleep(GET_RECORDS_INTERVAL_SECONDS * 2 ** attempt)
+    return None
+
+
+def read_shard(kinesis_client, stream_name, shard_id, after_sequence=None, starting_position="TRIM_HORIZON",
+               max_records=10000, limit=1000, poll_interval_seconds=GET_RECORDS_INTERVAL_SECONDS, sleep=time.sleep):
+    """
+    Read up to ``max_records`` from one shard, resuming at its checkpoint ``after_sequence`` when given.
+
+    The checkpoint is a sequence number to resume after, or ``{"at_timestamp": ...}`` for a shard
+    pinned to a start time. Returns the records (each tagged with ``ShardId``) and the new
+    checkpoint: the last sequence number read, else the checkpoint it started from. A shard that
+    stays throttled past the retries returns what was read so far.
+    """
+    iterator_args = {"StreamName": stream_name, "ShardId": shard_id}
+    if isinstance(after_sequence, dict):
+        iterator_args.update(ShardIteratorType="AT_TIMESTAMP",
+                             Timestamp=parse_event_timestamp(after_sequence["at_timestamp"]))
+    elif after_sequence:
+        iterator_args.update(ShardIteratorType="AFTER_SEQUENCE_NUMBER", StartingSequenceNumber=after_sequence)
+    else:
+        iterator_args["ShardIteratorType"] = starting_position
+
+    shard_iterator = kinesis_client.get_shard_iterator(**iterator_args)["ShardIterator"]
+    records = []
+    last_sequence = after_sequence
+    while shard_iterator and len(records) < max_records:
+        response = _get_records(kinesis_client, shard_iterator, min(limit, max_records - len(records)), sleep)
+        if response is None:
+            logger.warning(f"GetRecords on {shard_id} still throttled after {MAX_THROTTLE_RETRIES} retries; "
+                           f"resuming next run")
+            break
+        for record in response.get("Records", []):
+            records.append({**record, "ShardId": shard_id})
+            last_sequence = record["SequenceNumber"]
+        if not response.get("Records") and response.get("MillisBehindLatest", 0) == 0:
+            break  # Caught up with the tip of the shard
+        shard_iterator = response.get("NextShardIterator")
+        if shard_iterator and len(records) < max_records:
+            sleep(poll_interval_seconds)  # Stay under the 5 GetRecords calls/sec/shard limit
+    return records, last_sequence
+
+
+def _initial_positions(shard_ids, checkpoints, starting_position, now=None):
+    """
+    Checkpoints for shards that have none yet.
+
+    On the first run, LATEST is pinned to the run start: a bare LATEST iterator is not a position
+    that can be saved, so a run that read nothing would start again from a later tip and skip
+    what arrived in between. Shards first seen after that (children of a reshard) start at their
+    beginning.
+    """
+    if checkpoints or starting_position != "LATEST":
+        return {}
+    pinned = {"at_timestamp": format_event_timestamp(now or datetime.now(timezone.utc))}
+    return {shard_id: pinned for shard_id in shard_ids}
+
+
+def poll_stream(kinesis_client, stream_name, checkpoints, max_workers=8, max_records_per_shard=10000,
+                starting_position="TRIM_HORIZON", poll_interval_seconds=GET_RECORDS_INTERVAL_SECONDS):
+    """Read every shard concurrently; returns all records and the advanced checkpoints."""
+    shard_ids = list_shard_ids(kinesis_client, stream_name)
+    positions = {**_initial_positions(shard_ids, checkpoints, starting_position), **checkpoints}
+    # Shards without a checkpoint once the stream has been read before are new: read them whole
+    new_shard_position = "TRIM_HORIZON" if checkpoints else starting_position
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shard_ids) or 1))) as pool:
+        futures = {
+            shard_id: pool.submit(read_shard, kinesis_client, stream_name, shard_id, positions.get(shard_id),
+                                  new_shard_position, max_records_per_shard,
+                                  poll_interval_seconds=poll_interval_seconds)
+            for shard_id in shard_ids
+        }
+        records = []
+        new_checkpoints = dict(checkpoints)
+        for shard_id, future in futures.items():
+            shard_records, last_sequence = future.result()
+            records.extend(shard_records)
+            if last_sequence:
+                new_checkpoints[shard_id] = last_sequence
+    return records, new_checkpoints
+
+
+def transform_records(records, stream_name=None, event_time_options=None):
+    """
+    Apply the click transform rules to raw Kinesis records.
+
+    ``event_time_options`` are keyword arguments of ``trusted_event_time`` (policy and allowed
+    skew). Returns ``(bronze_rows, dead_letter_rows)`` as lists of dicts keyed by the bronze
+    and dead-letter column names, matching what the Glue job writes.
+    """
+    bronze_rows = []
+    dead_letter_rows = []
+    now = datetime.now(timezone.utc)
+    for record in records:
+        fields, reject_reason = parse_payload(record["Data"])
+        metadata = {
+            "shard_id": record.get("ShardId"),
+            "partition_key": record.get("PartitionKey"),
+            "sequence_number": record.get("SequenceNumber"),
+        }
+        if reject_reason:
+            dead_letter_rows.append({
+                "raw_data": bytes(record["Data"]),
+                "error_reason": reject_reason,
+                "stream_name": stream_name,
+                **metadata,
+                "approximate_arrival_timestamp": record.get("ApproximateArrivalTimestamp"),
+                "dlq_ts": now,
+                "dlq_date": now.date(),
+            })
+            continue
+
+        client_ts = parse_event_timestamp(fields["timestamp"]) if fields["timestamp"] is not None else None
+        event_ts, clock_skew_seconds, event_time_source = trusted_event_time(
+            client_ts, fields["ingest_ts"], record.get("ApproximateArrivalTimestamp"), **(event_time_options or {}))
+        bronze_rows.append({
+            **{name: fields[name] for name in FIELD_NAMES},
+            **metadata,
+            "clock_skew_seconds": clock_skew_seconds,
+            "event_time_source": event_time_source,
+            "event_ts": event_ts,
+            "event_date": event_ts.date() if event_ts else None,
+        })
+    return bronze_rows, dead_letter_rows
+
+
+def write_delta(rows, table_uri, schema, partition_column, storage_options=None):
+    if not rows:
+        return 0
+    table = pa.Table.from_pylist(rows, schema=schema)
+    # Merge like the Glue writer (mergeSchema) so new payload fields become new columns
+    write_deltalake(table_uri, table, mode="append", partition_by=[partition_column], schema_mode="merge",
+                    storage_options=storage_options)
+    return table.num_rows
+
+
+def load_checkpoints(checkpoint_uri, s3_client=None):
+    """Load the ``{shard_id: sequence_number}`` map from a local path or ``s3://`` URI."""
+    if checkpoint_uri.startswith("s3://"):
+        bucket, _, key = checkpoint_uri[5:].partition("/")
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except s3_client.exceptions.NoSuchKey:
+            return {}
+        return json.loads(body)
+    if not os.path.exists(checkpoint_uri):
+        return {}
+    with open(checkpoint_uri, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoints(checkpoint_uri, checkpoints, s3_client=None):
+    body = json.dumps(checkpoints, sort_keys=True)
+    if checkpoint_uri.startswith("s3://"):
+        bucket, _, key = checkpoint_uri[5:].partition("/")
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"))
+        return
+    tmp_path = f"{checkpoint_uri}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(body)
+    os.replace(tmp_path, checkpoint_uri)
+
+
+def run_once(stream_name, bronze_uri, dlq_uri, checkpoint_uri, region=None, max_workers=8,
+             max_records_per_shard=10000, starting_position="TRIM_HORIZON", kinesis_client=None, s3_client=None,
+             event_time_policy=DEFAULT_EVENT_TIME_POLICY):
+    """Poll, transform and append one micro-batch; returns a summary of what was written."""
+    started = time.perf_counter()
+    kinesis_client = kinesis_client or boto3.client("kinesis", region_name=region)
+    if checkpoint_uri.startswith("s3://"):
+        s3_client = s3_client or boto3.client("s3", region_name=region)
+
+    checkpoints = load_checkpoints(checkpoint_uri, s3_client)
+    records, new_checkpoints = poll_stream(kinesis_client, stream_name, checkpoints, max_workers,
+                                           max_records_per_shard, starting_position)
+    bronze_rows, dead_letter_rows = transform_records(records, stream_name, {"policy": event_time_policy})
+
+    written = write_delta(bronze_rows, bronze_uri, BRONZE_ARROW_SCHEMA, "event_date")
+    rejected = write_delta(dead_letter_rows, dlq_uri, DEAD_LETTER_ARROW_SCHEMA, "dlq_date")
+    if new_checkpoints != checkpoints:
+        save_checkpoints(checkpoint_uri, new_checkpoints, s3_client)
+
+    summary = {
+        "records": len(records),
+        "bronze_rows": written,
+        "dead_letter_rows": rejected,
+        "shards": len(new_checkpoints),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info(f"Micro-batch complete: {summary}")
+    return summary
+
+
+def lambda_handler(event, context):
+    """Scheduled Lambda entry point; configuration comes from environment variables."""
+    return run_once(
+        stream_name=os.environ["STREAM_NAME"],
+        bronze_uri=os.environ["BRONZE_TABLE_URI"],
+        dlq_uri=os.environ["DLQ_TABLE_URI"],
+        checkpoint_uri=os.environ["CHECKPOINT_URI"],
+        region=os.environ.get("REGION"),
+        max_workers=int(os.environ.get("MAX_WORKERS", "8")),
+        max_records_per_shard=int(os.environ.get("MAX_RECORDS_PER_SHARD", "10000")),
+        starting_position=os.environ.get("STARTING_POSITION", "TRIM_HORIZON"),
+        event_time_policy=os.environ.get("EVENT_TIME_POLICY", DEFAULT_EVENT_TIME_POLICY),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll Kinesis and append click micro-batches to Delta")
+    parser.add_argument("--stream-name", required=True)
+    parser.add_argument("--bronze-uri", required=True)
+    parser.add_argument("--dlq-uri", required=True)
+    parser.add_argument("--checkpoint-uri", required=True)
+    parser.add_argument("--region")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--max-records-per-shard", type=int, default=10000)
+    parser.add_argument("--starting-position", choices=["TRIM_HORIZON", "LATEST"], default="TRIM_HORIZON")
+    parser.add_argument("--event-time-policy", choices=EVENT_TIME_POLICIES, default=DEFAULT_EVENT_TIME_POLICY,
+                        help="What event_ts becomes for clicks whose client clock is skewed (see etl.click_schema)")
+    parser.add_argument("--interval-seconds", type=float, default=0,
+                        help="Keep polling with this pause between batches (0 runs a single batch)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format="[%(asctime)s] %(levelname)s %(filename)s:%(lineno)d %(message)s")
+    while True:
+        run_once(args.stream_name, args.bronze_uri, args.dlq_uri, args.checkpoint_uri, args.region,
+                 args.max_workers, args.max_records_per_shard, args.starting_position,
+                 event_time_policy=args.event_time_policy)
+        if not args.interval_seconds:
+            return
+        time.sleep(args.interval_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Optional request_id index for point lookups on the bronze Delta table.
+
+``request_id`` is random, so Parquet min/max statistics never skip anything and a lookup by id
+scans all of bronze. Two structures make it cheap:
+
+* Parquet bloom filters on ``request_id``, written by the Glue job (``REQUEST_ID_BLOOM_FILTER_CONF``),
+  let Spark and Athena skip the row groups that cannot hold the id;
+* a sidecar Delta table of ``(prefix, path)`` rows, where ``prefix`` is the start of
+  sha256(request_id), lists the bronze files holding ids with that prefix. It is updated after
+  each bronze commit from the files that commit added, and is z-ordered on ``prefix`` every
+  ``compact_every`` appends so file statistics prune a lookup down to a few index files.
+
+``RequestIdIndex.lookup`` reads only the candidate bronze files. Indexed commits are tracked
+with a Delta transaction id (``INDEX_APP_ID``), so an update retried after a failure is a no-op.
+
+    python -m etl.request_id_index s3://bucket/dev/bronze/clicks/ 9b2f0c1e-...   # look up
+    python -m etl.request_id_index s3://bucket/dev/bronze/clicks/ --update       # catch up
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from etl.athena_manifest import DeltaLog, ObjectStorage
+
+logger = logging.getLogger("request_id_index")
+logger.setLevel(logging.INFO)
+
+INDEX_DIR = "_request_id_index"
+INDEX_APP_ID = "request-id-index"
+# Hex characters of sha256(request_id) kept per index row. With 16**6 prefixes a bronze file of
+# n ids covers about n / 16.7M of them, so a lookup's candidates are a small share of the files.
+PREFIX_LENGTH = 6
+COMPACT_EVERY_COMMITS = 50
+
+INDEX_SCHEMA = pa.schema([pa.field("prefix", pa.string()), pa.field("path", pa.string())])
+
+# Parquet writer settings for the Glue job; Spark copies session confs into the Hadoop conf
+REQUEST_ID_BLOOM_FILTER_CONF = {
+    "parquet.bloom.filter.enabled#request_id": "true",
+    "parquet.bloom.filter.expected.ndv#request_id": "1000000",
+    "parquet.bloom.filter.fpp#request_id": "0.01",
+}
+
+
+def request_id_prefix(request_id, length=PREFIX_LENGTH):
+    return hashlib.sha256(request_id.encode("utf-8")).hexdigest()[:length]
+
+
+def _open(path):
+    """Return ``(filesystem, path)`` for an ``s3://`` URI or a local path."""
+    return fs.FileSystem.from_uri(path) if "://" in path else (fs.LocalFileSystem(), path)
+
+
+def _plain_strings(table):
+    """Cast ``string_view`` columns (written by newer delta-rs) to ``string``, which every kernel supports."""
+    schema = pa.schema([field.with_type(pa.string()) if field.type == pa.string_view() else field
+                        for field in table.schema])
+    return table if schema == table.schema else table.cast(schema)
+
+
+class RequestIdIndex:
+    """Sidecar ``request_id`` prefix index of one bronze Delta table."""
+
+    def __init__(self, table_path, index_path=None, prefix_length=PREFIX_LENGTH,
+                 compact_every=COMPACT_EVERY_COMMITS, max_workers=8, s3_client=None, storage_options=None):
+        self.table_path = table_path.rstrip("/")
+        self.index_path = (index_path or f"{self.table_path}/{INDEX_DIR}").rstrip("/")
+        self.prefix_length = prefix_length
+        self.compact_every = compact_every
+        self.max_workers = max_workers
+        self.storage_options = storage_options
+        self.delta_log = DeltaLog(self.table_path, ObjectStorage(s3_client))
+        self._lock = threading.Lock()
+
+    def _index_table(self):
+        from deltalake import DeltaTable
+
+        if not DeltaTable.is_deltatable(self.index_path, storage_options=self.storage_options):
+            return None
+        return DeltaTable(self.index_path, storage_options=self.storage_options)
+
+    def _file_prefixes(self, path):
+        filesystem, file_path = _open(path)
+        request_ids = pq.read_table(file_path, columns=["request_id"], filesystem=filesystem).column("request_id")
+        return {request_id_prefix(request_id, self.prefix_length)
+                for request_id in request_ids.unique().to_pylist() if request_id}
+
+    def _paths_to_index(self, last_version):
+        """Return ``(version, paths)``: the files added since ``last_version``, or every live file."""
+        versions = self.delta_log.commit_versions_after(last_version)
+        if last_version is None or (versions and versions[0] != last_version + 1):
+            logger.info(f"Indexing every live file of {self.table_path} (last indexed version {last_version})")
+            version, live_files = self.delta_log.snapshot()
+            return version, list(live_files)
+        paths = [self.delta_log.absolute_path(action["path"])
+                 for version in versions
+                 for kind, action in self.delta_log.commit_actions(version) if kind == "add"]
+        return (versions[-1] if versions else None), paths
+
+    def update(self):
+        """
+        Index the bronze files added since the last update (the post-commit hook).
+
+        Returns a summary, or None when there was nothing new. Files removed from bronze keep
+        their index rows; ``lookup`` only reads candidates that are still live.
+        """
+        from deltalake import CommitProperties, Transaction, write_deltalake
+
+        with self._lock:
+            index = self._index_table()
+            last_version = index.transaction_version(INDEX_APP_ID) if index else None
+            version, paths = self._paths_to_index(last_version)
+            if version is None or not paths:
+                # Commits without new files (deletes, compaction removes only) are re-read next time
+                return None
+
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(paths)))) as pool:
+                rows = sorted((prefix, path) for path, prefixes in zip(paths, pool.map(self._file_prefixes, paths))
+                              for prefix in prefixes)
+            entries = pa.table({"prefix": [prefix for prefix, _ in rows], "path": [path for _, path in rows]},
+                               schema=INDEX_SCHEMA)
+            write_deltalake(self.index_path, entries, mode="append", storage_options=self.storage_options,
+                            commit_properties=CommitProperties(app_transactions=[Transaction(INDEX_APP_ID, version)]))
+
+            index = self._index_table()
+            if self.compact_every and index.version() and index.version() % self.compact_every == 0:
+                index.optimize.z_order(["prefix"])
+                logger.info(f"Z-ordered request_id index {self.index_path} at version {index.version()}")
+
+        summary = {"version": version, "files": len(paths), "entries": entries.num_rows}
+        logger.info(f"Updated request_id index for {self.table_path}: {summary}")
+        return summary
+
+    def candidate_files(self, request_id):
+        """Bronze files that may hold ``request_id`` (indexed, possibly since removed)."""
+        index = self._index_table()
+        if index is None:
+            return []
+        entries = index.to_pyarrow_table(columns=["path"],
+                                         filters=[("prefix", "=", request_id_prefix(request_id, self.prefix_length))])
+        return sorted(set(entries.column("path").to_pylist()))
+
+    def _partition_values(self, path):
+        relative = path[len(self.table_path) + 1:] if path.startswith(self.table_path + "/") else path
+        return dict(unquote(segment).split("=", 1) for segment in relative.split("/")[:-1] if "=" in segment)
+
+    def lookup(self, request_id, live_only=True):
+        """
+        Return the bronze rows (dicts, partition columns included) whose ``request_id`` matches.
+
+        Only candidate files are read. With ``live_only`` candidates are first checked against
+        the current table version, so files replaced by compaction or deletes are skipped; rows
+        in files added since the last ``update`` are found once it has run.
+        """
+        candidates = self.candidate_files(request_id)
+        if live_only and candidates:
+            _, live_files = self.delta_log.snapshot()
+            candidates = [path for path in candidates if path in live_files]
+
+        rows = []
+        for path in candidates:
+            filesystem, file_path = _open(path)
+            try:
+                table = pq.read_table(file_path, filesystem=filesystem)
+            except FileNotFoundError:
+                continue  # Removed and vacuumed since it was indexed
+            matches = _plain_strings(table).filter(pc.field("request_id") == request_id)
+            partition_values = self._partition_values(path)
+            rows.extend({**row, **partition_values} for row in matches.to_pylist())
+        logger.info(f"request_id {request_id}: {len(rows)} row(s) from {len(candidates)} candidate file(s)")
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up bronze clicks by request_id through the sidecar index")
+    parser.add_argument("table_path", help="Bronze Delta table (s3:// URI or local path)")
+    parser.add_argument("request_id", nargs="?")
+    parser.add_argument("--update", action="store_true", help="Index the files added since the last update")
+    parser.add_argument("--index-path", help=f"Index table (default: <table_path>/{INDEX_DIR})")
+    args = parser.parse_args(argv)
+    if not args.update and not args.request_id:
+        parser.error("give a request_id to look up, or --update")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="[%(asctime)s] %(levelname)s %(filename)s:%(lineno)d %(message)s")
+    s3_client = None
+    if args.table_path.startswith("s3://"):
+        import boto3
+        s3_client = boto3.client("s3")
+    index = RequestIdIndex(args.table_path, index_path=args.index_path, s3_client=s3_client)
+    if args.update:
+        index.update()
+    if args.request_id:
+        for row in index.lookup(args.request_id):
+            print(json.dumps(row, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Mergeable unique-visitor sketches for the gold layer.
+
+``COUNT(DISTINCT visitor)`` cannot be rolled up from daily results, so unique visitors over a
+week or a month used to mean scanning every bronze row in the range. The gold table instead
+holds one HyperLogLog sketch of the visitors of each (page, hour), built with Spark's
+``hll_sketch_agg`` (Apache DataSketches HLL). Sketches of any set of hours merge with
+``hll_union_agg`` into the sketch of their union, so a month of uniques for a page is a merge of
+about 720 small binaries.
+
+Gold table columns: ``page``, ``bucket_start`` (the hour), ``bucket_date`` (partition column),
+``sketch`` (binary), ``events`` and ``unidentified_events``: clicks with neither a ``visitor_id``
+nor a client IP (the default ``GEOIP_RAW_IP=drop`` keeps none), which no sketch counts rather than
+folding every such browser into one visitor per user agent. Every micro-batch appends its own partial sketches; they
+merge like any other rows, and ``compact_partition`` folds a finished day into one row per
+(page, hour). Merging is idempotent for visitors, so a replay that re-appends an hour never
+inflates its uniques (only ``events``).
+
+    from etl.unique_visitors import unique_visitors
+    unique_visitors(spark, "s3://bucket/dev/gold/unique_visitors/", start, end, granularity="week").show()
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from pyspark.sql.functions import (
+    coalesce, col, concat_ws, count, date_trunc, hll_sketch_agg, hll_sketch_estimate, hll_union_agg, lit, sha2,
+    to_date, when,
+)
+from pyspark.sql.functions import sum as sum_
+
+logger = logging.getLogger("unique_visitors")
+logger.setLevel(logging.INFO)
+
+UNIQUE_VISITORS_SINK = "unique_visitors"
+BUCKET = "hour"
+GRANULARITIES = ("hour", "day", "week", "month")
+# 2**12 HLL buckets: about 1.6% relative standard error at under 3 KiB per sketch
+LG_CONFIG_K = 12
+# Stand-in visitor for rows without a visitor_id (clients with storage disabled, older events), used
+# only when the first column is set: a user agent alone would merge every visitor of a browser build
+FALLBACK_VISITOR_COLUMNS = ("client_ip", "userAgent")
+
+
+def visitor_key(df):
+    """
+    Column identifying the visitor of each row: ``visitor_id``, else a hash of the fallback columns.
+
+    Null when the row has no ``visitor_id`` and no ``client_ip``: such clicks cannot be told apart.
+    """
+    fallback = lit(None).cast("string")
+    if FALLBACK_VISITOR_COLUMNS[0] in df.columns:
+        hashed = sha2(concat_ws("\x1f", *[coalesce(col(name).cast("string"), lit(""))
+                                           for name in FALLBACK_VISITOR_COLUMNS if name in df.columns]), 256)
+        fallback = when(col(FALLBACK_VISITOR_COLUMNS[0]).isNotNull(), hashed)
+    if "visitor_id" not in df.columns:
+        return fallback
+    return coalesce(col("visitor_id"), fallback)
+
+
+def unique_visitor_sketches(bronze_df, lg_config_k=LG_CONFIG_K):
+    """One sketch of the visitors of each (page, hour) in ``bronze_df``, in the gold table's layout."""
+    visitor = visitor_key(bronze_df)
+    return (
+        bronze_df
+        .where(col("page").isNotNull() & col("event_ts").isNotNull())
+        .withColumn("bucket_start", date_trunc(BUCKET, col("event_ts")))
+        .groupBy("page", "bucket_start")
+        # The sketch skips null visitors; they are only counted
+        .agg(hll_sketch_agg(visitor, lg_config_k).alias("sketch"), count(lit(1)).alias("events"),
+             count(when(visitor.isNull(), 1)).alias("unidentified_events"))
+        .withColumn("bucket_date", to_date(col("bucket_start")))
+        .select("page", "bucket_start", "bucket_date", "sketch", "events", "unidentified_events")
+    )
+
+
+def compact_sketches(sketch_df):
+    """Fold the partial sketches of each (page, hour) into one."""
+    return (
+        sketch_df
+        .groupBy("page", "bucket_start", "bucket_date")
+        .agg(hll_union_agg("sketch").alias("sketch"), sum_("events").alias("events"),
+             _sum_unidentified_events(sketch_df))
+        .select("page", "bucket_start", "bucket_date", "sketch", "events", "unidentified_events")
+    )
+
+
+def _sum_unidentified_events(sketch_df):
+    # Rows appended before the column existed read it as null
+    if "unidentified_events" not in sketch_df.columns:
+        return lit(0).cast("long").alias("unidentified_events")
+    return coalesce(sum_("unidentified_events"), lit(0)).cast("long").alias("unidentified_events")
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.combine(value, time.min)
+
+
+def merge_unique_visitors(sketch_df, start, end, pages=None, granularity=None, by_page=True):
+    """
+    Estimate unique visitors in ``[start, end)`` by merging sketches.
+
+    Returns one row per page (all pages together with ``by_page=False``) and, with a
+    ``granularity`` of hour/day/week/month, per period: ``unique_visitors``, ``events``, the
+    ``unidentified_events`` left out of ``unique_visitors`` and the number of ``sketches`` merged.
+    ``start``/``end`` are dates or datetimes on hour boundaries.
+    """
+    if granularity is not None and granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}, got {granularity!r}")
+    start, end = _as_datetime(start), _as_datetime(end)
+
+    df = sketch_df.where(
+        # bucket_date first so the partition filter prunes whole days before the hour filter
+        (col("bucket_date") >= lit(start.date())) & (col("bucket_date") <= lit((end - timedelta(microseconds=1)).date()))
+        & (col("bucket_start") >= lit(start)) & (col("bucket_start") < lit(end))
+    )
+    if pages is not None:
+        df = df.where(col("page").isin(list(pages)))
+
+    group_by = (["page"] if by_page else []) + \
+        ([date_trunc(granularity, col("bucket_start")).alias("period_start")] if granularity else [])
+    return df.groupBy(*group_by).agg(
+        hll_sketch_estimate(hll_union_agg("sketch")).alias("unique_visitors"),
+        sum_("events").alias("events"),
+        _sum_unidentified_events(df),
+        count(lit(1)).alias("sketches"),
+    )
+
+
+def read_unique_visitor_sketches(spark, path):
+    return spark.read.format("delta").load(path)
+
+
+def unique_visitors(spark, path, start, end, pages=None, granularity=None, by_page=True):
+    """``merge_unique_visitors`` over the gold Delta table at ``path``."""
+    return merge_unique_visitors(read_unique_visitor_sketches(spark, path), start, end, pages=pages,
+                                 granularity=granularity, by_page=by_page)
+
+
+def compact_partition(spark, path, bucket_date):
+    """Rewrite one finished day of the gold table with a single sketch per (page, hour)."""
+    day = read_unique_visitor_sketches(spark, path).where(col("bucket_date") == lit(bucket_date))
+    (
+        compact_sketches(day).write
+        .format("delta")
+        .mode("overwrite")
+        .option("replaceWhere", f"bucket_date = '{bucket_date.isoformat()}'")
+        .save(path)
+    )
+    logger.info(f"Compacted unique-visitor sketches of {bucket_date} in {path}")
@@ -36,6 +36,7 @@ module "glue" {
   role_arn          = module.iam.glue_job_role_arn
   scripts_bucket    = module.bucket.bucket_name
   script_local_path = "${path.module}/../../etl/glue_stream.py"
+  etl_package_dir   = "${path.module}/../../etl"
 
   stream_name       = module.stream.stream_name
   stream_arn        = module.stream.stream_arn
@@ -105,16 +106,17 @@ module "ingest_api" {
   code_local_path = "${path.module}/../../etl/handlers/click_handler.py"
   code_s3_key     = "${var.project}/${var.environment}/click_handler.zip"
 
-  # Add a source_code_hash parameter that changes when code changes
-  source_code_hash = filebase64sha256("${path.module}/../../etl/handlers/click_handler.py")
-
-  lambda_handler = "click_handler.lambda_handler"
+  lambda_handler = "etl.handlers.click_handler.lambda_handler"
 
   # Schema registry information
   registry_name = module.glue.schema_registry_name
   schema_name   = module.glue.schema_name
 
-  lambda_layers = []
+  # Geo-IP enrichment: the layer built by `python -m etl.handlers.geoip` holds geoip/ranges.bin
+  lambda_layers    = compact([var.geoip_layer_arn])
+  geoip_table_path = var.geoip_layer_arn != "" ? "/opt/geoip/ranges.bin" : ""
+  geoip_raw_ip     = var.geoip_raw_ip
+
   depends_on = [module.bucket, module.stream, module.iam, module.glue, module.lambda_layer]
 
 }
@@ -7,6 +7,28 @@ resource "aws_s3_object" "glue_script" {
   content_type = "text/x-python-script"
 }
 
+# ─── Package the etl modules imported by the script (shared click schema etc.) ────
+data "archive_file" "etl_package" {
+  type        = "zip"
+  output_path = "${path.module}/build/etl_package.zip"
+
+  dynamic "source" {
+    for_each = fileset(var.etl_package_dir, "*.py")
+    content {
+      content  = file("${var.etl_package_dir}/${source.value}")
+      filename = "etl/${source.value}"
+    }
+  }
+}
+
+resource "aws_s3_object" "etl_package" {
+  bucket       = var.scripts_bucket
+  key          = "${var.project}/${var.environment}/etl_package.zip"
+  source       = data.archive_file.etl_package.output_path
+  etag         = data.archive_file.etl_package.output_md5
+  content_type = "application/zip"
+}
+
 # ─── Upload Delta Lake core JAR ────
 resource "aws_s3_object" "delta_core_jar" {
   bucket = var.scripts_bucket
@@ -43,7 +65,8 @@ resource "aws_glue_schema" "click_stream_schema" {
   description     = "Schema for incoming clickstream events."
 
   # Schema definition based on the _define_input_schema() from glue_stream.py
-  # element, page, userAgent, timestamp, ingest_ts, request_id
+  # element, page, userAgent, timestamp, ingest_ts, request_id, event_id, geo_country, geo_region,
+  # referrer_host, client_ip, visitor_id
   schema_definition = jsonencode({
     type = "object",
     properties = {
@@ -52,7 +75,13 @@ resource "aws_glue_schema" "click_stream_schema" {
       userAgent  = { type = "string", description = "User agent string of the client" },
       timestamp  = { type = "string", format = "date-time", description = "Timestamp of the event (ISO 8601 string)" },
       ingest_ts  = { type = "string", format = "date-time", description = "Timestamp when the event was ingested (ISO 8601 string)" },
-      request_id = { type = "string", description = "Unique identifier for the request" }
+      request_id = { type = "string", description = "Unique identifier for the request" },
+      event_id   = { type = "string", description = "Client-generated event identifier, reused when the browser retries" },
+      geo_country   = { type = "string", description = "Country code resolved from the caller IP at ingest" },
+      geo_region    = { type = "string", description = "Region (subdivision) code resolved from the caller IP at ingest" },
+      referrer_host = { type = "string", description = "Host of the request Referer header" },
+      client_ip     = { type = "string", description = "Caller IP truncated to /24 (IPv4) or /48 (IPv6), only when GEOIP_RAW_IP=truncate" },
+      visitor_id    = { type = "string", description = "First-party visitor identifier the browser keeps in localStorage" }
     },
     # Assume all fields are optional as per Python StructField(..., True)
     # If some fields are mandatory, add them to a "required" array:
@@ -66,6 +95,13 @@ resource "aws_glue_schema" "click_stream_schema" {
 }
 
 
+# The request_id index is written with delta-rs, which Glue installs only when the index is on
+locals {
+  request_id_index_arguments = var.enable_request_id_index ? {
+    "--additional-python-modules" = "deltalake==${var.deltalake_version}"
+  } : {}
+}
+
 # 2. Create the Glue streaming job
 resource "aws_glue_job" "click_stream" {
   name     = "${var.project}-stream-${var.environment}"
@@ -78,16 +114,20 @@ resource "aws_glue_job" "click_stream" {
   }
 
   glue_version      = "5.0"
-  worker_type = "G.1X"
-  number_of_workers = 2
+  # Sized with etl/capacity_advisor.py
+  worker_type       = var.worker_type
+  number_of_workers = var.number_of_workers
 
   # Connections for Kinesis
   connections = [var.connection_name]
 
 
-  default_arguments = {
+  default_arguments = merge({
     "--enable-continuous-cloudwatch-log" = "true"
-    "--job-bookmark-option"              = "job-bookmark-enable"
+    # Streaming batch metrics (numRecords, batchProcessingTimeInMs) read by etl/capacity_advisor.py
+    "--enable-metrics"                   = "true"
+    # The Spark checkpoint is the only resume state; bookmarks do not track the Kinesis source
+    "--job-bookmark-option"              = "job-bookmark-disable"
     "--enable-glue-datacatalog"          = "true"
     "--TempDir"                          = "s3://${var.scripts_bucket}/${var.project}/${var.environment}/temp/"
 
@@ -97,9 +137,38 @@ resource "aws_glue_job" "click_stream" {
     "--S3_BRONZE_BUCKET"                 = var.bronze_bucket_name
     "--STREAM_ARN"                       = var.stream_arn
 
+    # Where to start reading when no checkpoint exists (LATEST, TRIM_HORIZON, AT_TIMESTAMP)
+    "--STARTING_POSITION"                = var.starting_position
+
+    # Kinesis read tuning (default, low_latency, throughput) and opt-in enhanced fan-out
+    "--KINESIS_READ_PRESET"              = var.kinesis_read_preset
+    "--ENABLE_EFO"                       = tostring(var.enable_efo)
+
+    # Post-commit hook: symlink manifests and partitions of the Athena bronze table
+    "--ATHENA_DATABASE"                  = aws_glue_catalog_database.clickstream_db.name
+    "--ATHENA_MANIFEST_TABLE"            = aws_glue_catalog_table.bronze_clicks_manifest.name
+
+    # request_id bloom filters on bronze plus the sidecar lookup index (post-commit hook)
+    "--REQUEST_ID_INDEX"                 = tostring(var.enable_request_id_index)
+
+    # Row order and Parquet encoding of bronze files (arrival, sorted)
+    "--WRITE_LAYOUT"                     = var.bronze_write_layout
+
+    # Gold aggregates written from the same micro-batches (s3://<bucket>/<env>/gold/<name>/)
+    "--GOLD_SINKS"                       = join(",", var.gold_sinks)
+
+    # What event_ts becomes when the client clock is skewed (client, clamp, server)
+    "--EVENT_TIME_POLICY"                = var.event_time_policy
+
+    # Funnel step counts from bronze read as a Delta stream (JSON, see etl/funnels.py)
+    "--FUNNELS"                          = var.funnels
+
     # Delta Lake support
     "--datalake-formats"                 = "delta"
 
+    # etl package (etl.click_schema, ...) imported by the script
+    "--extra-py-files"                   = "s3://${var.scripts_bucket}/${aws_s3_object.etl_package.key}"
+
     # S3A credentials provider
     "--conf"                             = "spark.hadoop.fs.s3a.aws.credentials.provider=com.amazonaws.auth.DefaultAWSCredentialsProviderChain"
 
@@ -120,7 +189,60 @@ resource "aws_glue_job" "click_stream" {
     "--glue.schemaRegistry.region"       = var.region
     "--glue.schemaRegistry.dataFormat"   = "JSON"
 
+  }, local.request_id_index_arguments)
+  execution_property {
+    max_concurrent_runs = 1
+  }
+}
+
+# 3. Batch replay job (same script; runs when --REPLAY_SHARD_RANGES or --REPLAY_FROM_TIMESTAMP is passed)
+#    aws glue start-job-run --job-name <name> \
+#      --arguments '{"--REPLAY_FROM_TIMESTAMP":"2024-05-01T13:00:00Z","--REPLAY_TO_TIMESTAMP":"2024-05-01T14:00:00Z"}'
+#    With --BACKFILL_SOURCE it loads NDJSON/gzip click dumps from a landing prefix instead:
+#      --arguments '{"--BACKFILL_SOURCE":"s3://<bucket>/<env>/landing/clicks/"}'
+resource "aws_glue_job" "click_replay" {
+  name     = "${var.project}-replay-${var.environment}"
+  role_arn = var.role_arn
+
+  command {
+    name            = "glueetl"
+    python_version  = "3"
+    script_location = "s3://${var.scripts_bucket}/${aws_s3_object.glue_script.key}"
   }
+
+  glue_version      = "5.0"
+  worker_type       = "G.1X"
+  number_of_workers = 2
+
+  connections = [var.connection_name]
+
+  default_arguments = merge({
+    "--enable-continuous-cloudwatch-log" = "true"
+    "--job-bookmark-option"              = "job-bookmark-disable"
+    "--TempDir"                          = "s3://${var.scripts_bucket}/${var.project}/${var.environment}/temp/"
+
+    "--STREAM_NAME"                      = var.stream_name
+    "--AWS_REGION"                       = var.region
+    "--ENVIRONMENT"                      = var.environment
+    "--S3_BRONZE_BUCKET"                 = var.bronze_bucket_name
+    "--STREAM_ARN"                       = var.stream_arn
+
+    "--datalake-formats"                 = "delta"
+    "--extra-py-files"                   = "s3://${var.scripts_bucket}/${aws_s3_object.etl_package.key}"
+
+    "--ATHENA_DATABASE"                  = aws_glue_catalog_database.clickstream_db.name
+    "--ATHENA_MANIFEST_TABLE"            = aws_glue_catalog_table.bronze_clicks_manifest.name
+    "--REQUEST_ID_INDEX"                 = tostring(var.enable_request_id_index)
+    "--WRITE_LAYOUT"                     = var.bronze_write_layout
+    "--GOLD_SINKS"                       = join(",", var.gold_sinks)
+    "--EVENT_TIME_POLICY"                = var.event_time_policy
+
+    "--glue.schemaRegistry.registryName" = "${var.project}-${var.environment}-registry"
+    "--glue.schemaRegistry.schemaName"   = "${var.project}-clickstream-schema-${var.environment}"
+    "--glue.schemaRegistry.region"       = var.region
+    "--glue.schemaRegistry.dataFormat"   = "JSON"
+  }, local.request_id_index_arguments)
+
   execution_property {
     max_concurrent_runs = 1
   }
@@ -181,6 +303,108 @@ resource "aws_glue_catalog_table" "clickstream_table" {
 
 }
 
+# Athena view of the bronze Delta table through its symlink manifests. The streaming and
+# replay jobs keep the manifests and partitions current (etl/athena_manifest.py).
+resource "aws_glue_catalog_table" "bronze_clicks_manifest" {
+  name          = "${var.project}_bronze_clicks_${var.environment}"
+  database_name = aws_glue_catalog_database.clickstream_db.name
+
+  table_type = "EXTERNAL_TABLE"
+
+  parameters = {
+    "EXTERNAL"       = "TRUE"
+    "classification" = "parquet"
+  }
+
+  partition_keys {
+    name = "event_date"
+    type = "date"
+  }
+
+  storage_descriptor {
+    location      = "s3://${var.bronze_bucket_name}/${var.environment}/bronze/clicks/_symlink_format_manifest/"
+    input_format  = "org.apache.hadoop.hive.ql.io.SymlinkTextInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+
+    ser_de_info {
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "element"
+      type = "string"
+    }
+    columns {
+      name = "page"
+      type = "string"
+    }
+    columns {
+      name = "userAgent"
+      type = "string"
+    }
+    columns {
+      name = "ingest_ts"
+      type = "string"
+    }
+    columns {
+      name = "request_id"
+      type = "string"
+    }
+    columns {
+      name = "event_id"
+      type = "string"
+    }
+    columns {
+      name = "geo_country"
+      type = "string"
+    }
+    columns {
+      name = "geo_region"
+      type = "string"
+    }
+    columns {
+      name = "referrer_host"
+      type = "string"
+    }
+    columns {
+      name = "client_ip"
+      type = "string"
+    }
+    columns {
+      name = "visitor_id"
+      type = "string"
+    }
+    columns {
+      name = "timestamp"
+      type = "string"
+    }
+    columns {
+      name = "shard_id"
+      type = "string"
+    }
+    columns {
+      name = "partition_key"
+      type = "string"
+    }
+    columns {
+      name = "sequence_number"
+      type = "string"
+    }
+    columns {
+      name = "clock_skew_seconds"
+      type = "bigint"
+    }
+    columns {
+      name = "event_time_source"
+      type = "string"
+    }
+    columns {
+      name = "event_ts"
+      type = "timestamp"
+    }
+  }
+}
+
 # Null resource for cleanup
 resource "null_resource" "glue_job_cleanup" {
   triggers = {
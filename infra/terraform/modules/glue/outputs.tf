@@ -2,6 +2,11 @@ output "glue_job_name" {
   value = aws_glue_job.click_stream.name
 }
 
+output "replay_job_name" {
+  value       = aws_glue_job.click_replay.name
+  description = "Name of the batch Glue job used to replay a Kinesis shard/sequence or timestamp range"
+}
+
 output "glue_script_s3_path" {
   value = aws_s3_object.glue_script.id
   description = "S3 path to the Glue script"
@@ -16,3 +21,8 @@ output "schema_name" {
   value = "${var.project}-clickstream-schema-${var.environment}"
   description = "Name of the created Glue Schema"
 }
+
+output "athena_bronze_table_name" {
+  value       = aws_glue_catalog_table.bronze_clicks_manifest.name
+  description = "Glue Catalog table Athena queries bronze through (symlink manifests)"
+}
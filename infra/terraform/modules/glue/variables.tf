@@ -24,6 +24,11 @@ variable "script_local_path" {
   description = "Local path to the Glue script"
 }
 
+variable "etl_package_dir" {
+  type        = string
+  description = "Local path to the etl package shipped to the job via --extra-py-files"
+}
+
 variable "stream_name" {
   type        = string
   description = "Name of the Kinesis stream to process"
@@ -72,6 +77,112 @@ variable "default_arguments" {
   default     = {}
 }
 
+variable "starting_position" {
+  description = "Kinesis position used only when the streaming checkpoint has no offsets (LATEST, TRIM_HORIZON or AT_TIMESTAMP)"
+  type        = string
+  default     = "TRIM_HORIZON"
+
+  validation {
+    condition     = contains(["LATEST", "TRIM_HORIZON", "AT_TIMESTAMP"], var.starting_position)
+    error_message = "starting_position must be LATEST, TRIM_HORIZON or AT_TIMESTAMP."
+  }
+}
+
+variable "kinesis_read_preset" {
+  description = "Kinesis connector tuning preset for the streaming job (default, low_latency or throughput)"
+  type        = string
+  default     = "default"
+
+  validation {
+    condition     = contains(["default", "low_latency", "throughput"], var.kinesis_read_preset)
+    error_message = "kinesis_read_preset must be default, low_latency or throughput."
+  }
+}
+
+variable "enable_efo" {
+  description = "Register an enhanced fan-out consumer for the streaming job and deregister it on exit"
+  type        = bool
+  default     = false
+}
+
+variable "worker_type" {
+  description = "Worker type of the streaming job"
+  type        = string
+  default     = "G.1X"
+
+  validation {
+    condition     = contains(["G.025X", "G.1X", "G.2X", "G.4X", "G.8X"], var.worker_type)
+    error_message = "worker_type must be one of G.025X, G.1X, G.2X, G.4X, G.8X."
+  }
+}
+
+variable "number_of_workers" {
+  description = "Workers of the streaming job, driver included; see etl/capacity_advisor.py for a recommendation"
+  type        = number
+  default     = 2
+
+  validation {
+    condition     = var.number_of_workers >= 2 && floor(var.number_of_workers) == var.number_of_workers
+    error_message = "number_of_workers must be a whole number of at least 2."
+  }
+}
+
+variable "bronze_write_layout" {
+  description = "Bronze file layout: arrival (arrival order, snappy) or sorted (page/element/event_ts order, zstd, dictionary encoded)"
+  type        = string
+  default     = "arrival"
+
+  validation {
+    condition     = contains(["arrival", "sorted"], var.bronze_write_layout)
+    error_message = "bronze_write_layout must be arrival or sorted."
+  }
+}
+
+variable "gold_sinks" {
+  description = "Gold aggregates the jobs maintain alongside bronze: any of unique_visitors, trending"
+  type        = list(string)
+  default     = []
+
+  validation {
+    condition     = alltrue([for sink in var.gold_sinks : contains(["unique_visitors", "trending"], sink)])
+    error_message = "gold_sinks may only contain unique_visitors and trending."
+  }
+}
+
+variable "event_time_policy" {
+  description = "What event_ts becomes when the client clock disagrees with the server beyond the allowed skew: clamp (to the allowed bound), server, or client (keep, flagged)"
+  type        = string
+  default     = "clamp"
+
+  validation {
+    condition     = contains(["client", "clamp", "server"], var.event_time_policy)
+    error_message = "event_time_policy must be one of client, clamp, server."
+  }
+}
+
+variable "funnels" {
+  description = "Funnels the streaming job tracks, as the JSON list described in etl/funnels.py; empty for none"
+  type        = string
+  default     = ""
+
+  validation {
+    condition     = var.funnels == "" || can(tolist(jsondecode(var.funnels)))
+    error_message = "funnels must be empty or a JSON list of funnels."
+  }
+}
+
+variable "enable_request_id_index" {
+  description = "Write request_id bloom filters on bronze and maintain the sidecar request_id lookup index"
+  type        = bool
+  default     = false
+}
+
+variable "deltalake_version" {
+  description = "deltalake (delta-rs) version installed on the Glue jobs when the request_id index is enabled"
+  type        = string
+  default     = "1.6.6"
+}
+
 variable "delta_jar_source_path" {
   description = "Local path to the Delta Lake core JAR file"
   type        = string
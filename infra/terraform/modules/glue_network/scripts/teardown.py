@@ -0,0 +1,233 @@
+"""
+Shared boto3 teardown helpers for the glue_network destroy-time provisioners.
+
+``terraform destroy`` runs cleanup_vpc_endpoints.py and cleanup_vpc_enis.py to remove what
+blocks the VPC from being deleted: interface endpoints and the ENIs Glue leaves behind. Both
+use this module instead of shelling out to the ``aws`` CLI:
+
+* describes are batched (up to DESCRIBE_BATCH_SIZE IDs per filter, all pages followed), so
+  the state of every endpoint or ENI is one call rather than one per resource;
+* ENIs are detached and deleted concurrently on a thread pool;
+* progress is polled with exponential backoff (``wait_until``) instead of fixed sleeps, so a
+  resource that is already gone costs no waiting at all.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger("teardown")
+
+# Values accepted per filter by the EC2 describe calls
+DESCRIBE_BATCH_SIZE = 200
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT_SECONDS = 300
+
+NOT_FOUND_ERROR_CODES = {
+    "InvalidNetworkInterfaceID.NotFound",
+    "InvalidVpcEndpointId.NotFound",
+    "InvalidAttachmentID.NotFound",
+}
+# Returned while an ENI is still attached or detaching
+ENI_IN_USE_ERROR_CODES = {"InvalidNetworkInterface.InUse", "InvalidParameterValue"}
+# ENIs owned by another AWS service; they are released by their owner and cannot be detached
+SERVICE_MANAGED_INTERFACE_TYPES = {
+    "vpc_endpoint",
+    "nat_gateway",
+    "gateway_load_balancer_endpoint",
+    "network_load_balancer",
+    "transit_gateway",
+    "lambda",
+}
+
+
+def ec2_client(region, max_workers=DEFAULT_MAX_WORKERS):
+    """EC2 client sized for ``max_workers`` threads, with adaptive retries for API throttling."""
+    return boto3.client("ec2", region_name=region, config=Config(
+        retries={"mode": "adaptive", "max_attempts": 10},
+        max_pool_connections=max(10, max_workers),
+    ))
+
+
+def wait_until(check, timeout=DEFAULT_TIMEOUT_SECONDS, initial_delay=1.0, max_delay=15.0,
+               sleep=time.sleep, clock=time.monotonic):
+    """
+    Call ``check`` until it returns a truthy value or ``timeout`` seconds have passed.
+
+    The delay between calls doubles from ``initial_delay`` up to ``max_delay`` (the way
+    botocore waiters back off) and never overshoots the deadline. Returns the last result.
+    """
+    deadline = clock() + timeout
+    delay = initial_delay
+    while True:
+        result = check()
+        remaining = deadline - clock()
+        if result or remaining <= 0:
+            return result
+        sleep(min(delay, remaining))
+        delay = min(max_delay, delay * 2)
+
+
+def _error_code(err):
+    return err.response.get("Error", {}).get("Code")
+
+
+def _batches(values):
+    values = list(values)
+    for start in range(0, len(values), DESCRIBE_BATCH_SIZE):
+        yield values[start:start + DESCRIBE_BATCH_SIZE]
+
+
+def describe_network_interfaces(ec2, filter_name, values):
+    """Return the ENIs whose ``filter_name`` matches any of ``values``; missing IDs are simply absent."""
+    paginator = ec2.get_paginator("describe_network_interfaces")
+    interfaces = []
+    for batch in _batches(values):
+        for page in paginator.paginate(Filters=[{"Name": filter_name, "Values": batch}]):
+            interfaces.extend(page.get("NetworkInterfaces", []))
+    return interfaces
+
+
+def describe_vpc_endpoints(ec2, endpoint_ids):
+    """Return the endpoints among ``endpoint_ids`` that still exist and are not yet deleted."""
+    paginator = ec2.get_paginator("describe_vpc_endpoints")
+    endpoints = []
+    for batch in _batches(endpoint_ids):
+        for page in paginator.paginate(Filters=[{"Name": "vpc-endpoint-id", "Values": batch}]):
+            endpoints.extend(endpoint for endpoint in page.get("VpcEndpoints", [])
+                             if endpoint.get("State", "").lower() != "deleted")
+    return endpoints
+
+
+def is_service_managed(interface):
+    return interface.get("RequesterManaged") or interface.get("InterfaceType") in SERVICE_MANAGED_INTERFACE_TYPES
+
+
+def delete_network_interface(ec2, interface, timeout=DEFAULT_TIMEOUT_SECONDS, sleep=time.sleep,
+                             clock=time.monotonic):
+    """
+    Detach (if attached) and delete one ENI; returns True once it is gone.
+
+    A forced detach takes a few seconds to settle, so the delete itself is the poll: it is
+    retried with backoff while EC2 still reports the ENI in use.
+    """
+    eni_id = interface["NetworkInterfaceId"]
+    attachment = interface.get("Attachment") or {}
+    if attachment.get("AttachmentId") and attachment.get("Status") != "detached":
+        logger.info(f"Detaching ENI {eni_id} (attachment: {attachment['AttachmentId']})")
+        try:
+            ec2.detach_network_interface(AttachmentId=attachment["AttachmentId"], Force=True)
+        except ClientError as err:
+            if _error_code(err) not in NOT_FOUND_ERROR_CODES:
+                raise
+
+    def try_delete():
+        try:
+            ec2.delete_network_interface(NetworkInterfaceId=eni_id)
+        except ClientError as err:
+            if _error_code(err) in NOT_FOUND_ERROR_CODES:
+                return True
+            if _error_code(err) in ENI_IN_USE_ERROR_CODES:
+                return False
+            raise
+        return True
+
+    deleted = wait_until(try_delete, timeout=timeout, sleep=sleep, clock=clock)
+    if deleted:
+        logger.info(f"Deleted ENI {eni_id}")
+    else:
+        logger.warning(f"ENI {eni_id} still in use after {timeout}s")
+    return deleted
+
+
+def delete_network_interfaces(ec2, interfaces, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT_SECONDS,
+                              skip_service_managed=True, sleep=time.sleep, clock=time.monotonic):
+    """
+    Delete ENIs concurrently; returns ``(deleted_ids, failed_ids)``.
+
+    Service-managed ENIs are skipped unless ``skip_service_managed`` is False. A failure on
+    one ENI is logged and never stops the others.
+    """
+    targets = []
+    for interface in interfaces:
+        if skip_service_managed and is_service_managed(interface):
+            logger.info(f"Skipping service-managed ENI {interface['NetworkInterfaceId']} "
+                        f"({interface.get('InterfaceType')}), released by its owner")
+        else:
+            targets.append(interface)
+
+    def delete(interface):
+        try:
+            return delete_network_interface(ec2, interface, timeout=timeout, sleep=sleep, clock=clock)
+        except ClientError as err:
+            logger.error(f"Could not delete ENI {interface['NetworkInterfaceId']}: {err}")
+            return False
+
+    deleted, failed = [], []
+    if not targets:
+        return deleted, failed
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        for interface, ok in zip(targets, pool.map(delete, targets)):
+            (deleted if ok else failed).append(interface["NetworkInterfaceId"])
+    return deleted, failed
+
+
+def _request_endpoint_deletion(ec2, endpoint_ids):
+    try:
+        response = ec2.delete_vpc_endpoints(VpcEndpointIds=list(endpoint_ids))
+    except ClientError as err:
+        logger.error(f"DeleteVpcEndpoints failed: {err}")
+        return
+    for item in response.get("Unsuccessful", []):
+        error = item.get("Error", {})
+        if error.get("Code") not in NOT_FOUND_ERROR_CODES:
+            logger.warning(f"Endpoint {item.get('ResourceId')} not deleted: {error.get('Message')}")
+
+
+def cleanup_vpc_endpoints(ec2, endpoint_ids, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT_SECONDS,
+                          sleep=time.sleep, clock=time.monotonic):
+    """
+    Delete VPC endpoints and wait for them to disappear; returns the IDs still present.
+
+    All endpoints are deleted in one call and polled together. Endpoints still present when
+    ``timeout`` runs out have their ENIs detached and deleted, then get one more delete and wait.
+    """
+    endpoint_ids = [endpoint_id.strip() for endpoint_id in endpoint_ids if endpoint_id and endpoint_id.strip()]
+    if not endpoint_ids:
+        return []
+    remaining = list(endpoint_ids)
+
+    def all_deleted():
+        remaining[:] = [endpoint["VpcEndpointId"] for endpoint in describe_vpc_endpoints(ec2, remaining)]
+        return not remaining
+
+    logger.info(f"Deleting VPC endpoints: {', '.join(endpoint_ids)}")
+    _request_endpoint_deletion(ec2, endpoint_ids)
+    if wait_until(all_deleted, timeout=timeout, sleep=sleep, clock=clock):
+        logger.info("VPC endpoints deleted")
+        return []
+
+    logger.warning(f"VPC endpoints still present, cleaning up their ENIs: {', '.join(remaining)}")
+    interfaces = describe_network_interfaces(ec2, "vpc-endpoint-id", remaining)
+    delete_network_interfaces(ec2, interfaces, max_workers=max_workers, timeout=timeout,
+                              skip_service_managed=False, sleep=sleep, clock=clock)
+    _request_endpoint_deletion(ec2, remaining)
+    if not wait_until(all_deleted, timeout=timeout, sleep=sleep, clock=clock):
+        logger.error(f"VPC endpoints could not be deleted: {', '.join(remaining)}")
+    return list(remaining)
+
+
+def cleanup_vpc_network_interfaces(ec2, vpc_id, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT_SECONDS,
+                                   sleep=time.sleep, clock=time.monotonic):
+    """Delete the lingering (e.g. Glue connection) ENIs of a VPC; returns ``(deleted_ids, failed_ids)``."""
+    interfaces = describe_network_interfaces(ec2, "vpc-id", [vpc_id])
+    logger.info(f"Found {len(interfaces)} ENIs in {vpc_id}")
+    return delete_network_interfaces(ec2, interfaces, max_workers=max_workers, timeout=timeout,
+                                     sleep=sleep, clock=clock)
+
+
+def configure_logging():
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s %(name)s: %(message)s")
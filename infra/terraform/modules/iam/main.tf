@@ -26,6 +26,17 @@ data "aws_iam_policy_document" "glue_policy" {
     ]
     resources = [var.stream_arn]
   }
+  statement {
+    sid = "EnhancedFanOutConsumer"
+    actions = [
+      "kinesis:DescribeStreamSummary",
+      "kinesis:RegisterStreamConsumer",
+      "kinesis:DescribeStreamConsumer",
+      "kinesis:DeregisterStreamConsumer",
+      "kinesis:SubscribeToShard"
+    ]
+    resources = [var.stream_arn, "${var.stream_arn}/consumer/*"]
+  }
   statement {
     sid       = "WriteToS3"
     actions   = ["s3:PutObject", "s3:PutObjectAcl"]
@@ -147,7 +158,8 @@ data "aws_iam_policy_document" "lambda_assume" {
 data "aws_iam_policy_document" "lambda_policy" {
   statement {
     sid       = "WriteToKinesis"
-    actions   = ["kinesis:PutRecord"]
+    # PutRecords: spill buffer drain, ListShards: shard-aware throttling
+    actions   = ["kinesis:PutRecord", "kinesis:PutRecords", "kinesis:ListShards"]
     resources = [var.stream_arn]
   }
   statement {
@@ -1,14 +1,19 @@
 locals {
   # infra/terraform ──↑
-  #                ../..  → realtime-clickstream-lakehouse/etl/handlers
-  handler_src = "${path.root}/../../etl/handlers/click_handler.py"
+  #                ../..  → realtime-clickstream-lakehouse/etl
+  etl_dir = "${path.root}/../../etl"
+  # The handlers package plus the shared click schema it validates against
+  handler_files = concat(
+    ["__init__.py", "click_schema.py"],
+    [for f in sort(fileset("${local.etl_dir}/handlers", "*.py")) : "handlers/${f}"]
+  )
 
 
   # location to write the ZIP
   zip_path    = "${path.module}/build/click_handler.zip"
 
-  # Calculate hash of the source file
-  source_hash = filebase64sha256(local.handler_src)
+  # Calculate hash of the handler package (click_handler.py and the modules it imports)
+  source_hash = base64sha256(join("", [for f in local.handler_files : filesha256("${local.etl_dir}/${f}")]))
 
 }
 
@@ -18,27 +23,21 @@ resource "local_file" "ensure_build_dir" {
   content  = "This file ensures the build directory exists"
 }
 
-# Create a copy of the source file with the correct name for Lambda
-# Also create a copy with a hash in the name to force archive_file to refresh
-resource "local_file" "source_file_copy" {
-  filename = "${path.module}/tmp/click_handler.py"
-  content  = file(local.handler_src)
-
-  # Create the tmp directory if it doesn't exist
-  provisioner "local-exec" {
-    # Use Python script for cross-platform compatibility
-    # Use relative path without quotes to avoid Windows path issues
-    command = "${var.python_command} ${path.root}\\scripts\\create_directory.py ${path.module}\\tmp"
-  }
-}
-
-# Create the Lambda handler ZIP package - Zip up handler directory
+# Create the Lambda handler ZIP package - files keep their etl/ package paths so click_handler can
+# import its sibling modules and etl.click_schema (handler: etl.handlers.click_handler.lambda_handler)
 data "archive_file" "handler_zip" {
   type        = "zip"
-  source_file = local_file.source_file_copy.filename
   output_path = local.zip_path
 
-  depends_on = [local_file.ensure_build_dir, local_file.source_file_copy]
+  dynamic "source" {
+    for_each = local.handler_files
+    content {
+      content  = file("${local.etl_dir}/${source.value}")
+      filename = "etl/${source.value}"
+    }
+  }
+
+  depends_on = [local_file.ensure_build_dir]
 
 }
 
@@ -88,8 +87,13 @@ resource "aws_lambda_function" "ingest" {
 
   environment {
     variables = {
-      STREAM_NAME = var.stream_name
-      REGION      = var.region
+      STREAM_NAME           = var.stream_name
+      REGION                = var.region
+      EVENT_LOG_SAMPLE_RATE = tostring(var.event_log_sample_rate)
+      SPILL_DIR             = var.spill_dir
+      SPILL_MAX_RECORDS     = tostring(var.spill_max_records)
+      GEOIP_TABLE_PATH      = var.geoip_table_path
+      GEOIP_RAW_IP          = var.geoip_raw_ip
     }
   }
 
@@ -285,7 +289,7 @@ resource "aws_ecr_repository" "lambda_repo" {
 # resource "null_resource" "build_lambda_image" {
 #   # Rebuild when handler or Dockerfile changes
 #   triggers = {
-#     handler_hash    = filebase64sha256(var.code_local_path)
+#     handler_hash    = local.source_hash
 #     dockerfile_hash = filebase64sha256("${path.module}/Dockerfile")
 #   }
 #
@@ -296,9 +300,9 @@ resource "aws_ecr_repository" "lambda_repo" {
 #     command = <<-EOT
 #       # Set the build context to the project root directory
 #
-#       mkdir -p "${path.module}/tmp"
-#       cp "${local.handler_src}" \
-#          "${path.module}/tmp/click_handler.py"
+#       mkdir -p "${path.module}/tmp/etl/handlers"
+#       cp "${local.etl_dir}/__init__.py" "${local.etl_dir}/click_schema.py" "${path.module}/tmp/etl/"
+#       cp "${local.etl_dir}"/handlers/*.py "${path.module}/tmp/etl/handlers/"
 #
 #       # Build image
 #       docker build -t ${var.project}-ingest-${var.environment} \
@@ -40,10 +40,41 @@ variable "code_s3_key" {
 
 variable "lambda_handler" {
   type        = string
-  default     = "click_handler.lambda_handler"
+  default     = "etl.handlers.click_handler.lambda_handler"
   description = "Lambda handler"
 }
 
+variable "event_log_sample_rate" {
+  type        = number
+  default     = 0.01
+  description = "Fraction of invocations that log the request body (metrics are emitted for every invocation)"
+  validation {
+    condition     = var.event_log_sample_rate >= 0 && var.event_log_sample_rate <= 1
+    error_message = "event_log_sample_rate must be between 0 and 1."
+  }
+}
+
+variable "spill_dir" {
+  type        = string
+  default     = ""
+  description = <<-EOT
+    Local directory where clicks that Kinesis keeps rejecting are spilled for later re-send (empty, the default,
+    disables spilling). Spilled clicks are answered 202 and the client stops retrying them, but the Lambda's /tmp
+    is lost when its container is reclaimed, so they are only as durable as the container; without spilling the
+    client gets a 429 with Retry-After and keeps the click.
+  EOT
+}
+
+variable "spill_max_records" {
+  type        = number
+  default     = 100
+  description = "Clicks a container holds in its spill before throttled writes get a 429 again, bounding what a lost container can take with it"
+  validation {
+    condition     = var.spill_max_records >= 1
+    error_message = "spill_max_records must be at least 1."
+  }
+}
+
 variable "lambda_runtime" {
   type        = string
   default     = "python3.12"
@@ -88,3 +119,19 @@ variable "python_command" {
   type        = string
   default     = "python"
 }
+
+variable "geoip_table_path" {
+  type        = string
+  default     = ""
+  description = "Path of the geo-IP range table inside the Lambda (e.g. /opt/geoip/ranges.bin from a layer); empty disables geo enrichment"
+}
+
+variable "geoip_raw_ip" {
+  type        = string
+  default     = "drop"
+  description = "What happens to the caller IP after the geo lookup: drop it, or truncate it to /24 (IPv4) or /48 (IPv6) and keep it"
+  validation {
+    condition     = contains(["drop", "truncate"], var.geoip_raw_ip)
+    error_message = "geoip_raw_ip must be \"drop\" or \"truncate\"."
+  }
+}
@@ -1,10 +1,14 @@
 resource "aws_kinesis_stream" "this" {
   name             = "${var.project}-click-${var.environment}"
-  shard_count      = 5
+  shard_count      = var.shard_count
   retention_period = 48
   tags = {
     Project     = var.project
     Environment = var.environment
   }
-}
 
+  lifecycle {
+    # Resharded with UpdateShardCount by etl/capacity_advisor.py --apply; shard_count is the initial size
+    ignore_changes = [shard_count]
+  }
+}
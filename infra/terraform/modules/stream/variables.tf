@@ -1,2 +1,8 @@
 variable "project" { type = string }
 variable "environment" { type = string }
+
+variable "shard_count" {
+  description = "Shards the stream is created with; later changes come from UpdateShardCount (etl/capacity_advisor.py)"
+  type        = number
+  default     = 5
+}
@@ -3,27 +3,41 @@
 Lambda Layer Builder Script for AWS Glue Schema Registry
 
 This script builds a Lambda layer containing the AWS Glue Schema Registry client
-and its dependencies. It can build the layer in two ways:
+and its dependencies. Builds are content-addressed: the layer is cached under a
+key derived from the requirement set, the target Python version and the target
+platform tag, so an unchanged requirement set returns the cached zip at once.
+On a cache miss the layer is built in one of three ways:
 
-1. Using Docker (preferred): Builds the layer in a container using the official
-   AWS Lambda Python 3.12 runtime image. This ensures binary compatibility with
-   the Lambda environment, which is critical for packages with C extensions like
-   orjson.
+1. From the local wheel cache (preferred): pip downloads manylinux wheels for the
+   Lambda runtime (Python 3.12, x86_64) into the cache once, then installs them
+   offline with --platform/--only-binary. This gives binary compatibility with the
+   Lambda environment without Docker, even on macOS or Windows.
 
-2. Locally (fallback): Builds the layer on the local machine. This may result in
+2. Using Docker: Builds the layer in a container using the official AWS Lambda
+   Python 3.12 runtime image, for requirements that ship no compatible wheel.
+
+3. Locally (fallback): Builds the layer on the local machine. This may result in
    compatibility issues if the local environment differs from the Lambda runtime
-   environment (e.g., Windows vs. Linux).
+   environment (e.g., Windows vs. Linux), so the result is not cached.
 
-The script automatically detects if Docker is available and uses it if possible.
+The zip is deterministic (sorted entries, fixed timestamps and permissions), so
+rebuilding the same requirement set produces byte-identical output and Terraform
+hashes stay stable.
 """
+import argparse
+import fnmatch
+import hashlib
+import json
 import logging
 import os
 import platform
 import shutil
+import statistics
 import subprocess
 import sys
 import tempfile
 import time
+import zipfile
 from pathlib import Path
 
 logger = logging.getLogger()
@@ -38,6 +52,270 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+LAYER_ZIP_NAME = "schema-registry-layer.zip"
+
+# Everything that determines the layer contents; any change gives a new cache key
+LAYER_REQUIREMENTS = [
+    "aws-glue-schema-registry==1.1.3",  # Main package for schema registry with specific version
+    "boto3>=1.17.102",  # Required dependency
+    "fastavro>=1.4.5",  # Required dependency
+    "fastjsonschema~=2.15",  # Required dependency
+    "orjson==3.10.18",  # Required dependency with specific version
+]
+LAMBDA_PYTHON_VERSION = "3.12"
+LAMBDA_PLATFORM_TAG = "manylinux2014_x86_64"
+# Bump when the way the layer is assembled changes without the inputs above changing
+LAYER_FORMAT_VERSION = 2
+
+# Post-processing: files the Lambda runtime never reads are pruned, and bytecode is compiled
+# as if it lived where Lambda extracts the layer
+PRUNE_DIR_PATTERNS = ("*.dist-info", "__pycache__", "tests", "test")
+PRUNE_FILE_PATTERNS = ("*.pyi", "py.typed", "*.pyx", "*.pxd", "*.c", "*.h")
+LAYER_RUNTIME_PATH = "/opt/python"
+# Modules the ingest Lambda imports from the layer; used for the import smoke test and timing
+LAYER_IMPORTS = ["aws_schema_registry", "boto3", "fastavro", "fastjsonschema", "orjson", "orjson.orjson"]
+
+# Fixed timestamp (the earliest a zip can hold) for every entry of a deterministic zip
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+DEFAULT_CACHE_DIR = os.environ.get("LAYER_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "clickstream-lambda-layers"))
+
+
+def layer_cache_key(requirements=None, python_version=LAMBDA_PYTHON_VERSION, platform_tag=LAMBDA_PLATFORM_TAG):
+    """
+    Return the content address of a layer build.
+
+    The key is a SHA-256 over the sorted requirement set, the target Python version,
+    the target platform tag and LAYER_FORMAT_VERSION.
+    """
+    key_material = json.dumps({
+        "requirements": sorted(requirements or LAYER_REQUIREMENTS),
+        "python_version": python_version,
+        "platform_tag": platform_tag,
+        "format_version": LAYER_FORMAT_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def write_deterministic_zip(source_dir, output_path):
+    """
+    Zip ``source_dir`` so the same files always produce the same bytes.
+
+    Entries are sorted, every timestamp is ZIP_EPOCH and permissions are normalised to
+    0644 (0755 for executables). The zip is written to a temporary file and moved into
+    place, so a crashed build never leaves a truncated zip behind.
+    """
+    paths = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in files:
+            paths.append(os.path.join(root, name))
+    paths.sort(key=lambda path: os.path.relpath(path, source_dir).replace(os.sep, "/"))
+
+    temp_path = f"{output_path}.tmp"
+    with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in paths:
+            info = zipfile.ZipInfo(os.path.relpath(path, source_dir).replace(os.sep, "/"), date_time=ZIP_EPOCH)
+            mode = 0o755 if os.stat(path).st_mode & 0o111 else 0o644
+            info.external_attr = (0o100000 | mode) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as f:
+                archive.writestr(info, f.read())
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def publish_layer_zip(cached_zip, output_path):
+    """
+    Copy a cached layer to ``output_path`` unless an identical file is already there.
+
+    Leaving an up-to-date output untouched keeps its mtime, so nothing downstream
+    sees a change.
+    """
+    if os.path.exists(output_path) and _file_sha256(output_path) == _file_sha256(cached_zip):
+        logger.info(f"{output_path} is already up to date")
+        return output_path
+    shutil.copyfile(cached_zip, f"{output_path}.tmp")
+    os.replace(f"{output_path}.tmp", output_path)
+    logger.info(f"Lambda layer written to: {output_path}")
+    return output_path
+
+
+def _pip_command():
+    """Return the pip invocation for this environment (pip module first, then pip on PATH)."""
+    import importlib.util
+    if importlib.util.find_spec("pip") is not None:
+        return [sys.executable, "-m", "pip"]
+    pip_cmd = "pip3" if sys.platform != "win32" else "pip"
+    if shutil.which(pip_cmd):
+        return [pip_cmd]
+    python_cmd = "python3" if sys.platform != "win32" else "python"
+    return [python_cmd, "-m", "pip"]
+
+
+def directory_size(path):
+    """Total size in bytes of the files under ``path``."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def measure_import_time(python_packages_dir, modules=None, runs=5):
+    """
+    Return the median seconds a fresh interpreter takes to import the layer modules, or None.
+
+    Each run is a new process with -B (Lambda's /opt is read-only, so nothing compiled
+    during an import is kept) and -S (only the layer and the standard library are on the
+    path). Returns None when the modules cannot be imported on this host, e.g. when it is
+    not the Lambda platform.
+    """
+    code = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {python_packages_dir!r})\n"
+        "started = time.perf_counter()\n"
+        f"import {', '.join(modules or LAYER_IMPORTS)}\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-B", "-S", "-c", code], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            logger.info(f"Layer modules cannot be imported on this host: {result.stderr.strip().splitlines()[-1:]}")
+            return None
+        timings.append(float(result.stdout.strip()))
+    return statistics.median(timings)
+
+
+def prune_layer(python_packages_dir):
+    """Remove metadata, tests, stubs, sources and console scripts; returns the number of paths removed."""
+    removed = 0
+    # Console scripts installed by pip --target; Lambda never runs them
+    bin_dir = os.path.join(python_packages_dir, "bin")
+    if os.path.isdir(bin_dir):
+        shutil.rmtree(bin_dir)
+        removed += 1
+    for root, dirs, files in os.walk(python_packages_dir):
+        for name in list(dirs):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in PRUNE_DIR_PATTERNS):
+                shutil.rmtree(os.path.join(root, name))
+                dirs.remove(name)
+                removed += 1
+        for name in files:
+            if any(fnmatch.fnmatch(name, pattern) for pattern in PRUNE_FILE_PATTERNS):
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def strip_shared_objects(python_packages_dir):
+    """Strip symbols from the layer's ELF shared objects; returns how many were stripped."""
+    strip = shutil.which("strip")
+    if platform.system() != "Linux" or strip is None:
+        logger.info("Skipping .so stripping: needs GNU strip on Linux")
+        return 0
+    stripped = 0
+    for root, _, files in os.walk(python_packages_dir):
+        for name in sorted(files):
+            if name.endswith(".so") or ".so." in name:
+                result = subprocess.run([strip, "--strip-unneeded", os.path.join(root, name)],
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                if result.returncode == 0:
+                    stripped += 1
+                else:
+                    logger.info(f"Could not strip {name}: {result.stderr.decode('utf-8').strip()}")
+    return stripped
+
+
+def precompile_bytecode(python_packages_dir):
+    """
+    Compile every module to unchecked-hash .pyc files for the Lambda Python version.
+
+    Unchecked-hash pycs are never revalidated against their source, so a cold start
+    skips both compilation and the per-module stat. Paths are recorded as
+    LAYER_RUNTIME_PATH and PYTHONHASHSEED is pinned, so the output is reproducible.
+    Uses this interpreter when it matches LAMBDA_PYTHON_VERSION, otherwise the Lambda
+    image through Docker; returns False (layer left without bytecode) if neither works.
+    """
+    compile_args = ["-m", "compileall", "-q", "-j", "0", "--invalidation-mode", "unchecked-hash"]
+    env = {**os.environ, "PYTHONHASHSEED": "0"}
+    if f"{sys.version_info[0]}.{sys.version_info[1]}" == LAMBDA_PYTHON_VERSION:
+        command = [sys.executable, *compile_args, "-d", LAYER_RUNTIME_PATH, python_packages_dir]
+    elif shutil.which("docker"):
+        command = ["docker", "run", "--rm", "-e", "PYTHONHASHSEED=0", "--entrypoint", "python3",
+                   "-v", f"{os.path.abspath(python_packages_dir)}:{LAYER_RUNTIME_PATH}",
+                   f"public.ecr.aws/lambda/python:{LAMBDA_PYTHON_VERSION}", *compile_args, LAYER_RUNTIME_PATH]
+    else:
+        logger.info(f"Skipping bytecode precompilation: needs Python {LAMBDA_PYTHON_VERSION} or Docker")
+        return False
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    if result.returncode != 0:
+        logger.error(f"Bytecode precompilation failed: {result.stderr.decode('utf-8').strip()}")
+        return False
+    return True
+
+
+def slim_layer(python_packages_dir):
+    """
+    Prune, strip and precompile the installed layer, logging size and import time before and after.
+
+    Returns a report dict with ``size_before``/``size_after`` (bytes) and
+    ``import_before``/``import_after`` (seconds, None when not measurable on this host).
+    Raises RuntimeError when the layer imported before post-processing but no longer does,
+    e.g. pruning removed a module it needs, so the broken layer is never zipped.
+    """
+    report = {"size_before": directory_size(python_packages_dir),
+              "import_before": measure_import_time(python_packages_dir)}
+    removed = prune_layer(python_packages_dir)
+    stripped = strip_shared_objects(python_packages_dir)
+    compiled = precompile_bytecode(python_packages_dir)
+    report.update(size_after=directory_size(python_packages_dir),
+                  import_after=measure_import_time(python_packages_dir))
+    if report["import_before"] is not None and report["import_after"] is None:
+        raise RuntimeError(f"Layer modules {LAYER_IMPORTS} no longer import after post-processing; "
+                           "check PRUNE_DIR_PATTERNS and PRUNE_FILE_PATTERNS")
+
+    logger.info(f"Layer post-processing: pruned {removed} paths, stripped {stripped} shared objects, "
+                f"bytecode {'precompiled' if compiled else 'not precompiled'}")
+    logger.info(f"Layer size: {report['size_before'] / 2 ** 20:.1f} MiB -> {report['size_after'] / 2 ** 20:.1f} MiB")
+    if report["import_before"] is not None and report["import_after"] is not None:
+        logger.info(f"Layer import time: {report['import_before'] * 1000:.0f} ms -> "
+                    f"{report['import_after'] * 1000:.0f} ms")
+    return report
+
+
+def _empty_directory(path):
+    """Remove whatever a failed build attempt left behind."""
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def _add_orjson_shim(python_packages_dir):
+    """Create the orjson.orjson module the schema registry client imports, if it doesn't exist."""
+    orjson_dir = os.path.join(python_packages_dir, "orjson")
+    if os.path.isdir(orjson_dir) and any(name.startswith("orjson.") and name.endswith((".so", ".pyd"))
+                                         for name in os.listdir(orjson_dir)):
+        # Current orjson wheels already ship orjson.orjson as the extension module; a package of
+        # the same name would shadow it and make `import orjson` fail with a circular import
+        return
+    try:
+        orjson_orjson_dir = os.path.join(orjson_dir, "orjson")
+        os.makedirs(orjson_orjson_dir, exist_ok=True)
+        init_file = os.path.join(orjson_orjson_dir, "__init__.py")
+        with open(init_file, "w", encoding="utf-8") as f:
+            f.write("from orjson import dumps, loads\n")
+        logger.info(f"Created orjson.orjson module at {orjson_orjson_dir}")
+    except Exception as e:
+        logger.error(f"Error creating orjson.orjson module: {e}")
+        # Don't fail the build if this step fails
+
 def start_docker_daemon():
     """
     Attempt to start the Docker daemon if it's installed but not running.
@@ -230,7 +508,51 @@ def is_docker_available():
         logger.info("Will fall back to local build method.")
         return False
 
-def build_layer_with_docker(temp_dir, output_path, python_packages_dir):
+def build_layer_from_wheel_cache(python_packages_dir, wheel_dir):
+    """
+    Install the layer requirements for the Lambda platform from the local wheel cache.
+
+    Wheels are installed offline first; only when the cache is missing one are the
+    requirements downloaded (as manylinux wheels for the Lambda runtime) into the cache
+    and the install retried. Repeat builds therefore never hit the package index.
+
+    Args:
+        python_packages_dir (str): Path to the directory where Python packages will be installed
+        wheel_dir (str): Path to the local wheel cache
+
+    Returns:
+        bool: True if the build was successful, False otherwise
+    """
+    os.makedirs(wheel_dir, exist_ok=True)
+    platform_args = [
+        "--platform", LAMBDA_PLATFORM_TAG,
+        "--python-version", LAMBDA_PYTHON_VERSION,
+        "--implementation", "cp",
+        "--only-binary=:all:",
+    ]
+    # --no-compile: bytecode compiled at install time embeds source mtimes, which would make
+    # every rebuild of the same wheels produce a different zip
+    install = _pip_command() + ["install", *LAYER_REQUIREMENTS, *platform_args,
+                                "--no-index", "--find-links", wheel_dir,
+                                "--target", python_packages_dir, "--upgrade", "--no-compile", "--quiet"]
+    if subprocess.run(install, stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode == 0:
+        logger.info(f"Installed layer packages from the wheel cache at {wheel_dir}")
+        return True
+
+    logger.info(f"Wheel cache incomplete, downloading {LAMBDA_PLATFORM_TAG} wheels into {wheel_dir}...")
+    download = _pip_command() + ["download", *LAYER_REQUIREMENTS, *platform_args, "--dest", wheel_dir, "--quiet"]
+    try:
+        subprocess.run(download, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        subprocess.run(install, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        stderr = getattr(e, "stderr", None)
+        logger.info(f"Wheel cache build failed: {stderr.decode('utf-8').strip() if stderr else e}")
+        return False
+    logger.info("Installed layer packages from freshly cached wheels.")
+    return True
+
+
+def build_layer_with_docker(temp_dir, python_packages_dir):
     """
     Build the Lambda layer using Docker with the AWS Lambda Python runtime.
 
@@ -241,7 +563,6 @@ def build_layer_with_docker(temp_dir, output_path, python_packages_dir):
 
     Args:
         temp_dir (str): Path to the temporary directory for building the layer
-        output_path (str): Path where the final layer ZIP file will be saved
         python_packages_dir (str): Path to the directory where Python packages will be installed
 
     Returns:
@@ -252,23 +573,14 @@ def build_layer_with_docker(temp_dir, output_path, python_packages_dir):
     try:
         # Create a Dockerfile in the temp directory
         dockerfile_path = os.path.join(temp_dir, "Dockerfile")
+        requirements = " ".join(f'"{requirement}"' for requirement in LAYER_REQUIREMENTS)
         with open(dockerfile_path, "w", encoding="utf-8") as f:
-            f.write("""
-# Stage 1: build on AWS Lambda Python 3.12 runtime
-FROM public.ecr.aws/sam/build-python3.12 AS builder
+            f.write(f"""
+# Stage 1: build on AWS Lambda Python {LAMBDA_PYTHON_VERSION} runtime
+FROM public.ecr.aws/sam/build-python{LAMBDA_PYTHON_VERSION} AS builder
 
 # Install packages with specific versions to ensure compatibility
-RUN pip3 install --no-cache-dir \
-      aws-glue-schema-registry==1.1.3 \
-      boto3>=1.17.102 \
-      fastavro>=1.4.5 \
-      fastjsonschema~=2.15 \
-      orjson==3.10.18 \
-      --target /opt/python
-
-# Create the orjson.orjson module if it doesn't exist
-RUN mkdir -p /opt/python/orjson/orjson && \
-    echo "from orjson import dumps, loads" > /opt/python/orjson/orjson/__init__.py
+RUN pip3 install --no-cache-dir --no-compile {requirements} --target /opt/python
 
 # Stage 2: assemble layer zip
 FROM scratch AS layer
@@ -315,18 +627,6 @@ CMD ["true"]
 
             # List the contents of the python directory for verification
             logger.info(f"Contents of {python_packages_dir}: {os.listdir(python_packages_dir)}")
-
-            # Create the zip file
-            if os.path.exists(output_path):
-                os.remove(output_path)
-
-            shutil.make_archive(
-                output_path[:-4],  # Remove .zip extension
-                "zip",
-                temp_dir
-            )
-
-            logger.info(f"Lambda layer created at: {output_path}")
             return True
         except subprocess.CalledProcessError as e:
             logger.error(f"Error copying files from Docker container: {e.stderr.decode('utf-8').strip() if hasattr(e, 'stderr') else str(e)}")
@@ -342,25 +642,23 @@ CMD ["true"]
                     check=True
                 )
             except subprocess.CalledProcessError as e:
-                logger.erorr(f"Warning: Failed to remove Docker container {container_id}: {e.stderr.decode('utf-8').strip() if hasattr(e, 'stderr') else str(e)}")
+                logger.error(f"Warning: Failed to remove Docker container {container_id}: {e.stderr.decode('utf-8').strip() if hasattr(e, 'stderr') else str(e)}")
     except Exception as err:
         logger.error(f"Unexpected error during Docker build: {str(err)}")
         logger.info("Falling back to local build method...")
         return False
 
-def build_layer_locally(temp_dir, output_path, python_packages_dir):
+def build_layer_locally(python_packages_dir):
     """
     Build the Lambda layer locally using pip.
 
-    This function attempts to install the required packages using the local
-    Python environment. This is a fallback method when Docker is not available.
-    Note that this method may result in compatibility issues if the local
+    This function installs the required packages using the local Python environment.
+    This is a fallback method when neither the wheel cache nor Docker can build the
+    layer. Note that this method may result in compatibility issues if the local
     environment differs from the Lambda runtime environment, especially for
     packages with binary dependencies like orjson.
 
     Args:
-        temp_dir (str): Path to the temporary directory for building the layer
-        output_path (str): Path where the final layer ZIP file will be saved
         python_packages_dir (str): Path to the directory where Python packages will be installed
 
     Returns:
@@ -371,112 +669,35 @@ def build_layer_locally(temp_dir, output_path, python_packages_dir):
     # Print the directory structure for debugging
     logger.info(f"Using Python packages directory at: {python_packages_dir}")
 
-    # Check if pip module is available in the current Python environment
-    pip_available = False
+    pip_cmd = _pip_command()
     try:
-        import importlib.util
-        pip_spec = importlib.util.find_spec("pip")
-        pip_available = pip_spec is not None
-    except ImportError:
-        pip_available = False
-
-    success = False
-
-    # Try different methods to install packages to handle various environments
-    if pip_available:
-        try:
-            # First, try using pip as a module (standard approach)
-            logger.info("Attempting to install packages using Python's pip module...")
-            subprocess.check_call([
-                sys.executable, "-m", "pip", "install",
-                "aws-glue-schema-registry==1.1.3",  # Main package for schema registry with specific version
-                "boto3>=1.17.102",  # Required dependency
-                "fastavro>=1.4.5",  # Required dependency
-                "fastjsonschema~=2.15",  # Required dependency
-                "orjson==3.10.18",  # Required dependency with specific version
-                "--no-cache-dir",  # Ensure a clean installation
-                "--target", python_packages_dir
-            ])
-            success = True
-            logger.info("Successfully installed packages using Python's pip module.")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"First pip install attempt failed: {e}")
-    else:
-        logger.info("Python's pip module not available in the current environment.")
-
-    # If first method failed, try using pip directly
-    if not success:
-        try:
-            # Determine pip command based on platform
-            pip_cmd = "pip3" if sys.platform != "win32" else "pip"
-            logger.info(f"Attempting to install packages using {pip_cmd} command...")
-            subprocess.check_call([
-                pip_cmd, "install",
-                "aws-glue-schema-registry==1.1.3",  # Main package for schema registry with specific version
-                "boto3>=1.17.102",  # Required dependency
-                "fastavro>=1.4.5",  # Required dependency
-                "fastjsonschema~=2.15",  # Required dependency
-                "orjson==3.10.18",  # Required dependency with specific version
-                "--no-cache-dir",  # Ensure a clean installation
-                "--target", python_packages_dir
-            ])
-            success = True
-            logger.info(f"Successfully installed packages using {pip_cmd} command.")
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
-            logger.info(f"Second pip install attempt failed: {e}")
-
-    # As a last resort, try using python/python3 with -m pip
-    if not success:
-        try:
-            # Use platform-specific Python command
-            python_cmd = "python3" if sys.platform != "win32" else "python"
-            logger.info(f"Attempting to install packages using {python_cmd} -m pip...")
-            subprocess.check_call([
-                python_cmd, "-m", "pip", "install",
-                "aws-glue-schema-registry==1.1.3",  # Main package for schema registry with specific version
-                "boto3>=1.17.102",  # Required dependency
-                "fastavro>=1.4.5",  # Required dependency
-                "fastjsonschema~=2.15",  # Required dependency
-                "orjson==3.10.18",  # Required dependency with specific version
-                "--no-cache-dir",  # Ensure a clean installation
-                "--target", python_packages_dir
-            ])
-            success = True
-            logger.info(f"Successfully installed packages using {python_cmd} -m pip.")
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
-            logger.error(f"Third pip install attempt failed: {e}")
-            raise Exception("All package installation methods failed. Please ensure pip is installed and accessible.")
-
-    # Create the orjson.orjson module if it doesn't exist
-    if success:
-        try:
-            # Create the directory structure
-            orjson_orjson_dir = os.path.join(python_packages_dir, "orjson", "orjson")
-            os.makedirs(orjson_orjson_dir, exist_ok=True)
-
-            # Create the __init__.py file
-            init_file = os.path.join(orjson_orjson_dir, "__init__.py")
-            with open(init_file, "w", encoding="utf-8") as f:
-                f.write("from orjson import dumps, loads\n")
-
-            logger.info(f"Created orjson.orjson module at {orjson_orjson_dir}")
-        except Exception as e:
-            logger.error(f"Error creating orjson.orjson module: {e}")
-            # Don't fail the build if this step fails
-
-    return success
-
-def build_schema_registry_layer(output_dir):
+        logger.info(f"Attempting to install packages using {' '.join(pip_cmd)}...")
+        subprocess.check_call(pip_cmd + [
+            "install", *LAYER_REQUIREMENTS,
+            "--no-cache-dir",  # Ensure a clean installation
+            "--no-compile",
+            "--target", python_packages_dir
+        ])
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logger.error(f"pip install failed: {e}")
+        raise Exception("All package installation methods failed. Please ensure pip is installed and accessible.")
+    logger.info(f"Successfully installed packages using {' '.join(pip_cmd)}.")
+    return True
+
+def build_schema_registry_layer(output_dir, cache_dir=DEFAULT_CACHE_DIR):
     """
     Build a schema registry layer with required AWS libraries.
 
     This is the main function that orchestrates the layer building process.
-    It creates a temporary directory, checks if Docker is available, and then
-    calls either build_layer_with_docker or build_layer_locally to build the layer.
-    It also verifies that the required packages were installed correctly.
+    It first looks for a cached layer with the same cache key and returns it
+    at once on a hit. On a miss it builds the layer from the wheel cache, with
+    Docker or locally (in that order), verifies that the required packages were
+    installed correctly, slims it (see slim_layer) and stores the deterministic
+    zip in the cache.
 
     Args:
         output_dir (str): Directory where the final layer ZIP file will be saved
+        cache_dir (str): Directory holding cached layers and wheels
 
     Returns:
         str: Path to the created layer ZIP file
@@ -484,33 +705,36 @@ def build_schema_registry_layer(output_dir):
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "schema-registry-layer.zip")
+    output_path = os.path.join(output_dir, LAYER_ZIP_NAME)
+
+    cache_key = layer_cache_key()
+    layers_dir = os.path.join(cache_dir, "layers")
+    cached_zip = os.path.join(layers_dir, f"{cache_key}.zip")
+    if os.path.exists(cached_zip):
+        logger.info(f"Layer cache hit for {cache_key[:12]}, skipping the build")
+        return publish_layer_zip(cached_zip, output_path)
+    logger.info(f"Layer cache miss for {cache_key[:12]}, building")
 
     # Create the layer
     with tempfile.TemporaryDirectory() as temp_dir:
         # Create the layer structure for Python Lambda layers
         # Lambda expects packages to be in the 'python' directory
-        python_packages_dir = os.path.join(temp_dir, "python")
+        layer_root = os.path.join(temp_dir, "layer")
+        python_packages_dir = os.path.join(layer_root, "python")
         os.makedirs(python_packages_dir, exist_ok=True)
 
-        # Check if Docker is available
-        docker_available = is_docker_available()
-
-        if docker_available:
-            # Build the layer using Docker (preferred method for binary compatibility)
-            docker_success = build_layer_with_docker(temp_dir, output_path, python_packages_dir)
-            if not docker_success:
-                logger.info("Docker build failed. Falling back to local build method.")
-                logger.info("WARNING: Building on a non-Linux platform may result in compatibility issues with Lambda.")
-                # Build the layer locally as a fallback
-                success = build_layer_locally(temp_dir, output_path, python_packages_dir)
-            else:
-                success = True
-        else:
-            logger.info("Docker is not available. Falling back to local build method.")
+        # Only builds that target the Lambda platform are cached under its key
+        cacheable = build_layer_from_wheel_cache(python_packages_dir, os.path.join(cache_dir, "wheels"))
+        if not cacheable and is_docker_available():
+            _empty_directory(python_packages_dir)
+            cacheable = build_layer_with_docker(temp_dir, python_packages_dir)
+        if not cacheable:
+            logger.info("Falling back to local build method.")
             logger.info("WARNING: Building on a non-Linux platform may result in compatibility issues with Lambda.")
-            # Build the layer locally
-            success = build_layer_locally(temp_dir, output_path, python_packages_dir)
+            _empty_directory(python_packages_dir)
+            build_layer_locally(python_packages_dir)
+
+        _add_orjson_shim(python_packages_dir)
 
         # Verify that the aws_glue_schema_registry package was installed correctly
         try:
@@ -533,26 +757,31 @@ def build_schema_registry_layer(output_dir):
         except Exception as err:
             logger.error(f"Error verifying installed packages: {err}")
 
-        # Create a zip file (overwrite if it exists)
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        slim_layer(python_packages_dir)
 
-        shutil.make_archive(
-            output_path[:-4],  # Remove .zip extension
-            "zip",
-            temp_dir
-        )
+        if not cacheable:
+            write_deterministic_zip(layer_root, output_path)
+            logger.info(f"Lambda layer created at: {output_path} (host build, not cached)")
+            return output_path
 
-        logger.info(f"Lambda layer created at: {output_path}")
-        return output_path
+        os.makedirs(layers_dir, exist_ok=True)
+        write_deterministic_zip(layer_root, cached_zip)
+        logger.info(f"Cached Lambda layer {cache_key[:12]} at {cached_zip}")
+        return publish_layer_zip(cached_zip, output_path)
 
 if __name__ == "__main__":
     # Get the project root (4 levels up from the script)
     project_root = Path(__file__).resolve().parents[3]
     layer_dir = project_root / "etl" / "layer_packages"
 
+    parser = argparse.ArgumentParser(description="Build the schema registry Lambda layer")
+    parser.add_argument("--output-dir", default=layer_dir.as_posix(), help="Directory for the layer zip")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached layers and wheels (default: $LAYER_CACHE_DIR or ~/.cache)")
+    args = parser.parse_args()
+
     try:
-        build_schema_registry_layer(layer_dir.as_posix())
+        build_schema_registry_layer(args.output_dir, cache_dir=args.cache_dir)
     except Exception as e:
         logger.error(f"Error creating lambda layer: {e}")
         sys.exit(1)
@@ -76,3 +76,15 @@ variable "lambda_layer_local_path" {
   type        = string
   default = ""
 }
+
+variable "geoip_layer_arn" {
+  type        = string
+  default     = ""
+  description = "ARN of a Lambda layer holding geoip/ranges.bin for ingest geo enrichment; empty disables it"
+}
+
+variable "geoip_raw_ip" {
+  type        = string
+  default     = "drop"
+  description = "Caller IP handling after the geo lookup: drop, or truncate (/24 IPv4, /48 IPv6) and keep"
+}
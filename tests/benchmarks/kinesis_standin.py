@@ -0,0 +1,66 @@
+"""
+Local stand-in for a single Kinesis shard with a deep backlog.
+
+Time is simulated so a benchmark covering minutes of reading finishes in milliseconds. The
+shard enforces the documented per-shard read limits:
+
+- shared throughput: 5 GetRecords calls/sec and 2 MB/sec, split with the other consumers
+  of the stream, at most 10,000 records per call
+- enhanced fan-out: a dedicated 2 MB/sec push pipe per consumer, no call limit
+"""
+from collections import deque
+
+SHARD_READ_BYTES_PER_SEC = 2 * 1024 * 1024
+SHARD_READ_CALLS_PER_SEC = 5
+MAX_RECORDS_PER_CALL = 10000
+GET_RECORDS_LATENCY_MS = 25
+EFO_PUSH_LATENCY_MS = 70
+
+
+class ProvisionedThroughputExceeded(Exception):
+    pass
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now_ms = 0.0
+
+    def advance(self, millis):
+        self.now_ms += millis
+
+
+class KinesisShardStandIn:
+    """One shard read by one consumer, optionally sharing its limits with ``other_consumers``."""
+
+    def __init__(self, clock, record_size_bytes=300, other_consumers=1, enhanced_fan_out=False):
+        self.clock = clock
+        self.record_size_bytes = record_size_bytes
+        self.enhanced_fan_out = enhanced_fan_out
+        share = 1 if enhanced_fan_out else 1 / (other_consumers + 1)
+        self.bytes_per_ms = SHARD_READ_BYTES_PER_SEC * share / 1000
+        self.calls_per_sec = SHARD_READ_CALLS_PER_SEC * share
+        self.byte_tokens = 0.0
+        self.last_refill_ms = 0.0
+        self.recent_calls = deque()
+
+    def _refill(self):
+        elapsed = self.clock.now_ms - self.last_refill_ms
+        # Unused read capacity is not banked for long: cap it at one second's worth
+        self.byte_tokens = min(self.byte_tokens + elapsed * self.bytes_per_ms, self.bytes_per_ms * 1000)
+        self.last_refill_ms = self.clock.now_ms
+
+    def get_records(self, limit):
+        """Return the number of records delivered by one read, advancing the clock by its latency."""
+        if not self.enhanced_fan_out:
+            while self.recent_calls and self.clock.now_ms - self.recent_calls[0] >= 1000:
+                self.recent_calls.popleft()
+            if len(self.recent_calls) >= self.calls_per_sec:
+                self.clock.advance(GET_RECORDS_LATENCY_MS)
+                raise ProvisionedThroughputExceeded()
+            self.recent_calls.append(self.clock.now_ms)
+
+        self.clock.advance(EFO_PUSH_LATENCY_MS if self.enhanced_fan_out else GET_RECORDS_LATENCY_MS)
+        self._refill()
+        records = min(limit, MAX_RECORDS_PER_CALL, int(self.byte_tokens // self.record_size_bytes))
+        self.byte_tokens -= records * self.record_size_bytes
+        return records
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pyarrow.parquet as pq
+import pytest
+
+sys.modules['awsglue.context'] = MagicMock()
+sys.modules['awsglue.utils'] = MagicMock()
+
+from etl.glue_stream import BRONZE_WRITE_LAYOUTS, _parquet_layout_conf
+
+ROWS = 1_000_000
+SCANS = 5
+
+REPORTED_COLUMNS = ("page", "element", "userAgent", "request_id")
+
+LAYOUTS = {
+    "arrival": BRONZE_WRITE_LAYOUTS["arrival"],
+    "arrival_zstd": {**BRONZE_WRITE_LAYOUTS["arrival"], "compression": "zstd", "zstd_level": 3},
+    "sorted": BRONZE_WRITE_LAYOUTS["sorted"],
+    "sorted_zstd19": {**BRONZE_WRITE_LAYOUTS["sorted"], "zstd_level": 19},
+}
+
+
+def _clicks(spark):
+    """Bronze-shaped rows in arrival order: skewed pages, a few elements and user agents, unique ids."""
+    return spark.sql(f"""
+        SELECT
+            concat('button-', cast(pmod(hash(id, 1), 40) AS string)) AS element,
+            concat('/page/', cast(floor(pow(rand(7), 3) * 300) AS string)) AS page,
+            concat('Mozilla/5.0 (agent ', cast(pmod(hash(id, 2), 60) AS string), ')') AS userAgent,
+            uuid() AS request_id,
+            uuid() AS event_id,
+            cast(pmod(hash(id, 3), 4) AS string) AS shard_id,
+            cast(id AS string) AS sequence_number,
+            timestamp_seconds(1714521600 + id DIV 20) AS event_ts,
+            date'2024-05-01' AS event_date
+        FROM range({ROWS})
+    """)
+
+
+def _column_bytes(files):
+    """Compressed bytes per column over all row groups, plus the row group count."""
+    sizes, row_groups = {}, 0
+    for path in files:
+        metadata = pq.ParquetFile(path).metadata
+        row_groups += metadata.num_row_groups
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                sizes[column.path_in_schema] = sizes.get(column.path_in_schema, 0) + column.total_compressed_size
+    return sizes, row_groups
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+def test_bronze_write_layouts(tmp_path, spark_session):
+    """Report bytes per row and page-filter scan time of each bronze write layout"""
+    source = _clicks(spark_session).localCheckpoint()
+    results = {}
+    for name, layout in LAYOUTS.items():
+        conf = _parquet_layout_conf(layout)
+        for key, value in conf.items():
+            spark_session.conf.set(key, value)
+        out = str(tmp_path / name)
+        df = source.coalesce(1)
+        if layout.get("sort_columns"):
+            df = df.sortWithinPartitions("event_date", *layout["sort_columns"])
+        started = time.perf_counter()
+        df.write.partitionBy("event_date").parquet(out)
+        write_s = time.perf_counter() - started
+        for key in conf:
+            spark_session.conf.unset(key)
+
+        files = list(Path(out).rglob("*.parquet"))
+        size = sum(path.stat().st_size for path in files)
+        columns, row_groups = _column_bytes(files)
+        started = time.perf_counter()
+        for _ in range(SCANS):
+            matched = spark_session.read.parquet(out).where("page = '/page/250'").select("element").count()
+        scan_ms = (time.perf_counter() - started) / SCANS * 1000
+        print(f"\n{name:>13}: {size / ROWS:6.1f} bytes/row, write {write_s:.1f}s, "
+              f"page-filter scan {scan_ms:.0f}ms ({matched} rows), {row_groups} row group(s); per row: "
+              + ", ".join(f"{column} {columns[column] / ROWS:.2f}" for column in REPORTED_COLUMNS))
+        results[name] = {column: columns[column] / ROWS for column in REPORTED_COLUMNS}
+        results[name]["total"] = size / ROWS
+
+    assert results["sorted"]["total"] < results["arrival"]["total"]
+    # The sort keys collapse to a few bytes per thousand rows; unsorted columns are left as they were
+    for column in ("page", "element"):
+        assert results["sorted"][column] < results["arrival_zstd"][column]
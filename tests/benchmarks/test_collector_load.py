@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer
+
+with patch.dict(os.environ, {"REGION": "us-east-1", "STREAM_NAME": "test-stream"}):
+    from etl.handlers.collector import KinesisBatcher, create_app
+
+CONCURRENT_CLIENTS = 64
+REQUESTS_PER_CLIENT = 250
+CLICKS_PER_REQUEST = 4
+PUT_RECORDS_LATENCY_SECONDS = 0.02
+
+
+class StubKinesis:
+    """PutRecords stand-in with a fixed service latency; records every record it accepts."""
+
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+        self.records = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def put_records(self, StreamName, Records):
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            self.records += len(Records)
+            self.calls += 1
+        return {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "1", "ShardId": "shardId-0"} for _ in Records]}
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def _load_test(kinesis):
+    batcher = KinesisBatcher(kinesis, "test-stream", max_batch_age_ms=50, max_buffered_records=50000)
+    latencies = []
+    statuses = []
+
+    async def client_loop(client, client_id):
+        body = json.dumps([{"element": f"button-{client_id % 8}", "page": "/load-test",
+                            "userAgent": "load-test", "timestamp": "2024-05-01T10:00:00Z"}] * CLICKS_PER_REQUEST)
+        for _ in range(REQUESTS_PER_CLIENT):
+            started = time.perf_counter()
+            response = await client.post("/events", data=body)
+            await response.read()
+            latencies.append(time.perf_counter() - started)
+            statuses.append(response.status)
+
+    async with TestClient(TestServer(create_app(batcher))) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, i) for i in range(CONCURRENT_CLIENTS)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed, batcher.stats
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="Set RUN_BENCHMARKS=1 to run benchmarks")
+def test_collector_throughput_and_tail_latency():
+    """Report clicks/sec and request latency percentiles against a stubbed Kinesis"""
+    kinesis = StubKinesis(PUT_RECORDS_LATENCY_SECONDS)
+    latencies, statuses, elapsed, stats = asyncio.run(_load_test(kinesis))
+
+    latencies.sort()
+    accepted = statuses.count(202)
+    print(f"\n{len(statuses)} requests from {CONCURRENT_CLIENTS} clients in {elapsed:.2f}s "
+          f"({accepted * CLICKS_PER_REQUEST / elapsed:,.0f} clicks/s, {statuses.count(429)} throttled)")
+    print(f"latency p50={statistics.median(latencies) * 1000:.2f}ms p99={_percentile(latencies, 0.99) * 1000:.2f}ms "
+          f"p99.9={_percentile(latencies, 0.999) * 1000:.2f}ms")
+    print(f"PutRecords calls={kinesis.calls} avg batch={kinesis.records / max(kinesis.calls, 1):.0f} records")
+
+    # Every accepted click reaches Kinesis once the collector shuts down
+    assert kinesis.records == stats["accepted"] == accepted * CLICKS_PER_REQUEST
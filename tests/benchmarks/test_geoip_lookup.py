@@ -0,0 +1,76 @@
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import pytest
+
+from etl.handlers.geoip import build_range_table
+
+RANGES = 1_000_000  # Same order of magnitude as a full city-level IPv4 database
+LOOKUPS = 500_000
+
+# Runs in a fresh interpreter so resident memory is not skewed by pytest or earlier tests
+PROBE = """
+import json, random, socket, struct, sys, time
+
+def rss():
+    fields = dict(line.split(":", 1) for line in open("/proc/self/status"))
+    return {key: int(fields[key].split()[0]) // 1024 for key in ("VmRSS", "RssAnon", "RssFile")}
+
+from etl.handlers.geoip import GeoIpTable
+rng = random.Random(7)
+ips = [socket.inet_ntoa(struct.pack(">I", rng.getrandbits(32))) for _ in range(int(sys.argv[2]))]
+before = rss()
+table = GeoIpTable(sys.argv[1])
+loaded = rss()
+started = time.perf_counter()
+resolved = sum(1 for ip in ips if table.lookup(ip))
+elapsed = time.perf_counter() - started
+print(json.dumps({"before": before, "loaded": loaded, "after_lookups": rss(),
+                  "us_per_lookup": elapsed / len(ips) * 1e6, "resolved": resolved}))
+"""
+
+
+def _synthetic_networks(count):
+    """Non-overlapping networks evenly spread over the IPv4 space, with 4000 locations."""
+    rng = random.Random(42)
+    step = 2 ** 32 // count
+    prefix = 32 - (step.bit_length() - 2)  # Largest aligned block that fits twice in a step
+    for i in range(count):
+        start = -(-(i * step) >> (32 - prefix)) << (32 - prefix)
+        yield (f"{socket.inet_ntoa(struct.pack('>I', start))}/{prefix}",
+               f"C{rng.randrange(200):03d}", f"R{rng.randrange(20):02d}")
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="resident memory is read from /proc")
+def test_geoip_lookup_cost_and_resident_memory(tmp_path):
+    """Report per-lookup cost and the container memory a million-range table adds"""
+    import json
+
+    started = time.perf_counter()
+    table = build_range_table(_synthetic_networks(RANGES))
+    path = tmp_path / "ranges.bin"
+    path.write_bytes(table)
+    print(f"\nbuilt {len(table) / 2 ** 20:.1f} MiB table for {RANGES} networks in {time.perf_counter() - started:.1f}s")
+
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    output = subprocess.run([sys.executable, "-c", PROBE, str(path), str(LOOKUPS)], cwd=project_root,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    for stage in ("before", "loaded", "after_lookups"):
+        memory = result[stage]
+        print(f"{stage:>14}: VmRSS {memory['VmRSS']} MiB (anonymous {memory['RssAnon']} MiB, "
+              f"file-backed {memory['RssFile']} MiB)")
+    print(f"lookup: {result['us_per_lookup']:.2f}us/event over {LOOKUPS} random IPv4 addresses, "
+          f"{result['resolved']} resolved")
+
+    # Mapping the table costs (next to) no heap: its pages are file-backed, shared with the page
+    # cache and only resident once a lookup touches them
+    assert result["loaded"]["RssAnon"] - result["before"]["RssAnon"] < 4
+    assert result["us_per_lookup"] < 20
@@ -0,0 +1,66 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.modules['awsglue.context'] = MagicMock()
+sys.modules['awsglue.utils'] = MagicMock()
+
+from etl.glue_stream import KINESIS_READ_PRESETS, _resolve_kinesis_read_options
+from tests.benchmarks.kinesis_standin import KinesisShardStandIn, ProvisionedThroughputExceeded, SimulatedClock
+
+# Glue Kinesis connector defaults for options a preset leaves unset
+CONNECTOR_DEFAULTS = {
+    "maxFetchTimeInMs": 1000,
+    "maxFetchRecordsPerShard": 100000,
+    "maxRecordPerRead": 10000,
+    "idleTimeBetweenReadsInMs": 0,
+    "retryIntervalMs": 1000,
+}
+# Fixed cost of one micro-batch outside the fetch (planning, Delta commit, checkpoint)
+MICRO_BATCH_OVERHEAD_MS = 3000
+SIMULATED_RUN_MS = 10 * 60 * 1000
+
+
+def _records_per_sec_per_shard(options, enhanced_fan_out, other_consumers=1):
+    """Drive the connector's per-shard fetch loop against the stand-in and return records/sec."""
+    settings = {**CONNECTOR_DEFAULTS, **{name: int(value) for name, value in options.items() if value.isdigit()}}
+    clock = SimulatedClock()
+    shard = KinesisShardStandIn(clock, other_consumers=other_consumers, enhanced_fan_out=enhanced_fan_out)
+
+    total = 0
+    while clock.now_ms < SIMULATED_RUN_MS:
+        batch_start = clock.now_ms
+        fetched = 0
+        while (fetched < settings["maxFetchRecordsPerShard"]
+               and clock.now_ms - batch_start < settings["maxFetchTimeInMs"]):
+            try:
+                fetched += shard.get_records(min(settings["maxRecordPerRead"],
+                                                 settings["maxFetchRecordsPerShard"] - fetched))
+            except ProvisionedThroughputExceeded:
+                clock.advance(settings["retryIntervalMs"])
+                continue
+            clock.advance(settings["idleTimeBetweenReadsInMs"])
+        total += fetched
+        clock.advance(MICRO_BATCH_OVERHEAD_MS)
+    return total / (clock.now_ms / 1000)
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="Set RUN_BENCHMARKS=1 to run benchmarks")
+def test_kinesis_read_presets_throughput():
+    """Report records/sec per shard for each read preset, shared vs enhanced fan-out"""
+    results = {}
+    for preset in KINESIS_READ_PRESETS:
+        for enhanced_fan_out in (False, True):
+            options = _resolve_kinesis_read_options({"KINESIS_READ_PRESET": preset,
+                                                     "ENABLE_EFO": str(enhanced_fan_out).lower()})
+            results[(preset, enhanced_fan_out)] = _records_per_sec_per_shard(options, enhanced_fan_out)
+
+    print("\npreset          mode     records/sec/shard")
+    for (preset, enhanced_fan_out), rate in results.items():
+        print(f"{preset:<15} {'efo' if enhanced_fan_out else 'shared':<8} {rate:>12,.0f}")
+
+    assert results[("throughput", False)] > results[("default", False)]
+    assert results[("throughput", True)] > results[("throughput", False)]
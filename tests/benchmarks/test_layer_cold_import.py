@@ -0,0 +1,42 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+SCRIPT_PATH = Path(__file__).resolve().parents[2] / "infra" / "terraform" / "scripts" / "build_layer.py"
+_spec = importlib.util.spec_from_file_location("build_layer", SCRIPT_PATH)
+build_layer = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(build_layer)
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+@pytest.mark.skipif(f"{sys.version_info[0]}.{sys.version_info[1]}" != build_layer.LAMBDA_PYTHON_VERSION
+                    or sys.platform != "linux", reason="the layer targets the Lambda Python on Linux")
+def test_slimmed_layer_imports_faster(tmp_path):
+    """Build the real layer (wheel cache, needs PyPI once) and compare size and cold import time"""
+    cache_dir = os.environ.get("LAYER_CACHE_DIR", str(tmp_path / "cache"))
+    packages = tmp_path / "raw" / "python"
+    packages.mkdir(parents=True)
+    assert build_layer.build_layer_from_wheel_cache(str(packages), os.path.join(cache_dir, "wheels"))
+    build_layer._add_orjson_shim(str(packages))
+    report = build_layer.slim_layer(str(packages))
+    print(f"\nlayer size {report['size_before'] / 2 ** 20:.1f} MiB -> {report['size_after'] / 2 ** 20:.1f} MiB, "
+          f"cold import {report['import_before'] * 1000:.0f} ms -> {report['import_after'] * 1000:.0f} ms")
+
+    # The zip Terraform uploads, extracted the way Lambda does, imports cleanly in a fresh interpreter
+    layer_zip = build_layer.write_deterministic_zip(str(packages.parent), str(tmp_path / "layer.zip"))
+    with zipfile.ZipFile(layer_zip) as archive:
+        archive.extractall(tmp_path / "opt")
+    code = (f"import sys; sys.path.insert(0, {str(tmp_path / 'opt' / 'python')!r}); "
+            f"import {', '.join(build_layer.LAYER_IMPORTS)}; "
+            "print(orjson.dumps({'ok': True}).decode(), fastavro.__file__.endswith('__init__.py'))")
+    result = subprocess.run([sys.executable, "-B", "-S", "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['{"ok":true}', "True"]
+
+    assert report["size_after"] < report["size_before"]
+    assert report["import_after"] < report["import_before"]
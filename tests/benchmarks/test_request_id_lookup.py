@@ -0,0 +1,65 @@
+import os
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pytest
+
+from etl.request_id_index import RequestIdIndex
+
+deltalake = pytest.importorskip("deltalake")
+
+COMMITS = 200  # One bronze micro-batch each
+ROWS_PER_COMMIT = 2_000
+LOOKUPS = 20
+
+SCHEMA = pa.schema([("request_id", pa.string()), ("page", pa.string()), ("element", pa.string()),
+                    ("userAgent", pa.string()), ("event_date", pa.date32())])
+
+
+def _bronze(table_path):
+    rng = random.Random(3)
+    ids = []
+    for commit in range(COMMITS):
+        day = date(2024, 5, 1) + timedelta(days=commit // 20)
+        rows = {"request_id": [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(ROWS_PER_COMMIT)],
+                "page": [f"/p{rng.randrange(50)}" for _ in range(ROWS_PER_COMMIT)],
+                "element": [f"button-{rng.randrange(20)}" for _ in range(ROWS_PER_COMMIT)],
+                "userAgent": ["Mozilla/5.0 (X11; Linux x86_64)"] * ROWS_PER_COMMIT,
+                "event_date": [day] * ROWS_PER_COMMIT}
+        deltalake.write_deltalake(table_path, pa.table(rows, schema=SCHEMA), mode="append",
+                                  partition_by=["event_date"])
+        ids.append(rows["request_id"][rng.randrange(ROWS_PER_COMMIT)])
+    return ids
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+def test_request_id_lookup_against_full_scan(tmp_path):
+    """Compare point-lookup latency through the sidecar index with a filtered scan of bronze"""
+    table_path = str(tmp_path / "bronze")
+    ids = random.Random(5).sample(_bronze(table_path), LOOKUPS)
+
+    index = RequestIdIndex(table_path, compact_every=0)
+    started = time.perf_counter()
+    index.update()
+    print(f"\nindexed {COMMITS} files ({COMMITS * ROWS_PER_COMMIT} rows) in {time.perf_counter() - started:.2f}s")
+    deltalake.DeltaTable(index.index_path).optimize.z_order(["prefix"])
+
+    def timed(lookup):
+        started = time.perf_counter()
+        found = [len(lookup(request_id)) for request_id in ids]
+        return (time.perf_counter() - started) / len(ids) * 1000, found
+
+    def full_scan(request_id):
+        return deltalake.DeltaTable(table_path).to_pyarrow_table(filters=[("request_id", "=", request_id)]).to_pylist()
+
+    scan_ms, scan_found = timed(full_scan)
+    index_ms, index_found = timed(index.lookup)
+    print(f"full scan: {scan_ms:.1f}ms/lookup, index: {index_ms:.1f}ms/lookup "
+          f"({scan_ms / index_ms:.1f}x), over {LOOKUPS} lookups")
+
+    assert index_found == scan_found == [1] * LOOKUPS
+    assert index_ms < scan_ms
@@ -0,0 +1,64 @@
+import os
+import random
+import time
+from collections import Counter, deque
+
+import pytest
+
+from etl.trending import SlidingWindowTopK
+
+EVENTS = 600_000
+PAGES = 200_000
+SLOTS = 30
+WINDOW_SLOTS = 10
+K = 20
+
+
+def _stream(rng):
+    """Zipf-distributed pages over SLOTS time slots, with the head of the distribution shifting halfway."""
+    weights = [1 / rank ** 1.1 for rank in range(1, PAGES + 1)]
+    per_slot = EVENTS // SLOTS
+    for slot in range(SLOTS):
+        shift = PAGES // 2 if slot >= SLOTS // 2 else 0
+        pages = rng.choices(range(PAGES), weights=weights, k=per_slot)
+        yield slot, [f"/page/{(page + shift) % PAGES}" for page in pages]
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+def test_trending_sketch_accuracy_and_throughput():
+    """Report top-K recall, estimate error, memory and update rate of the sliding-window tracker"""
+    tracker = SlidingWindowTopK(k=K, window_seconds=WINDOW_SLOTS * 30, slot_seconds=30)
+    window = deque()
+    recalls, errors, elapsed, tracked = [], [], 0.0, 0
+
+    for slot, pages in _stream(random.Random(17)):
+        # Pre-aggregated per (page, slot), as the sink receives a micro-batch from Spark
+        counts = Counter(pages)
+        started = time.perf_counter()
+        for page, amount in counts.items():
+            tracker.add(page, slot, amount)
+        top = tracker.top()
+        elapsed += time.perf_counter() - started
+        tracked = max(tracked, tracker.tracked_keys)
+
+        window.append(counts)
+        if len(window) > WINDOW_SLOTS:
+            window.popleft()
+        exact = sum(window, Counter())
+        exact_top = {page for page, _ in exact.most_common(K)}
+        recalls.append(len(exact_top & {page for page, _ in top}) / K)
+        # Over-count as a share of the window's events, the unit of the sketch's guarantee
+        errors.extend((estimate - exact[page]) / tracker.window_events for page, estimate in top)
+
+    counters = tracker.slot_count * tracker.slots[0].depth * tracker.slots[0].width
+    print(f"\n{EVENTS} events over {PAGES} pages: {EVENTS / elapsed:,.0f} events/s "
+          f"(pre-aggregated per slot), "
+          f"mean top-{K} recall {sum(recalls) / len(recalls):.3f} (min {min(recalls):.2f}), "
+          f"max over-count {max(errors):.3%} of the window (bound e/width = {2.71828 / tracker.slots[0].width:.3%}), "
+          f"{counters * 8 / 1024:.0f} KiB of counters, "
+          f"at most {tracked} candidates tracked")
+
+    assert min(recalls) >= 0.95
+    assert min(errors) >= 0
+    assert tracked < 2 * tracker.capacity
@@ -0,0 +1,66 @@
+import json
+import os
+import time
+
+import pytest
+
+from etl.click_schema import (
+    FIELD_MAX_LENGTHS,
+    FIELD_NAMES,
+    REQUIRED_CLIENT_FIELDS,
+    SERVER_FIELDS,
+    format_event_timestamp,
+    parse_event_timestamp,
+)
+from etl.handlers.validator import validate_click
+
+EVENTS = 200_000
+
+
+def _naive_validate(payload):
+    """Schema-walking baseline: the same checks, interpreted per event."""
+    if not isinstance(payload, dict):
+        raise ValueError("Click payload must be a JSON object")
+    clean = {}
+    for name in FIELD_NAMES:
+        if name in SERVER_FIELDS:
+            continue
+        value = payload.get(name)
+        if value is None:
+            if name in REQUIRED_CLIENT_FIELDS:
+                raise ValueError(f"{name} is required")
+            continue
+        if not isinstance(value, str) or len(value) > FIELD_MAX_LENGTHS.get(name, len(value)):
+            raise ValueError(f"{name} is invalid")
+        if name == "timestamp":
+            value = format_event_timestamp(parse_event_timestamp(value))
+        clean[name] = value
+    return clean
+
+
+def _us_per_event(validate, payloads):
+    started = time.perf_counter()
+    for payload in payloads:
+        validate(payload)
+    return (time.perf_counter() - started) / len(payloads) * 1e6
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+def test_validator_cost_per_event(sample_click_event):
+    """Report the per-event cost of the compiled validator next to JSON parsing and a naive validator"""
+    # Browsers send Date.toISOString(); other clients may send offsets that need converting
+    for label, timestamp in (("toISOString", "2023-09-15T14:30:45.123Z"), ("offset", "2023-09-15T16:30:45+0200")):
+        body = json.dumps({**sample_click_event, "timestamp": timestamp,
+                           "event_id": "3f2b8c1e-8d7a-4c55-9a43-0d6f2b1c9e77"})
+        payloads = [json.loads(body) for _ in range(EVENTS)]
+
+        parse_us = _us_per_event(json.loads, [body] * EVENTS)
+        naive_us = _us_per_event(_naive_validate, payloads)
+        compiled_us = _us_per_event(validate_click, payloads)
+        print(f"\n{label:>11}: json.loads {parse_us:.2f}us/event, naive validator {naive_us:.2f}us/event, "
+              f"compiled validator {compiled_us:.2f}us/event")
+
+        # Converting an offset is dominated by the timestamp parse either way
+        if label == "toISOString":
+            assert compiled_us < naive_us
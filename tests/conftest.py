@@ -98,6 +98,8 @@ def pytest_configure(config):
     os.environ["CHECK_AWS_RESOURCES"] = "1"
     os.environ["VALIDATE_TERRAFORM"] = "1"
     os.environ["PROJECT_NAME"] = "clickstream-lakehouse"
+    # Handler tests swap in MagicMock Kinesis clients, which cannot answer ListShards
+    os.environ.setdefault("SHARD_AWARE_THROTTLING", "false")
 
     # Register custom markers
     config.addinivalue_line("markers",
@@ -106,6 +108,8 @@ def pytest_configure(config):
                             "terraform: mark test as a terraform test")
     config.addinivalue_line("markers",
                             "infrastructure: mark test as infrastructure test")
+    config.addinivalue_line("markers",
+                            "benchmark: mark test as a benchmark (set RUN_BENCHMARKS=1 to run)")
 
 
 @pytest.fixture(scope="session")
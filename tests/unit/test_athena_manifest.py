@@ -0,0 +1,145 @@
+import os
+from datetime import date
+
+import boto3
+import pyarrow as pa
+import pytest
+from botocore.stub import Stubber
+
+from etl.athena_manifest import MANIFEST_DIR, PARTITION_STORAGE, VERSION_FILE, AthenaManifestPublisher
+
+deltalake = pytest.importorskip("deltalake")
+
+
+def _append(table_path, rows, mode="append"):
+    table = pa.Table.from_pylist(rows, schema=pa.schema([("page", pa.string()), ("event_date", pa.date32())]))
+    deltalake.write_deltalake(table_path, table, mode=mode, partition_by=["event_date"])
+
+
+def _rows(day, count):
+    return [{"page": f"/p{i}", "event_date": day} for i in range(count)]
+
+
+def _manifest(table_path, value):
+    with open(os.path.join(table_path, MANIFEST_DIR, f"event_date={value}", "manifest")) as f:
+        return f.read().splitlines()
+
+
+def _glue_client():
+    return boto3.client("glue", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+
+
+def _expect_partitions(stub, table_path, values, errors=()):
+    stub.add_response("batch_create_partition", {"Errors": list(errors)}, {
+        "DatabaseName": "clicks_db",
+        "TableName": "bronze_clicks",
+        "PartitionInputList": [
+            {"Values": [value], "StorageDescriptor": {
+                **PARTITION_STORAGE, "Location": f"{table_path}/{MANIFEST_DIR}/event_date={value}/"}}
+            for value in values
+        ],
+    })
+
+
+class TestAthenaManifestPublisher:
+    """Unit tests for the incremental symlink manifest / Glue partition post-commit hook"""
+
+    def test_first_publish_builds_all_manifests_and_registers_partitions(self, tmp_path, spark_session):
+        """Every partition gets a manifest Spark can read through, and one bulk registration"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, _rows(date(2024, 5, 1), 3) + _rows(date(2024, 5, 2), 2))
+        glue = _glue_client()
+        publisher = AthenaManifestPublisher(table_path, glue_client=glue, database="clicks_db",
+                                            table_name="bronze_clicks")
+
+        with Stubber(glue) as stub:
+            _expect_partitions(stub, table_path, ["2024-05-01", "2024-05-02"])
+            summary = publisher.publish()
+            stub.assert_no_pending_responses()
+
+        assert summary == {"version": 0, "partitions": ["2024-05-01", "2024-05-02"], "registered": 2}
+        first_day = _manifest(table_path, "2024-05-01")
+        assert first_day and all(path.startswith(f"{table_path}/event_date=2024-05-01/") for path in first_day)
+        assert spark_session.read.parquet(*first_day).count() == 3
+        with open(os.path.join(table_path, MANIFEST_DIR, VERSION_FILE)) as f:
+            assert f.read() == "0"
+
+    def test_later_batches_touch_only_their_partitions(self, tmp_path):
+        """Only partitions in the new commits are rewritten; only unseen ones are registered"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, _rows(date(2024, 5, 1), 3) + _rows(date(2024, 5, 2), 2))
+        glue = _glue_client()
+        publisher = AthenaManifestPublisher(table_path, glue_client=glue, database="clicks_db",
+                                            table_name="bronze_clicks")
+        with Stubber(glue) as stub:
+            _expect_partitions(stub, table_path, ["2024-05-01", "2024-05-02"])
+            publisher.publish()
+
+        untouched = os.path.join(table_path, MANIFEST_DIR, "event_date=2024-05-01", "manifest")
+        untouched_mtime = os.stat(untouched).st_mtime_ns
+        _append(table_path, _rows(date(2024, 5, 2), 4))
+        _append(table_path, _rows(date(2024, 5, 3), 1))
+
+        with Stubber(glue) as stub:
+            _expect_partitions(stub, table_path, ["2024-05-03"])
+            summary = publisher.publish()
+            stub.assert_no_pending_responses()
+
+            # Nothing new: no log replay, no Glue call
+            assert publisher.publish() is None
+
+        assert summary == {"version": 2, "partitions": ["2024-05-02", "2024-05-03"], "registered": 1}
+        assert os.stat(untouched).st_mtime_ns == untouched_mtime
+        assert len(_manifest(table_path, "2024-05-02")) == 2
+        assert len(_manifest(table_path, "2024-05-03")) == 1
+
+    def test_removed_files_leave_the_manifest(self, tmp_path):
+        """Delete/compaction commits drop the old files from the partition's manifest"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, _rows(date(2024, 5, 1), 3) + _rows(date(2024, 5, 2), 2))
+        publisher = AthenaManifestPublisher(table_path)
+        publisher.publish()
+
+        deltalake.DeltaTable(table_path).delete("page = '/p0'")
+        summary = publisher.publish()
+
+        assert summary["partitions"] == ["2024-05-01", "2024-05-02"]
+        live = set(deltalake.DeltaTable(table_path).file_uris())
+        manifests = set(_manifest(table_path, "2024-05-01") + _manifest(table_path, "2024-05-02"))
+        assert {os.path.normpath(path.replace("file://", "")) for path in live} == \
+            {os.path.normpath(path) for path in manifests}
+
+    def test_rebuilds_from_checkpoint_when_log_history_is_gone(self, tmp_path):
+        """Without a usable last version the live file set comes from the latest checkpoint"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, _rows(date(2024, 5, 1), 3))
+        _append(table_path, _rows(date(2024, 5, 2), 2))
+        table = deltalake.DeltaTable(table_path)
+        table.create_checkpoint()
+        os.remove(os.path.join(table_path, "_delta_log", f"{0:020d}.json"))  # Cleaned up by log retention
+        _append(table_path, _rows(date(2024, 5, 2), 1))
+
+        summary = AthenaManifestPublisher(table_path).publish()
+
+        assert summary["version"] == 2
+        assert len(_manifest(table_path, "2024-05-01")) == 1
+        assert len(_manifest(table_path, "2024-05-02")) == 2
+
+    def test_registration_errors_other_than_already_exists_fail_the_hook(self, tmp_path):
+        """An existing partition is fine; any other error stops before the version advances"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, _rows(date(2024, 5, 1), 1) + _rows(date(2024, 5, 2), 1))
+        glue = _glue_client()
+        publisher = AthenaManifestPublisher(table_path, glue_client=glue, database="clicks_db",
+                                            table_name="bronze_clicks")
+
+        with Stubber(glue) as stub:
+            _expect_partitions(stub, table_path, ["2024-05-01", "2024-05-02"], errors=[
+                {"PartitionValues": ["2024-05-01"], "ErrorDetail": {"ErrorCode": "AlreadyExistsException"}},
+                {"PartitionValues": ["2024-05-02"], "ErrorDetail": {"ErrorCode": "AccessDeniedException",
+                                                                    "ErrorMessage": "denied"}},
+            ])
+            with pytest.raises(RuntimeError, match="1 partition"):
+                publisher.publish()
+
+        assert not os.path.exists(os.path.join(table_path, MANIFEST_DIR, VERSION_FILE))
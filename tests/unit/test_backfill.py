@@ -0,0 +1,92 @@
+import gzip
+from unittest.mock import MagicMock
+
+import pytest
+
+from etl.backfill import (
+    BATCH_CLAIMED,
+    BATCH_INGESTED,
+    BackfillManifest,
+    list_landing_files,
+    plan_batches,
+)
+
+
+def _file(path, size=10):
+    return {"path": path, "size": size}
+
+
+class TestListLandingFiles:
+    """Unit tests for the parallel landing listing"""
+
+    def test_lists_nested_local_directories(self, tmp_path):
+        """Every NDJSON file at any depth is listed; markers, temporary and other files are not"""
+        day = tmp_path / "2024" / "05" / "01"
+        day.mkdir(parents=True)
+        (tmp_path / "2024" / "04" / "30").mkdir(parents=True)
+        (day / "part-0.json").write_text('{"page": "/"}\n')
+        with gzip.open(day / "part-1.json.gz", "wt") as f:
+            f.write('{"page": "/a"}\n')
+        (tmp_path / "2024" / "04" / "30" / "clicks.ndjson").write_text('{"page": "/b"}\n')
+        for skipped in ("_SUCCESS", ".part-2.json", "notes.txt"):
+            (day / skipped).write_text("x")
+
+        files = list_landing_files(str(tmp_path), max_workers=4)
+
+        assert [item["path"][len(str(tmp_path)) + 1:] for item in files] == [
+            "2024/04/30/clicks.ndjson", "2024/05/01/part-0.json", "2024/05/01/part-1.json.gz"]
+        assert files[1]["size"] == len('{"page": "/"}\n')
+        with pytest.raises(ValueError, match="not a directory"):
+            list_landing_files(str(tmp_path / "missing"))
+
+    def test_lists_s3_one_level_per_request(self):
+        """Each S3 prefix is listed with a delimiter and its common prefixes are listed in turn"""
+        pages = {
+            "landing/": [{"CommonPrefixes": [{"Prefix": "landing/2024-05-01/"}, {"Prefix": "landing/2024-05-02/"}]}],
+            "landing/2024-05-01/": [{"Contents": [{"Key": "landing/2024-05-01/a.json.gz", "Size": 5}]},
+                                    {"Contents": [{"Key": "landing/2024-05-01/b.json.gz", "Size": 7}]}],
+            "landing/2024-05-02/": [{"Contents": [{"Key": "landing/2024-05-02/_manifest", "Size": 1},
+                                                  {"Key": "landing/2024-05-02/c.jsonl", "Size": 9}]}],
+        }
+        s3_client = MagicMock()
+        s3_client.get_paginator.return_value.paginate.side_effect = lambda Bucket, Prefix, Delimiter: pages[Prefix]
+
+        files = list_landing_files("s3://raw/landing", s3_client, max_workers=2)
+
+        assert files == [_file("s3://raw/landing/2024-05-01/a.json.gz", 5),
+                         _file("s3://raw/landing/2024-05-01/b.json.gz", 7),
+                         _file("s3://raw/landing/2024-05-02/c.jsonl", 9)]
+        paginate = s3_client.get_paginator.return_value.paginate
+        assert sorted(call.kwargs["Prefix"] for call in paginate.call_args_list) == sorted(pages)
+
+
+class TestPlanBatches:
+    """Unit tests for backfill batch planning"""
+
+    def test_batches_are_bounded_by_files_and_bytes(self):
+        files = [_file(f"/landing/{index}.json", size) for index, size in enumerate([40, 40, 40, 90, 10])]
+
+        batches = plan_batches(files, {}, max_files=2, max_bytes=100)
+
+        assert [[item["path"][9:] for item in batch["files"]] for batch in batches] == \
+            [["0.json", "1.json"], ["2.json"], ["3.json", "4.json"]]
+        assert batches == plan_batches(files, {}, max_files=2, max_bytes=100)
+        assert len({batch["batch_id"] for batch in batches}) == 3
+
+    def test_recorded_files_are_skipped_and_claimed_batches_resumed(self, tmp_path):
+        """Ingested files are not planned again; a claimed batch comes back first with the same id and files"""
+        manifest = BackfillManifest(str(tmp_path / "manifest"))
+        done = {"batch_id": "aaa", "files": [_file("/landing/0.json")]}
+        interrupted = {"batch_id": "bbb", "files": [_file("/landing/1.json"), _file("/landing/2.json")]}
+        manifest.record(done, BATCH_CLAIMED)
+        manifest.record(done, BATCH_INGESTED)
+        manifest.record(interrupted, BATCH_CLAIMED)
+
+        recorded = manifest.load()
+        assert {batch_id: entry["state"] for batch_id, entry in recorded.items()} == \
+            {"aaa": BATCH_INGESTED, "bbb": BATCH_CLAIMED}
+
+        files = [_file(f"/landing/{index}.json") for index in range(4)]
+        batches = plan_batches(files, recorded)
+        assert batches[0] == interrupted
+        assert [[item["path"] for item in batch["files"]] for batch in batches[1:]] == [["/landing/3.json"]]
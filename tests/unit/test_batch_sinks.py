@@ -0,0 +1,148 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from pyspark.sql.functions import col, udf
+from pyspark.sql.types import StringType
+
+from etl.batch_sinks import DeltaBatchSink, LogSampleSink, MicroBatchFanOut, PartitionSpreadSink, write_delta_batch
+
+
+class RecordingSink:
+    """Sink that keeps what it was given, optionally failing on chosen batches"""
+
+    def __init__(self, name, fail_on=()):
+        self.name = name
+        self.fail_on = set(fail_on)
+        self.calls = []
+
+    def write(self, prepared_df, batch_id, txn_app_id):
+        if batch_id in self.fail_on:
+            self.fail_on.discard(batch_id)
+            raise RuntimeError(f"{self.name} unavailable")
+        self.calls.append((batch_id, txn_app_id, sorted(row.value for row in prepared_df.collect())))
+
+
+def _app_id(sink_name):
+    return f"clicks-{sink_name}-abc"
+
+
+class TestBatchSinks:
+    """Unit tests for the single-pass micro-batch fan-out"""
+
+    def test_write_delta_batch_sorts_after_the_partition_column(self):
+        """Sorting leads with the partition column; every batch carries its Delta transaction id"""
+        df = MagicMock()
+        sorted_df = df.sortWithinPartitions.return_value
+
+        write_delta_batch(df, "s3://b/bronze/", "event_date", "clicks-bronze-abc", 42,
+                          sort_columns=("page", "element", "event_ts"))
+
+        df.sortWithinPartitions.assert_called_once_with("event_date", "page", "element", "event_ts")
+        writer = sorted_df.write.format.return_value.mode.return_value
+        writer.option.assert_called_once_with("txnAppId", "clicks-bronze-abc")
+        writer.option.return_value.option.assert_called_once_with("txnVersion", 42)
+
+        unsorted = MagicMock()
+        write_delta_batch(unsorted, "s3://b/bronze/", "event_date", "clicks-bronze-abc", 43)
+        unsorted.sortWithinPartitions.assert_not_called()
+
+    def test_delta_sink_writes_its_own_frame(self):
+        prepared_df = MagicMock()
+        build = MagicMock()
+        sink = DeltaBatchSink("dlq", "s3://b/dlq/", build, "dlq_date")
+
+        sink.write(prepared_df, 7, "clicks-dlq-abc")
+
+        build.assert_called_once_with(prepared_df)
+        writer = build.return_value.write.format.return_value.mode.return_value
+        writer.option.assert_called_once_with("txnAppId", "clicks-dlq-abc")
+
+    def test_every_sink_gets_each_batch_with_its_own_app_id(self, spark_session):
+        bronze, dlq = RecordingSink("bronze"), RecordingSink("dlq")
+        fan_out = MicroBatchFanOut([bronze, dlq], _app_id)
+
+        fan_out(spark_session.createDataFrame([("a",), ("b",)], "value string"), 3)
+
+        assert bronze.calls == [(3, "clicks-bronze-abc", ["a", "b"])]
+        assert dlq.calls == [(3, "clicks-dlq-abc", ["a", "b"])]
+        summary = fan_out.metrics.summary()
+        assert list(summary) == ["bronze", "dlq"]
+        assert summary["bronze"]["batches"] == 1 and summary["bronze"]["failures"] == 0
+
+    def test_failed_sink_fails_the_batch_and_is_timed(self, spark_session):
+        """The error reaches the query so the batch is retried; later sinks wait for the retry"""
+        bronze, gold, dlq = RecordingSink("bronze"), RecordingSink("gold", fail_on=[5]), RecordingSink("dlq")
+        fan_out = MicroBatchFanOut([bronze, gold, dlq], _app_id)
+        batch = spark_session.createDataFrame([("a",)], "value string")
+
+        with pytest.raises(RuntimeError, match="gold unavailable"):
+            fan_out(batch, 5)
+        assert dlq.calls == []
+
+        fan_out(batch, 5)  # Retry: a Delta sink that committed batch 5 would skip it by its txn id
+        assert [call[0] for call in bronze.calls] == [5, 5]
+        assert [call[0] for call in gold.calls] == [5]
+        assert [call[0] for call in dlq.calls] == [5]
+        assert fan_out.metrics.summary()["gold"]["failures"] == 1
+
+    def test_sink_names_must_be_unique(self):
+        with pytest.raises(ValueError, match="unique"):
+            MicroBatchFanOut([RecordingSink("bronze"), RecordingSink("bronze")], _app_id)
+
+    def test_sample_sink_logs_the_first_non_empty_batch_only(self, spark_session, caplog):
+        sink = LogSampleSink(lambda df: df.where(col("value") != "skip"), rows=1)
+        caplog.set_level("INFO", logger="batch_sinks")
+
+        sink.write(spark_session.createDataFrame([("skip",)], "value string"), 0, "unused")
+        sink.write(spark_session.createDataFrame([("a",), ("b",)], "value string"), 1, "unused")
+        sink.write(spark_session.createDataFrame([("c",)], "value string"), 2, "unused")
+
+        samples = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Sample")]
+        assert samples == ["Sample from batch 1: {'value': 'a'}"]
+
+    def test_partition_spread_sink_reports_stray_partitions(self, spark_session):
+        """Partitions with a sliver of the batch are counted as stray, and rows are counted per flag"""
+        sink = PartitionSpreadSink(lambda df: df, "event_date", flag_column="source", stray_fraction=0.1)
+        rows = [("2024-05-01", "client")] * 18 + [("2024-04-02", "client_skewed"), ("2031-01-01", "client_skewed")]
+
+        sink.write(spark_session.createDataFrame(rows, "event_date string, source string"), 0, "unused")
+        sink.write(spark_session.createDataFrame([("2024-05-01", "client")] * 2, "event_date string, source string"),
+                   1, "unused")
+        sink.write(spark_session.createDataFrame([], "event_date string, source string"), 2, "unused")
+
+        assert sink.summary() == {"batches": 2, "rows": 22, "partitions": 4, "max_partitions": 3,
+                                  "stray_partitions": 2, "flags": {"client": 20, "client_skewed": 2},
+                                  "mean_partitions": 2.0}
+
+    def test_adding_sinks_does_not_reread_the_source(self, tmp_path, spark_session):
+        """One streaming query decodes each record once, however many sinks read the batch"""
+        source = tmp_path / "source"
+        source.mkdir()
+        for part in range(3):
+            (source / f"part-{part}.json").write_text(
+                "\n".join(json.dumps({"value": f"{part}-{i}"}) for i in range(10)))
+
+        decoded = spark_session.sparkContext.accumulator(0)
+
+        def decode(value):
+            decoded.add(1)
+            return value.upper()
+
+        decode_udf = udf(decode, StringType())
+        sinks = [RecordingSink(name) for name in ("bronze", "dlq", "gold", "sample")]
+        fan_out = MicroBatchFanOut(sinks, _app_id, prepare=lambda df: df.select(decode_udf("value").alias("value")))
+
+        query = (
+            spark_session.readStream.schema("value string").option("maxFilesPerTrigger", 1).json(str(source))
+            .writeStream.foreachBatch(fan_out)
+            .option("checkpointLocation", str(tmp_path / "checkpoint"))
+            .trigger(availableNow=True)
+            .start()
+        )
+        query.awaitTermination()
+
+        assert decoded.value == 30
+        for sink in sinks:
+            assert [call[0] for call in sink.calls] == [0, 1, 2]
+            assert sum(len(call[2]) for call in sink.calls) == 30
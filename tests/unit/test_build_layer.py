@@ -0,0 +1,148 @@
+import importlib.util
+import os
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+SCRIPT_PATH = Path(__file__).resolve().parents[2] / "infra" / "terraform" / "scripts" / "build_layer.py"
+_spec = importlib.util.spec_from_file_location("build_layer", SCRIPT_PATH)
+build_layer = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(build_layer)
+
+
+def _fake_install(python_packages_dir, wheel_dir):
+    os.makedirs(os.path.join(python_packages_dir, "aws_schema_registry"))
+    Path(python_packages_dir, "aws_schema_registry", "__init__.py").write_text("VERSION = '1.1.3'\n")
+    return True
+
+
+class TestBuildLayer:
+    """Unit tests for the content-addressed Lambda layer build"""
+
+    def test_cache_key_covers_requirements_python_and_platform(self):
+        """The key ignores requirement order but changes with any input"""
+        key = build_layer.layer_cache_key()
+        assert key == build_layer.layer_cache_key(list(reversed(build_layer.LAYER_REQUIREMENTS)))
+        assert key != build_layer.layer_cache_key(build_layer.LAYER_REQUIREMENTS + ["six==1.17.0"])
+        assert key != build_layer.layer_cache_key(python_version="3.13")
+        assert key != build_layer.layer_cache_key(platform_tag="manylinux2014_aarch64")
+
+    def test_zip_is_deterministic(self, tmp_path):
+        """Same files give byte-identical zips whatever their mtimes or creation order"""
+        for name, order in (("a", ["b.py", "a/z.py", "a/y.py"]), ("b", ["a/y.py", "b.py", "a/z.py"])):
+            root = tmp_path / name
+            for index, relative in enumerate(order):
+                path = root / "python" / relative
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(f"# {relative}\n")
+                os.utime(path, (1_700_000_000 + index * 1000, 1_700_000_000 + index * 1000))
+            build_layer.write_deterministic_zip(str(root), str(tmp_path / f"{name}.zip"))
+
+        assert (tmp_path / "a.zip").read_bytes() == (tmp_path / "b.zip").read_bytes()
+        with zipfile.ZipFile(tmp_path / "a.zip") as archive:
+            assert archive.namelist() == ["python/a/y.py", "python/a/z.py", "python/b.py"]
+            assert {info.date_time for info in archive.infolist()} == {build_layer.ZIP_EPOCH}
+
+    def test_cache_miss_builds_once_then_hits(self, tmp_path):
+        """A miss builds and caches the layer; the next run returns it without building or rewriting"""
+        output_dir = tmp_path / "out"
+        cache_dir = tmp_path / "cache"
+
+        with patch.object(build_layer, "build_layer_from_wheel_cache", side_effect=_fake_install) as install:
+            output_path = build_layer.build_schema_registry_layer(str(output_dir), cache_dir=str(cache_dir))
+        install.assert_called_once()
+        cached = cache_dir / "layers" / f"{build_layer.layer_cache_key()}.zip"
+        assert Path(output_path).read_bytes() == cached.read_bytes()
+        with zipfile.ZipFile(output_path) as archive:
+            assert "python/orjson/orjson/__init__.py" in archive.namelist()
+
+        os.utime(output_path, (1_600_000_000, 1_600_000_000))
+        with patch.object(build_layer, "build_layer_from_wheel_cache") as install, \
+                patch.object(build_layer, "is_docker_available") as docker:
+            assert build_layer.build_schema_registry_layer(str(output_dir), cache_dir=str(cache_dir)) == output_path
+        install.assert_not_called()
+        docker.assert_not_called()
+        # An identical output is left alone so its mtime (and anything keyed on it) does not change
+        assert os.path.getmtime(output_path) == 1_600_000_000
+
+    def test_host_builds_are_not_cached(self, tmp_path):
+        """A local fallback build targets the host platform, so it is never stored under the Lambda key"""
+        with patch.object(build_layer, "build_layer_from_wheel_cache", return_value=False), \
+                patch.object(build_layer, "is_docker_available", return_value=False), \
+                patch.object(build_layer, "build_layer_locally",
+                             side_effect=lambda packages_dir: _fake_install(packages_dir, None)):
+            output_path = build_layer.build_schema_registry_layer(str(tmp_path / "out"), cache_dir=str(tmp_path / "cache"))
+
+        assert os.path.exists(output_path)
+        assert not (tmp_path / "cache" / "layers").exists()
+
+    def test_slim_layer_prunes_and_precompiles(self, tmp_path):
+        """Post-processing drops metadata, tests and stubs and leaves unchecked-hash bytecode the layer imports"""
+        import subprocess
+        import sys
+
+        packages = tmp_path / "python"
+        for relative, content in {
+            "clicklib/__init__.py": "from .core import answer\n",
+            "clicklib/core.py": "def answer():\n    return 42\n",
+            "clicklib/core.pyi": "def answer() -> int: ...\n",
+            "clicklib/tests/test_core.py": "def test_answer():\n    pass\n",
+            "clicklib-1.0.dist-info/RECORD": "",
+            "bin/clicklib": "#!/usr/bin/env python\n",
+        }.items():
+            path = packages / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+
+        host_version = f"{sys.version_info[0]}.{sys.version_info[1]}"
+        with patch.object(build_layer, "LAYER_IMPORTS", ["clicklib"]), \
+                patch.object(build_layer, "LAMBDA_PYTHON_VERSION", host_version):
+            report = build_layer.slim_layer(str(packages))
+
+        tag = sys.implementation.cache_tag
+        remaining = sorted(path.relative_to(packages).as_posix() for path in packages.rglob("*") if path.is_file())
+        assert remaining == ["clicklib/__init__.py", f"clicklib/__pycache__/__init__.{tag}.pyc",
+                             f"clicklib/__pycache__/core.{tag}.pyc", "clicklib/core.py"]
+        assert report["size_before"] > 0 and report["size_after"] > 0
+        assert report["import_before"] is not None and report["import_after"] is not None
+
+        # Unchecked-hash bytecode is used as-is: an edited source is not even looked at
+        (packages / "clicklib" / "core.py").write_text("def answer():\n    return 0\n")
+        result = subprocess.run([sys.executable, "-B", "-S", "-c",
+                                 f"import sys; sys.path.insert(0, {str(packages)!r}); "
+                                 "import clicklib; print(clicklib.answer())"],
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "42"
+        # Compiled against the path Lambda extracts the layer to, not the build directory
+        pyc = (packages / "clicklib" / "__pycache__" / f"core.{tag}.pyc").read_bytes()
+        assert f"{build_layer.LAYER_RUNTIME_PATH}/clicklib/core.py".encode() in pyc and str(tmp_path).encode() not in pyc
+
+    def test_slim_layer_fails_when_pruning_breaks_imports(self, tmp_path):
+        """A layer that imported before post-processing but not after fails the build instead of shipping"""
+        packages = tmp_path / "python"
+        for relative, content in {
+            "clicklib/__init__.py": "from .tests.fixtures import answer\n",
+            "clicklib/tests/__init__.py": "",
+            "clicklib/tests/fixtures.py": "def answer():\n    return 42\n",
+        }.items():
+            path = packages / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+
+        with patch.object(build_layer, "LAYER_IMPORTS", ["clicklib"]), \
+                patch.object(build_layer, "precompile_bytecode", return_value=False), \
+                pytest.raises(RuntimeError, match="no longer import"):
+            build_layer.slim_layer(str(packages))
+
+    def test_orjson_shim_skipped_when_extension_exists(self, tmp_path):
+        """The orjson.orjson shim is only created for wheels without the orjson.orjson extension"""
+        (tmp_path / "orjson").mkdir()
+        (tmp_path / "orjson" / "orjson.cpython-312-x86_64-linux-gnu.so").write_bytes(b"")
+        build_layer._add_orjson_shim(str(tmp_path))
+        assert not (tmp_path / "orjson" / "orjson").exists()
+
+        (tmp_path / "orjson" / "orjson.cpython-312-x86_64-linux-gnu.so").unlink()
+        build_layer._add_orjson_shim(str(tmp_path))
+        assert (tmp_path / "orjson" / "orjson" / "__init__.py").exists()
@@ -0,0 +1,178 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from etl.capacity_advisor import ShardScaler, fetch_glue_metrics, fetch_stream_metrics, percentile, recommend
+
+# One hour of CloudWatch metrics at 60s periods, recorded from a 5-shard stream and a 2 x G.1X job
+RECORDED = os.path.join(os.path.dirname(__file__), "mocks", "capacity_metrics.json")
+START = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+END = START + timedelta(hours=1)
+
+
+def _recorded(window, source):
+    """A recorded GetMetricData response, with timestamps as datetimes like botocore returns them."""
+    with open(RECORDED) as f:
+        response = json.load(f)[window][source]
+    for result in response["MetricDataResults"]:
+        result["Timestamps"] = [datetime.fromisoformat(value.replace("Z", "+00:00"))
+                                for value in result["Timestamps"]]
+    return response
+
+
+def _client(service):
+    return boto3.client(service, region_name="us-east-1", aws_access_key_id="testing",
+                        aws_secret_access_key="testing")
+
+
+def _fetch(window):
+    cloudwatch = _client("cloudwatch")
+    with Stubber(cloudwatch) as stub:
+        expected = {"MetricDataQueries": ANY, "StartTime": START, "EndTime": END, "ScanBy": "TimestampAscending"}
+        stub.add_response("get_metric_data", _recorded(window, "stream"), expected)
+        stub.add_response("get_metric_data", _recorded(window, "glue"), expected)
+        stream = fetch_stream_metrics(cloudwatch, "clickstream-click-dev", START, END)
+        glue = fetch_glue_metrics(cloudwatch, "clickstream-stream-dev", START, END)
+        stub.assert_no_pending_responses()
+    return stream, glue
+
+
+def _summary(open_shards, status="ACTIVE", mode="PROVISIONED"):
+    return {"StreamDescriptionSummary": {
+        "StreamName": "clickstream-click-dev", "StreamARN": "arn:aws:kinesis:us-east-1:123456789012:stream/s",
+        "StreamStatus": status, "StreamModeDetails": {"StreamMode": mode}, "RetentionPeriodHours": 48,
+        "StreamCreationTimestamp": START, "EnhancedMonitoring": [], "OpenShardCount": open_shards}}
+
+
+class TestCapacityAdvisor:
+    """Unit tests for the shard and worker recommendations"""
+
+    def test_fetch_pages_through_metric_data(self):
+        """Series are keyed by name, in time order, across NextToken pages"""
+        cloudwatch = _client("cloudwatch")
+        first = {"MetricDataResults": [{"Id": "batch_records", "Timestamps": [START + timedelta(minutes=1)],
+                                        "Values": [20.0]}], "NextToken": "page-2"}
+        second = {"MetricDataResults": [{"Id": "batch_records", "Timestamps": [START], "Values": [10.0]},
+                                        {"Id": "batch_ms", "Timestamps": [START], "Values": [5.0]}]}
+        with Stubber(cloudwatch) as stub:
+            stub.add_response("get_metric_data", first)
+            stub.add_response("get_metric_data", second, {"MetricDataQueries": ANY, "StartTime": START,
+                                                          "EndTime": END, "ScanBy": "TimestampAscending",
+                                                          "NextToken": "page-2"})
+            glue = fetch_glue_metrics(cloudwatch, "clickstream-stream-dev", START, END)
+
+        assert glue == {"batch_records": [10.0, 20.0], "batch_ms": [5.0]}
+
+    def test_surge_scales_shards_and_workers_up(self):
+        """Throttled writes and a growing iterator age call for more shards and workers"""
+        stream, glue = _fetch("surge")
+        result = recommend(stream, glue, shards=5, workers=2)
+
+        assert (result["shards"], result["workers"]) == (9, 4)
+        assert result["load"]["iterator_age_seconds"] > 60
+        assert any("throttled" in reason for reason in result["reasons"])
+        assert any("catch up" in reason for reason in result["reasons"])
+
+        # Larger workers: one executor's cores already cover the shards
+        capped = recommend(stream, glue, shards=5, workers=2, worker_type="G.2X")
+        assert capped["workers"] == 3
+        assert any("read parallelism" in reason for reason in capped["reasons"])
+
+    def test_steady_load_scales_down_only_past_the_band(self):
+        """Shards come down when a fraction of them would do; capacity just above the need stays"""
+        stream, glue = _fetch("steady")
+
+        assert (recommend(stream, glue, shards=5, workers=2)["shards"],
+                recommend(stream, glue, shards=5, workers=2)["workers"]) == (2, 2)
+        assert recommend(stream, glue, shards=3, workers=2)["shards"] == 3
+        lagging = {**stream, "iterator_age_ms": stream["iterator_age_ms"][:-1] + [300_000]}
+        assert recommend(lagging, glue, shards=5, workers=2)["shards"] == 5
+
+    def test_hot_shards_scale_up_without_rate_pressure(self):
+        stream = {"incoming_bytes": [60 * 1024 * 1024] * 10, "incoming_records": [60_000] * 10,
+                  "write_throttles": [0] * 8 + [25, 30]}
+        result = recommend(stream, {}, shards=4, workers=2)
+
+        assert (result["shards"], result["workers"]) == (6, 2)
+        assert "hot shards" in result["reasons"][0]
+        assert "no Glue batch metrics" in result["reasons"][1]
+
+    def test_percentile_is_nearest_rank(self):
+        assert percentile([], 95) == 0.0
+        assert percentile(list(range(1, 101)), 95) == 95
+        assert percentile([3, 1, 2], 50) == 2
+
+
+class TestShardScaler:
+    """Unit tests for applying shard recommendations"""
+
+    def test_scale_up_applies_within_uniform_scaling_limits_and_cools_down(self, tmp_path):
+        kinesis = _client("kinesis")
+        scaler = ShardScaler(kinesis, "clickstream-click-dev", str(tmp_path / "state.json"))
+
+        with Stubber(kinesis) as stub:
+            stub.add_response("describe_stream_summary", _summary(4), {"StreamName": "clickstream-click-dev"})
+            stub.add_response("update_shard_count", {"StreamName": "clickstream-click-dev", "CurrentShardCount": 4,
+                                                     "TargetShardCount": 8},
+                              {"StreamName": "clickstream-click-dev", "TargetShardCount": 8,
+                               "ScalingType": "UNIFORM_SCALING"})
+            assert scaler.apply(20, now=START) == {"action": "updated", "from": 4, "to": 8}
+
+            stub.add_response("describe_stream_summary", _summary(8), {"StreamName": "clickstream-click-dev"})
+            skipped = scaler.apply(12, now=START + timedelta(minutes=5))
+            stub.assert_no_pending_responses()
+
+        assert skipped["action"] == "skipped" and "cooldown" in skipped["reason"]
+        assert scaler.load_state()["changes"] == [{"at": START.isoformat(), "from": 4, "to": 8}]
+
+    def test_scale_down_needs_consecutive_recommendations(self, tmp_path):
+        kinesis = _client("kinesis")
+        scaler = ShardScaler(kinesis, "clickstream-click-dev", str(tmp_path / "state.json"),
+                             policy={"scale_down_evaluations": 2})
+
+        with Stubber(kinesis) as stub:
+            for _ in range(4):
+                stub.add_response("describe_stream_summary", _summary(5))
+            stub.add_response("update_shard_count", {"StreamName": "clickstream-click-dev", "CurrentShardCount": 5,
+                                                     "TargetShardCount": 3},
+                              {"StreamName": "clickstream-click-dev", "TargetShardCount": 3,
+                               "ScalingType": "UNIFORM_SCALING"})
+            first = scaler.apply(2, now=START)
+            # A run at the current count resets the streak
+            assert scaler.apply(5, now=START + timedelta(hours=1))["action"] == "skipped"
+            assert scaler.apply(2, now=START + timedelta(hours=2))["action"] == "skipped"
+            applied = scaler.apply(2, now=START + timedelta(hours=3))
+            stub.assert_no_pending_responses()
+
+        assert "1 of 2 times" in first["reason"]
+        assert applied == {"action": "updated", "from": 5, "to": 3}
+
+    @pytest.mark.parametrize("summary, reason", [
+        (_summary(4, status="UPDATING"), "stream is UPDATING"),
+        (_summary(4, mode="ON_DEMAND"), "stream is on-demand"),
+    ])
+    def test_streams_that_cannot_be_resharded_are_left_alone(self, tmp_path, summary, reason):
+        kinesis = _client("kinesis")
+        with Stubber(kinesis) as stub:
+            stub.add_response("describe_stream_summary", summary)
+            result = ShardScaler(kinesis, "clickstream-click-dev", str(tmp_path / "state.json")).apply(8, now=START)
+            stub.assert_no_pending_responses()
+        assert result == {"action": "skipped", "reason": reason}
+
+    def test_daily_change_limit(self, tmp_path):
+        state_path = tmp_path / "state.json"
+        changes = [{"at": (START - timedelta(hours=hours)).isoformat(), "from": 4, "to": 4} for hours in (30, 20, 10)]
+        state_path.write_text(json.dumps({"changes": changes, "low_evaluations": 0}))
+        kinesis = _client("kinesis")
+        scaler = ShardScaler(kinesis, "clickstream-click-dev", str(state_path), policy={"max_changes_per_day": 2})
+
+        with Stubber(kinesis) as stub:
+            stub.add_response("describe_stream_summary", _summary(4))
+            result = scaler.apply(6, now=START)
+
+        assert result["reason"] == "2 changes in the last 24h"
+        assert len(scaler.load_state()["changes"]) == 2
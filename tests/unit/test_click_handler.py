@@ -97,3 +97,111 @@ class TestClickHandler:
             # Verify Kinesis call used "unknown" as the partition key
             args, kwargs = mock_kinesis.put_record.call_args
             assert kwargs["PartitionKey"] == "unknown"
+
+    def test_handler_emits_embedded_metric_format(self, mock_kinesis, sample_api_gateway_event, capsys):
+        """Test the per-invocation EMF record declares every metric with a unit and a numeric value"""
+        mock_kinesis.put_record.return_value = {"ShardId": "shard-1", "SequenceNumber": "seq-1"}
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'EVENT_LOG_SAMPLE_RATE', 0):
+            lambda_handler(sample_api_gateway_event, mock_context)
+
+        emf_lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"_aws"' in line]
+        assert len(emf_lines) == 1
+        record = emf_lines[0]
+
+        assert isinstance(record["_aws"]["Timestamp"], int)
+        [directive] = record["_aws"]["CloudWatchMetrics"]
+        assert directive["Namespace"] == "ClickstreamIngest"
+        assert directive["Dimensions"] == [["StreamName"]]
+        assert record["StreamName"] == "test-stream"
+        assert {(m["Name"], m["Unit"]) for m in directive["Metrics"]} == {
+            ("ParseLatency", "Milliseconds"),
+            ("EnrichLatency", "Milliseconds"),
+            ("KinesisPutLatency", "Milliseconds"),
+            ("PayloadBytes", "Bytes"),
+        }
+        for metric in directive["Metrics"]:
+            assert isinstance(record[metric["Name"]], (int, float)) and record[metric["Name"]] >= 0
+
+        _, kwargs = mock_kinesis.put_record.call_args
+        assert record["PayloadBytes"] == len(kwargs["Data"])
+        assert record["StatusCode"] == 200
+        assert record["RequestId"] == "test-request-id"
+
+    def test_handler_metrics_on_invalid_json(self, mock_kinesis, capsys):
+        """Test a rejected request still emits EMF, without declaring the phases it never reached"""
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis):
+            lambda_handler({"body": "{invalid json}"}, MagicMock())
+
+        record = json.loads([line for line in capsys.readouterr().out.splitlines() if '"_aws"' in line][0])
+        assert record["StatusCode"] == 400
+        assert record["_aws"]["CloudWatchMetrics"][0]["Metrics"] == []
+
+    def test_handler_throttled_returns_429(self, mock_kinesis, sample_api_gateway_event):
+        """Test a write still throttled when the latency budget runs out gets 429 with Retry-After"""
+        from botocore.exceptions import ClientError
+
+        mock_kinesis.put_record.side_effect = ClientError(
+            {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "Rate exceeded"}}, "PutRecord")
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'PUT_LATENCY_BUDGET_MS', 50):
+            result = lambda_handler(sample_api_gateway_event, mock_context)
+
+        assert result["statusCode"] == 429
+        assert int(result["headers"]["Retry-After"]) >= 1
+        assert "Too many requests" in json.loads(result["body"])["error"]
+        assert mock_kinesis.put_record.call_count >= 1
+
+    def test_handler_skips_duplicate_event_ids(self, mock_kinesis, sample_api_gateway_event, capsys):
+        """Test a retried click with the same event_id is acknowledged without a second Kinesis write"""
+        mock_kinesis.put_record.return_value = {"ShardId": "shard-1", "SequenceNumber": "seq-1"}
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        event = {"body": json.dumps({**json.loads(sample_api_gateway_event["body"]), "event_id": "evt-123"})}
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'seen_events', click_handler_module.SeenEventCache()):
+            first = lambda_handler(event, mock_context)
+            retry = lambda_handler(event, mock_context)
+
+        assert first["statusCode"] == 200 and retry["statusCode"] == 200
+        assert json.loads(retry["body"]) == {"ingested": True, "duplicate": True}
+        mock_kinesis.put_record.assert_called_once()
+        assert json.loads(mock_kinesis.put_record.call_args.kwargs["Data"])["event_id"] == "evt-123"
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"_aws"' in line]
+        assert [record["DuplicateEvents"] for record in records] == [0, 1]
+        assert (records[-1]["DedupCacheHits"], records[-1]["DedupCacheMisses"]) == (1, 1)
+
+    def test_handler_rejects_invalid_payload(self, mock_kinesis):
+        """Test a payload failing schema validation gets 400 and never reaches Kinesis"""
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        event = {"body": json.dumps({"element": "button-signup", "timestamp": "2023-09-15T14:30:45Z"})}
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis):
+            result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 400
+        assert json.loads(result["body"]) == {"error": "Invalid click payload", "message": "page is required"}
+        mock_kinesis.put_record.assert_not_called()
+
+    def test_handler_sends_normalized_payload(self, mock_kinesis, sample_api_gateway_event):
+        """Test the record written to Kinesis carries the canonical UTC timestamp and no unknown fields"""
+        mock_kinesis.put_record.return_value = {"ShardId": "shard-1", "SequenceNumber": "seq-1"}
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        body = {**json.loads(sample_api_gateway_event["body"]), "timestamp": "2023-09-15T16:30:45+0200", "debug": 1}
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis):
+            assert lambda_handler({"body": json.dumps(body)}, mock_context)["statusCode"] == 200
+
+        payload = json.loads(mock_kinesis.put_record.call_args.kwargs["Data"])
+        assert payload["timestamp"] == "2023-09-15T14:30:45.000Z"
+        assert "debug" not in payload
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from etl.click_schema import (
+    REJECT_INVALID_TIMESTAMP,
+    REJECT_MALFORMED_JSON,
+    REJECT_NO_KNOWN_FIELDS,
+    parse_event_timestamp,
+    parse_payload,
+    trusted_event_time,
+)
+
+SERVER = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestClickSchema:
+    """Unit tests for the canonical click schema rules"""
+
+    def test_parse_event_timestamp(self):
+        """Browser ISO-8601 timestamps and numeric offsets parse to UTC; other formats do not"""
+        assert parse_event_timestamp("2023-09-15T14:30:45.123Z") == datetime(2023, 9, 15, 14, 30, 45, 123000,
+                                                                              tzinfo=timezone.utc)
+        assert parse_event_timestamp("2023-09-15T14:30:45+0130") == datetime(2023, 9, 15, 13, 0, 45,
+                                                                             tzinfo=timezone.utc)
+        assert parse_event_timestamp("2023-09-15 14:30:45") is None
+        assert parse_event_timestamp("2023-02-30T14:30:45Z") is None
+
+    def test_parse_payload_reject_reasons(self):
+        """Payloads are classified with the same reject reasons as the Glue job"""
+        fields, reason = parse_payload(b'{"element": "button", "page": "/home"}')
+        assert reason is None and fields["element"] == "button" and fields["timestamp"] is None
+
+        assert parse_payload(b"{not json")[1] == REJECT_MALFORMED_JSON
+        assert parse_payload(b'"just a string"')[1] == REJECT_MALFORMED_JSON
+        assert parse_payload(b'{"other": 1}')[1] == REJECT_NO_KNOWN_FIELDS
+        assert parse_payload(b'{"page": "/", "timestamp": "yesterday"}')[1] == REJECT_INVALID_TIMESTAMP
+
+    def test_trusted_event_time_policies(self):
+        """Skew within bounds keeps the client time; beyond them each policy flags, clamps or replaces it"""
+        ingest = "2024-05-01T12:00:00Z"
+        ahead, behind = SERVER + timedelta(days=400), SERVER - timedelta(hours=2, milliseconds=500)
+
+        assert trusted_event_time(SERVER + timedelta(seconds=30), ingest) == (SERVER + timedelta(seconds=30), 30,
+                                                                              "client")
+        assert trusted_event_time(ahead, ingest, policy="client") == (ahead, 400 * 86400, "client_skewed")
+        # Clamping is the default
+        assert trusted_event_time(ahead, ingest) == (SERVER + timedelta(minutes=5), 400 * 86400, "clamped")
+        assert trusted_event_time(behind, ingest, policy="clamp") == (SERVER - timedelta(hours=1), -7201, "clamped")
+        assert trusted_event_time(behind, ingest, policy="server", max_past_seconds=7200) == (SERVER, -7201, "server")
+        assert trusted_event_time(behind, ingest, policy="server", max_past_seconds=7201)[2] == "client"
+
+    def test_trusted_event_time_falls_back_to_arrival(self):
+        """Without ingest_ts the Kinesis arrival time is the server time; a missing side is not skew"""
+        client = SERVER + timedelta(hours=1)
+        assert trusted_event_time(client, None, SERVER, policy="server") == (SERVER, 3600, "server")
+        assert trusted_event_time(client, "not a time", SERVER, policy="client")[1:] == (3600, "client_skewed")
+        assert trusted_event_time(None, None, SERVER) == (SERVER, None, "server")
+        assert trusted_event_time(client, None, None, policy="server") == (client, None, "client")
+        assert trusted_event_time(None, None, None) == (None, None, None)
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer
+
+with patch.dict(os.environ, {"REGION": "us-east-1", "STREAM_NAME": "test-stream"}):
+    from etl.handlers.collector import KinesisBatcher, create_app
+    from etl.handlers.geoip import GeoIpTable, build_range_table
+    from etl.handlers.spill import SpillBuffer
+
+
+def _ok_response(Records, **kwargs):
+    return {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "1", "ShardId": "shardId-0"} for _ in Records]}
+
+
+def _sent_records(mock_kinesis):
+    return [record for call in mock_kinesis.put_records.call_args_list for record in call.kwargs["Records"]]
+
+
+async def _post_events(app, *bodies, headers=None):
+    async with TestClient(TestServer(app)) as client:
+        responses = []
+        for body in bodies:
+            response = await client.post("/events", data=body if isinstance(body, str) else json.dumps(body),
+                                         headers=headers)
+            responses.append((response.status, dict(response.headers), await response.json()))
+        return responses
+
+
+class TestCollector:
+    """Unit tests for the asyncio HTTP collector"""
+
+    def test_single_and_batched_clicks_are_enriched_and_flushed(self, sample_click_event):
+        """Both request shapes are enriched like the Lambda and reach Kinesis via PutRecords"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=10)
+            return await _post_events(create_app(batcher), sample_click_event,
+                                      [sample_click_event, {**sample_click_event, "element": "a-pricing"}])
+
+        responses = asyncio.run(scenario())
+
+        assert [status for status, _, _ in responses] == [202, 202]
+        assert [body["accepted"] for _, _, body in responses] == [1, 2]
+        records = _sent_records(mock_kinesis)
+        assert len(records) == 3
+        payloads = [json.loads(record["Data"]) for record in records]
+        assert all("ingest_ts" in payload and "request_id" in payload for payload in payloads)
+        assert len({payload["request_id"] for payload in payloads}) == 3
+        assert {record["PartitionKey"] for record in records} == {"button-signup", "a-pricing"}
+        assert all(call.kwargs["StreamName"] == "test-stream" for call in mock_kinesis.put_records.call_args_list)
+
+    @pytest.mark.parametrize("raw_ip_mode, expected_ip", [("drop", None), ("truncate", "127.0.0.0")])
+    def test_clicks_get_the_lambda_request_context(self, tmp_path, sample_click_event, raw_ip_mode, expected_ip):
+        """Referer host and geo-IP of the caller are added as in the Lambda; the raw IP is never sent"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+        table_path = tmp_path / "ranges.bin"
+        table_path.write_bytes(build_range_table([("127.0.0.0/8", "ZZ", "LOOPBACK")]))
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=10)
+            app = create_app(batcher, geoip=GeoIpTable(str(table_path)), raw_ip_mode=raw_ip_mode)
+            return await _post_events(app, sample_click_event, headers={"Referer": "https://news.example.com/a?b=1"})
+
+        assert asyncio.run(scenario())[0][0] == 202
+
+        data = _sent_records(mock_kinesis)[0]["Data"]
+        payload = json.loads(data)
+        assert (payload["geo_country"], payload["geo_region"]) == ("ZZ", "LOOPBACK")
+        assert payload["referrer_host"] == "news.example.com"
+        assert payload.get("client_ip") == expected_ip
+        assert b"127.0.0.1" not in data
+
+    @pytest.mark.parametrize("hops, forwarded, expected_ip", [
+        (0, "198.51.100.7, 203.0.113.9", "127.0.0.0"),
+        (1, "198.51.100.7, 203.0.113.9", "203.0.113.0"),
+        (2, "198.51.100.7, 203.0.113.9", "198.51.100.0"),
+        (3, "203.0.113.9", "203.0.113.0"),
+        (1, None, "127.0.0.0"),
+    ])
+    def test_caller_is_read_through_trusted_proxies(self, sample_click_event, hops, forwarded, expected_ip):
+        """Behind TRUSTED_PROXY_HOPS proxies the caller is the X-Forwarded-For entry they added, else the peer"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=10)
+            app = create_app(batcher, raw_ip_mode="truncate", trusted_proxy_hops=hops)
+            return await _post_events(app, sample_click_event,
+                                      headers={"X-Forwarded-For": forwarded} if forwarded else None)
+
+        assert asyncio.run(scenario())[0][0] == 202
+        assert json.loads(_sent_records(mock_kinesis)[0]["Data"])["client_ip"] == expected_ip
+
+    def test_repeated_event_ids_are_acknowledged_once(self, sample_click_event):
+        """A click whose event_id was already accepted, in this or an earlier request, is not buffered again"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+        first = {**sample_click_event, "event_id": "evt-1"}
+        second = {**sample_click_event, "event_id": "evt-2"}
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=10)
+            return await _post_events(create_app(batcher), [first, first, second], first, [second, sample_click_event])
+
+        responses = asyncio.run(scenario())
+
+        assert [status for status, _, _ in responses] == [202, 202, 202]
+        assert [(body["accepted"], body["duplicates"]) for _, _, body in responses] == [(2, 1), (0, 1), (1, 1)]
+        assert sorted(json.loads(record["Data"]).get("event_id", "") for record in _sent_records(mock_kinesis)) == \
+            ["", "evt-1", "evt-2"]
+
+    def test_invalid_body_returns_400(self):
+        """Bodies that are not a click object or an array of them are rejected"""
+        mock_kinesis = MagicMock()
+
+        async def scenario():
+            return await _post_events(create_app(KinesisBatcher(mock_kinesis, "test-stream")),
+                                      "{invalid json}", [], ["not-an-object"], [{"page": "/", "timestamp": "now"}])
+
+        responses = asyncio.run(scenario())
+
+        assert [status for status, _, _ in responses] == [400, 400, 400, 400]
+        assert "Invalid JSON" in responses[0][2]["error"]
+        assert responses[3][2]["error"] == "Invalid click payload"
+        mock_kinesis.put_records.assert_not_called()
+
+    def test_full_buffer_returns_429_with_retry_after(self, sample_click_event):
+        """Requests that would exceed the buffer bound get 429 and nothing is partially buffered"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=60000, max_buffered_records=3)
+            responses = await _post_events(create_app(batcher, retry_after_seconds=2),
+                                           [sample_click_event] * 2, [sample_click_event] * 2)
+            return responses, batcher.stats
+
+        responses, stats = asyncio.run(scenario())
+
+        assert responses[0][0] == 202
+        status, headers, body = responses[1]
+        assert status == 429
+        assert headers["Retry-After"] == "2"
+        assert stats["accepted"] == 2 and stats["rejected"] == 2
+        # The accepted records are still flushed on shutdown
+        assert len(_sent_records(mock_kinesis)) == 2
+
+    def test_batches_respect_record_and_byte_limits(self):
+        """A batch never exceeds the configured record count or byte size"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_records=10, max_batch_bytes=1000)
+            assert batcher.offer([(f"key-{i % 3}", b"x" * 95) for i in range(25)])
+            flusher = asyncio.create_task(batcher.run())
+            batcher.close()
+            await flusher
+
+        asyncio.run(scenario())
+
+        batches = [call.kwargs["Records"] for call in mock_kinesis.put_records.call_args_list]
+        assert sum(len(batch) for batch in batches) == 25
+        assert all(len(batch) <= 10 for batch in batches)
+        assert all(sum(len(r["Data"]) + len(r["PartitionKey"]) for r in batch) <= 1000 for batch in batches)
+        # Round-robin across partition keys keeps each key's records in order
+        for key in ("key-0", "key-1", "key-2"):
+            assert [r for batch in batches for r in batch if r["PartitionKey"] == key]
+
+    def test_age_threshold_flushes_partial_batch(self):
+        """A partial batch is sent once its oldest record reaches the age threshold"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = _ok_response
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_batch_age_ms=20)
+            flusher = asyncio.create_task(batcher.run())
+            batcher.offer([("key", b"{}")])
+            await asyncio.sleep(0.2)
+            sent_before_close = mock_kinesis.put_records.call_count
+            batcher.close()
+            await flusher
+            return sent_before_close
+
+        assert asyncio.run(scenario()) == 1
+
+    def test_failed_records_are_retried(self):
+        """Records PutRecords reports as failed are requeued and sent again"""
+        mock_kinesis = MagicMock()
+        responses = iter([
+            {"FailedRecordCount": 1, "Records": [
+                {"SequenceNumber": "1", "ShardId": "shardId-0"},
+                {"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": "Rate exceeded"},
+            ]},
+        ])
+        mock_kinesis.put_records.side_effect = lambda **kwargs: next(responses, None) or _ok_response(**kwargs)
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream")
+            batcher.offer([("a", b"first"), ("b", b"second")])
+            flusher = asyncio.create_task(batcher.run())
+            batcher.close()
+            await flusher
+            return batcher.stats
+
+        stats = asyncio.run(scenario())
+
+        assert mock_kinesis.put_records.call_count == 2
+        assert [r["Data"] for r in mock_kinesis.put_records.call_args_list[1].kwargs["Records"]] == [b"second"]
+        assert stats["retried_records"] == 1
+        assert stats["put_records"] == 2
+
+    def test_exhausted_records_are_spilled(self, tmp_path):
+        """With a spill buffer, records that run out of attempts are spilled instead of dropped"""
+        mock_kinesis = MagicMock()
+        mock_kinesis.put_records.side_effect = RuntimeError("Kinesis unavailable")
+        spill = SpillBuffer(str(tmp_path))
+
+        async def scenario():
+            batcher = KinesisBatcher(mock_kinesis, "test-stream", max_attempts=2, spill=spill)
+            batcher.offer([("a", b"first"), ("b", b"second")])
+            flusher = asyncio.create_task(batcher.run())
+            batcher.close()
+            await flusher
+            return batcher.stats
+
+        stats = asyncio.run(scenario())
+
+        assert stats["spilled_records"] == 2 and stats["dropped_records"] == 0
+        assert spill.pending_records == 2
+
+    def test_import_has_no_lambda_side_effects(self):
+        """The collector imports without the Lambda's environment and never loads click_handler"""
+        env = {key: value for key, value in os.environ.items() if key not in ("STREAM_NAME", "SPILL_DIR")}
+        script = "import sys, etl.handlers.collector; print('etl.handlers.click_handler' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+        assert result.stdout.strip() == "False"
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pyarrow
+import pyspark
+import pytest
+
+from etl.funnels import _watermarked_clicks, funnel_step_events, parse_funnels, run_funnel_stream
+
+pytest.importorskip("pandas")
+
+# pyspark 3.5's applyInPandasWithState serializer slices batches with float offsets, which pyarrow 26 rejects
+STATEFUL_PANDAS_BROKEN = int(pyspark.__version__.split(".")[0]) < 4 and int(pyarrow.__version__.split(".")[0]) >= 26
+
+T0 = datetime(2024, 5, 1, 10, 0)
+CLICK_SCHEMA = ("page string, element string, visitor_id string, client_ip string, userAgent string, "
+                "event_ts timestamp, event_time_source string")
+SIGNUP = [{"name": "signup", "window_minutes": 30,
+           "steps": [{"name": "landing", "page": "/"},
+                     {"name": "form", "page": "/signup", "element": ["submit", "submit-footer"]},
+                     {"name": "confirm", "page": "/confirm"}]}]
+
+
+def _clicks(spark_session, directory, clicks, source="client"):
+    rows = [(page, element, visitor, None, None, T0 + timedelta(minutes=minutes), source)
+            for visitor, page, element, minutes in clicks]
+    spark_session.createDataFrame(rows, CLICK_SCHEMA).write.mode("append").parquet(str(directory))
+
+
+class TestFunnels:
+    """Unit tests for the incremental funnel stage"""
+
+    def test_parse_funnels_rejects_invalid_config(self):
+        (funnel,) = parse_funnels(SIGNUP)
+        assert [name for name, _ in funnel.steps] == ["landing", "form", "confirm"]
+        assert funnel.steps[1][1] == {"page": ["/signup"], "element": ["submit", "submit-footer"]}
+        assert funnel.window_ms == 30 * 60_000
+
+        for config, message in (
+            ("not json", "valid JSON"),
+            ({"name": "signup"}, "list of funnels"),
+            ([{"name": "a", "window_minutes": 5, "steps": [{"page": "/"}]}], "at least two steps"),
+            ([{"name": "a", "steps": [{"page": "/"}, {"page": "/b"}]}], "window_minutes"),
+            ([{"name": "a", "window_minutes": 5, "steps": [{"page": "/"}, {"referrer": "x"}]}], "page and/or element"),
+            (SIGNUP + SIGNUP, "unique"),
+        ):
+            with pytest.raises(ValueError, match=message):
+                parse_funnels(config)
+
+    def test_step_events_keep_matching_clicks_per_funnel(self, spark_session):
+        """Each click is tagged with the steps it matches in each funnel; others are dropped"""
+        funnels = parse_funnels(SIGNUP + [{"name": "pricing", "window_minutes": 5,
+                                           "steps": [{"page": "/"}, {"page": "/pricing"}]}])
+        clicks = spark_session.createDataFrame([
+            ("/", None, "v1", None, None, T0, "client"),
+            ("/signup", "submit", None, "10.0.0.1", "ua", T0, None),
+            ("/signup", "submit", None, None, "ua", T0, None),  # Cannot be told apart from other "ua" visitors
+            ("/signup", "cancel", "v1", None, None, T0, "client"),
+            ("/pricing", None, "v1", None, None, None, "server"),
+            ("/pricing", None, "v1", None, None, T0 + timedelta(days=1), "client_skewed"),
+        ], CLICK_SCHEMA)
+
+        rows = funnel_step_events(clicks, funnels).collect()
+
+        assert sorted((row.funnel, row.visitor, list(row.steps)) for row in rows if row.visitor == "v1") == \
+            [("pricing", "v1", [0]), ("signup", "v1", [0])]
+        (anonymous,) = [row for row in rows if row.visitor != "v1"]
+        assert (anonymous.funnel, list(anonymous.steps), len(anonymous.visitor)) == ("signup", [1], 64)
+
+    def test_skewed_clicks_never_reach_the_watermark(self, spark_session, tmp_path):
+        """A click a day ahead of the server is filtered before the watermark, so it cannot move it"""
+        source = tmp_path / "bronze"
+        _clicks(spark_session, source, [("a", "/", None, 0), ("a", "/signup", "submit", 5)])
+        _clicks(spark_session, source, [("z", "/", None, 24 * 60)], source="client_skewed")
+
+        stream = spark_session.readStream.schema(CLICK_SCHEMA).parquet(str(source))
+        query = (_watermarked_clicks(stream, "1 minute").writeStream.foreachBatch(lambda df, batch_id: df.collect())
+                 .option("checkpointLocation", str(tmp_path / "chkpt")).trigger(availableNow=True).start())
+        query.awaitTermination()
+
+        assert [progress["eventTime"].get("max") for progress in query.recentProgress] == ["2024-05-01T10:05:00.000Z"]
+
+    @pytest.mark.skipif(STATEFUL_PANDAS_BROKEN, reason="applyInPandasWithState needs pyarrow<26 on pyspark 3.5")
+    def test_progress_carries_across_runs_and_expires(self, spark_session, tmp_path):
+        """Steps reached in order within the window count across runs; stale progress is dropped by watermark"""
+        source = tmp_path / "bronze"
+        _clicks(spark_session, source, [
+            ("a", "/", None, 0), ("a", "/signup", "submit", 5),
+            ("b", "/", None, 1),
+            ("c", "/", None, 2), ("c", "/confirm", None, 3),  # Skips a step: stays at landing
+        ])
+        written = []
+
+        def record(counts_df, out_path, partition_column, txn_app_id, txn_version):
+            # Collected inside the micro-batch, as the Delta write would be
+            assert (out_path, partition_column, txn_app_id) == \
+                ("s3://b/dev/gold/funnels/", "funnel_date", "clicks-funnels-abc")
+            written.extend((row.step_name, row.visitors) for row in counts_df.collect())
+
+        def run():
+            with patch("etl.funnels.write_delta_batch", side_effect=record):
+                stream = spark_session.readStream.schema(CLICK_SCHEMA).parquet(str(source))
+                query = run_funnel_stream(stream, parse_funnels(SIGNUP), "s3://b/dev/gold/funnels/",
+                                          str(tmp_path / "chkpt"), lambda sink: f"clicks-{sink}-abc",
+                                          watermark_delay="1 minute")
+            return query.lastProgress["stateOperators"][0]["numRowsTotal"]
+
+        assert run() == 3
+        assert sorted(written) == [("form", 1), ("landing", 3)]
+
+        written.clear()
+        _clicks(spark_session, source, [
+            ("a", "/confirm", None, 12),  # Completes within 30 minutes of landing
+            ("b", "/signup", "submit", 45),  # Too late: b is back at the start
+            ("d", "/", None, 50),
+        ])
+        # Only d, which entered at minute 50, is still in progress once the watermark passed minute 49
+        assert run() == 1
+        assert sorted(written) == [("confirm", 1), ("landing", 1)]
+
+    @pytest.mark.skipif(STATEFUL_PANDAS_BROKEN, reason="applyInPandasWithState needs pyarrow<26 on pyspark 3.5")
+    def test_skewed_click_does_not_expire_other_visitors(self, spark_session, tmp_path):
+        """A future-skewed click neither times out visitors in progress nor makes their next clicks late"""
+        source = tmp_path / "bronze"
+        _clicks(spark_session, source, [("a", "/", None, 0)])
+        _clicks(spark_session, source, [("z", "/", None, 24 * 60)], source="client_skewed")
+        written = []
+
+        def record(counts_df, out_path, partition_column, txn_app_id, txn_version):
+            written.extend((row.step_name, row.visitors) for row in counts_df.collect())
+
+        def run():
+            with patch("etl.funnels.write_delta_batch", side_effect=record):
+                stream = spark_session.readStream.schema(CLICK_SCHEMA).parquet(str(source))
+                query = run_funnel_stream(stream, parse_funnels(SIGNUP), "s3://b/dev/gold/funnels/",
+                                          str(tmp_path / "chkpt"), lambda sink: f"clicks-{sink}-abc",
+                                          watermark_delay="1 minute")
+            return query.lastProgress["stateOperators"][0]["numRowsTotal"]
+
+        assert run() == 1
+        assert written == [("landing", 1)]
+
+        written.clear()
+        _clicks(spark_session, source, [("a", "/signup", "submit", 5)])
+        assert run() == 1
+        assert written == [("form", 1)]
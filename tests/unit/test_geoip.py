@@ -0,0 +1,96 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from etl.handlers.geoip import GeoIpTable, build_range_table, load_geoip_table, main, truncate_ip
+
+with patch.dict(os.environ, {"REGION": "us-east-1", "STREAM_NAME": "test-stream"}):
+    from etl.handlers.click_handler import lambda_handler
+    import etl.handlers.click_handler as click_handler_module
+
+NETWORKS = [
+    ("81.2.69.0/24", "GB", "ENG"),
+    ("81.2.70.0/24", "GB", "ENG"),
+    ("216.160.83.0/24", "US", "WA"),
+    ("2001:480::/32", "US", "CA"),
+]
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    path = tmp_path / "ranges.bin"
+    path.write_bytes(build_range_table(NETWORKS))
+    return str(path)
+
+
+class TestGeoIp:
+    """Unit tests for the memory-mapped geo-IP range table"""
+
+    def test_lookup_ipv4_ipv6_and_gaps(self, table_path):
+        """Addresses resolve to their network's location; gaps and invalid input resolve to None"""
+        table = GeoIpTable(table_path)
+
+        assert table.lookup("81.2.69.160") == ("GB", "ENG")
+        assert table.lookup("81.2.70.255") == ("GB", "ENG")  # Adjacent networks merged into one range
+        assert table.lookup("216.160.83.56") == ("US", "WA")
+        assert table.lookup("2001:480:10::1") == ("US", "CA")
+        assert table.lookup("::ffff:216.160.83.1") == ("US", "WA")
+        for unknown in ("81.2.71.0", "1.1.1.1", "255.255.255.255", "2001:481::1", "not-an-ip", ""):
+            assert table.lookup(unknown) is None
+        assert len(table) == 6
+
+    def test_build_rejects_overlaps_and_long_ipv6_prefixes(self):
+        """Overlapping networks and IPv6 prefixes finer than /64 cannot be encoded"""
+        with pytest.raises(ValueError, match="Overlapping"):
+            build_range_table([("10.0.0.0/8", "US", ""), ("10.1.0.0/16", "CA", "")])
+        with pytest.raises(ValueError, match="/64"):
+            build_range_table([("2001:db8::/96", "US", "")])
+
+    def test_truncate_ip(self):
+        """Truncation keeps the /24 of IPv4 and the /48 of IPv6 addresses"""
+        assert truncate_ip("81.2.69.160") == "81.2.69.0"
+        assert truncate_ip("2001:480:10:2a::1") == "2001:480:10::"
+        assert truncate_ip("bogus") is None
+
+    def test_missing_or_invalid_table_disables_enrichment(self, tmp_path):
+        """A missing or foreign file is logged and enrichment is turned off instead of failing"""
+        (tmp_path / "bad.bin").write_bytes(b"not a range table....")
+        assert load_geoip_table(str(tmp_path / "missing.bin")) is None
+        assert load_geoip_table(str(tmp_path / "bad.bin")) is None
+
+    def test_builds_layer_zip_from_csv(self, tmp_path):
+        """The CLI turns a network CSV into a layer zip holding geoip/ranges.bin"""
+        import zipfile
+
+        source = tmp_path / "blocks.csv"
+        source.write_text("network,country,region\n" + "".join(f"{n},{c},{r}\n" for n, c, r in NETWORKS))
+        assert main([str(source), str(tmp_path / "layer.zip")]) == 0
+        with zipfile.ZipFile(tmp_path / "layer.zip") as layer:
+            assert layer.read("geoip/ranges.bin") == build_range_table(NETWORKS)
+
+    @pytest.mark.parametrize("raw_ip_mode, expected_ip", [("drop", None), ("truncate", "216.160.83.0")])
+    def test_handler_enriches_and_drops_or_truncates_ip(self, table_path, mock_kinesis, sample_api_gateway_event,
+                                                        raw_ip_mode, expected_ip):
+        """The Lambda adds country, region and Referer host; the raw IP never reaches Kinesis"""
+        mock_kinesis.put_record.return_value = {"ShardId": "shard-1", "SequenceNumber": "seq-1"}
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        event = {
+            **sample_api_gateway_event,
+            "headers": {"Referer": "https://news.example.com/story?id=1"},
+            "requestContext": {"identity": {"sourceIp": "216.160.83.56"}},
+        }
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'geoip', GeoIpTable(table_path)), \
+                patch.object(click_handler_module, 'GEOIP_RAW_IP', raw_ip_mode):
+            assert lambda_handler(event, mock_context)["statusCode"] == 200
+
+        data = mock_kinesis.put_record.call_args.kwargs["Data"]
+        payload = json.loads(data)
+        assert (payload["geo_country"], payload["geo_region"]) == ("US", "WA")
+        assert payload["referrer_host"] == "news.example.com"
+        assert payload.get("client_ip") == expected_ip
+        assert b"216.160.83.56" not in data
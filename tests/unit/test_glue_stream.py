@@ -1,6 +1,16 @@
+import gzip
+import io
 import json
+import shutil
 import sys
-from unittest.mock import patch, MagicMock
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import ANY, patch, MagicMock
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from pyspark.sql.functions import to_date
 
 # Import the ETL functions directly (patching the SparkContext and GlueContext)
 # Mock AWS Glue and PySpark imports first
@@ -10,9 +20,41 @@ sys.modules['awsglue.utils'] = MagicMock()
 from etl.glue_stream import (
     _define_input_schema,
     _configure_spark_for_s3_parquet,
+    _parse_click_payload,
+    _split_dead_letters,
+    _select_bronze_columns,
+    _with_event_ts,
+    _build_replay_ranges,
+    _pin_replay_tip,
+    _read_kinesis_range,
+    _replay_spec,
+    _replay_txn_app_id,
+    _resolve_starting_position,
+    _read_checkpoint_offsets,
+    _report_checkpoint_lag,
+    _resolve_kinesis_read_options,
+    _register_efo_consumer,
+    _deregister_efo_consumer,
     check_for_kinesis_data,
-    check_data_post_processing
+    check_data_post_processing,
+    _PostCommitHookListener,
+    _post_commit_hook,
+    _resolve_write_layout,
+    _parquet_layout_conf,
+    _bronze_frame,
+    _clickstream_sinks,
+    _resolve_gold_sinks,
+    _resolve_funnels,
+    _resolve_event_time,
+    _run_funnel_stage,
+    _sink_txn_app_id,
+    _CheckpointTxnAppIds,
+    run_backfill_job,
+    BRONZE_QUERY_NAME,
+    BRONZE_WRITE_LAYOUTS,
 )
+from etl.batch_sinks import MicroBatchFanOut
+from etl.request_id_index import REQUEST_ID_BLOOM_FILTER_CONF
 
 class TestGlueStream:
     """Unit tests for Glue ETL components"""
@@ -23,7 +65,8 @@ class TestGlueStream:
 
         # Verify schema has the expected fields
         field_names = [field.name for field in schema.fields]
-        expected_fields = ["element", "page", "userAgent", "timestamp", "ingest_ts", "request_id"]
+        expected_fields = ["element", "page", "userAgent", "timestamp", "ingest_ts", "request_id", "event_id",
+                           "geo_country", "geo_region", "referrer_host", "client_ip", "visitor_id"]
 
         assert len(schema.fields) == len(expected_fields)
         for field in expected_fields:
@@ -93,6 +136,11 @@ class TestGlueStream:
         assert mock_conf["spark.sql.parquet.compression.codec"] == "snappy"
         assert mock_conf["spark.sql.parquet.mergeSchema"] == "false"
         assert mock_conf["spark.sql.parquet.filterPushdown"] == "true"
+        assert not set(REQUEST_ID_BLOOM_FILTER_CONF) & set(mock_conf)
+
+        _configure_spark_for_s3_parquet(mock_spark, request_id_bloom_filter=True)
+        for key, value in REQUEST_ID_BLOOM_FILTER_CONF.items():
+            assert mock_conf[key] == value
 
 
     def test_check_data_post_processing(self, mock_s3):
@@ -112,3 +160,540 @@ class TestGlueStream:
             # Verify logs
             mock_logger.info.assert_any_call("Checking for output files in S3 bucket 'test-bucket' with prefix 'dev/bronze/clicks/'")
             mock_logger.info.assert_any_call("Found 2 output item(s) in S3 at 'test-bucket/dev/bronze/clicks/'.")
+
+    def test_split_dead_letters_routes_corrupt_records(self, spark_session):
+        """Malformed and schema-violating records go to the DLQ frame; only clean rows remain"""
+        schema = _define_input_schema()
+        raw_df = spark_session.createDataFrame(
+            [
+                (bytearray(json.dumps({"element": "button", "page": "/home",
+                                       "timestamp": "2023-09-15T10:00:00Z"}).encode("utf-8")),
+                 "shardId-000000000000", "button", "1"),
+                (bytearray(b'{"element": "button", "page": '), "shardId-000000000000", "button", "2"),
+                (bytearray(b'{"unexpected": 1}'), "shardId-000000000001", "unknown", "3"),
+                (bytearray(b'{"page": "/home", "timestamp": "yesterday"}'), "shardId-000000000001", "unknown", "4"),
+            ],
+            ["data", "shardId", "partitionKey", "sequenceNumber"],
+        )
+
+        clean_df, dead_letter_df = _split_dead_letters(_parse_click_payload(raw_df, schema), schema)
+
+        clean_rows = clean_df.collect()
+        assert len(clean_rows) == 1
+        assert clean_rows[0]["page"] == "/home"
+        assert clean_rows[0]["shard_id"] == "shardId-000000000000"
+        assert clean_rows[0]["sequence_number"] == "1"
+        assert "_corrupt_record" not in clean_df.columns
+
+        dead_letters = {row["sequence_number"]: row for row in dead_letter_df.collect()}
+        assert {seq: row["error_reason"] for seq, row in dead_letters.items()} == {
+            "2": "malformed_json",
+            "3": "no_known_fields",
+            "4": "invalid_timestamp",
+        }
+        assert bytes(dead_letters["2"]["raw_data"]) == b'{"element": "button", "page": '
+        assert dead_letters["3"]["shard_id"] == "shardId-000000000001"
+        assert dead_letters["3"]["partition_key"] == "unknown"
+        assert dead_letters["2"]["dlq_date"] is not None
+
+    def test_select_bronze_columns_keeps_kinesis_metadata(self, spark_session):
+        """Bronze rows carry shard id, partition key and sequence number for dedupe and replay"""
+        schema = _define_input_schema()
+        raw_df = spark_session.createDataFrame(
+            [(bytearray(b'{"page": "/home", "timestamp": "2023-09-15T10:00:00Z"}'),
+              "shardId-000000000000", "button", "49633314117839700824134151018549967652563289382723198018")],
+            ["data", "shardId", "partitionKey", "sequenceNumber"],
+        )
+        clean_df, _ = _split_dead_letters(_parse_click_payload(raw_df, schema), schema)
+        with_event_ts = _with_event_ts(clean_df)
+        bronze_df = _select_bronze_columns(with_event_ts.withColumn("event_date", to_date(with_event_ts["event_ts"])))
+
+        row = bronze_df.collect()[0]
+        assert row["shard_id"] == "shardId-000000000000"
+        assert row["partition_key"] == "button"
+        assert row["sequence_number"] == "49633314117839700824134151018549967652563289382723198018"
+        assert row["event_ts"] == datetime(2023, 9, 15, 10, 0)
+
+    def test_event_time_policy_bounds_client_clock_skew(self, spark_session):
+        """A client clock hours ahead is kept, clamped or replaced by the arrival time depending on the policy"""
+        assert _resolve_event_time({}) == {"policy": "clamp", "max_future_seconds": 300, "max_past_seconds": 3600}
+        assert _resolve_event_time({"EVENT_TIME_POLICY": "Client", "CLOCK_SKEW_MAX_PAST_SECONDS": "7200"}) == \
+            {"policy": "client", "max_future_seconds": 300, "max_past_seconds": 7200}
+        with pytest.raises(ValueError, match="EVENT_TIME_POLICY"):
+            _resolve_event_time({"EVENT_TIME_POLICY": "ingest"})
+
+        schema = _define_input_schema()
+        raw_df = spark_session.createDataFrame(
+            [(bytearray(b'{"page": "/late", "timestamp": "2024-05-01T08:00:00Z"}'), "shard-1", "1",
+              datetime(2024, 5, 1, 12, 0))],
+            "data binary, shardId string, sequenceNumber string, approximateArrivalTimestamp timestamp")
+        clean_df, _ = _split_dead_letters(_parse_click_payload(raw_df, schema), schema)
+
+        rows = {policy: _with_event_ts(clean_df, _resolve_event_time({"EVENT_TIME_POLICY": policy})).first()
+                for policy in ("client", "clamp", "server")}
+        assert [(rows[policy]["event_ts"], rows[policy]["event_time_source"]) for policy in rows] == [
+            (datetime(2024, 5, 1, 8, 0), "client_skewed"),
+            (datetime(2024, 5, 1, 11, 0), "clamped"),
+            (datetime(2024, 5, 1, 12, 0), "server"),
+        ]
+        assert rows["clamp"]["clock_skew_seconds"] == -4 * 3600
+
+    def test_build_replay_ranges(self):
+        """Sequence ranges come from the job argument; timestamp ranges cover every shard"""
+        kinesis_client = MagicMock()
+        kinesis_client.list_shards.side_effect = [
+            {"Shards": [{"ShardId": "shard-1"}], "NextToken": "token-1"},
+            {"Shards": [{"ShardId": "shard-2"}]},
+        ]
+
+        by_sequence = _build_replay_ranges(kinesis_client, "test-stream",
+                                           shard_ranges='{"shard-2": ["200", "300"], "shard-1": ["100", null]}')
+        assert by_sequence == [
+            {"shard_id": "shard-1", "from_sequence": "100", "to_sequence": None},
+            {"shard_id": "shard-2", "from_sequence": "200", "to_sequence": "300"},
+        ]
+        kinesis_client.list_shards.assert_not_called()
+
+        by_time = _build_replay_ranges(kinesis_client, "test-stream",
+                                       from_timestamp="2024-05-01T13:00:00Z", to_timestamp="2024-05-01T14:00:00Z")
+        assert [r["shard_id"] for r in by_time] == ["shard-1", "shard-2"]
+        kinesis_client.list_shards.assert_called_with(NextToken="token-1")
+
+        capped = _build_replay_ranges(kinesis_client, "test-stream", shard_ranges={"shard-1": ["100", None]},
+                                      to_timestamp="2024-05-01T14:00:00Z")
+        assert capped == [{"shard_id": "shard-1", "from_sequence": "100", "to_sequence": None,
+                           "to_timestamp": "2024-05-01T14:00:00Z"}]
+
+    def test_replay_timestamps_need_a_utc_offset(self):
+        """A bound without Z or an offset is rejected before any record is read"""
+        kinesis_client = MagicMock()
+        with pytest.raises(ValueError, match="needs a UTC offset"):
+            _build_replay_ranges(kinesis_client, "test-stream", from_timestamp="2024-05-01T13:00:00Z",
+                                 to_timestamp="2024-05-01T14:00:00")
+        with pytest.raises(ValueError, match="needs a UTC offset"):
+            _build_replay_ranges(kinesis_client, "test-stream", from_timestamp="2024-05-01T13:00:00")
+        kinesis_client.list_shards.assert_not_called()
+        assert _build_replay_ranges(kinesis_client, "test-stream", shard_ranges={"shard-1": ["1", "2"]},
+                                    from_timestamp="2024-05-01T13:00:00+02:00") == \
+            [{"shard_id": "shard-1", "from_sequence": "1", "to_sequence": "2"}]
+
+    def test_read_kinesis_range_stops_at_upper_sequence(self):
+        """Only records between the sequence bounds are yielded"""
+        arrival = datetime(2024, 5, 1, 13, 30, tzinfo=timezone.utc)
+        kinesis_client = MagicMock()
+        kinesis_client.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        kinesis_client.get_records.side_effect = [
+            {"Records": [{"Data": b"a", "PartitionKey": "k", "SequenceNumber": "100", "ApproximateArrivalTimestamp": arrival},
+                         {"Data": b"b", "PartitionKey": "k", "SequenceNumber": "150", "ApproximateArrivalTimestamp": arrival}],
+             "NextShardIterator": "iterator-2", "MillisBehindLatest": 1000},
+            {"Records": [{"Data": b"c", "PartitionKey": "k", "SequenceNumber": "201", "ApproximateArrivalTimestamp": arrival}],
+             "NextShardIterator": "iterator-3", "MillisBehindLatest": 0},
+        ]
+
+        rows = list(_read_kinesis_range(
+            kinesis_client, "test-stream",
+            {"shard_id": "shard-1", "from_sequence": "100", "to_sequence": "200"},
+            poll_interval_seconds=0,
+        ))
+
+        assert [row[4] for row in rows] == ["100", "150"]
+        assert rows[0] == (b"a", "test-stream", "shard-1", "k", "100", arrival)
+        kinesis_client.get_shard_iterator.assert_called_once_with(
+            StreamName="test-stream", ShardId="shard-1",
+            ShardIteratorType="AT_SEQUENCE_NUMBER", StartingSequenceNumber="100",
+        )
+
+    def test_read_kinesis_range_by_timestamp_stops_at_tip(self):
+        """Timestamp replays use AT_TIMESTAMP and stop once the iterator catches up"""
+        kinesis_client = MagicMock()
+        kinesis_client.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        kinesis_client.get_records.return_value = {"Records": [], "NextShardIterator": "iterator-2",
+                                                   "MillisBehindLatest": 0}
+
+        rows = list(_read_kinesis_range(
+            kinesis_client, "test-stream",
+            {"shard_id": "shard-1", "from_timestamp": "2024-05-01T13:00:00Z", "to_timestamp": None},
+            poll_interval_seconds=0,
+        ))
+
+        assert rows == []
+        kwargs = kinesis_client.get_shard_iterator.call_args.kwargs
+        assert kwargs["ShardIteratorType"] == "AT_TIMESTAMP"
+        assert kwargs["Timestamp"] == datetime(2024, 5, 1, 13, 0, tzinfo=timezone.utc)
+        kinesis_client.get_records.assert_called_once()
+
+    def test_replay_txn_app_id_is_stable(self):
+        """The same replay range always maps to the same Delta transaction id"""
+        ranges = [{"shard_id": "shard-1", "from_sequence": "100", "to_sequence": "200"}]
+        assert _replay_txn_app_id("dev", ranges) == _replay_txn_app_id("dev", [dict(ranges[0])])
+        assert _replay_txn_app_id("dev", ranges) != _replay_txn_app_id("prod", ranges)
+
+    def test_open_ended_replays_are_pinned_to_the_run_start(self):
+        """Runs "up to the tip" get the run start as upper bound, so a later run gets a new id"""
+        first = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+        later = first.replace(day=2)
+        by_time = {"REPLAY_FROM_TIMESTAMP": "2024-05-01T00:00:00Z"}
+        by_sequence = {"REPLAY_SHARD_RANGES": '{"shard-1": ["100", null]}'}
+
+        assert _pin_replay_tip(by_time, now=first)["REPLAY_TO_TIMESTAMP"] == "2024-05-01T12:00:00Z"
+        assert _pin_replay_tip(by_sequence, now=first)["REPLAY_TO_TIMESTAMP"] == "2024-05-01T12:00:00Z"
+        ids = [_replay_txn_app_id("dev", _replay_spec(args, "clicks", [])) for args in
+               (_pin_replay_tip(by_time, now=first), _pin_replay_tip(by_time, now=later))]
+        assert ids[0] != ids[1]
+
+        bounded = [{**by_time, "REPLAY_TO_TIMESTAMP": "2024-05-01T06:00:00Z"},
+                   {"REPLAY_SHARD_RANGES": {"shard-1": ["100", "200"]}}]
+        assert [_pin_replay_tip(args, now=later) for args in bounded] == bounded
+
+    def test_replay_txn_app_id_survives_a_reshard(self):
+        """A timestamp replay keeps its id when the shards it expands to change between runs"""
+        job_args = {"REPLAY_FROM_TIMESTAMP": "2024-05-01T12:00:00Z", "REPLAY_TO_TIMESTAMP": "2024-05-01T13:00:00Z"}
+        window = {"from_timestamp": job_args["REPLAY_FROM_TIMESTAMP"], "to_timestamp": job_args["REPLAY_TO_TIMESTAMP"]}
+        before = [{"shard_id": "shard-1", **window}]
+        after = [{"shard_id": shard_id, **window} for shard_id in ("shard-1", "shard-2", "shard-3")]
+
+        assert _replay_txn_app_id("dev", _replay_spec(job_args, "clicks", before)) == \
+            _replay_txn_app_id("dev", _replay_spec(job_args, "clicks", after))
+        assert _replay_txn_app_id("dev", _replay_spec(job_args, "clicks", before)) != \
+            _replay_txn_app_id("dev", _replay_spec(job_args, "other-clicks", before))
+
+        sequences = [{"shard_id": "shard-1", "from_sequence": "100", "to_sequence": "200"}]
+        assert _replay_spec({"REPLAY_SHARD_RANGES": "shard-1:100:200"}, "clicks", sequences) == sequences
+
+    def test_resolve_starting_position(self):
+        """Named positions, AT_TIMESTAMP and per-shard sequence maps are translated for the connector"""
+        assert _resolve_starting_position({}, "test-stream") == "TRIM_HORIZON"
+        assert _resolve_starting_position({"STARTING_POSITION": "latest"}, "test-stream") == "LATEST"
+        assert _resolve_starting_position(
+            {"STARTING_POSITION": "AT_TIMESTAMP", "STARTING_TIMESTAMP": "2024-05-01T13:00:00Z"}, "test-stream"
+        ) == "2024-05-01T13:00:00Z"
+
+        position = json.loads(_resolve_starting_position(
+            {"STARTING_POSITION": "LATEST", "STARTING_SEQUENCE_NUMBERS": '{"shardId-000000000000": "100"}'},
+            "test-stream",
+        ))
+        assert position["metadata"]["streamName"] == "test-stream"
+        assert position["shardId-000000000000"] == {"iteratorType": "AFTER_SEQUENCE_NUMBER", "iteratorPosition": "100"}
+
+    @pytest.mark.parametrize("job_args", [
+        {"STARTING_POSITION": "EARLIEST_EVER"},
+        {"STARTING_POSITION": "AT_TIMESTAMP"},
+        {"STARTING_POSITION": "AT_TIMESTAMP", "STARTING_TIMESTAMP": "yesterday"},
+        {"STARTING_SEQUENCE_NUMBERS": "{}"},
+    ])
+    def test_resolve_starting_position_rejects_invalid_arguments(self, job_args):
+        """Invalid starting-position arguments fail before the stream is opened"""
+        with pytest.raises(ValueError):
+            _resolve_starting_position(job_args, "test-stream")
+
+    def test_read_checkpoint_offsets_uses_latest_batch(self, mock_s3):
+        """The newest numbered offsets file is parsed and the metadata entry dropped"""
+        mock_s3.list_objects_v2.return_value = {
+            "Contents": [
+                {"Key": "dev/checkpoints/clicks/offsets/9"},
+                {"Key": "dev/checkpoints/clicks/offsets/10"},
+                {"Key": "dev/checkpoints/clicks/offsets/.10.crc"},
+            ],
+            "IsTruncated": False,
+        }
+        offsets = {
+            "metadata": {"streamName": "test-stream", "batchId": "10"},
+            "shardId-000000000000": {"iteratorType": "AFTER_SEQUENCE_NUMBER", "iteratorPosition": "100"},
+        }
+        mock_s3.get_object.return_value = {
+            "Body": io.BytesIO(("v1\n" + json.dumps({"batchWatermarkMs": 0}) + "\n" + json.dumps(offsets)).encode("utf-8"))
+        }
+
+        batch_id, shard_offsets = _read_checkpoint_offsets(mock_s3, "s3://test-bucket/dev/checkpoints/clicks/")
+
+        assert batch_id == 10
+        assert shard_offsets == {"shardId-000000000000": offsets["shardId-000000000000"]}
+        mock_s3.list_objects_v2.assert_called_once_with(Bucket="test-bucket", Prefix="dev/checkpoints/clicks/offsets/")
+        mock_s3.get_object.assert_called_once_with(Bucket="test-bucket", Key="dev/checkpoints/clicks/offsets/10")
+
+    def test_read_checkpoint_offsets_without_checkpoint(self, mock_s3):
+        """A missing checkpoint means the configured starting position applies"""
+        mock_s3.list_objects_v2.return_value = {"IsTruncated": False}
+        assert _read_checkpoint_offsets(mock_s3, "s3://test-bucket/dev/checkpoints/clicks/") is None
+
+    def test_report_checkpoint_lag(self, mock_kinesis):
+        """Lag is read per shard from MillisBehindLatest; unresolvable positions are reported as None"""
+        mock_kinesis.get_shard_iterator.side_effect = [
+            {"ShardIterator": "iterator-1"},
+            Exception("Sequence number is trimmed"),
+        ]
+        mock_kinesis.get_records.return_value = {"Records": [], "MillisBehindLatest": 120000}
+
+        lag = _report_checkpoint_lag(mock_kinesis, "test-stream", {
+            "shardId-000000000000": {"iteratorType": "AFTER_SEQUENCE_NUMBER", "iteratorPosition": "100"},
+            "shardId-000000000001": {"iteratorType": "AFTER_SEQUENCE_NUMBER", "iteratorPosition": "1"},
+        })
+
+        assert lag == {"shardId-000000000000": 120000, "shardId-000000000001": None}
+        mock_kinesis.get_shard_iterator.assert_any_call(
+            StreamName="test-stream", ShardId="shardId-000000000000",
+            ShardIteratorType="AFTER_SEQUENCE_NUMBER", StartingSequenceNumber="100",
+        )
+
+    def test_resolve_kinesis_read_options(self):
+        """Presets supply connector options and individual job arguments override them"""
+        assert _resolve_kinesis_read_options({}) == {}
+
+        options = _resolve_kinesis_read_options({"KINESIS_READ_PRESET": "throughput", "MAX_FETCH_TIME_IN_MS": "3000"})
+        assert options["maxFetchTimeInMs"] == "3000"
+        assert options["maxFetchRecordsPerShard"] == "500000"
+        assert options["addIdleTimeBetweenReads"] == "true"
+
+        efo_options = _resolve_kinesis_read_options({"ENABLE_EFO": "true", "IDLE_TIME_BETWEEN_READS_IN_MS": "50"})
+        assert efo_options["idleTimeBetweenReadsInMs"] == "50"
+
+    @pytest.mark.parametrize("job_args", [
+        {"KINESIS_READ_PRESET": "turbo"},
+        {"MAX_RECORD_PER_READ": "20000"},
+        {"MAX_FETCH_TIME_IN_MS": "soon"},
+        {"IDLE_TIME_BETWEEN_READS_IN_MS": "50"},
+    ])
+    def test_resolve_kinesis_read_options_rejects_invalid_arguments(self, job_args):
+        """Unknown presets, out-of-range values and shared-limit violations are rejected"""
+        with pytest.raises(ValueError):
+            _resolve_kinesis_read_options(job_args)
+
+    def test_register_efo_consumer_waits_until_active(self):
+        """A missing consumer is registered and polled until ACTIVE, then deregistered on cleanup"""
+        stream_arn = "arn:aws:kinesis:us-east-1:123456789012:stream/test-stream"
+        consumer_arn = f"{stream_arn}/consumer/test-job-efo:1700000000"
+        kinesis_client = boto3.client("kinesis", region_name="us-east-1",
+                                      aws_access_key_id="testing", aws_secret_access_key="testing")
+
+        with Stubber(kinesis_client) as stubber:
+            stubber.add_client_error("describe_stream_consumer", "ResourceNotFoundException",
+                                     expected_params={"StreamARN": stream_arn, "ConsumerName": "test-job-efo"})
+            stubber.add_response("register_stream_consumer", {"Consumer": {
+                "ConsumerName": "test-job-efo", "ConsumerARN": consumer_arn,
+                "ConsumerStatus": "CREATING", "ConsumerCreationTimestamp": datetime(2024, 5, 1),
+            }}, {"StreamARN": stream_arn, "ConsumerName": "test-job-efo"})
+            stubber.add_response("describe_stream_consumer", {"ConsumerDescription": {
+                "ConsumerName": "test-job-efo", "ConsumerARN": consumer_arn, "ConsumerStatus": "ACTIVE",
+                "ConsumerCreationTimestamp": datetime(2024, 5, 1), "StreamARN": stream_arn,
+            }}, {"ConsumerARN": consumer_arn})
+            stubber.add_response("deregister_stream_consumer", {}, {"ConsumerARN": consumer_arn})
+
+            with patch("etl.glue_stream.time.sleep"):
+                assert _register_efo_consumer(kinesis_client, stream_arn, "test-job-efo") == consumer_arn
+            _deregister_efo_consumer(kinesis_client, consumer_arn)
+            stubber.assert_no_pending_responses()
+
+    def test_post_commit_hook_runs_after_bronze_batches_only(self):
+        """The hook runs for bronze batches that read rows; hook failures never reach the query"""
+        hook = MagicMock(side_effect=[None, RuntimeError("Glue throttled")])
+        listener = _PostCommitHookListener(BRONZE_QUERY_NAME, hook)
+
+        def progress_event(name, rows):
+            return SimpleNamespace(progress=SimpleNamespace(name=name, numInputRows=rows, batchId=7))
+
+        bronze, sample, empty = progress_event(BRONZE_QUERY_NAME, 10), progress_event(None, 10), \
+            progress_event(BRONZE_QUERY_NAME, 0)
+
+        for event in (sample, empty, bronze, bronze):
+            listener.onQueryProgress(event)
+
+        assert hook.call_count == 2
+
+    def test_post_commit_hooks_follow_job_arguments(self):
+        """Manifest publishing and the request_id index each run only when configured; one failing
+        does not stop the other"""
+        assert _post_commit_hook({"AWS_REGION": "us-east-1", "REQUEST_ID_INDEX": "false"}, "s3://b/bronze") is None
+
+        publisher, index = MagicMock(), MagicMock()
+        publisher.publish.side_effect = RuntimeError("Glue throttled")
+        with patch("etl.glue_stream.AthenaManifestPublisher", return_value=publisher), \
+                patch("etl.glue_stream.RequestIdIndex", return_value=index):
+            hook = _post_commit_hook({"AWS_REGION": "us-east-1", "ATHENA_DATABASE": "db",
+                                      "ATHENA_MANIFEST_TABLE": "bronze", "REQUEST_ID_INDEX": "true"},
+                                     "s3://b/bronze")
+            with pytest.raises(RuntimeError, match="Glue throttled"):
+                hook()
+
+        index.update.assert_called_once_with()
+
+    def test_resolve_write_layout(self):
+        """Layouts resolve from the preset and per-setting overrides"""
+        assert _resolve_write_layout({}) == BRONZE_WRITE_LAYOUTS["arrival"]
+
+        layout = _resolve_write_layout({"WRITE_LAYOUT": "sorted", "PARQUET_ZSTD_LEVEL": "9",
+                                        "WRITE_SORT_COLUMNS": "page, event_ts"})
+        assert layout["sort_columns"] == ("page", "event_ts")
+        assert layout["compression"] == "zstd"
+        assert layout["zstd_level"] == 9
+        assert layout["force_dictionary"] is True
+
+        layout = _resolve_write_layout({"WRITE_LAYOUT": "sorted", "WRITE_SORT_COLUMNS": "none",
+                                        "PARQUET_COMPRESSION": "SNAPPY", "PARQUET_FORCE_DICTIONARY": "false"})
+        assert layout["sort_columns"] == ()
+        assert layout["compression"] == "snappy"
+        assert layout["force_dictionary"] is False
+
+    @pytest.mark.parametrize("job_args", [
+        {"WRITE_LAYOUT": "clustered"},
+        {"PARQUET_COMPRESSION": "brotli"},
+        {"PARQUET_ZSTD_LEVEL": "23"},
+        {"PARQUET_ROW_GROUP_MB": "big"},
+        {"PARQUET_PAGE_KB": "4"},
+    ])
+    def test_resolve_write_layout_rejects_invalid_arguments(self, job_args):
+        with pytest.raises(ValueError):
+            _resolve_write_layout(job_args)
+
+    def test_parquet_layout_conf(self):
+        """The sorted layout maps to zstd, sized row groups/pages and dictionaries on all but unique ids"""
+        conf = _parquet_layout_conf(BRONZE_WRITE_LAYOUTS["sorted"])
+
+        assert conf["spark.sql.parquet.compression.codec"] == "zstd"
+        assert conf["parquet.compression.codec.zstd.level"] == "3"
+        assert conf["parquet.block.size"] == str(128 * 1024 * 1024)
+        assert conf["parquet.page.size"] == str(1024 * 1024)
+        assert conf["parquet.enable.dictionary"] == "true"
+        assert conf["parquet.enable.dictionary#request_id"] == "false"
+        assert _parquet_layout_conf(BRONZE_WRITE_LAYOUTS["arrival"]) == {
+            "spark.sql.parquet.compression.codec": "snappy"}
+
+    def test_clickstream_sinks_share_one_parse(self, spark_session):
+        """Bronze gets the clean rows and the DLQ the rejects, both from the same prepared batch"""
+        from etl.glue_stream import _prepare_batch
+
+        schema = _define_input_schema()
+        raw_df = spark_session.createDataFrame(
+            [(b'{"element": "button", "page": "/home", "timestamp": "2024-05-01T10:00:00Z"}', "shard-1", "1"),
+             (b'not json', "shard-1", "2")],
+            "data binary, shardId string, sequenceNumber string")
+        prepared_df = _prepare_batch(raw_df, schema)
+
+        bronze, dlq, spread, sample = _clickstream_sinks(schema, "s3://b/bronze/", "s3://b/dlq/",
+                                                         BRONZE_WRITE_LAYOUTS["sorted"])
+
+        assert (bronze.name, dlq.name, spread.name, sample.name) == ("bronze", "dlq", "partition_spread", "sample")
+        assert bronze.sort_columns == ("page", "element", "event_ts")
+        rows = bronze.build(prepared_df).collect()
+        assert [(row.page, row.sequence_number, str(row.event_date)) for row in rows] == \
+            [("/home", "1", "2024-05-01")]
+        assert [row.sequence_number for row in dlq.build(prepared_df).collect()] == ["2"]
+        assert _bronze_frame(prepared_df, schema).columns == bronze.build(prepared_df).columns
+
+        no_dlq = _clickstream_sinks(schema, "s3://b/bronze/", "s3://b/dlq/", BRONZE_WRITE_LAYOUTS["arrival"],
+                                    with_dead_letters=False)
+        assert [sink.name for sink in no_dlq] == ["bronze", "partition_spread", "sample"]
+
+    def test_gold_sinks_follow_job_arguments(self):
+        """GOLD_SINKS enables gold aggregates in a fixed order, each under its own path"""
+        assert _resolve_gold_sinks({}) == []
+        assert _resolve_gold_sinks({"GOLD_SINKS": " Trending,unique_visitors"}) == ["unique_visitors", "trending"]
+        with pytest.raises(ValueError, match="GOLD_SINKS"):
+            _resolve_gold_sinks({"GOLD_SINKS": "sessions"})
+
+        sinks = _clickstream_sinks(_define_input_schema(), "s3://b/bronze/", "s3://b/dlq/",
+                                   BRONZE_WRITE_LAYOUTS["arrival"], gold_sinks=["unique_visitors", "trending"],
+                                   gold_root="s3://b/dev/gold/")
+        assert [sink.name for sink in sinks] == ["bronze", "dlq", "unique_visitors", "trending", "partition_spread",
+                                                  "sample"]
+        assert sinks[3].out_path == "s3://b/dev/gold/trending/"
+
+    def test_funnel_stage_reads_bronze_as_a_delta_stream(self):
+        """FUNNELS runs the funnel query over bronze with its own checkpoint and gold table"""
+        assert _resolve_funnels({"FUNNELS": None}) == []
+        job_args = {"S3_BRONZE_BUCKET": "b", "ENVIRONMENT": "dev",
+                    "FUNNELS": '[{"name": "signup", "window_minutes": 30, "steps": [{"page": "/"}, {"page": "/ok"}]}]'}
+        funnels = _resolve_funnels(job_args)
+        spark = MagicMock()
+
+        with patch("etl.glue_stream.run_funnel_stream") as run_funnel_stream:
+            _run_funnel_stage(spark, funnels, job_args, "s3://b/dev/bronze/clicks/")
+
+        reader = spark.readStream.format.return_value
+        spark.readStream.format.assert_called_once_with("delta")
+        reader.option.return_value.load.assert_called_once_with("s3://b/dev/bronze/clicks/")
+        run_funnel_stream.assert_called_once_with(
+            reader.option.return_value.load.return_value, funnels, "s3://b/dev/gold/funnels/",
+            "s3://b/dev/checkpoints/funnels/", ANY)
+        txn_app_ids = run_funnel_stream.call_args.args[4]
+        assert isinstance(txn_app_ids, _CheckpointTxnAppIds)
+        assert txn_app_ids.chkpt_path == "s3://b/dev/checkpoints/funnels/"
+
+    def test_backfill_loads_landing_files_once(self, tmp_path, spark_session):
+        """NDJSON and gzip files go through the streaming transforms; a re-run skips what the manifest has"""
+        landing = tmp_path / "landing" / "2024-05-01"
+        landing.mkdir(parents=True)
+        (landing / "part-0.json").write_text(
+            '{"page": "/home", "timestamp": "2024-05-01T10:00:00Z"}\n\nnot json\n')
+        with gzip.open(landing / "part-1.json.gz", "wt") as f:
+            f.write('{"page": "/pricing", "timestamp": "2024-05-01T10:05:00Z", "ingest_ts": "2024-05-01T10:05:01Z"}\n')
+        job_args = {"BACKFILL_SOURCE": str(tmp_path / "landing"), "BACKFILL_MANIFEST": str(tmp_path / "manifest"),
+                    "BACKFILL_MAX_FILES_PER_BATCH": "1", "S3_BRONZE_BUCKET": "b", "ENVIRONMENT": "dev",
+                    "AWS_REGION": "us-east-1"}
+        writes = []
+
+        def record(df, out_path, partition_column, txn_app_id, txn_version, sort_columns=()):
+            writes.append((out_path, txn_app_id, txn_version, df.collect()))
+
+        with patch("etl.batch_sinks.write_delta_batch", side_effect=record):
+            assert run_backfill_job(job_args, spark_session, "s3://b/dev/bronze/clicks/", "s3://b/dev/dlq/clicks/") == 2
+            assert run_backfill_job(job_args, spark_session, "s3://b/dev/bronze/clicks/", "s3://b/dev/dlq/clicks/") == 0
+
+        bronze = [(app_id, [(row.page, row.event_time_source, str(row.event_date)) for row in rows])
+                  for out_path, app_id, _, rows in writes if out_path == "s3://b/dev/bronze/clicks/"]
+        assert [rows for _, rows in bronze] == [[("/home", "client", "2024-05-01")],
+                                               [("/pricing", "client", "2024-05-01")]]
+        assert all(app_id.startswith("clicks-backfill-dev-") for app_id, _ in bronze)
+        (dead_letter,) = [rows for out_path, _, _, rows in writes if out_path == "s3://b/dev/dlq/clicks/" and rows]
+        assert [(bytes(row.raw_data), row.stream_name.endswith("part-0.json")) for row in dead_letter] == \
+            [(b"not json", True)]
+
+        with pytest.raises(ValueError, match="BACKFILL_MAX_FILES_PER_BATCH"):
+            run_backfill_job({**job_args, "BACKFILL_MAX_FILES_PER_BATCH": "0"}, spark_session, "b", "d")
+
+    def test_sink_txn_app_ids_are_stable_per_checkpoint_and_sink(self):
+        chkpt = "s3://b/dev/checkpoints/clicks/"
+        assert _sink_txn_app_id(chkpt, "bronze", "q1") == _sink_txn_app_id(chkpt, "bronze", "q1")
+        assert _sink_txn_app_id(chkpt, "bronze", "q1").startswith("clicks-bronze-")
+        assert _sink_txn_app_id(chkpt, "bronze", "q1") != _sink_txn_app_id(chkpt, "dlq", "q1")
+        assert _sink_txn_app_id(chkpt, "bronze", "q1") != _sink_txn_app_id(chkpt, "bronze", "q2")
+        assert _sink_txn_app_id(chkpt, "bronze", "q1") != \
+            _sink_txn_app_id("s3://b/prod/checkpoints/clicks/", "bronze", "q1")
+
+    def test_rows_still_land_after_a_checkpoint_reset(self, spark_session, tmp_path):
+        """A deleted checkpoint restarts batch ids at 0, but under a new query id Delta does not skip them"""
+        source = tmp_path / "source"
+        source.mkdir()
+        chkpt = str(tmp_path / "checkpoint")
+        committed = set()  # (txnAppId, txnVersion) pairs a Delta table has seen
+        landed = []
+
+        class DeltaLikeSink:
+            name = "bronze"
+
+            def write(self, prepared_df, batch_id, txn_app_id):
+                if (txn_app_id, batch_id) not in committed:
+                    committed.add((txn_app_id, batch_id))
+                    landed.extend(row.value for row in prepared_df.collect())
+
+        def run(part):
+            (source / f"part-{part}.json").write_text(json.dumps({"value": part}))
+            fan_out = MicroBatchFanOut([DeltaLikeSink()], _CheckpointTxnAppIds(spark_session, chkpt))
+            query = (
+                spark_session.readStream.schema("value string").json(str(source))
+                .writeStream.foreachBatch(fan_out)
+                .option("checkpointLocation", chkpt)
+                .trigger(availableNow=True)
+                .start()
+            )
+            query.awaitTermination()
+            return str(query.id)
+
+        first = run("a")
+        assert run("b") == first  # Same checkpoint: same query id, next batch id
+        shutil.rmtree(chkpt)
+        (source / "part-a.json").unlink()
+        (source / "part-b.json").unlink()
+        assert run("c") != first
+
+        assert landed == ["a", "b", "c"]
+        assert len({app_id for app_id, _ in committed}) == 2
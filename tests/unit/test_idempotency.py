@@ -0,0 +1,44 @@
+from etl.handlers.idempotency import SeenEventCache
+
+
+class TestSeenEventCache:
+    """Unit tests for the per-container event ID cache"""
+
+    def test_repeats_hit_until_ttl_expires(self):
+        """An added ID is a hit until its TTL passes, then a miss again"""
+        now = [0.0]
+        cache = SeenEventCache(ttl_seconds=60, clock=lambda: now[0])
+
+        assert not cache.seen("evt-1")
+        cache.add("evt-1")
+        now[0] = 59
+        assert cache.seen("evt-1")
+        now[0] = 61
+        assert not cache.seen("evt-1")
+        assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0, "expirations": 1}
+        assert len(cache) == 0
+
+    def test_bounded_by_least_recently_used(self):
+        """Past max_entries the least recently seen ID is evicted"""
+        cache = SeenEventCache(max_entries=3)
+        for event_id in ("a", "b", "c"):
+            cache.add(event_id)
+        assert cache.seen("a")  # "a" becomes most recently used
+        cache.add("d")
+
+        assert len(cache) == 3
+        assert cache.stats["evictions"] == 1
+        assert not cache.seen("b")
+        assert all(cache.seen(event_id) for event_id in ("a", "c", "d"))
+
+    def test_add_purges_expired_entries(self):
+        """Expired IDs at the old end are dropped on insert, so idle entries do not pin memory"""
+        now = [0.0]
+        cache = SeenEventCache(ttl_seconds=10, clock=lambda: now[0])
+        for i in range(100):
+            cache.add(f"old-{i}")
+        now[0] = 11
+        cache.add("new")
+
+        assert len(cache) == 1
+        assert cache.stats["expirations"] == 100
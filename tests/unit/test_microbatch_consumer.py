@@ -0,0 +1,195 @@
+import json
+import sys
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+pytest.importorskip("deltalake")
+sys.modules['awsglue.context'] = MagicMock()
+sys.modules['awsglue.utils'] = MagicMock()
+
+from deltalake import DeltaTable
+from pyspark.sql.functions import col, date_format, to_date
+
+from etl.click_schema import BRONZE_COLUMNS
+from etl.glue_stream import (
+    _define_input_schema,
+    _parse_click_payload,
+    _select_bronze_columns,
+    _split_dead_letters,
+    _with_event_ts,
+)
+from etl.microbatch_consumer import poll_stream, read_shard, run_once, transform_records
+
+ARRIVAL = datetime(2024, 5, 1, 13, 30, tzinfo=timezone.utc)
+
+PARITY_PAYLOADS = [
+    json.dumps({"element": "BUTTON", "page": "/home", "userAgent": "Mozilla/5.0",
+                "timestamp": "2024-05-01T23:59:59.123Z", "ingest_ts": "2024-05-02T00:00:01Z",
+                "request_id": "req-1"}).encode("utf-8"),
+    json.dumps({"element": "A", "page": "/pricing", "timestamp": "2024-05-02T01:30:00+0200"}).encode("utf-8"),
+    json.dumps({"element": "DIV", "page": "/docs"}).encode("utf-8"),
+    json.dumps({"element": 42, "page": {"path": "/nested"}, "timestamp": "2024-05-01T10:00:00Z"}).encode("utf-8"),
+    b'{"element": "BUTTON", "page": ',
+    b'[1, 2, 3]',
+    b'{"unexpected": true}',
+    json.dumps({"page": "/home", "timestamp": "2024-05-01 10:00:00"}).encode("utf-8"),
+    # Skewed client clocks: ahead of ingest_ts, and behind the Kinesis arrival time
+    json.dumps({"page": "/future", "timestamp": "2025-01-01T00:00:00Z", "ingest_ts": "2024-05-01T13:29:00Z"}).encode(
+        "utf-8"),
+    json.dumps({"page": "/past", "timestamp": "2024-04-01T00:00:00.250Z"}).encode("utf-8"),
+]
+
+
+def _kinesis_records(payloads):
+    return [
+        {"Data": payload, "PartitionKey": f"key-{i}", "SequenceNumber": str(100 + i),
+         "ApproximateArrivalTimestamp": ARRIVAL, "ShardId": "shardId-000000000000"}
+        for i, payload in enumerate(payloads)
+    ]
+
+
+class TestMicrobatchConsumer:
+    """Unit tests for the pure-Python micro-batch consumer"""
+
+    def test_read_shard_resumes_after_checkpoint(self, mock_kinesis):
+        """A checkpointed shard resumes after the stored sequence number and stops at the tip"""
+        mock_kinesis.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        mock_kinesis.get_records.side_effect = [
+            {"Records": _kinesis_records([b"{}"])[:1], "NextShardIterator": "iterator-2", "MillisBehindLatest": 10},
+            {"Records": [], "NextShardIterator": "iterator-3", "MillisBehindLatest": 0},
+        ]
+
+        records, last_sequence = read_shard(mock_kinesis, "test-stream", "shard-1", after_sequence="99",
+                                            poll_interval_seconds=0)
+
+        assert len(records) == 1
+        assert records[0]["ShardId"] == "shard-1"
+        assert last_sequence == "100"
+        mock_kinesis.get_shard_iterator.assert_called_once_with(
+            StreamName="test-stream", ShardId="shard-1",
+            ShardIteratorType="AFTER_SEQUENCE_NUMBER", StartingSequenceNumber="99",
+        )
+
+    def test_poll_stream_reads_all_shards(self, mock_kinesis):
+        """Every shard is polled and only shards that returned records advance their checkpoint"""
+        mock_kinesis.list_shards.return_value = {"Shards": [{"ShardId": "shard-1"}, {"ShardId": "shard-2"}]}
+        mock_kinesis.get_shard_iterator.side_effect = lambda **kwargs: {"ShardIterator": kwargs["ShardId"]}
+        mock_kinesis.get_records.side_effect = lambda ShardIterator, Limit: (
+            {"Records": [{"Data": b"{}", "SequenceNumber": "7"}], "MillisBehindLatest": 0}
+            if ShardIterator == "shard-1" else {"Records": [], "MillisBehindLatest": 0}
+        )
+
+        records, checkpoints = poll_stream(mock_kinesis, "test-stream", {"shard-2": "5"}, max_workers=2)
+
+        assert len(records) == 1
+        assert checkpoints == {"shard-1": "7", "shard-2": "5"}
+
+    def test_latest_is_pinned_so_clicks_between_polls_are_kept(self, mock_kinesis):
+        """An empty first LATEST poll still saves a position; the next poll starts there, not at a new tip"""
+        mock_kinesis.list_shards.return_value = {"Shards": [{"ShardId": "shard-1"}]}
+        mock_kinesis.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        mock_kinesis.get_records.return_value = {"Records": [], "MillisBehindLatest": 0}
+
+        with patch("etl.microbatch_consumer.datetime") as clock:
+            clock.now.return_value = ARRIVAL
+            _, checkpoints = poll_stream(mock_kinesis, "test-stream", {}, starting_position="LATEST")
+        assert checkpoints == {"shard-1": {"at_timestamp": "2024-05-01T13:30:00.000Z"}}
+
+        mock_kinesis.list_shards.return_value = {"Shards": [{"ShardId": "shard-1"}, {"ShardId": "shard-2"}]}
+        mock_kinesis.get_records.return_value = {"Records": _kinesis_records([b"{}"])[:1], "MillisBehindLatest": 0}
+        records, checkpoints = poll_stream(mock_kinesis, "test-stream", checkpoints, starting_position="LATEST")
+
+        assert len(records) == 2 and checkpoints == {"shard-1": "100", "shard-2": "100"}
+        iterators = {call.kwargs["ShardId"]: call.kwargs for call in mock_kinesis.get_shard_iterator.call_args_list[1:]}
+        assert iterators["shard-1"]["ShardIteratorType"] == "AT_TIMESTAMP"
+        assert iterators["shard-1"]["Timestamp"] == ARRIVAL
+        # A shard first seen after the first run (a reshard child) is read from its start
+        assert iterators["shard-2"]["ShardIteratorType"] == "TRIM_HORIZON"
+
+    def test_read_shard_paces_and_retries_throttled_calls(self, mock_kinesis):
+        """Pages are read at most 5 times a second per shard and throttled calls back off and retry"""
+        throttled = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}},
+                                "GetRecords")
+        mock_kinesis.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        mock_kinesis.get_records.side_effect = [
+            {"Records": [], "NextShardIterator": "iterator-2", "MillisBehindLatest": 5000},
+            throttled,
+            {"Records": _kinesis_records([b"{}"])[:1], "NextShardIterator": "iterator-3", "MillisBehindLatest": 0},
+            {"Records": [], "NextShardIterator": "iterator-4", "MillisBehindLatest": 0},
+        ]
+        sleeps = []
+
+        records, last_sequence = read_shard(mock_kinesis, "test-stream", "shard-1", sleep=sleeps.append)
+
+        assert (len(records), last_sequence) == (1, "100")
+        assert sleeps == [0.2, 0.2, 0.2]
+
+        mock_kinesis.get_records.side_effect = [throttled] * 6
+        sleeps.clear()
+        assert read_shard(mock_kinesis, "test-stream", "shard-1", after_sequence="100", sleep=sleeps.append) == \
+            ([], "100")
+        assert sleeps == [0.2, 0.4, 0.8, 1.6, 3.2]
+
+    @pytest.mark.parametrize("policy", ["client", "clamp", "server"])
+    def test_transform_matches_spark_path(self, spark_session, policy):
+        """The pure-Python transform produces the same bronze rows and rejects as the Glue job"""
+        spark_session.conf.set("spark.sql.session.timeZone", "UTC")
+        records = _kinesis_records(PARITY_PAYLOADS)
+        schema = _define_input_schema()
+
+        raw_df = spark_session.createDataFrame(
+            [(bytearray(r["Data"]), r["ShardId"], r["PartitionKey"], r["SequenceNumber"],
+              r["ApproximateArrivalTimestamp"]) for r in records],
+            "data binary, shardId string, partitionKey string, sequenceNumber string, "
+            "approximateArrivalTimestamp timestamp",
+        )
+        clean_df, dead_letter_df = _split_dead_letters(_parse_click_payload(raw_df, schema), schema)
+        with_event_ts = _with_event_ts(clean_df, {"policy": policy})
+        spark_bronze = (
+            _select_bronze_columns(with_event_ts.withColumn("event_date", to_date(col("event_ts"))))
+            .withColumn("event_ts", date_format(col("event_ts"), "yyyy-MM-dd'T'HH:mm:ss.SSSSSS"))
+            .withColumn("event_date", col("event_date").cast("string"))
+        )
+        spark_rows = {row["sequence_number"]: row.asDict() for row in spark_bronze.collect()}
+        spark_rejects = {row["sequence_number"]: row["error_reason"] for row in dead_letter_df.collect()}
+
+        bronze_rows, dead_letter_rows = transform_records(records, "test-stream", {"policy": policy})
+        python_rows = {
+            row["sequence_number"]: {
+                **row,
+                "event_ts": row["event_ts"].strftime("%Y-%m-%dT%H:%M:%S.%f") if row["event_ts"] else None,
+                "event_date": row["event_date"].isoformat() if row["event_date"] else None,
+            }
+            for row in bronze_rows
+        }
+        python_rejects = {row["sequence_number"]: row["error_reason"] for row in dead_letter_rows}
+
+        assert list(spark_bronze.columns) == BRONZE_COLUMNS
+        assert python_rows == spark_rows
+        assert python_rejects == spark_rejects
+        assert len(python_rows) == 6 and len(python_rejects) == 4
+        assert {row["page"]: row["event_time_source"] for row in bronze_rows}["/future"] == \
+            {"client": "client_skewed", "clamp": "clamped", "server": "server"}[policy]
+
+    def test_run_once_appends_to_delta_and_checkpoints(self, mock_kinesis, tmp_path):
+        """A micro-batch lands clean rows in bronze, rejects in the DLQ, and records shard positions"""
+        mock_kinesis.list_shards.return_value = {"Shards": [{"ShardId": "shardId-000000000000"}]}
+        mock_kinesis.get_shard_iterator.return_value = {"ShardIterator": "iterator-1"}
+        mock_kinesis.get_records.return_value = {
+            "Records": _kinesis_records(PARITY_PAYLOADS[:1] + PARITY_PAYLOADS[4:5]), "MillisBehindLatest": 0,
+        }
+        checkpoint_path = tmp_path / "checkpoint.json"
+
+        summary = run_once("test-stream", str(tmp_path / "bronze"), str(tmp_path / "dlq"), str(checkpoint_path),
+                           kinesis_client=mock_kinesis)
+
+        assert summary["bronze_rows"] == 1 and summary["dead_letter_rows"] == 1
+        bronze = DeltaTable(str(tmp_path / "bronze")).to_pyarrow_table().to_pylist()
+        assert bronze[0]["request_id"] == "req-1"
+        assert bronze[0]["event_date"].isoformat() == "2024-05-01"
+        dlq = DeltaTable(str(tmp_path / "dlq")).to_pyarrow_table().to_pylist()
+        assert dlq[0]["error_reason"] == "malformed_json"
+        assert json.loads(checkpoint_path.read_text()) == {"shardId-000000000000": "101"}
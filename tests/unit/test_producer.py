@@ -0,0 +1,290 @@
+import hashlib
+import heapq
+import itertools
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from etl.handlers.producer import AdaptiveTokenBucket, ShardMap, ThrottleAwareProducer, ThrottledError
+
+MAX_HASH_KEY = 2 ** 128 - 1
+PUT_LATENCY_SECONDS = 0.01
+
+
+def _throttle_error():
+    return ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "Rate exceeded"}},
+                       "PutRecord")
+
+
+def _even_shards(count):
+    step = (MAX_HASH_KEY + 1) // count
+    return [{"ShardId": f"shardId-{i:012d}",
+             "HashKeyRange": {"StartingHashKey": str(i * step),
+                              "EndingHashKey": str(MAX_HASH_KEY if i == count - 1 else (i + 1) * step - 1)}}
+            for i in range(count)]
+
+
+class VirtualTime:
+    """
+    Virtual clock shared by many threads: time only moves when every thread is sleeping.
+
+    Lets the overload simulation run concurrent producers against the fake Kinesis in a few
+    seconds of wall time while keeping their interleaving realistic.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def clock(self):
+        return self.now
+
+    def _advance(self):
+        if self._running == 0 and self._sleepers:
+            wake, _, event = heapq.heappop(self._sleepers)
+            self.now = max(self.now, wake)
+            self._running += 1
+            event.set()
+
+    def sleep(self, seconds):
+        event = threading.Event()
+        with self._lock:
+            # Like a real sleep, always let some time pass (tiny waits would otherwise round away)
+            heapq.heappush(self._sleepers, (self.now + max(seconds, 1e-6), next(self._seq), event))
+            self._running -= 1
+            self._advance()
+        event.wait()
+
+    def run(self, targets):
+        threads = [threading.Thread(target=self._wrap, args=(target,)) for target in targets]
+        with self._lock:
+            self._running = len(threads)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _wrap(self, target):
+        try:
+            target()
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._advance()
+
+
+class FakeKinesis:
+    """PutRecord stand-in enforcing the per-shard write limit of 1,000 records/sec."""
+
+    def __init__(self, vtime, shards, records_per_sec=1000):
+        self.vtime = vtime
+        self.shard_map = ShardMap(shards)
+        self.records_per_sec = records_per_sec
+        self.tokens = {shard["ShardId"]: float(records_per_sec) for shard in shards}
+        self.updated_at = {shard["ShardId"]: 0.0 for shard in shards}
+        self.accepted = 0
+        self.throttled = 0
+
+    def put_record(self, StreamName, PartitionKey, Data):
+        self.vtime.sleep(PUT_LATENCY_SECONDS)
+        shard_id = self.shard_map.shard_for(PartitionKey)
+        now = self.vtime.now
+        self.tokens[shard_id] = min(self.records_per_sec,
+                                    self.tokens[shard_id] + (now - self.updated_at[shard_id]) * self.records_per_sec)
+        self.updated_at[shard_id] = now
+        if self.tokens[shard_id] < 1:
+            self.throttled += 1
+            raise _throttle_error()
+        self.tokens[shard_id] -= 1
+        self.accepted += 1
+        return {"ShardId": shard_id, "SequenceNumber": str(self.accepted)}
+
+
+def _bursty_arrivals(duration_seconds, burst_rate, trough_rate, period_seconds=1.0):
+    """Arrival times alternating between a burst and a trough each half period."""
+    arrivals = []
+    t = 0.0
+    while t < duration_seconds:
+        in_burst = (t % period_seconds) < period_seconds / 2
+        t += 1 / (burst_rate if in_burst else trough_rate)
+        arrivals.append(t)
+    return arrivals
+
+
+def _simulate(make_put, containers=100, duration_seconds=4, burst_rate=4000, trough_rate=1000):
+    """Spread bursty arrivals across Lambda-like containers that each serve one request at a time."""
+    vtime = VirtualTime()
+    kinesis = FakeKinesis(vtime, _even_shards(2))
+    keys = [f"element-{i}" for i in range(16)]
+    arrivals = _bursty_arrivals(duration_seconds, burst_rate, trough_rate)
+    outcomes = []
+
+    def container(index):
+        put = make_put(kinesis, vtime)
+        for i in range(index, len(arrivals), containers):
+            if vtime.now < arrivals[i]:
+                vtime.sleep(arrivals[i] - vtime.now)
+            started = vtime.now
+            try:
+                put(b"{}", keys[i % len(keys)])
+                outcomes.append(("ok", vtime.now - started))
+            except (ThrottledError, ClientError) as err:
+                outcomes.append(("rejected", getattr(err, "retry_after_seconds", None)))
+
+    vtime.run([lambda index=index: container(index) for index in range(containers)])
+    latencies = sorted(latency for status, latency in outcomes if status == "ok")
+    return {
+        "offered": len(arrivals),
+        "delivered": len(latencies),
+        "rejected": sum(1 for status, _ in outcomes if status == "rejected"),
+        "retry_after": [value for status, value in outcomes if status == "rejected"],
+        # Time spent inside the put, excluding the wait for the container to be free
+        "p99_latency": latencies[int(len(latencies) * 0.99)],
+        "throttled_calls": kinesis.throttled,
+    }
+
+
+class TestProducer:
+    """Unit tests for the throttle-aware Kinesis producer"""
+
+    def test_token_bucket_backs_off_and_recovers(self):
+        """Throttles halve the rate down to the floor; successes add it back linearly"""
+        now = [0.0]
+        bucket = AdaptiveTokenBucket(max_rate=100, min_rate=10, increase=5, clock=lambda: now[0])
+
+        assert all(bucket.acquire() == 0 for _ in range(100))
+        assert bucket.acquire() == pytest.approx(0.01)
+
+        for _ in range(5):
+            bucket.on_throttle()
+        assert bucket.rate == 10
+        now[0] += 1.0
+        assert bucket.tokens <= bucket.capacity
+        bucket.on_success()
+        assert bucket.rate == 15
+
+    def test_shard_map_matches_kinesis_hashing(self):
+        """Partition keys land in the shard whose hash key range holds MD5(key)"""
+        shard_map = ShardMap(_even_shards(4))
+        for key in ("BUTTON", "A", "DIV", "unknown"):
+            hash_key = int(hashlib.md5(key.encode()).hexdigest(), 16)
+            assert shard_map.shard_for(key) == f"shardId-{hash_key * 4 // (MAX_HASH_KEY + 1):012d}"
+
+    def test_bucket_count_is_bounded_by_shards(self):
+        """Buckets follow shards, or the stream without a shard map, never the client-supplied keys"""
+        keys = [f"element-{i}" for i in range(1000)]
+        per_shard = ThrottleAwareProducer(MagicMock(), "test-stream", shard_map=ShardMap(_even_shards(4)))
+        stream_wide = ThrottleAwareProducer(MagicMock(), "test-stream")
+
+        assert len({id(per_shard.bucket_for(key)) for key in keys}) == 4
+        assert len({id(stream_wide.bucket_for(key)) for key in keys}) == 1
+        assert len(per_shard._buckets) == 4 and len(stream_wide._buckets) == 1
+
+    def test_shard_map_reloads_after_a_reshard(self):
+        """A write answered by an unknown shard reloads the map and drops the buckets of closed shards"""
+        now = [100.0]
+        kinesis = MagicMock()
+        kinesis.list_shards.return_value = {"Shards": _even_shards(4)}
+        producer = ThrottleAwareProducer(kinesis, "test-stream", shard_map=ShardMap(_even_shards(2)),
+                                         clock=lambda: now[0])
+        kinesis.put_record.return_value = {"ShardId": "shardId-000000000000", "SequenceNumber": "1"}
+        producer.put_record(b"{}", "BUTTON")
+        kinesis.list_shards.assert_not_called()
+
+        kinesis.put_record.return_value = {"ShardId": "shardId-000000000003", "SequenceNumber": "2"}
+        producer.put_record(b"{}", "BUTTON")
+        assert producer.shard_map.shard_ids == {f"shardId-{i:012d}" for i in range(4)}
+        assert set(producer._buckets) <= producer.shard_map.shard_ids
+
+        # Reloads are spaced out even if the new map still misses the shard
+        kinesis.put_record.return_value = {"ShardId": "shardId-000000000009", "SequenceNumber": "3"}
+        producer.put_record(b"{}", "BUTTON")
+        now[0] += 60
+        producer.put_record(b"{}", "BUTTON")
+        assert kinesis.list_shards.call_count == 2
+
+    def test_retries_throttles_within_budget(self):
+        """A throttled write is retried after a jittered backoff and succeeds"""
+        now = [0.0]
+        sleeps = []
+
+        class Kinesis:
+            calls = 0
+
+            def put_record(self, **kwargs):
+                self.calls += 1
+                if self.calls < 3:
+                    raise _throttle_error()
+                return {"ShardId": "shardId-0", "SequenceNumber": "1"}
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        producer = ThrottleAwareProducer(Kinesis(), "test-stream", clock=lambda: now[0], sleep=sleep,
+                                         rng=lambda: 0.5)
+
+        assert producer.put_record(b"{}", "BUTTON")["SequenceNumber"] == "1"
+        assert producer.stats == {"records": 1, "attempts": 3, "throttles": 2, "rejected": 0}
+        assert sleeps[:2] == [pytest.approx(0.0125), pytest.approx(0.025)]
+        assert producer.bucket_for("BUTTON").rate < producer.max_rate
+
+    def test_budget_exhaustion_raises_throttled_error(self):
+        """Persistent throttling ends in ThrottledError with a Retry-After hint, inside the budget"""
+        now = [0.0]
+
+        class Kinesis:
+            def put_record(self, **kwargs):
+                now[0] += PUT_LATENCY_SECONDS
+                raise _throttle_error()
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        producer = ThrottleAwareProducer(Kinesis(), "test-stream", latency_budget_ms=300,
+                                         clock=lambda: now[0], sleep=sleep)
+
+        with pytest.raises(ThrottledError) as exc_info:
+            producer.put_record(b"{}", "BUTTON")
+        assert exc_info.value.retry_after_seconds >= 1
+        assert exc_info.value.attempts > 1
+        assert now[0] <= 0.3 + PUT_LATENCY_SECONDS
+
+    def test_non_throttle_errors_are_not_retried(self):
+        """Errors other than throttling propagate on the first attempt"""
+        class Kinesis:
+            def put_record(self, **kwargs):
+                raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": "missing"}},
+                                  "PutRecord")
+
+        producer = ThrottleAwareProducer(Kinesis(), "test-stream")
+        with pytest.raises(ClientError):
+            producer.put_record(b"{}", "BUTTON")
+        assert producer.stats["attempts"] == 1
+
+    def test_goodput_under_bursty_overload(self):
+        """Simulate 125% average load on two shards: retries absorb bursts and tail latency stays bounded"""
+        def naive(kinesis, vtime):
+            return lambda data, key: kinesis.put_record(StreamName="test-stream", PartitionKey=key, Data=data)
+
+        def throttle_aware(kinesis, vtime):
+            producer = ThrottleAwareProducer(kinesis, "test-stream", latency_budget_ms=1000,
+                                             shard_map=kinesis.shard_map, clock=vtime.clock, sleep=vtime.sleep)
+            return producer.put_record
+
+        baseline = _simulate(naive)
+        adaptive = _simulate(throttle_aware)
+        for name, result in (("naive", baseline), ("throttle-aware", adaptive)):
+            print(f"\n{name:>14}: delivered {result['delivered']} of {result['offered']}, "
+                  f"{result['rejected']} rejected, {result['throttled_calls']} throttled calls, "
+                  f"p99 put latency {result['p99_latency'] * 1000:.0f}ms")
+
+        assert adaptive["delivered"] > baseline["delivered"]
+        assert adaptive["rejected"] < baseline["rejected"]
+        assert adaptive["p99_latency"] <= 1.0 + PUT_LATENCY_SECONDS
+        assert all(retry_after >= 1 for retry_after in adaptive["retry_after"])
@@ -0,0 +1,105 @@
+import uuid
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from etl.request_id_index import INDEX_APP_ID, REQUEST_ID_BLOOM_FILTER_CONF, RequestIdIndex, request_id_prefix
+
+deltalake = pytest.importorskip("deltalake")
+
+SCHEMA = pa.schema([("request_id", pa.string()), ("page", pa.string()), ("event_date", pa.date32())])
+
+
+def _append(table_path, day, count):
+    rows = [{"request_id": str(uuid.uuid4()), "page": f"/p{i}", "event_date": day} for i in range(count)]
+    deltalake.write_deltalake(table_path, pa.Table.from_pylist(rows, schema=SCHEMA), mode="append",
+                              partition_by=["event_date"])
+    return [row["request_id"] for row in rows]
+
+
+class TestRequestIdIndex:
+    """Unit tests for the sidecar request_id index and its lookups"""
+
+    def test_update_indexes_new_commits_once(self, tmp_path):
+        """The first update covers the table; later ones only the new files; reruns are no-ops"""
+        table_path = str(tmp_path / "bronze")
+        _append(table_path, date(2024, 5, 1), 20)
+        _append(table_path, date(2024, 5, 2), 20)
+        index = RequestIdIndex(table_path)
+
+        first = index.update()
+        assert first == {"version": 1, "files": 2, "entries": 40}
+        assert index.update() is None
+
+        _append(table_path, date(2024, 5, 2), 5)
+        assert index.update() == {"version": 2, "files": 1, "entries": 5}
+        assert deltalake.DeltaTable(index.index_path).transaction_version(INDEX_APP_ID) == 2
+
+    def test_lookup_reads_only_candidate_files(self, tmp_path):
+        """A lookup returns the row with its partition value and never opens unrelated files"""
+        table_path = str(tmp_path / "bronze")
+        ids = []
+        for day in range(1, 11):
+            ids.extend(_append(table_path, date(2024, 5, day), 10))
+        index = RequestIdIndex(table_path)
+        index.update()
+        target = ids[37]
+
+        candidates = index.candidate_files(target)
+        rows = index.lookup(target)
+
+        assert len(candidates) == 1  # 100 ids over 16**6 prefixes: no collisions to expect
+        assert rows == [{"request_id": target, "page": "/p7", "event_date": "2024-05-04"}]
+        assert index.lookup(str(uuid.uuid4())) == []
+
+    def test_lookup_skips_files_no_longer_in_the_table(self, tmp_path):
+        """Rows deleted from bronze stop matching; rewritten rows match again once re-indexed"""
+        table_path = str(tmp_path / "bronze")
+        ids = _append(table_path, date(2024, 5, 1), 10)
+        index = RequestIdIndex(table_path)
+        index.update()
+
+        deltalake.DeltaTable(table_path).delete(f"request_id = '{ids[0]}'")
+
+        assert index.lookup(ids[0]) == []
+        assert len(index.lookup(ids[0], live_only=False)) == 1
+        assert index.lookup(ids[1]) == []  # Its rows moved to a file added after the last update
+        index.update()
+        assert len(index.lookup(ids[1])) == 1
+
+    def test_index_is_compacted_on_prefix(self, tmp_path):
+        """Every compact_every appends the index is z-ordered so lookups prune index files"""
+        table_path = str(tmp_path / "bronze")
+        index = RequestIdIndex(table_path, compact_every=3)
+        ids = []
+        for day in range(1, 5):
+            ids.extend(_append(table_path, date(2024, 5, day), 10))
+            index.update()
+
+        history = [entry["operation"] for entry in deltalake.DeltaTable(index.index_path).history()]
+        assert "OPTIMIZE" in history
+        assert all(index.candidate_files(request_id) for request_id in ids)
+
+    def test_prefix_is_stable(self):
+        assert request_id_prefix("abc") == "ba7816"
+        assert request_id_prefix("abc", length=2) == "ba"
+
+    def test_bloom_filter_conf_reaches_spark_parquet_writer(self, tmp_path, spark_session):
+        """The session confs the Glue job sets make Spark write a request_id bloom filter"""
+        for key, value in REQUEST_ID_BLOOM_FILTER_CONF.items():
+            spark_session.conf.set(key, value)
+        try:
+            out = str(tmp_path / "out")
+            spark_session.createDataFrame([(str(uuid.uuid4()), "/home") for _ in range(50)],
+                                          "request_id string, page string").coalesce(1).write.parquet(out)
+        finally:
+            for key in REQUEST_ID_BLOOM_FILTER_CONF:
+                spark_session.conf.unset(key)
+
+        (data_file,) = [path for path in (tmp_path / "out").iterdir() if path.suffix == ".parquet"]
+        row_group = pq.ParquetFile(data_file).metadata.row_group(0)
+        columns = {row_group.column(i).path_in_schema: row_group.column(i) for i in range(row_group.num_columns)}
+        assert columns["request_id"].bloom_filter_offset is not None
+        assert columns["page"].bloom_filter_offset is None
@@ -0,0 +1,130 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from etl.handlers.spill import SpillBuffer, read_segment
+
+with patch.dict(os.environ, {"REGION": "us-east-1", "STREAM_NAME": "test-stream"}):
+    from etl.handlers.click_handler import lambda_handler
+    import etl.handlers.click_handler as click_handler_module
+
+
+def _records(start, count):
+    return [(f"key-{i % 3}", json.dumps({"n": i}).encode("utf-8")) for i in range(start, start + count)]
+
+
+def _put_records_ok(StreamName, Records):
+    return {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "1", "ShardId": "shardId-0"} for _ in Records]}
+
+
+class TestSpillBuffer:
+    """Unit tests for the local spill buffer"""
+
+    def test_append_and_read_back(self, tmp_path):
+        """Spilled records are read back in order with their partition keys"""
+        spill = SpillBuffer(str(tmp_path))
+        assert spill.empty
+        spill.append(_records(0, 3))
+        spill.append(_records(3, 2))
+
+        assert not spill.empty
+        assert spill.pending_records == 5
+        [segment] = os.listdir(tmp_path)
+        assert read_segment(str(tmp_path / segment)) == _records(0, 5)
+
+    def test_evicts_oldest_segments_over_cap(self, tmp_path):
+        """Past max_bytes the oldest segments are deleted and the newest records survive"""
+        spill = SpillBuffer(str(tmp_path), max_bytes=2000, segment_bytes=500)
+        for start in range(0, 200, 10):
+            spill.append(_records(start, 10))
+
+        assert spill.total_bytes <= 2000
+        assert spill.stats["evicted"] == 200 - spill.pending_records
+        remaining = [record for name in sorted(os.listdir(tmp_path)) for record in read_segment(str(tmp_path / name))]
+        assert remaining == _records(200 - len(remaining), len(remaining))
+
+    def test_recovers_segments_and_ignores_torn_tail(self, tmp_path):
+        """A new buffer picks up earlier segments; a half-written frame is skipped"""
+        SpillBuffer(str(tmp_path)).append(_records(0, 4))
+        [segment] = os.listdir(tmp_path)
+        with open(tmp_path / segment, "ab") as f:
+            f.write(b"\x10\x00\x00\x00\x05")  # Torn header of a fifth record
+
+        spill = SpillBuffer(str(tmp_path))
+        assert spill.pending_records == 4
+        spill.append(_records(4, 1))
+        assert len(os.listdir(tmp_path)) == 2  # New records never go after a torn tail
+
+    def test_drain_resends_and_respills_rejections(self, tmp_path):
+        """Drain sends the oldest segment in bulk; rejected records are spilled again"""
+        spill = SpillBuffer(str(tmp_path))
+        spill.append(_records(0, 4))
+        kinesis = MagicMock()
+        kinesis.put_records.return_value = {"FailedRecordCount": 1, "Records": [
+            {"SequenceNumber": "1"}, {"SequenceNumber": "2"},
+            {"ErrorCode": "ProvisionedThroughputExceededException"}, {"SequenceNumber": "3"},
+        ]}
+
+        assert spill.drain(kinesis, "test-stream") == 3
+        assert kinesis.put_records.call_args.kwargs["Records"][0] == {"PartitionKey": "key-0", "Data": _records(0, 1)[0][1]}
+        assert spill.pending_records == 1
+
+        kinesis.put_records.side_effect = EndpointConnectionError(endpoint_url="https://kinesis")
+        assert spill.drain(kinesis, "test-stream") == 0
+        assert spill.pending_records == 1
+
+        kinesis.put_records.side_effect = _put_records_ok
+        assert spill.drain(kinesis, "test-stream") == 1
+        assert spill.empty and os.listdir(tmp_path) == []
+
+    def test_lambda_spills_during_brownout_and_drains_after(self, tmp_path, mock_kinesis, sample_api_gateway_event):
+        """Clicks that fail during an outage are spilled (202) and re-sent once Kinesis recovers"""
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        spill = SpillBuffer(str(tmp_path))
+        mock_kinesis.put_records.side_effect = _put_records_ok
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'spill', spill), \
+                patch.object(click_handler_module, 'SPILL_DRAIN_INTERVAL_SECONDS', 0):
+            # Happy path: nothing spilled, nothing drained
+            mock_kinesis.put_record.return_value = {"ShardId": "shard-1", "SequenceNumber": "1"}
+            assert lambda_handler(sample_api_gateway_event, mock_context)["statusCode"] == 200
+            mock_kinesis.put_records.assert_not_called()
+
+            # Brownout: the write fails and the click is spilled instead of lost
+            mock_kinesis.put_record.side_effect = EndpointConnectionError(endpoint_url="https://kinesis")
+            results = [lambda_handler(sample_api_gateway_event, mock_context) for _ in range(3)]
+            assert [result["statusCode"] for result in results] == [202, 202, 202]
+            assert json.loads(results[0]["body"]) == {"ingested": False, "spilled": True}
+            assert spill.pending_records == 3
+
+            # Recovery: the next successful invocation drains the backlog with PutRecords, off the request path
+            mock_kinesis.put_record.side_effect = None
+            assert lambda_handler(sample_api_gateway_event, mock_context)["statusCode"] == 200
+            click_handler_module._spill_drainer.join(timeout=5)
+
+        assert spill.empty
+        [drain_call] = mock_kinesis.put_records.call_args_list
+        resent = [json.loads(record["Data"]) for record in drain_call.kwargs["Records"]]
+        assert len(resent) == 3 and all(payload["element"] == "button-signup" for payload in resent)
+
+    def test_lambda_answers_429_once_the_spill_is_over_its_cap(self, tmp_path, mock_kinesis, sample_api_gateway_event):
+        """Past SPILL_MAX_RECORDS the click is refused with 429, so the client retries it instead"""
+        mock_context = MagicMock()
+        mock_context.aws_request_id = "test-request-id"
+        spill = SpillBuffer(str(tmp_path))
+        mock_kinesis.put_record.side_effect = ClientError(
+            {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "Rate exceeded"}}, "PutRecord")
+
+        with patch.object(click_handler_module, 'kinesis', mock_kinesis), \
+                patch.object(click_handler_module, 'spill', spill), \
+                patch.object(click_handler_module, 'SPILL_MAX_RECORDS', 2), \
+                patch.object(click_handler_module, 'PUT_LATENCY_BUDGET_MS', 20):
+            results = [lambda_handler(sample_api_gateway_event, mock_context) for _ in range(3)]
+
+        assert [result["statusCode"] for result in results] == [202, 202, 429]
+        assert "Retry-After" in results[2]["headers"]
+        assert spill.pending_records == 2
@@ -0,0 +1,157 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from etl.trending import CountMinSketch, SlidingWindowTopK, TrendingSink
+
+START = datetime(2024, 5, 1, 10, 0)
+
+
+def _zipf_keys(rng, count, keys, prefix="/page/"):
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    return [f"{prefix}{index}" for index in rng.choices(range(keys), weights=weights, k=count)]
+
+
+class TestCountMinSketch:
+    """Unit tests for the count-min sketch"""
+
+    def test_never_underestimates_and_stays_within_bound(self):
+        """Every estimate is at least the true count and over it by no more than e/width of the total"""
+        sketch = CountMinSketch(width=256, depth=4)
+        counts = Counter(_zipf_keys(random.Random(3), 20000, 5000))
+        for key, amount in counts.items():
+            sketch.add(key, amount)
+
+        assert sketch.total == 20000
+        errors = [sketch.estimate(key) - amount for key, amount in counts.items()]
+        assert min(errors) >= 0
+        assert sum(error <= sketch.error_bound for error in errors) / len(errors) > 0.95
+
+    def test_conservative_update_only_raises_the_smallest_counters(self):
+        """A conservative add lifts counters to the key's new estimate and leaves higher ones alone"""
+        sketch = CountMinSketch(width=8, depth=2)
+        buckets = sketch.buckets("/home")
+        sketch.rows[0][buckets[0]] = 7
+        sketch.add("/home", 2, conservative=True)
+
+        assert [row[bucket] for row, bucket in zip(sketch.rows, buckets)] == [7, 2]
+        assert sketch.estimate("/home") == 2
+        assert sketch.total == 2
+        with pytest.raises(ValueError, match="depth between"):
+            CountMinSketch(64, 17)
+
+
+class TestSlidingWindowTopK:
+    """Unit tests for the sliding-window heavy hitters"""
+
+    def test_top_k_matches_exact_counts(self):
+        """On a skewed stream the reported top 10 is the exact top 10, estimates within the bound"""
+        tracker = SlidingWindowTopK(k=10, window_seconds=60, slot_seconds=10, width=1024)
+        keys = _zipf_keys(random.Random(5), 30000, 20000)
+        for key in keys:
+            tracker.add(key, slot=0)
+
+        exact = Counter(keys).most_common(10)
+        top = tracker.top()
+        assert [key for key, _ in top] == [key for key, _ in exact]
+        for (_, estimate), (_, true_count) in zip(top, exact):
+            assert true_count <= estimate <= true_count + tracker.error_bound
+        assert tracker.tracked_keys < 2 * tracker.capacity
+
+    def test_window_expires_old_slots(self):
+        """Counts leave the window with their slot; a page trending earlier drops out"""
+        tracker = SlidingWindowTopK(k=2, window_seconds=30, slot_seconds=10, width=128)
+        tracker.add("/old", slot=100, amount=50)
+        tracker.add("/new", slot=101, amount=5)
+        assert tracker.top() == [("/old", 50), ("/new", 5)]
+        assert tracker.window_bounds == (990, 1020)
+
+        tracker.add("/new", slot=103, amount=1)
+        assert tracker.top() == [("/new", 6)]
+        assert tracker.window_events == 6
+
+        tracker.add("/new", slot=200)
+        assert tracker.top() == [("/new", 1)]
+
+    def test_late_events_are_dropped(self):
+        tracker = SlidingWindowTopK(k=2, window_seconds=30, slot_seconds=10, width=128)
+        tracker.add("/home", slot=10)
+        assert tracker.add("/home", slot=7, amount=3) is False
+        assert tracker.add("/home", slot=8) is True
+        assert tracker.late_events == 3
+        assert tracker.top() == [("/home", 2)]
+
+    def test_window_never_moves_past_the_allowed_future(self):
+        """A slot beyond now + max_future_seconds is rejected and does not move the window"""
+        now = 1_000_000.0
+        tracker = SlidingWindowTopK(k=2, window_seconds=30, slot_seconds=10, width=128, max_future_seconds=300,
+                                    clock=lambda: now)
+        assert tracker.add("/home", slot=100_000, amount=100) is True
+        assert tracker.add("/home", slot=100_000 + 8640) is False
+        assert tracker.add("/home", slot=100_000, amount=50) is True
+        assert tracker.add("/home", slot=100_030) is True
+
+        assert (tracker.future_events, tracker.late_events) == (1, 0)
+        assert tracker.newest_slot == 100_030
+        tracker.advance(200_000)
+        assert tracker.newest_slot == 100_030
+
+    def test_rejects_window_not_made_of_slots(self):
+        with pytest.raises(ValueError, match="multiple of slot_seconds"):
+            SlidingWindowTopK(window_seconds=45, slot_seconds=30)
+
+
+class TestTrendingSink:
+    """Unit tests for the trending micro-batch sink"""
+
+    @staticmethod
+    def _batch(spark_session, clicks):
+        return spark_session.createDataFrame(
+            [(page, element, START + timedelta(seconds=offset)) for page, element, offset in clicks],
+            "page string, element string, event_ts timestamp")
+
+    def test_snapshot_per_batch_without_double_counting_retries(self, spark_session):
+        """Each batch publishes a top-K snapshot; a retried batch is published again but counted once"""
+        sink = TrendingSink("s3://b/dev/gold/trending/", lambda df: df, k=2, window_seconds=60, slot_seconds=10)
+        batch = self._batch(spark_session, [("/home", "cta", 1), ("/home", "cta", 2), ("/pricing", "cta", 3),
+                                            ("/signup", None, 4), ("/signup", "nav", 15), ("/signup", "nav", 16)])
+
+        with patch("etl.trending.write_delta_batch") as write:
+            sink.write(batch, 0, "clicks-trending-abc")
+            sink.write(batch, 0, "clicks-trending-abc")
+
+        assert write.call_count == 2
+        snapshot_df, out_path, partition_column, txn_app_id, txn_version = write.call_args.args
+        assert (out_path, partition_column, txn_app_id, txn_version) == \
+            ("s3://b/dev/gold/trending/", "snapshot_date", "clicks-trending-abc", 0)
+        rows = [(row.kind, row.rank, row.key, row.estimate, row.window_events) for row in snapshot_df.collect()]
+        assert rows == [("page", 1, "/signup", 3, 6), ("page", 2, "/home", 2, 6),
+                        ("element", 1, "cta", 3, 5), ("element", 2, "nav", 2, 5)]
+        (row,) = snapshot_df.where("kind = 'page' AND rank = 1").collect()
+        assert (row.window_start, row.window_end) == (START - timedelta(seconds=40), START + timedelta(seconds=20))
+
+    def test_future_skewed_click_does_not_empty_the_window(self, spark_session):
+        """A click with a client clock a day ahead, among normal clicks, is left out of the window"""
+        sink = TrendingSink("s3://b/dev/gold/trending/", lambda df: df, k=2, window_seconds=60, slot_seconds=10)
+        rows = [("/home", "cta", START + timedelta(seconds=offset % 50), "client") for offset in range(100)]
+        rows.append(("/home", "cta", START + timedelta(days=1), "client_skewed"))
+        rows += [("/home", "cta", START + timedelta(seconds=50), "client")] * 50
+        batch = spark_session.createDataFrame(
+            rows, "page string, element string, event_ts timestamp, event_time_source string")
+
+        with patch("etl.trending.write_delta_batch"):
+            sink.write(batch, 0, "clicks-trending-abc")
+
+        tracker = sink.trackers["page"]
+        assert (tracker.late_events, tracker.window_events) == (0, 150)
+        assert tracker.estimate("/home") == 150
+        assert tracker.window_bounds[1] == (START + timedelta(seconds=60) - datetime(1970, 1, 1)).total_seconds()
+
+    def test_empty_window_publishes_nothing(self, spark_session):
+        sink = TrendingSink("s3://b/dev/gold/trending/", lambda df: df)
+        with patch("etl.trending.write_delta_batch") as write:
+            sink.write(self._batch(spark_session, [(None, None, 1)]), 3, "clicks-trending-abc")
+        write.assert_not_called()
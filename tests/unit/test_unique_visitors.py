@@ -0,0 +1,115 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from pyspark.sql.functions import col, countDistinct, date_trunc
+
+from etl.unique_visitors import compact_sketches, merge_unique_visitors, unique_visitor_sketches
+
+PAGES = ["/home", "/pricing", "/signup"]
+START = datetime(2024, 4, 1)
+DAYS = 42
+
+
+@pytest.fixture(scope="module")
+def clicks(spark_session):
+    """Six weeks of clicks: a stable pool of regulars plus one-off visitors, some without visitor_id."""
+    rng = random.Random(11)
+    rows = []
+    for day in range(DAYS):
+        for _ in range(1000):
+            regular = rng.random() < 0.6
+            visitor = f"v-{rng.randrange(4000)}" if regular else f"once-{day}-{rng.getrandbits(48)}"
+            ts = START + timedelta(days=day, seconds=rng.randrange(86400))
+            anonymous = rng.random() < 0.05
+            rows.append((rng.choice(PAGES), None if anonymous else visitor, f"ua-{visitor}", f"10.0.{day}.0", ts))
+    return spark_session.createDataFrame(
+        rows, "page string, visitor_id string, userAgent string, client_ip string, event_ts timestamp").cache()
+
+
+def _exact(clicks, start, end, granularity=None):
+    in_range = clicks.where((col("event_ts") >= start) & (col("event_ts") < end))
+    keyed = in_range.selectExpr("page", "event_ts",
+                                "coalesce(visitor_id, concat(client_ip, '|', userAgent)) AS visitor")
+    group = ["page"] + ([date_trunc(granularity, "event_ts").alias("period_start")] if granularity else [])
+    return {tuple(row[:-1]): row[-1] for row in keyed.groupBy(*group).agg(countDistinct("visitor")).collect()}
+
+
+def _estimates(sketches, start, end, granularity=None):
+    merged = merge_unique_visitors(sketches, start, end, granularity=granularity)
+    return {tuple(row[:-4]): row for row in merged.collect()}
+
+
+class TestUniqueVisitors:
+    """Accuracy of merged HLL sketches against exact distinct counts"""
+
+    def test_merged_ranges_match_exact_counts(self, clicks, tmp_path, spark_session):
+        """Day, week and whole-range merges of hourly sketches stay within a few percent of exact"""
+        # Two partial sketches per hour, as two micro-batches would append, round-tripped through Parquet
+        halves = [clicks.where(col("event_ts").cast("long") % 2 == parity) for parity in (0, 1)]
+        for half in halves:
+            unique_visitor_sketches(half).write.mode("append").partitionBy("bucket_date").parquet(str(tmp_path))
+        sketches = spark_session.read.parquet(str(tmp_path))
+        end = START + timedelta(days=DAYS)
+
+        for granularity, start in ((None, START), ("week", START), ("day", START + timedelta(days=40))):
+            exact = _exact(clicks, start, end, granularity)
+            estimates = _estimates(sketches, start, end, granularity)
+            assert estimates.keys() == exact.keys()
+            for key, expected in exact.items():
+                row = estimates[key]
+                assert abs(row.unique_visitors - expected) / expected < 0.05, (granularity, key, row, expected)
+
+        whole = _estimates(sketches, START, end)
+        assert sum(row.events for row in whole.values()) == clicks.count()
+        assert sum(row.unidentified_events for row in whole.values()) == 0
+        # One partial sketch per (hour, micro-batch) that saw the page
+        partials = clicks.where(col("page") == "/home").select(
+            date_trunc("hour", "event_ts"), col("event_ts").cast("long") % 2).distinct().count()
+        assert whole[("/home",)].sketches == partials
+
+    def test_compaction_keeps_estimates_and_folds_partials(self, clicks):
+        """Folding the partial sketches of each hour leaves one per hour and the same answer"""
+        day = datetime(2024, 4, 3)
+        partials = unique_visitor_sketches(clicks.where(col("visitor_id").isNotNull())).unionByName(
+            unique_visitor_sketches(clicks.where(col("visitor_id").isNull())))
+        compacted = compact_sketches(partials)
+
+        before = _estimates(partials, day, day + timedelta(days=1))
+        after = _estimates(compacted, day, day + timedelta(days=1))
+
+        # A union of unions may switch estimators, so the two agree closely rather than exactly
+        assert before.keys() == after.keys()
+        for key, row in after.items():
+            assert abs(row.unique_visitors - before[key].unique_visitors) / before[key].unique_visitors < 0.01
+        assert all(row.sketches == 24 for row in after.values())
+
+    def test_site_wide_merge_and_hour_boundaries(self, clicks):
+        """Without by_page all pages merge into one count; ranges cut at hour boundaries"""
+        sketches = unique_visitor_sketches(clicks)
+        start, end = datetime(2024, 4, 10, 6), datetime(2024, 4, 10, 18)
+
+        (row,) = merge_unique_visitors(sketches, start, end, by_page=False).collect()
+        exact = clicks.where((col("event_ts") >= start) & (col("event_ts") < end)).selectExpr(
+            "coalesce(visitor_id, concat(client_ip, '|', userAgent)) AS visitor").distinct().count()
+
+        assert row.sketches == 12 * len(PAGES)
+        assert abs(row.unique_visitors - exact) / exact < 0.05
+        assert merge_unique_visitors(sketches, date(2024, 6, 1), date(2024, 6, 2)).count() == 0
+
+    def test_clicks_without_visitor_id_or_ip_are_reported_not_merged(self, spark_session):
+        """Id-less clicks without a client IP are counted apart, not as one visitor per user agent"""
+        rows = [("/home", f"v-{i}", "ua", "10.0.0.0", START) for i in range(3)] + \
+            [("/home", None, "ua", None, START + timedelta(minutes=i)) for i in range(50)] + \
+            [("/home", None, "ua", "10.0.1.0", START)]
+        clicks = spark_session.createDataFrame(
+            rows, "page string, visitor_id string, userAgent string, client_ip string, event_ts timestamp")
+
+        (row,) = merge_unique_visitors(compact_sketches(unique_visitor_sketches(clicks)), START,
+                                       START + timedelta(hours=1)).collect()
+
+        assert (row.unique_visitors, row.events, row.unidentified_events) == (4, 54, 50)
+
+    def test_rejects_unknown_granularity(self, clicks):
+        with pytest.raises(ValueError, match="granularity"):
+            merge_unique_visitors(clicks, START, START, granularity="quarter")
@@ -0,0 +1,53 @@
+import pytest
+
+from etl.click_schema import CLICK_FIELDS, SERVER_FIELDS
+from etl.handlers.validator import ValidationError, compile_validator, generate_validator_source, validate_click
+
+
+class TestValidator:
+    """Unit tests for the compiled click payload validator"""
+
+    def test_checks_every_client_field_of_the_canonical_schema(self):
+        """The generated code covers CLICK_FIELDS minus the fields set at ingest"""
+        source = generate_validator_source()
+        for name, _ in CLICK_FIELDS:
+            assert (f"payload.get({name!r})" in source) == (name not in SERVER_FIELDS)
+
+    def test_normalizes_timestamp_and_drops_unknown_fields(self):
+        """Offsets are converted to canonical UTC; unknown and server-set fields are dropped"""
+        clean = validate_click({
+            "element": "button-signup",
+            "page": "/landing-page",
+            "timestamp": "2023-09-15T16:30:45.500+0200",
+            "request_id": "spoofed",
+            "debug": True,
+        })
+        assert clean == {"element": "button-signup", "page": "/landing-page",
+                         "timestamp": "2023-09-15T14:30:45.500Z"}
+        assert validate_click({"page": "/", "timestamp": "2023-09-15T14:30:45Z"})["timestamp"] == \
+            "2023-09-15T14:30:45.000Z"
+
+    @pytest.mark.parametrize("payload, message", [
+        (["not", "an", "object"], "JSON object"),
+        ({"timestamp": "2023-09-15T14:30:45Z"}, "page is required"),
+        ({"page": "/"}, "timestamp is required"),
+        ({"page": 42, "timestamp": "2023-09-15T14:30:45Z"}, "page must be a string"),
+        ({"page": "/", "timestamp": "2023-09-15T14:30:45Z", "element": "x" * 257}, "element exceeds 256"),
+        ({"page": "/", "timestamp": "yesterday"}, "timestamp must be ISO 8601"),
+    ])
+    def test_rejects_invalid_payloads(self, payload, message):
+        """Missing required fields, wrong types, overlong values and bad timestamps are rejected"""
+        with pytest.raises(ValidationError, match=message):
+            validate_click(payload)
+
+    def test_optional_fields_may_be_null(self):
+        """Optional fields that are null or absent are omitted from the result"""
+        assert validate_click({"page": "/", "timestamp": "2023-09-15T14:30:45Z", "element": None}) == \
+            {"page": "/", "timestamp": "2023-09-15T14:30:45.000Z"}
+
+    def test_custom_schema(self):
+        """compile_validator accepts a narrower schema"""
+        validate = compile_validator(field_names=["page"], required=[], max_lengths={"page": 3})
+        assert validate({"page": "/ab", "element": "dropped"}) == {"page": "/ab"}
+        with pytest.raises(ValidationError):
+            validate({"page": "/abc"})
@@ -0,0 +1,178 @@
+import importlib.util
+import threading
+import time
+from pathlib import Path
+
+import boto3
+from botocore.stub import Stubber
+
+SCRIPT_PATH = (Path(__file__).resolve().parents[2] / "infra" / "terraform" / "modules" / "glue_network"
+               / "scripts" / "teardown.py")
+_spec = importlib.util.spec_from_file_location("teardown", SCRIPT_PATH)
+teardown = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(teardown)
+
+
+class FakeClock:
+    """Deterministic clock/sleep pair so backoff tests never actually wait"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _ec2():
+    return boto3.client("ec2", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+
+
+def _eni(eni_id, attachment_id=None, interface_type="interface", requester_managed=False):
+    interface = {"NetworkInterfaceId": eni_id, "InterfaceType": interface_type, "RequesterManaged": requester_managed,
+                 "Status": "in-use" if attachment_id else "available"}
+    if attachment_id:
+        interface["Attachment"] = {"AttachmentId": attachment_id, "Status": "attached"}
+    return interface
+
+
+def _filters(name, values):
+    return {"Filters": [{"Name": name, "Values": values}]}
+
+
+class TestVpcTeardown:
+    """Unit tests for the boto3 VPC teardown library, stubbed with botocore's Stubber"""
+
+    def test_wait_until_backs_off_exponentially_to_the_deadline(self):
+        """Delays double up to the cap and the last sleep stops at the timeout"""
+        clock = FakeClock()
+        result = teardown.wait_until(lambda: False, timeout=40, max_delay=15, sleep=clock.sleep, clock=clock)
+
+        assert result is False
+        assert clock.sleeps == [1, 2, 4, 8, 15, 10]
+
+    def test_wait_until_returns_without_sleeping_when_already_done(self):
+        clock = FakeClock()
+        assert teardown.wait_until(lambda: "done", sleep=clock.sleep, clock=clock) == "done"
+        assert clock.sleeps == []
+
+    def test_endpoints_are_deleted_and_polled_in_one_call(self):
+        """One delete and one describe per poll cover every endpoint"""
+        ec2 = _ec2()
+        clock = FakeClock()
+        ids = ["vpce-1", "vpce-2", "vpce-3"]
+        with Stubber(ec2) as stub:
+            stub.add_response("delete_vpc_endpoints", {"Unsuccessful": []}, {"VpcEndpointIds": ids})
+            stub.add_response("describe_vpc_endpoints", {"VpcEndpoints": [
+                {"VpcEndpointId": "vpce-1", "State": "deleting"},
+                {"VpcEndpointId": "vpce-2", "State": "deleted"},
+            ]}, _filters("vpc-endpoint-id", ids))
+            stub.add_response("describe_vpc_endpoints", {"VpcEndpoints": []}, _filters("vpc-endpoint-id", ["vpce-1"]))
+
+            remaining = teardown.cleanup_vpc_endpoints(ec2, ["vpce-1", " vpce-2", "vpce-3", ""],
+                                                       sleep=clock.sleep, clock=clock)
+            stub.assert_no_pending_responses()
+
+        assert remaining == []
+        assert clock.sleeps == [1]
+
+    def test_stuck_endpoint_gets_its_enis_removed_and_is_deleted_again(self):
+        """Past the timeout the endpoint's ENIs are detached and deleted, then the delete is retried"""
+        ec2 = _ec2()
+        clock = FakeClock()
+        with Stubber(ec2) as stub:
+            stub.add_response("delete_vpc_endpoints", {}, {"VpcEndpointIds": ["vpce-1"]})
+            for _ in range(2):
+                stub.add_response("describe_vpc_endpoints", {"VpcEndpoints": [
+                    {"VpcEndpointId": "vpce-1", "State": "deleting"}]}, _filters("vpc-endpoint-id", ["vpce-1"]))
+            stub.add_response("describe_network_interfaces", {"NetworkInterfaces": [
+                _eni("eni-1", "attach-1", interface_type="vpc_endpoint", requester_managed=True)]},
+                _filters("vpc-endpoint-id", ["vpce-1"]))
+            stub.add_response("detach_network_interface", {}, {"AttachmentId": "attach-1", "Force": True})
+            stub.add_response("delete_network_interface", {}, {"NetworkInterfaceId": "eni-1"})
+            stub.add_response("delete_vpc_endpoints", {}, {"VpcEndpointIds": ["vpce-1"]})
+            stub.add_response("describe_vpc_endpoints", {"VpcEndpoints": []}, _filters("vpc-endpoint-id", ["vpce-1"]))
+
+            remaining = teardown.cleanup_vpc_endpoints(ec2, ["vpce-1"], timeout=1, sleep=clock.sleep, clock=clock)
+            stub.assert_no_pending_responses()
+
+        assert remaining == []
+
+    def test_vpc_sweep_detaches_waits_and_skips_service_managed_enis(self):
+        """In-use ENIs are force-detached and deleted once released; service-owned ones are left alone"""
+        ec2 = _ec2()
+        clock = FakeClock()
+        with Stubber(ec2) as stub:
+            stub.add_response("describe_network_interfaces", {"NetworkInterfaces": [
+                _eni("eni-free"),
+                _eni("eni-glue", "attach-glue"),
+                _eni("eni-endpoint", "attach-endpoint", interface_type="vpc_endpoint", requester_managed=True),
+            ]}, _filters("vpc-id", ["vpc-1"]))
+            stub.add_response("delete_network_interface", {}, {"NetworkInterfaceId": "eni-free"})
+            stub.add_response("detach_network_interface", {}, {"AttachmentId": "attach-glue", "Force": True})
+            stub.add_client_error("delete_network_interface", "InvalidNetworkInterface.InUse",
+                                  expected_params={"NetworkInterfaceId": "eni-glue"})
+            stub.add_response("delete_network_interface", {}, {"NetworkInterfaceId": "eni-glue"})
+
+            deleted, failed = teardown.cleanup_vpc_network_interfaces(ec2, "vpc-1", max_workers=1,
+                                                                      sleep=clock.sleep, clock=clock)
+            stub.assert_no_pending_responses()
+
+        assert deleted == ["eni-free", "eni-glue"]
+        assert failed == []
+        assert clock.sleeps == [1]
+
+    def test_missing_enis_count_as_deleted_and_errors_are_isolated(self):
+        """NotFound means already gone; any other error fails only that ENI"""
+        ec2 = _ec2()
+        with Stubber(ec2) as stub:
+            stub.add_client_error("delete_network_interface", "InvalidNetworkInterfaceID.NotFound",
+                                  expected_params={"NetworkInterfaceId": "eni-gone"})
+            stub.add_client_error("delete_network_interface", "UnauthorizedOperation",
+                                  expected_params={"NetworkInterfaceId": "eni-denied"})
+
+            deleted, failed = teardown.delete_network_interfaces(ec2, [_eni("eni-gone"), _eni("eni-denied")],
+                                                                 max_workers=1)
+
+        assert deleted == ["eni-gone"]
+        assert failed == ["eni-denied"]
+
+    def test_describes_are_batched_by_filter_size(self):
+        """Large ID lists are split into DESCRIBE_BATCH_SIZE chunks rather than one call per ID"""
+        ec2 = _ec2()
+        ids = [f"vpce-{i}" for i in range(450)]
+        with Stubber(ec2) as stub:
+            for start in (0, 200, 400):
+                stub.add_response("describe_vpc_endpoints", {"VpcEndpoints": []},
+                                  _filters("vpc-endpoint-id", ids[start:start + 200]))
+            assert teardown.describe_vpc_endpoints(ec2, ids) == []
+            stub.assert_no_pending_responses()
+
+    def test_enis_are_deleted_concurrently(self):
+        """With several workers the per-ENI waits overlap instead of adding up"""
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+
+        class SlowEc2:
+            def delete_network_interface(self, NetworkInterfaceId):
+                with lock:
+                    active.append(NetworkInterfaceId)
+                    peak[0] = max(peak[0], len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.remove(NetworkInterfaceId)
+
+        interfaces = [_eni(f"eni-{i}") for i in range(16)]
+        started = time.perf_counter()
+        deleted, failed = teardown.delete_network_interfaces(SlowEc2(), interfaces, max_workers=8)
+        elapsed = time.perf_counter() - started
+
+        assert sorted(deleted) == sorted(interface["NetworkInterfaceId"] for interface in interfaces)
+        assert failed == []
+        assert peak[0] > 1
+        assert elapsed < 16 * 0.05